@@ -0,0 +1,256 @@
+# accounts.py
+# Dhan client accounts the tools can act for.
+#
+# The account in config.py is always available as "default". More accounts
+# are listed in accounts.json (or the file named by DHAN_ACCOUNTS_FILE):
+#
+#   {"accounts": [{"name": "family", "client_id": "1000000002",
+#                  "access_token_env": "DHAN_FAMILY_TOKEN",
+#                  "rate_limits": {"order": [[10, 1], [250, 60]]}}]}
+#
+# Each account has its own DhanClient, so its own connection pool, rate limit
+# buckets and circuit breakers, and its own directory under data_cache for
+# local state such as its trade journal. Tools that take an `account`
+# argument act for one account by name, for several given as a
+# comma-separated list, or for "all" of them concurrently.
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from config import (
+    DHAN_ACCESS_TOKEN, DHAN_ACCOUNTS_FILE, DHAN_API_BASE_URL, DHAN_CLIENT_ID, DHAN_JOURNAL_ENABLED,
+    DHAN_PAPER_TRADING
+)
+import dhan_client
+from rate_limiter import DEFAULT_LIMITS, RateLimiter
+
+DEFAULT_ACCOUNT = "default"
+ALL_ACCOUNTS = "all"
+
+# Statuses of Dhan's answer to GET /holdings for an empty demat account
+NO_HOLDINGS_STATUSES = (404, 500)
+
+ACCOUNTS_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cache", "accounts")
+
+
+class Account:
+    """
+    One Dhan client account.
+
+    Attributes:
+        name: Name used to select the account
+        client_id: Dhan client ID, sent as dhanClientId in order bodies
+        access_token: API access token
+        client: DhanClient used for this account's calls
+        base_url: API base URL
+        cache_dir: Directory for this account's local state
+    """
+
+    def __init__(self, name, client_id, access_token, client, base_url=DHAN_API_BASE_URL, cache_dir=None):
+        self.name = name
+        self.client_id = client_id
+        self.access_token = access_token
+        self.client = client
+        self.base_url = base_url.rstrip("/")
+        self.cache_dir = cache_dir or os.path.join(ACCOUNTS_CACHE_DIR, name)
+
+    @property
+    def is_default(self):
+        return self.name == DEFAULT_ACCOUNT
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def headers(self):
+        return {
+            "Content-Type": "application/json",
+            "access-token": self.access_token
+        }
+
+    def cache_path(self, *parts):
+        """Path inside this account's cache directory"""
+        return os.path.join(self.cache_dir, *parts)
+
+
+def default_account():
+    """The account configured in config.py, using the module level client"""
+    return Account(DEFAULT_ACCOUNT, DHAN_CLIENT_ID, DHAN_ACCESS_TOKEN, dhan_client.default_client,
+                   cache_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cache"))
+
+def account_from_config(entry):
+    """
+    Build an account from one accounts.json entry.
+
+    Raises:
+        ValueError if the entry is incomplete
+    """
+    name = str(entry.get("name") or "").strip()
+    if not name or name.lower() in (DEFAULT_ACCOUNT, ALL_ACCOUNTS) or "," in name:
+        raise ValueError(f"Invalid account name {name!r}")
+    token = entry.get("access_token")
+    if not token and entry.get("access_token_env"):
+        token = os.environ.get(entry["access_token_env"])
+    if not entry.get("client_id") or not token:
+        raise ValueError(f"Account {name!r} needs a client_id and an access_token or access_token_env")
+
+    limits = dict(DEFAULT_LIMITS)
+    for category, windows in (entry.get("rate_limits") or {}).items():
+        limits[category] = [(float(count), float(window)) for count, window in windows]
+    base_url = entry.get("base_url") or DHAN_API_BASE_URL
+    client = dhan_client.DhanClient(base_url=base_url, rate_limiter=RateLimiter(limits, name=name))
+    account = Account(name, str(entry["client_id"]), token, client, base_url)
+
+    if DHAN_PAPER_TRADING:
+        # Every account trades against its own paper book
+        from paper_trading import PaperBroker
+        client.paper_broker = PaperBroker()
+        client.paper_broker.start_price_stream()
+    if DHAN_JOURNAL_ENABLED:
+        from trade_journal import TradeJournal
+        client.add_listener(TradeJournal(account.cache_path("trade_journal.db")).record_response)
+    return account
+
+def load_accounts(path=DHAN_ACCOUNTS_FILE):
+    """
+    Load the default account and the accounts listed in `path`.
+
+    Returns:
+        Mapping of account name to Account, default first
+    """
+    accounts = {DEFAULT_ACCOUNT: default_account()}
+    if not path or not os.path.exists(path):
+        return accounts
+    with open(path, 'r') as file:
+        entries = json.load(file).get("accounts", [])
+    for entry in entries:
+        account = account_from_config(entry)
+        if account.name in accounts:
+            raise ValueError(f"Account {account.name!r} is listed twice")
+        accounts[account.name] = account
+    return accounts
+
+
+# Accounts of this process, loaded on first use
+_accounts = None
+_accounts_lock = threading.Lock()
+
+def accounts():
+    global _accounts
+    if _accounts is None:
+        with _accounts_lock:
+            if _accounts is None:
+                _accounts = load_accounts()
+    return _accounts
+
+def get_account(name=None):
+    """
+    Look up an account by name (default: the account in config.py).
+
+    Raises:
+        KeyError if there is no such account
+    """
+    name = DEFAULT_ACCOUNT if name is None or str(name).strip() == "" else str(name).strip()
+    account = accounts().get(name)
+    if account is None:
+        raise KeyError(f"Unknown account '{name}'. Available accounts: {', '.join(accounts())}")
+    return account
+
+def fetch_holding_rows(account):
+    """
+    Demat holdings of an account as Dhan's rows ([] when it has none).
+
+    Dhan answers 404 or 500 with an error body when there are no holdings;
+    those answers are not retried and do not count against the endpoint's
+    circuit breaker.
+
+    Raises:
+        requests.exceptions.RequestException if the holdings could not be fetched
+    """
+    response = account.client.get(account.url("/holdings"), headers=account.headers(),
+                                  expected_statuses=NO_HOLDINGS_STATUSES)
+    if response.status_code in NO_HOLDINGS_STATUSES:
+        return []
+    response.raise_for_status()
+    return response.json() or []
+
+def is_fan_out(selector):
+    """True if the selector names more than one account (or "all")"""
+    return selector is not None and (str(selector).strip().lower() == ALL_ACCOUNTS or "," in str(selector))
+
+def select_accounts(selector=None):
+    """
+    Accounts matching a selector: None (default account), a name,
+    comma-separated names, or "all".
+
+    Raises:
+        KeyError if a named account does not exist
+    """
+    if selector is not None and str(selector).strip().lower() == ALL_ACCOUNTS:
+        return list(accounts().values())
+    names = [None] if selector is None else [name for name in str(selector).split(",") if name.strip()]
+    selected = []
+    for name in names or [None]:
+        account = get_account(name)
+        if account not in selected:
+            selected.append(account)
+    return selected
+
+def fan_out(selector, fn):
+    """
+    Call fn(account) for every selected account concurrently.
+
+    Request errors are caught per account, so one failing account does not
+    hide the results of the others.
+
+    Returns:
+        List of (account, result, error, latency in ms), in account order
+
+    Raises:
+        KeyError if a named account does not exist
+    """
+    selected = select_accounts(selector)
+
+    def timed(account):
+        start = time.perf_counter()
+        try:
+            result, error = fn(account), None
+        except requests.exceptions.RequestException as e:
+            result, error = None, e
+        return account, result, error, round((time.perf_counter() - start) * 1000, 1)
+
+    if len(selected) == 1:
+        return [timed(selected[0])]
+    with ThreadPoolExecutor(max_workers=len(selected)) as executor:
+        return list(executor.map(timed, selected))
+
+def merge_rows(results, key):
+    """
+    Merge per-account lists of records (see records.py) into one tool response.
+
+    Each row gets an "account" field, and "accounts" lists the status, row
+    count and latency of every account.
+    """
+    rows, summaries = [], []
+    for account, result, error, latency in results:
+        summary = {"account": account.name, "latency_ms": latency}
+        if error is not None:
+            summary.update(status="error", message=str(error))
+        else:
+            for record in result or []:
+                rows.append(record.to_dict(account=account.name))
+            summary.update(status="success", count=len(result or []))
+        summaries.append(summary)
+    return fan_out_response(summaries, **{f"{key}_count": len(rows), key: rows})
+
+def fan_out_response(summaries, **fields):
+    """Tool response for a fan-out: an error only if every account failed"""
+    failed = [summary["account"] for summary in summaries if summary["status"] == "error"]
+    response = {"status": "error" if len(failed) == len(summaries) else "success"}
+    if failed:
+        response["message"] = f"Failed for account(s): {', '.join(failed)}"
+    response.update(fields)
+    response["accounts"] = summaries
+    return response
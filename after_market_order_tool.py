@@ -1,37 +1,17 @@
 # after_market_order_tool.py
-import json
-import os
-import requests
 from mcp.server.fastmcp import FastMCP
-from config import DHAN_CLIENT_ID, DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL
+from config import DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL
+from amo_queue import (
+    AMO_TIMES, DEFAULT_CONCURRENCY, DEFAULT_WARM_UP_SECONDS, amo_queue, format_time, order_body, parse_flush_time,
+    validate_amo
+)
+from order_idempotency import submit_order
+from reference_cache import find_stock_code
+from tool_metrics import instrument_server
 
 # Create the MCP server
 mcp = FastMCP("DhanHQ After Market Order")
-
-# Helper function to load stocks data
-def load_stocks_data():
-    """Load the stocks data from stocks.json file"""
-    try:
-        # Get the directory of the current script
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        # Construct the path to stocks.json
-        stocks_file_path = os.path.join(script_dir, "stocks.json")
-        
-        with open(stocks_file_path, 'r') as file:
-            data = json.load(file)
-            return data.get('companies', [])
-    except Exception as e:
-        print(f"Error loading stocks data: {e}")
-        return []
-
-# Find stock code by name
-def find_stock_code(stock_name):
-    """Find the stock code for a given stock name"""
-    stocks = load_stocks_data()
-    for stock in stocks:
-        if stock.get('stock_name', '').lower() == stock_name.lower():
-            return stock.get('stock_code')
-    return None
+instrument_server(mcp)
 
 @mcp.tool()
 def place_after_market_order(
@@ -43,7 +23,8 @@ def place_after_market_order(
     order_type="LIMIT",
     price=None,
     trigger_price=None,
-    disclosed_quantity=None
+    disclosed_quantity=None,
+    correlation_id=None
 ):
     """
     Place an After Market Order (AMO) to be executed on the next trading day.
@@ -62,36 +43,17 @@ def place_after_market_order(
         price: Order price (required for LIMIT orders)
         trigger_price: Trigger price (required for STOP_LOSS orders)
         disclosed_quantity: Number of shares to be disclosed (optional)
+        correlation_id: Client ID for this order (optional). Reusing it returns
+            the order it already placed instead of placing a new one
     
     Returns:
         Status of the order placement
     """
-    # Validate transaction type
-    if transaction_type.upper() not in ["BUY", "SELL"]:
+    error = validate_amo(transaction_type, order_type, price, trigger_price, amo_time)
+    if error:
         return {
             "status": "error",
-            "message": "Transaction type must be either 'BUY' or 'SELL'"
-        }
-    
-    # Validate order type and required parameters
-    if order_type.upper() == "LIMIT" and price is None:
-        return {
-            "status": "error",
-            "message": "Price is required for LIMIT orders"
-        }
-    
-    if order_type.upper() in ["STOP_LOSS", "STOP_LOSS_MARKET"] and trigger_price is None:
-        return {
-            "status": "error",
-            "message": "Trigger price is required for STOP_LOSS orders"
-        }
-    
-    # Validate AMO time
-    valid_amo_times = ["PRE_OPEN", "OPEN", "OPEN_30", "OPEN_60"]
-    if amo_time not in valid_amo_times:
-        return {
-            "status": "error",
-            "message": f"AMO time must be one of {valid_amo_times}"
+            "message": error
         }
     
     # Find the stock code
@@ -109,44 +71,18 @@ def place_after_market_order(
         "access-token": DHAN_ACCESS_TOKEN
     }
     
-    order_data = {
-        "dhanClientId": DHAN_CLIENT_ID,
-        "transactionType": transaction_type.upper(),
-        "exchangeSegment": "NSE_EQ",
-        "productType": product_type.upper(),
-        "orderType": order_type.upper(),
-        "validity": "DAY",
-        "securityId": stock_code,
-        "quantity": str(quantity),
-        "afterMarketOrder": True,
-        "amoTime": amo_time
-    }
-    
-    # Add price if provided
-    if price is not None:
-        order_data["price"] = str(price)
-    else:
-        order_data["price"] = ""
-    
-    # Add trigger price if provided
-    if trigger_price is not None:
-        order_data["triggerPrice"] = str(trigger_price)
-    else:
-        order_data["triggerPrice"] = ""
-    
-    # Add disclosed quantity if provided
-    if disclosed_quantity is not None:
-        order_data["disclosedQuantity"] = str(disclosed_quantity)
-    else:
-        order_data["disclosedQuantity"] = ""
+    order_data = order_body(stock_code, quantity, transaction_type, amo_time, product_type, order_type,
+                            price, trigger_price, disclosed_quantity)
     
     try:
-        response = requests.post(url, headers=headers, json=order_data)
+        response, correlation_id, outcome = submit_order(url, headers, order_data, correlation_id)
         
         if response.status_code in [200, 201, 202]:
             return {
                 "status": "success",
                 "message": f"After Market Order placed successfully for {quantity} shares of {stock_name}",
+                "correlation_id": correlation_id,
+                "submission": outcome,
                 "order_details": {
                     "amo_time": amo_time,
                     "transaction_type": transaction_type,
@@ -161,7 +97,9 @@ def place_after_market_order(
             return {
                 "status": "error",
                 "message": f"Failed to place After Market Order. Status code: {response.status_code}",
-                "details": response.text
+                "details": response.text,
+                "correlation_id": correlation_id,
+                "submission": outcome
             }
     except Exception as e:
         return {
@@ -169,6 +107,296 @@ def place_after_market_order(
             "message": f"Error placing After Market Order: {str(e)}"
         }
 
+@mcp.tool()
+def stage_amo(
+    stock_name,
+    quantity,
+    transaction_type,
+    amo_time="OPEN",
+    product_type="CNC",
+    order_type="LIMIT",
+    price=None,
+    trigger_price=None,
+    allow_duplicate=False
+):
+    """
+    Stage an After Market Order to be sent later with the rest of the queue.
+    
+    Staged orders for the same stock, product type, AMO time, order type and
+    price are netted: opposite sides offset each other and only the net
+    quantity is sent when the queue is flushed.
+    
+    Args:
+        stock_name: Name of the stock (e.g., "ADANIENT")
+        quantity: Number of shares to buy/sell
+        transaction_type: "BUY" or "SELL"
+        amo_time: "PRE_OPEN", "OPEN", "OPEN_30" or "OPEN_60" (default: "OPEN")
+        product_type: Product type (default: "CNC")
+        order_type: Order type (default: "LIMIT")
+        price: Order price (required for LIMIT orders)
+        trigger_price: Trigger price (required for STOP_LOSS orders)
+        allow_duplicate: Stage even if an identical order is already staged (default: False)
+    
+    Returns:
+        The staged leg and the net order for its stock
+    """
+    error = validate_amo(transaction_type, order_type, price, trigger_price, amo_time)
+    if error:
+        return {
+            "status": "error",
+            "message": error
+        }
+    
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        quantity = 0
+    if quantity <= 0:
+        return {
+            "status": "error",
+            "message": "Quantity must be a positive whole number"
+        }
+    
+    stock_code = find_stock_code(stock_name)
+    if not stock_code:
+        return {
+            "status": "error",
+            "message": f"Stock '{stock_name}' not found in stocks.json"
+        }
+    
+    leg, duplicate = amo_queue.stage({
+        "stock_name": stock_name.upper(),
+        "security_id": stock_code,
+        "transaction_type": transaction_type.upper(),
+        "quantity": quantity,
+        "amo_time": amo_time,
+        "product_type": product_type.upper(),
+        "order_type": order_type.upper(),
+        "price": float(price) if price is not None else None,
+        "trigger_price": float(trigger_price) if trigger_price is not None else None
+    }, allow_duplicate=allow_duplicate)
+    
+    net_orders = [order for order in amo_queue.netted() if leg["leg_id"] in order["legs"]]
+    return {
+        "status": "success",
+        "message": (f"An identical order is already staged as {leg['leg_id']}; pass allow_duplicate=True to stage it again"
+                    if duplicate else f"Staged {leg['transaction_type']} {quantity} {leg['stock_name']} as {leg['leg_id']}"),
+        "duplicate": duplicate,
+        "leg": leg,
+        "net_order": net_orders[0] if net_orders else None
+    }
+
+@mcp.tool()
+def list_staged_amos():
+    """
+    List staged After Market Orders, the netted orders a flush would send,
+    and the flush schedule.
+    
+    Returns:
+        Staged legs, net orders, schedule and a summary of the last flush
+    """
+    net_orders = amo_queue.netted()
+    last_report = amo_queue.last_report
+    return {
+        "status": "success",
+        "legs_count": len(amo_queue.legs),
+        "legs": amo_queue.list_legs(),
+        "orders_to_send": sum(1 for order in net_orders if order["quantity"]),
+        "net_orders": net_orders,
+        "schedule": amo_queue.schedule,
+        "last_flush": {key: last_report.get(key) for key in ("trigger", "started_at", "orders", "outcomes_by_status")}
+                      if last_report else None
+    }
+
+@mcp.tool()
+def update_staged_amo(leg_id, quantity=None, transaction_type=None, price=None, trigger_price=None, amo_time=None):
+    """
+    Change a staged After Market Order.
+    
+    Args:
+        leg_id: ID of the staged leg (e.g., "L3")
+        quantity: New quantity (optional)
+        transaction_type: New side, "BUY" or "SELL" (optional)
+        price: New limit price (optional)
+        trigger_price: New trigger price (optional)
+        amo_time: New AMO time (optional)
+    
+    Returns:
+        The updated leg
+    """
+    if transaction_type is not None and transaction_type.upper() not in ["BUY", "SELL"]:
+        return {
+            "status": "error",
+            "message": "Transaction type must be either 'BUY' or 'SELL'"
+        }
+    if amo_time is not None and amo_time not in AMO_TIMES:
+        return {
+            "status": "error",
+            "message": f"AMO time must be one of {AMO_TIMES}"
+        }
+    if quantity is not None:
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            return {
+                "status": "error",
+                "message": "Quantity must be a positive whole number"
+            }
+        if quantity <= 0:
+            return {
+                "status": "error",
+                "message": "Quantity must be positive; use remove_staged_amo to drop a leg"
+            }
+    try:
+        price = float(price) if price is not None else None
+        trigger_price = float(trigger_price) if trigger_price is not None else None
+    except (TypeError, ValueError):
+        return {
+            "status": "error",
+            "message": "Price and trigger price must be numbers"
+        }
+    
+    leg = amo_queue.update(
+        leg_id,
+        quantity=quantity,
+        transaction_type=transaction_type.upper() if transaction_type is not None else None,
+        price=price,
+        trigger_price=trigger_price,
+        amo_time=amo_time
+    )
+    if leg is None:
+        return {
+            "status": "error",
+            "message": f"No staged order with ID {leg_id}"
+        }
+    return {
+        "status": "success",
+        "leg": leg
+    }
+
+@mcp.tool()
+def remove_staged_amo(leg_id=None, clear_all=False):
+    """
+    Remove a staged After Market Order, or all of them.
+    
+    Args:
+        leg_id: ID of the staged leg to remove
+        clear_all: Remove every staged leg instead (default: False)
+    
+    Returns:
+        What was removed
+    """
+    if clear_all:
+        return {
+            "status": "success",
+            "message": f"Removed {amo_queue.clear()} staged orders"
+        }
+    leg = amo_queue.remove(leg_id) if leg_id else None
+    if leg is None:
+        return {
+            "status": "error",
+            "message": f"No staged order with ID {leg_id}"
+        }
+    return {
+        "status": "success",
+        "message": f"Removed {leg_id}",
+        "leg": leg
+    }
+
+@mcp.tool()
+def flush_staged_amos(concurrency=DEFAULT_CONCURRENCY):
+    """
+    Send all staged After Market Orders now, netted and concurrently.
+    
+    Args:
+        concurrency: Orders sent at once; the client rate limiter still
+            paces them (default: 8)
+    
+    Returns:
+        Per-order outcomes; legs of failed orders stay staged
+    """
+    try:
+        report = amo_queue.flush(int(concurrency))
+    except RuntimeError as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+    return {
+        "status": "success" if not report["outcomes_by_status"].get("failed") else "partial",
+        **report
+    }
+
+@mcp.tool()
+def schedule_amo_flush(at_time, concurrency=DEFAULT_CONCURRENCY, warm_up_seconds=DEFAULT_WARM_UP_SECONDS):
+    """
+    Send all staged After Market Orders at a set time.
+    
+    Connections to the API are opened shortly before the flush so the
+    orders go out without connection setup delay. Scheduling again replaces
+    the earlier schedule.
+    
+    Args:
+        at_time: Time in IST, "HH:MM" for the next occurrence or "YYYY-MM-DD HH:MM"
+        concurrency: Orders sent at once (default: 8)
+        warm_up_seconds: Seconds before the flush to open connections (default: 10)
+    
+    Returns:
+        The schedule
+    """
+    try:
+        run_at = parse_flush_time(at_time)
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+    schedule = amo_queue.schedule_flush(run_at, int(concurrency), float(warm_up_seconds))
+    return {
+        "status": "success",
+        "message": f"Staged orders will be sent at {format_time(run_at)}",
+        "schedule": schedule,
+        "legs_count": len(amo_queue.legs)
+    }
+
+@mcp.tool()
+def cancel_amo_flush():
+    """
+    Cancel the scheduled flush of staged After Market Orders. Staged orders stay in the queue.
+    
+    Returns:
+        The cancelled schedule
+    """
+    schedule = amo_queue.cancel_schedule()
+    if schedule is None:
+        return {
+            "status": "error",
+            "message": "No flush is scheduled"
+        }
+    return {
+        "status": "success",
+        "schedule": schedule
+    }
+
+@mcp.tool()
+def get_amo_flush_report():
+    """
+    Get the per-order outcomes of the last flush of staged After Market Orders.
+    
+    Returns:
+        The last flush report and the current schedule
+    """
+    if amo_queue.last_report is None:
+        return {
+            "status": "error",
+            "message": "The AMO queue has not been flushed yet"
+        }
+    return {
+        "status": "success",
+        "schedule": amo_queue.schedule,
+        "report": amo_queue.last_report
+    }
+
 @mcp.resource("dhan://amo/help")
 def amo_help():
     """
@@ -194,8 +422,13 @@ def amo_help():
     3. For STOP_LOSS orders, trigger price must be specified
     4. AMOs can be modified or cancelled before market open on the next trading day
     5. The default validity for AMOs is DAY
+    6. Orders can be staged with stage_amo and sent together with
+       flush_staged_amos or at a set time with schedule_amo_flush
     """
 
+# Re-arm a flush that was scheduled before the server restarted
+amo_queue.resume_schedule()
+
 # Run the server if executed directly
 if __name__ == "__main__":
     mcp.run()
\ No newline at end of file
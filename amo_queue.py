@@ -0,0 +1,434 @@
+# amo_queue.py
+# Staging queue for after market orders.
+#
+# AMOs are staged during the evening instead of being sent one by one. The
+# queue is kept in data_cache/amo_queue.json and survives restarts. Staged
+# legs are netted per security, product, AMO time, order type and price, so a
+# BUY 100 and a SELL 40 become one BUY 60 and offsetting legs send nothing.
+# A flush sends the netted orders concurrently; dhan_client's rate limiter
+# paces them and order_idempotency gives each one a correlation ID derived
+# from the legs it nets, so flushing again after a crash cannot duplicate an
+# order. A scheduled flush opens pooled connections shortly before the
+# target time so the first orders do not pay for TCP and TLS setup.
+import datetime
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from config import DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL, DHAN_CLIENT_ID
+import dhan_client
+from order_idempotency import submit_order
+
+QUEUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cache", "amo_queue.json")
+
+AMO_TIMES = ["PRE_OPEN", "OPEN", "OPEN_30", "OPEN_60"]
+
+# Exchange timezone for scheduled flush times
+IST_OFFSET = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+# Default flush concurrency, and how early connections are opened before a scheduled flush
+DEFAULT_CONCURRENCY = 8
+DEFAULT_WARM_UP_SECONDS = 10
+
+# Leg fields that must match for legs to be netted into one order
+NET_KEY_FIELDS = ["security_id", "product_type", "amo_time", "order_type", "price", "trigger_price"]
+
+
+def validate_amo(transaction_type, order_type, price, trigger_price, amo_time):
+    """Return an error message for invalid AMO parameters, or None"""
+    if transaction_type.upper() not in ["BUY", "SELL"]:
+        return "Transaction type must be either 'BUY' or 'SELL'"
+    if order_type.upper() == "LIMIT" and price is None:
+        return "Price is required for LIMIT orders"
+    if order_type.upper() in ["STOP_LOSS", "STOP_LOSS_MARKET"] and trigger_price is None:
+        return "Trigger price is required for STOP_LOSS orders"
+    if amo_time not in AMO_TIMES:
+        return f"AMO time must be one of {AMO_TIMES}"
+    return None
+
+def order_body(security_id, quantity, transaction_type, amo_time, product_type, order_type,
+               price=None, trigger_price=None, disclosed_quantity=None):
+    """Request body of an AMO for POST /orders"""
+    return {
+        "dhanClientId": DHAN_CLIENT_ID,
+        "transactionType": transaction_type.upper(),
+        "exchangeSegment": "NSE_EQ",
+        "productType": product_type.upper(),
+        "orderType": order_type.upper(),
+        "validity": "DAY",
+        "securityId": security_id,
+        "quantity": str(quantity),
+        "afterMarketOrder": True,
+        "amoTime": amo_time,
+        "price": str(price) if price is not None else "",
+        "triggerPrice": str(trigger_price) if trigger_price is not None else "",
+        "disclosedQuantity": str(disclosed_quantity) if disclosed_quantity is not None else ""
+    }
+
+def parse_flush_time(value, now=None):
+    """
+    Parse a flush time in IST.
+
+    Args:
+        value: "HH:MM", "HH:MM:SS" (next occurrence) or "YYYY-MM-DD HH:MM[:SS]"
+        now: Current time as a timestamp (default: time.time())
+
+    Returns:
+        Timestamp of the flush
+    """
+    now = time.time() if now is None else now
+    value = value.strip()
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.datetime.strptime(value, fmt).replace(tzinfo=IST_OFFSET).timestamp()
+        except ValueError:
+            pass
+    for fmt in ("%H:%M:%S", "%H:%M"):
+        try:
+            clock = datetime.datetime.strptime(value, fmt).time()
+        except ValueError:
+            continue
+        today = datetime.datetime.fromtimestamp(now, IST_OFFSET).date()
+        target = datetime.datetime.combine(today, clock, IST_OFFSET)
+        if target.timestamp() <= now:
+            target += datetime.timedelta(days=1)
+        return target.timestamp()
+    raise ValueError(f"Invalid time '{value}'. Use HH:MM or YYYY-MM-DD HH:MM (IST)")
+
+def format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, IST_OFFSET).strftime("%Y-%m-%d %H:%M:%S IST")
+
+
+class AmoQueue:
+    """
+    Persistent AMO staging queue.
+
+    Args:
+        path: JSON file holding the queue (None keeps it in memory only)
+    """
+
+    def __init__(self, path=QUEUE_PATH):
+        self.path = path
+        self.legs = {}
+        self.batch_id = uuid.uuid4().hex[:8]
+        self.next_leg = 1
+        self.schedule = None
+        self.last_report = None
+        self._lock = threading.RLock()
+        self._flushing = False
+        self._timer = None
+        self._cancel = threading.Event()
+        self._load()
+
+    # ------------------------------------------------------------------
+    # Persistence
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as file:
+                state = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Error loading AMO queue: {e}", file=sys.stderr)
+            return
+        self.legs = {leg["leg_id"]: leg for leg in state.get("legs", [])}
+        self.batch_id = state.get("batch_id", self.batch_id)
+        self.next_leg = state.get("next_leg", len(self.legs) + 1)
+        self.schedule = state.get("schedule")
+        self.last_report = state.get("last_report")
+
+    def _save(self):
+        """Rewrite the queue file atomically"""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        state = {
+            "batch_id": self.batch_id,
+            "next_leg": self.next_leg,
+            "legs": list(self.legs.values()),
+            "schedule": self.schedule,
+            "last_report": self.last_report
+        }
+        temporary = self.path + ".tmp"
+        with open(temporary, 'w') as file:
+            json.dump(state, file, indent=2)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+    # ------------------------------------------------------------------
+    # Editing
+
+    def stage(self, leg, allow_duplicate=False):
+        """
+        Add a leg to the queue.
+
+        Args:
+            leg: Dictionary with stock_name, security_id, transaction_type,
+                quantity and the NET_KEY_FIELDS
+            allow_duplicate: Stage the leg even if an identical one is staged
+
+        Returns:
+            Tuple of (staged leg, True if an identical leg was already staged)
+        """
+        with self._lock:
+            if not allow_duplicate:
+                for existing in self.legs.values():
+                    if all(existing.get(field) == leg.get(field)
+                           for field in NET_KEY_FIELDS + ["transaction_type", "quantity"]):
+                        return dict(existing), True
+            leg = dict(leg, leg_id=f"L{self.next_leg}", status="staged",
+                       staged_at=time.strftime("%Y-%m-%d %H:%M:%S"))
+            self.next_leg += 1
+            self.legs[leg["leg_id"]] = leg
+            self._save()
+            return dict(leg), False
+
+    def update(self, leg_id, **fields):
+        """Change fields of a staged leg; returns the leg or None if unknown"""
+        with self._lock:
+            leg = self.legs.get(leg_id)
+            if leg is None:
+                return None
+            leg.update({key: value for key, value in fields.items() if value is not None})
+            leg["status"] = "staged"
+            leg.pop("last_error", None)
+            self._save()
+            return dict(leg)
+
+    def remove(self, leg_id):
+        with self._lock:
+            leg = self.legs.pop(leg_id, None)
+            if leg is not None:
+                self._save()
+            return leg
+
+    def clear(self):
+        with self._lock:
+            count = len(self.legs)
+            self.legs.clear()
+            self._save()
+            return count
+
+    def list_legs(self):
+        with self._lock:
+            return [dict(leg) for leg in self.legs.values()]
+
+    # ------------------------------------------------------------------
+    # Netting and flushing
+
+    def netted(self):
+        """
+        Net staged legs into the orders a flush would send.
+
+        Returns:
+            List of net orders; orders whose legs offset exactly have
+            quantity 0 and are not sent
+        """
+        with self._lock:
+            groups = {}
+            for leg in self.legs.values():
+                key = tuple(leg.get(field) for field in NET_KEY_FIELDS)
+                group = groups.setdefault(key, {"stock_name": leg["stock_name"], "net": 0, "legs": []})
+                sign = 1 if leg["transaction_type"] == "BUY" else -1
+                group["net"] += sign * int(leg["quantity"])
+                group["legs"].append(leg["leg_id"])
+
+            orders = []
+            for key, group in groups.items():
+                order = dict(zip(NET_KEY_FIELDS, key))
+                net = group["net"]
+                order.update({
+                    "stock_name": group["stock_name"],
+                    "transaction_type": "BUY" if net > 0 else "SELL" if net < 0 else None,
+                    "quantity": abs(net),
+                    "legs": group["legs"]
+                })
+                # Leg IDs are never reused, so legs staged again after a flush get a new ID,
+                # while legs left staged by a failed flush are retried under the same one
+                digest = hashlib.sha1(json.dumps([self.batch_id, list(key), net, group["legs"]])
+                                      .encode("utf-8")).hexdigest()
+                order["correlation_id"] = f"amo{digest[:17]}"
+                orders.append(order)
+            return orders
+
+    def _submit(self, order, started):
+        """Send one net order and describe the outcome"""
+        outcome = {key: order[key] for key in ("stock_name", "transaction_type", "quantity", "amo_time",
+                                               "product_type", "order_type", "price", "legs", "correlation_id")}
+        if order["quantity"] == 0:
+            outcome["status"] = "netted_out"
+            return outcome
+
+        url = f"{DHAN_API_BASE_URL}/orders"
+        headers = {
+            "Content-Type": "application/json",
+            "access-token": DHAN_ACCESS_TOKEN
+        }
+        body = order_body(order["security_id"], order["quantity"], order["transaction_type"], order["amo_time"],
+                          order["product_type"], order["order_type"], order["price"], order["trigger_price"])
+        sent = time.perf_counter()
+        outcome["started_after_ms"] = round((sent - started) * 1000, 1)
+        try:
+            response, _, submission = submit_order(url, headers, body, order["correlation_id"])
+            outcome["submission"] = submission
+            outcome["http_status"] = response.status_code
+            if response.status_code in [200, 201, 202]:
+                data = response.json()
+                outcome.update(status="placed", order_id=data.get("orderId"), order_status=data.get("orderStatus"))
+            else:
+                outcome.update(status="unresolved" if submission == "unresolved" else "failed",
+                               error=response.text[:500])
+        except requests.exceptions.RequestException as e:
+            outcome.update(status="failed", error=str(e))
+        outcome["latency_ms"] = round((time.perf_counter() - sent) * 1000, 1)
+        return outcome
+
+    def flush(self, concurrency=DEFAULT_CONCURRENCY, trigger="manual"):
+        """
+        Send every net order concurrently.
+
+        Legs of placed (or netted out) orders leave the queue; legs of failed
+        orders stay staged with the error, and flushing again retries them
+        under the same correlation IDs.
+
+        Returns:
+            Flush report with per-order outcomes
+        """
+        with self._lock:
+            if self._flushing:
+                raise RuntimeError("A flush is already running")
+            self._flushing = True
+            orders = self.netted()
+        try:
+            started = time.perf_counter()
+            started_at = time.time()
+            if orders:
+                with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(orders)))) as executor:
+                    outcomes = list(executor.map(lambda order: self._submit(order, started), orders))
+            else:
+                outcomes = []
+            elapsed = time.perf_counter() - started
+
+            counts = {}
+            for outcome in outcomes:
+                counts[outcome["status"]] = counts.get(outcome["status"], 0) + 1
+            report = {
+                "trigger": trigger,
+                "started_at": format_time(started_at),
+                "duration_ms": round(elapsed * 1000, 1),
+                "orders": len(outcomes),
+                "outcomes_by_status": counts,
+                "results": outcomes
+            }
+            with self._lock:
+                for outcome in outcomes:
+                    for leg_id in outcome["legs"]:
+                        leg = self.legs.get(leg_id)
+                        if leg is None:
+                            continue
+                        if outcome["status"] in ("placed", "netted_out"):
+                            del self.legs[leg_id]
+                        else:
+                            leg["status"] = outcome["status"]
+                            leg["last_error"] = outcome.get("error")
+                if not self.legs:
+                    self.batch_id = uuid.uuid4().hex[:8]
+                self.last_report = report
+                self._save()
+            return report
+        finally:
+            with self._lock:
+                self._flushing = False
+
+    # ------------------------------------------------------------------
+    # Scheduling
+
+    def schedule_flush(self, run_at, concurrency=DEFAULT_CONCURRENCY, warm_up_seconds=DEFAULT_WARM_UP_SECONDS,
+                       connections=None):
+        """
+        Flush the queue at a given time, replacing any earlier schedule.
+
+        The schedule runs on a background thread so it fires whether or not
+        a client is connected, and is saved so a restarted server re-arms it.
+
+        Args:
+            run_at: Timestamp of the flush
+            concurrency: Orders sent at once
+            warm_up_seconds: Seconds before run_at at which connections are opened
+            connections: Connections to open (default: the concurrency)
+        """
+        with self._lock:
+            self.cancel_schedule(save=False)
+            self.schedule = {
+                "run_at": run_at,
+                "run_at_ist": format_time(run_at),
+                "concurrency": concurrency,
+                "warm_up_seconds": warm_up_seconds,
+                "connections": connections or concurrency,
+                "state": "scheduled"
+            }
+            self._save()
+            self._arm()
+            return dict(self.schedule)
+
+    def cancel_schedule(self, save=True):
+        with self._lock:
+            if self._timer is not None:
+                self._cancel.set()
+                self._timer = None
+            if self.schedule is not None and self.schedule["state"] == "scheduled":
+                self.schedule["state"] = "cancelled"
+            if save:
+                self._save()
+            return self.schedule
+
+    def resume_schedule(self):
+        """Re-arm a saved schedule; one whose time passed while stopped is marked missed, not run"""
+        with self._lock:
+            if self.schedule is None or self.schedule["state"] != "scheduled" or self._timer is not None:
+                return
+            if self.schedule["run_at"] < time.time():
+                self.schedule["state"] = "missed"
+                self._save()
+                return
+            self._arm()
+
+    def _arm(self):
+        self._cancel = threading.Event()
+        self._timer = threading.Thread(target=self._run_schedule, args=(dict(self.schedule), self._cancel),
+                                       name="amo-flush", daemon=True)
+        self._timer.start()
+
+    def _run_schedule(self, schedule, cancel):
+        warm_at = schedule["run_at"] - schedule["warm_up_seconds"]
+        if cancel.wait(max(0.0, warm_at - time.time())):
+            return
+        warmed = dhan_client.warm_up(schedule["connections"])
+        if cancel.wait(max(0.0, schedule["run_at"] - time.time())):
+            return
+        late_ms = round((time.time() - schedule["run_at"]) * 1000, 1)
+        with self._lock:
+            self._timer = None
+            self.schedule["state"] = "running"
+        try:
+            report = self.flush(schedule["concurrency"], trigger="scheduled")
+            report.update(scheduled_for=schedule["run_at_ist"], late_ms=late_ms, warmed_connections=warmed)
+            state = "done"
+        except Exception as e:
+            report, state = {"trigger": "scheduled", "error": str(e)}, "failed"
+        with self._lock:
+            self.schedule["state"] = state
+            self.last_report = report
+            self._save()
+
+
+# Queue shared by the AMO tools
+amo_queue = AmoQueue()
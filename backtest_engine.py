@@ -0,0 +1,241 @@
+# backtest_engine.py
+# Offline replay of super-order entry/target/stop/trailing logic over daily
+# candles. One symbol is simulated for a whole parameter grid at once: the
+# loop runs over bars and every step updates NumPy arrays with one element per
+# parameter combination. Symbols are spread over a process pool.
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from indicators import IndicatorEngine
+from super_order_levels import compute_stoploss_price, compute_target_price, trailed_stoploss_price
+
+# Statistics reported for every parameter combination
+RESULT_FIELDS = [
+    "trades", "target_exits", "stoploss_exits", "end_of_data_exits",
+    "wins", "losses", "pnl", "return_percent", "max_drawdown", "bars_in_market"
+]
+
+
+def build_grid(target_values, stoploss_values, trailing_jumps):
+    """
+    Expand parameter lists into flat arrays, one element per combination.
+
+    Args:
+        target_values: Target values to test (None entries mean no target)
+        stoploss_values: Stop loss values to test (None entries mean no stop loss)
+        trailing_jumps: Trailing jumps to test (0 for no trailing)
+
+    Returns:
+        Dictionary with "target_value", "stoploss_value" and "trailing_jump" arrays
+    """
+    combos = list(itertools.product(target_values, stoploss_values, trailing_jumps))
+    as_array = lambda values: np.array([np.nan if v is None else float(v) for v in values])
+    return {
+        "target_value": as_array([c[0] for c in combos]),
+        "stoploss_value": as_array([c[1] for c in combos]),
+        "trailing_jump": as_array([c[2] for c in combos])
+    }
+
+def simulate(
+    candles,
+    grid,
+    transaction_type="BUY",
+    target_type="percentage",
+    stoploss_type="percentage",
+    trailing_type="value",
+    quantity=1,
+    entry_every=1
+):
+    """
+    Replay super orders over one symbol's candles for every grid combination.
+
+    A position is opened at the bar open whenever it is flat and the bar index
+    is a multiple of `entry_every`. While open, the stop loss is checked before
+    the target within a bar (the conservative assumption for daily bars), gaps
+    through a level fill at the open, and the trailing stop is moved from the
+    bar's extreme after exits are checked. Positions still open at the end are
+    closed at the last close.
+
+    Args:
+        candles: Dictionary with open/high/low/close arrays for one symbol
+        grid: Parameter arrays from build_grid
+        transaction_type: "BUY" or "SELL"
+        target_type: "value", "percentage" or "atr"
+        stoploss_type: "value", "percentage" or "atr"
+        trailing_type: "value" for an absolute trailing jump, "percentage" for a
+            percentage of the entry price
+        quantity: Quantity per trade
+        entry_every: Only enter on bars whose index is a multiple of this
+
+    Returns:
+        Dictionary of statistic name to array, one element per combination
+    """
+    opens = np.asarray(candles["open"], dtype=np.float64)
+    highs = np.asarray(candles["high"], dtype=np.float64)
+    lows = np.asarray(candles["low"], dtype=np.float64)
+    closes = np.asarray(candles["close"], dtype=np.float64)
+    bars = len(closes)
+
+    side = transaction_type.upper()
+    direction = 1.0 if side == "BUY" else -1.0
+    combos = len(grid["target_value"])
+    target_values = grid["target_value"]
+    stoploss_values = grid["stoploss_value"]
+    trailing_jumps = np.nan_to_num(grid["trailing_jump"])
+
+    # ATR levels use the previous bar's ATR so entries never look ahead
+    atr_series = None
+    if "atr" in (target_type, stoploss_type) and bars:
+        atr_series = IndicatorEngine(["atr"]).compute(candles)["atr"]
+
+    stats = {field: np.zeros(combos) for field in RESULT_FIELDS}
+    in_position = np.zeros(combos, dtype=bool)
+    entry = np.zeros(combos)
+    target = np.zeros(combos)
+    initial_stop = np.zeros(combos)
+    stop = np.zeros(combos)
+    best = np.zeros(combos)
+    jump = np.zeros(combos)
+    realized = np.zeros(combos)
+    peak = np.zeros(combos)
+    no_target = np.inf * direction
+    no_stop = -np.inf * direction
+
+    def close_positions(mask, prices, counter):
+        pnl = (prices - entry[mask]) * direction * quantity
+        realized[mask] += pnl
+        stats["pnl"][mask] += pnl
+        stats["return_percent"][mask] += (prices / entry[mask] - 1) * direction * 100
+        stats[counter][mask] += 1
+        stats["trades"][mask] += 1
+        stats["wins"][mask] += pnl > 0
+        stats["losses"][mask] += pnl < 0
+        in_position[mask] = False
+
+    for t in range(bars):
+        bar_open, bar_high, bar_low, bar_close = opens[t], highs[t], lows[t], closes[t]
+
+        # Entries at the open
+        if t % entry_every == 0:
+            atr = atr_series[t - 1] if atr_series is not None and t > 0 else np.nan
+            if atr_series is None or not np.isnan(atr):
+                enter = ~in_position
+                if enter.any():
+                    entry[enter] = bar_open
+                    targets = compute_target_price(bar_open, side, target_type, target_values[enter], atr)
+                    stops = compute_stoploss_price(bar_open, side, stoploss_type, stoploss_values[enter], atr)
+                    target[enter] = np.where(np.isnan(targets), no_target, targets)
+                    initial_stop[enter] = np.where(np.isnan(stops), no_stop, stops)
+                    stop[enter] = initial_stop[enter]
+                    best[enter] = bar_open
+                    if trailing_type == "percentage":
+                        jump[enter] = bar_open * trailing_jumps[enter] / 100
+                    else:
+                        jump[enter] = trailing_jumps[enter]
+                    in_position |= enter
+
+        if not in_position.any():
+            peak = np.maximum(peak, realized)
+            continue
+
+        # Exits, stop loss first
+        if side == "BUY":
+            stop_hit = in_position & (bar_low <= stop)
+            stop_fill = np.minimum(bar_open, stop)
+            target_hit = in_position & ~stop_hit & (bar_high >= target)
+            target_fill = np.maximum(bar_open, target)
+        else:
+            stop_hit = in_position & (bar_high >= stop)
+            stop_fill = np.maximum(bar_open, stop)
+            target_hit = in_position & ~stop_hit & (bar_low <= target)
+            target_fill = np.minimum(bar_open, target)
+
+        if stop_hit.any():
+            close_positions(stop_hit, stop_fill[stop_hit], "stoploss_exits")
+        if target_hit.any():
+            close_positions(target_hit, target_fill[target_hit], "target_exits")
+
+        # Trail the stop loss of positions that are still open
+        holding = in_position & (jump > 0)
+        if holding.any():
+            extreme = bar_high if side == "BUY" else bar_low
+            best[holding] = np.maximum(best[holding], extreme) if side == "BUY" else np.minimum(best[holding], extreme)
+            stop[holding] = trailed_stoploss_price(
+                initial_stop[holding], entry[holding], best[holding], side, jump[holding], np.floor
+            )
+
+        stats["bars_in_market"] += in_position
+
+        # Mark to market at the close for the drawdown
+        equity = realized + np.where(in_position, (bar_close - entry) * direction * quantity, 0.0)
+        peak = np.maximum(peak, equity)
+        stats["max_drawdown"] = np.maximum(stats["max_drawdown"], peak - equity)
+
+    if bars and in_position.any():
+        open_positions = in_position.copy()
+        close_positions(open_positions, np.full(open_positions.sum(), closes[-1]), "end_of_data_exits")
+
+    return stats
+
+def summarize(stats, grid, top_n=5):
+    """
+    Rank parameter combinations by P&L.
+
+    Args:
+        stats: Result of simulate (or summed results of several symbols)
+        grid: Parameter arrays from build_grid
+        top_n: Number of combinations to return
+
+    Returns:
+        List of the best combinations with their statistics
+    """
+    order = np.argsort(-stats["pnl"], kind="stable")[:top_n]
+    ranked = []
+    for index in order:
+        trades = stats["trades"][index]
+        row = {
+            name: None if np.isnan(values[index]) else float(values[index])
+            for name, values in grid.items()
+        }
+        row.update({field: round(float(stats[field][index]), 4) for field in RESULT_FIELDS})
+        row["win_rate"] = round(float(stats["wins"][index] / trades), 4) if trades else None
+        ranked.append(row)
+    return ranked
+
+def _simulate_cached(job):
+    """Process pool entry point: load one symbol from the candle cache and simulate it"""
+    from historical_data_tool import CandleCache
+
+    name, security_id, cache_dir, from_date, to_date, grid, options = job
+    candles = CandleCache(cache_dir).get_cached(security_id, from_date, to_date)
+    if len(candles["close"]) == 0:
+        return name, 0, None
+    return name, len(candles["close"]), simulate(candles, grid, **options)
+
+def run_backtest(stocks, grid, cache_dir, from_date, to_date, workers=None, **options):
+    """
+    Backtest many symbols from the local candle cache, in parallel across symbols.
+
+    Args:
+        stocks: List of (name, security ID)
+        grid: Parameter arrays from build_grid
+        cache_dir: Candle cache directory
+        from_date: First date (inclusive)
+        to_date: Last date (inclusive)
+        workers: Process count (default: CPU count, 1 runs in-process)
+        **options: Passed to simulate
+
+    Returns:
+        Dictionary mapping stock name to (bars, stats); stats is None without cached data
+    """
+    jobs = [(name, security_id, cache_dir, from_date, to_date, grid, options) for name, security_id in stocks]
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1:
+        results = map(_simulate_cached, jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_simulate_cached, jobs))
+    return {name: (bars, stats) for name, bars, stats in results}
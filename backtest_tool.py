@@ -0,0 +1,180 @@
+# backtest_tool.py
+import datetime
+
+import numpy as np
+import requests
+from mcp.server.fastmcp import FastMCP
+
+from backtest_engine import RESULT_FIELDS, build_grid, run_backtest, summarize
+from historical_data_tool import DATE_FORMAT, candle_cache, parse_date
+from indicator_tool import parse_list, resolve_stocks
+from super_order_levels import LEVEL_TYPES
+from tool_metrics import instrument_server
+
+# Create the MCP server
+mcp = FastMCP("DhanHQ Super Order Backtest")
+instrument_server(mcp)
+
+# Largest parameter grid accepted in one call
+MAX_GRID_SIZE = 10000
+
+
+def parse_values(value):
+    """Parse a list or comma separated string of numbers; "none" means the level is not set"""
+    values = []
+    for item in parse_list(value):
+        values.append(None if str(item).lower() == "none" else float(item))
+    return values
+
+@mcp.tool()
+def backtest_super_order(
+    stock_name,
+    transaction_type="BUY",
+    target_values="1,2,3",
+    stoploss_values="0.5,1,2",
+    trailing_jumps="0",
+    target_type="percentage",
+    stoploss_type="percentage",
+    trailing_type="value",
+    from_date=None,
+    to_date=None,
+    quantity=1,
+    entry_every=1,
+    fetch_missing=False,
+    top_n=5,
+    workers=None
+):
+    """
+    Backtest super order target/stop loss/trailing settings on daily candles.
+
+    Every combination of target, stop loss and trailing jump is replayed with the
+    same rules as place_super_order: enter at the bar open when flat, exit at the
+    stop loss or target, and trail the stop loss by one jump for every jump the
+    price moves in favour.
+
+    Args:
+        stock_name: Stock name, comma separated list of names, or "ALL" for every stock
+        transaction_type: "BUY" or "SELL"
+        target_values: Comma separated target values to test ("none" for no target)
+        stoploss_values: Comma separated stop loss values to test ("none" for no stop loss)
+        trailing_jumps: Comma separated trailing jumps to test (0 for no trailing)
+        target_type: "value", "percentage" or "atr"
+        stoploss_type: "value", "percentage" or "atr"
+        trailing_type: "value" for an absolute jump, "percentage" for a percentage of the entry price
+        from_date: First date in YYYY-MM-DD format (default: one year ago)
+        to_date: Last date in YYYY-MM-DD format (default: today)
+        quantity: Quantity per trade (default: 1)
+        entry_every: Only enter on every Nth bar (default: 1)
+        fetch_missing: Fetch candles that are not cached yet (default: False, fully offline)
+        top_n: Number of best combinations to return (default: 5)
+        workers: Number of worker processes (default: CPU count)
+
+    Returns:
+        Best parameter combinations per stock and across all stocks. Across
+        stocks, counts and P&L are summed and worst_symbol_max_drawdown is the
+        largest drawdown of any one stock (not of the combined equity curve)
+    """
+    if transaction_type.upper() not in ["BUY", "SELL"]:
+        return {
+            "status": "error",
+            "message": "Transaction type must be either 'BUY' or 'SELL'"
+        }
+
+    if target_type not in LEVEL_TYPES or stoploss_type not in LEVEL_TYPES:
+        return {
+            "status": "error",
+            "message": f"Target and stop loss types must be one of {LEVEL_TYPES}"
+        }
+
+    if trailing_type not in ["value", "percentage"]:
+        return {
+            "status": "error",
+            "message": "Trailing type must be either 'value' or 'percentage'"
+        }
+
+    try:
+        grid = build_grid(parse_values(target_values), parse_values(stoploss_values), parse_values(trailing_jumps))
+        end = parse_date(to_date) if to_date else datetime.date.today()
+        start = parse_date(from_date) if from_date else end - datetime.timedelta(days=365)
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": f"Invalid parameters: {str(e)}"
+        }
+
+    combos = len(grid["target_value"])
+    if combos == 0 or combos > MAX_GRID_SIZE:
+        return {
+            "status": "error",
+            "message": f"Parameter grid must have between 1 and {MAX_GRID_SIZE} combinations, got {combos}"
+        }
+
+    stocks, unknown = resolve_stocks(stock_name)
+    if unknown:
+        return {
+            "status": "error",
+            "message": f"Stocks not found in stocks.json: {unknown}"
+        }
+
+    if fetch_missing:
+        try:
+            for _, security_id in stocks:
+                candle_cache.get(security_id, start, end)
+        except requests.exceptions.RequestException as e:
+            return {
+                "status": "error",
+                "message": f"Failed to fetch historical data: {str(e)}"
+            }
+
+    results = run_backtest(
+        stocks, grid, candle_cache.cache_dir, start, end,
+        workers=workers,
+        transaction_type=transaction_type.upper(),
+        target_type=target_type,
+        stoploss_type=stoploss_type,
+        trailing_type=trailing_type,
+        quantity=quantity,
+        entry_every=max(int(entry_every), 1)
+    )
+
+    per_stock = {}
+    no_data = []
+    totals = None
+    for name, (bars, stats) in results.items():
+        if stats is None:
+            no_data.append(name)
+            continue
+        per_stock[name] = {"bars": bars, "best": summarize(stats, grid, top_n)}
+        if totals is None:
+            totals = {field: np.zeros(combos) for field in RESULT_FIELDS}
+        for field in RESULT_FIELDS:
+            if field == "max_drawdown":
+                totals[field] = np.maximum(totals[field], stats[field])
+            else:
+                totals[field] += stats[field]
+
+    if totals is None:
+        return {
+            "status": "error",
+            "message": "No cached candles for the requested stocks; run get_historical_data or set fetch_missing=True",
+            "no_data": no_data
+        }
+
+    # Drawdowns of different stocks do not add up; the total keeps the largest
+    overall_best = summarize(totals, grid, top_n)
+    for row in overall_best:
+        row["worst_symbol_max_drawdown"] = row.pop("max_drawdown")
+
+    return {
+        "status": "success",
+        "period": {"from": start.strftime(DATE_FORMAT), "to": end.strftime(DATE_FORMAT)},
+        "combinations": combos,
+        "stocks_count": len(per_stock),
+        "overall_best": overall_best,
+        "per_stock": per_stock,
+        "no_data": no_data
+    }
+
+# Run the server if executed directly
+if __name__ == "__main__":
+    mcp.run()
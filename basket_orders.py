@@ -0,0 +1,510 @@
+# basket_orders.py
+# Streaming import of basket orders from CSV or JSONL files.
+#
+# A basket file holds one row per order ("quantity" and "transaction_type")
+# or per target holding ("target_quantity"). Rows are read one at a time from
+# a generator, resolved against stocks.json, validated and, for targets,
+# turned into the delta against current holdings and positions. Orders are
+# sent in batches of concurrent requests that the account's rate limiter
+# paces. After every batch the run writes a checkpoint and appends its
+# results to data_cache/baskets, so an interrupted import resumes after the
+# last finished batch. Each row's correlation ID is derived from the basket
+# and row number, so rows of a batch that was cut short are recognised as
+# already placed instead of being sent twice.
+import csv
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from accounts import fetch_holding_rows, get_account
+from order_idempotency import submit_order
+from records import Holding, Position
+from reference_cache import resolve_stock
+
+BASKET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cache", "baskets")
+
+PRODUCT_TYPES = ["CNC", "INTRADAY", "MARGIN", "MTF"]
+ORDER_TYPES = ["MARKET", "LIMIT", "STOP_LOSS", "STOP_LOSS_MARKET"]
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_BATCH_SIZE = 50
+
+# Failed rows listed in a run summary; every result is in the results file
+MAX_REPORTED_FAILURES = 20
+
+# Accepted spellings of row fields, all compared in lower case
+FIELD_ALIASES = {
+    "stock_name": ["stock_name", "stock", "symbol", "name"],
+    "quantity": ["quantity", "qty"],
+    "target_quantity": ["target_quantity", "target_qty", "target"],
+    "transaction_type": ["transaction_type", "side", "action"],
+    "product_type": ["product_type", "product"],
+    "order_type": ["order_type", "type"],
+    "price": ["price", "limit_price"],
+    "trigger_price": ["trigger_price", "trigger"]
+}
+
+
+def read_rows(path):
+    """
+    Yield (row number, fields) for each row of a CSV or JSONL file.
+
+    Field names are lower-cased. Files ending in .jsonl or .ndjson are read
+    as one JSON object per line, anything else as CSV with a header row.
+    Row numbers are line numbers, so they stay stable across runs.
+    """
+    if path.lower().endswith((".jsonl", ".ndjson")):
+        with open(path, 'r', encoding='utf-8') as file:
+            for number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield number, {"_error": f"Invalid JSON: {e}"}
+                    continue
+                if not isinstance(row, dict):
+                    yield number, {"_error": "Row is not a JSON object"}
+                    continue
+                yield number, {str(key).strip().lower(): value for key, value in row.items()}
+    else:
+        with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                if not any((value or "").strip() for value in row.values() if isinstance(value, str)):
+                    continue
+                yield reader.line_num, {str(key).strip().lower(): value for key, value in row.items() if key}
+
+def count_rows(path):
+    """Number of non-blank data lines, read in blocks so the file is never held in memory"""
+    count = 0
+    with open(path, 'rb') as file:
+        for line in file:
+            if line.strip():
+                count += 1
+    if not path.lower().endswith((".jsonl", ".ndjson")):
+        count = max(count - 1, 0)
+    return count
+
+def _field(row, name):
+    for alias in FIELD_ALIASES[name]:
+        value = row.get(alias)
+        if value is not None and str(value).strip() != "":
+            return str(value).strip()
+    return None
+
+def _integer(value):
+    number = float(value)
+    if number != int(number):
+        raise ValueError(f"{value} is not a whole number")
+    return int(number)
+
+def fetch_current_quantities(account):
+    """
+    Net quantity held per security: demat holdings plus the day's positions.
+
+    Raises:
+        requests.exceptions.RequestException if either list could not be fetched
+    """
+    quantities = {}
+    for holding in Holding.from_rows(fetch_holding_rows(account)):
+        sid = str(holding.security_id)
+        quantities[sid] = quantities.get(sid, 0) + int(holding.total_quantity or 0)
+    response = account.client.get(account.url("/positions"), headers=account.headers())
+    response.raise_for_status()
+    for position in Position.from_rows(response.json()):
+        sid = str(position.security_id)
+        quantities[sid] = quantities.get(sid, 0) + int(position.net_quantity or 0)
+    return quantities
+
+def plan_row(number, row, current, product_type="CNC", order_type="MARKET"):
+    """
+    Resolve and validate one basket row.
+
+    Args:
+        number: Row number in the file
+        row: Row fields from read_rows
+        current: Mapping of security ID to net quantity. It is updated with
+            the row's order, so later rows for the same stock see the
+            quantity the basket has already moved to
+        product_type, order_type: Defaults for rows that do not set them
+
+    Returns:
+        Plan dictionary with "status" "ready", "unchanged" (target already
+        met) or "invalid" (with "error")
+    """
+    plan = {"row": number, "status": "invalid"}
+    if "_error" in row:
+        plan["error"] = row["_error"]
+        return plan
+
+    name = _field(row, "stock_name")
+    plan["stock_name"] = name
+    entry = resolve_stock(name) if name else None
+    if entry is None:
+        plan["error"] = f"Stock '{name}' not found in stocks.json" if name else "Row has no stock_name"
+        return plan
+    plan["stock_name"], security_id = entry
+    plan["security_id"] = security_id
+
+    plan["product_type"] = (_field(row, "product_type") or product_type).upper()
+    plan["order_type"] = (_field(row, "order_type") or order_type).upper()
+    if plan["product_type"] not in PRODUCT_TYPES:
+        plan["error"] = f"Product type must be one of {PRODUCT_TYPES}"
+        return plan
+    if plan["order_type"] not in ORDER_TYPES:
+        plan["error"] = f"Order type must be one of {ORDER_TYPES}"
+        return plan
+    try:
+        price, trigger_price = _field(row, "price"), _field(row, "trigger_price")
+        plan["price"] = float(price) if price is not None else None
+        plan["trigger_price"] = float(trigger_price) if trigger_price is not None else None
+    except ValueError:
+        plan["error"] = "Price and trigger price must be numbers"
+        return plan
+    if plan["order_type"] == "LIMIT" and plan["price"] is None:
+        plan["error"] = "Price is required for LIMIT orders"
+        return plan
+    if plan["order_type"] in ("STOP_LOSS", "STOP_LOSS_MARKET") and plan["trigger_price"] is None:
+        plan["error"] = "Trigger price is required for STOP_LOSS orders"
+        return plan
+
+    held = current.get(security_id, 0)
+    plan["current_quantity"] = held
+    target = _field(row, "target_quantity")
+    try:
+        if target is not None:
+            target = _integer(target)
+            if target < 0:
+                raise ValueError("Target quantity cannot be negative")
+            plan["target_quantity"] = target
+            delta = target - held
+        else:
+            side = (_field(row, "transaction_type") or "").upper()
+            if side not in ("BUY", "SELL"):
+                raise ValueError("Transaction type must be either 'BUY' or 'SELL' (or give a target_quantity)")
+            quantity = _field(row, "quantity")
+            if quantity is None:
+                raise ValueError("Row has no quantity (or target_quantity)")
+            quantity = _integer(quantity)
+            if quantity <= 0:
+                raise ValueError("Quantity must be positive")
+            delta = quantity if side == "BUY" else -quantity
+    except ValueError as e:
+        plan["error"] = str(e)
+        return plan
+
+    if delta == 0:
+        plan.update(status="unchanged", transaction_type=None, quantity=0)
+        return plan
+    if delta < 0 and plan["product_type"] == "CNC" and held + delta < 0:
+        plan["error"] = f"Cannot sell {-delta} shares of {plan['stock_name']} on CNC; {held} held"
+        return plan
+
+    current[security_id] = held + delta
+    plan.update(status="ready", transaction_type="BUY" if delta > 0 else "SELL", quantity=abs(delta))
+    return plan
+
+def order_body(plan, client_id):
+    """Request body for POST /orders"""
+    return {
+        "dhanClientId": client_id,
+        "transactionType": plan["transaction_type"],
+        "exchangeSegment": "NSE_EQ",
+        "productType": plan["product_type"],
+        "orderType": plan["order_type"],
+        "validity": "DAY",
+        "securityId": plan["security_id"],
+        "quantity": str(plan["quantity"]),
+        "disclosedQuantity": "",
+        "price": str(plan["price"]) if plan["price"] is not None else "",
+        "triggerPrice": str(plan["trigger_price"]) if plan["trigger_price"] is not None else "",
+        "afterMarketOrder": False
+    }
+
+def file_fingerprint(path, account=None):
+    """Basket ID of a file for an account: changes whenever the file is modified"""
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    if account is not None and not account.is_default:
+        key += f"|{account.name}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+class BasketHalted(Exception):
+    """A batch had orders that were not sent; the run stops at the previous checkpoint"""
+
+
+class BasketRun:
+    """
+    One import of a basket file.
+
+    Args:
+        path: CSV or JSONL file
+        basket_id: Checkpoint name; runs with the same ID resume each other
+        product_type, order_type: Defaults for rows that do not set them
+        concurrency: Orders sent at once
+        batch_size: Rows between checkpoints
+        account: accounts.Account the orders are placed for (default: the
+            account in config.py)
+    """
+
+    def __init__(self, path, basket_id, product_type="CNC", order_type="MARKET",
+                 concurrency=DEFAULT_CONCURRENCY, batch_size=DEFAULT_BATCH_SIZE, account=None):
+        self.path = os.path.abspath(path)
+        self.account = account or get_account()
+        self.basket_id = basket_id
+        self.product_type = product_type.upper()
+        self.order_type = order_type.upper()
+        self.concurrency = max(1, int(concurrency))
+        self.batch_size = max(1, int(batch_size))
+        self.checkpoint_path = os.path.join(BASKET_DIR, f"{basket_id}.json")
+        self.results_path = os.path.join(BASKET_DIR, f"{basket_id}.results.jsonl")
+        self.state = {
+            "basket_id": basket_id,
+            "account": self.account.name,
+            "file": self.path,
+            "status": "new",
+            "total_rows": None,
+            "rows_done": 0,
+            "last_row": 0,
+            "counts": {},
+            "failures": [],
+            "quantities": None,
+            "started_at": None,
+            "updated_at": None,
+            "runs": 0
+        }
+        self._lock = threading.Lock()
+
+    # Checkpoints
+
+    def load_checkpoint(self):
+        """Load the saved state of an earlier run; returns False if there is none"""
+        if not os.path.exists(self.checkpoint_path):
+            return False
+        with open(self.checkpoint_path, 'r') as file:
+            self.state.update(json.load(file))
+        return True
+
+    def _save_checkpoint(self):
+        os.makedirs(BASKET_DIR, exist_ok=True)
+        self.state["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        temporary = self.checkpoint_path + ".tmp"
+        with open(temporary, 'w') as file:
+            json.dump(self.state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.checkpoint_path)
+
+    def _append_results(self, results):
+        os.makedirs(BASKET_DIR, exist_ok=True)
+        with open(self.results_path, 'a') as file:
+            for result in results:
+                file.write(json.dumps(result) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def progress(self):
+        """Summary of the run so far"""
+        with self._lock:
+            state = {key: value for key, value in self.state.items() if key != "quantities"}
+            state["failures"] = list(state["failures"])
+            state["counts"] = dict(state["counts"])
+        state["results_file"] = self.results_path
+        return state
+
+    # Planning and submission
+
+    def plans(self, current, start_after=0):
+        """Generator of row plans, skipping rows up to `start_after`"""
+        for number, row in read_rows(self.path):
+            if number <= start_after:
+                continue
+            yield plan_row(number, row, current, self.product_type, self.order_type)
+
+    def correlation_id(self, row):
+        digest = hashlib.sha1(f"{self.basket_id}|{row}".encode("utf-8")).hexdigest()
+        return f"bkt{digest[:17]}"
+
+    def _submit(self, plan):
+        """Send one planned order and return its result"""
+        result = dict(plan)
+        if plan["status"] != "ready":
+            return result
+        result["correlation_id"] = self.correlation_id(plan["row"])
+        sent = time.perf_counter()
+        try:
+            response, _, submission = submit_order(self.account.url("/orders"), self.account.headers(),
+                                                   order_body(plan, self.account.client_id),
+                                                   result["correlation_id"], account=self.account)
+            result["submission"] = submission
+            result["http_status"] = response.status_code
+            if response.status_code in [200, 201, 202]:
+                data = response.json()
+                result.update(status="placed", order_id=data.get("orderId"), order_status=data.get("orderStatus"))
+            else:
+                result.update(status="unresolved" if submission == "unresolved" else "failed",
+                              error=response.text[:500])
+        except requests.exceptions.RequestException as e:
+            # Not sent at all (circuit open, rate limit deadline, connect timeout)
+            result.update(status="not_sent", error=str(e))
+        result["latency_ms"] = round((time.perf_counter() - sent) * 1000, 1)
+        return result
+
+    def _record(self, results, last_row):
+        with self._lock:
+            counts = self.state["counts"]
+            for result in results:
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+                if result["status"] not in ("placed", "unchanged") and len(self.state["failures"]) < MAX_REPORTED_FAILURES:
+                    self.state["failures"].append({key: result.get(key) for key in
+                                                   ("row", "stock_name", "status", "error")})
+            self.state["rows_done"] += len(results)
+            self.state["last_row"] = last_row
+
+    def execute(self, dry_run=False, progress=None):
+        """
+        Run the import from the last checkpoint.
+
+        Args:
+            dry_run: Plan and validate every row without sending orders or
+                writing checkpoints
+            progress: Optional callback(rows done, total rows, message), called
+                after each batch
+
+        Returns:
+            Run summary (see progress()); dry runs also include "preview"
+        """
+        with self._lock:
+            if self.state["total_rows"] is None:
+                self.state["total_rows"] = count_rows(self.path)
+            if self.state["quantities"] is None:
+                self.state["quantities"] = fetch_current_quantities(self.account)
+            self.state["status"] = "running"
+            self.state["started_at"] = self.state["started_at"] or time.strftime("%Y-%m-%d %H:%M:%S")
+            self.state["runs"] += 1
+        current = dict(self.state["quantities"])
+        total = self.state["total_rows"]
+
+        if dry_run:
+            preview, counts = [], {}
+            for plan in self.plans(current):
+                counts[plan["status"]] = counts.get(plan["status"], 0) + 1
+                if len(preview) < MAX_REPORTED_FAILURES:
+                    preview.append(plan)
+            summary = self.progress()
+            summary.update(status="dry_run", counts=counts, rows_done=sum(counts.values()), preview=preview)
+            return summary
+
+        plans = self.plans(current, start_after=self.state["last_row"])
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                while True:
+                    batch = list(itertools.islice(plans, self.batch_size))
+                    if not batch:
+                        break
+                    results = list(executor.map(self._submit, batch))
+                    not_sent = [result for result in results if result["status"] == "not_sent"]
+                    if not_sent:
+                        raise BasketHalted(f"Row {not_sent[0]['row']} ({not_sent[0].get('stock_name')}) was not sent: "
+                                           f"{not_sent[0]['error']}")
+                    self._append_results(results)
+                    self._record(results, batch[-1]["row"])
+                    with self._lock:
+                        self.state["quantities"] = dict(current)
+                        self._save_checkpoint()
+                    if progress is not None:
+                        progress(self.state["rows_done"], total,
+                                 f"{self.state['rows_done']}/{total} rows, row {batch[-1]['row']} done")
+        except Exception as e:
+            with self._lock:
+                self.state["status"] = "interrupted"
+                self.state["error"] = str(e)
+                self._save_checkpoint()
+            summary = self.progress()
+            summary["resume_hint"] = "Fix the cause and run the same basket again to resume after the last checkpoint"
+            return summary
+
+        with self._lock:
+            self.state["status"] = "completed"
+            self.state.pop("error", None)
+            self._save_checkpoint()
+        return self.progress()
+
+
+# Runs active in this process, by basket ID
+_active = {}
+_active_lock = threading.Lock()
+
+def run_basket(path, product_type="CNC", order_type="MARKET", concurrency=DEFAULT_CONCURRENCY,
+               batch_size=DEFAULT_BATCH_SIZE, dry_run=False, resume=True, progress=None, account=None):
+    """
+    Import a basket file, resuming an interrupted run of the same file for
+    the same account.
+
+    A completed basket is not sent again when resume is True; pass
+    resume=False to start a new run of the file under a new basket ID.
+
+    Returns:
+        Run summary
+
+    Raises:
+        RuntimeError if this basket is already running
+        requests.exceptions.RequestException if current quantities could not be fetched
+    """
+    account = account or get_account()
+    basket_id = file_fingerprint(path, account)
+    if not resume and not dry_run:
+        basket_id = f"{basket_id[:8]}{uuid.uuid4().hex[:4]}"
+    run = BasketRun(path, basket_id, product_type, order_type, concurrency, batch_size, account)
+    if dry_run:
+        return run.execute(dry_run=True)
+    if run.load_checkpoint() and run.state["status"] == "completed":
+        summary = run.progress()
+        summary["message"] = "Basket already completed; pass resume=False to send it again"
+        return summary
+
+    with _active_lock:
+        if basket_id in _active:
+            raise RuntimeError(f"Basket {basket_id} is already running")
+        _active[basket_id] = run
+    try:
+        return run.execute(progress=progress)
+    finally:
+        with _active_lock:
+            _active.pop(basket_id, None)
+
+def basket_progress(basket_id=None, limit=20):
+    """
+    Progress of one basket, or a list of recent baskets.
+
+    Returns:
+        Run summary for `basket_id` (None if unknown), or a list of summaries
+        newest first
+    """
+    if basket_id is not None:
+        with _active_lock:
+            run = _active.get(basket_id)
+        if run is not None:
+            return run.progress()
+        run = BasketRun(os.devnull, basket_id)
+        return run.progress() if run.load_checkpoint() else None
+
+    if not os.path.isdir(BASKET_DIR):
+        return []
+    names = [name for name in os.listdir(BASKET_DIR) if name.endswith(".json")]
+    names.sort(key=lambda name: os.path.getmtime(os.path.join(BASKET_DIR, name)), reverse=True)
+    summaries = []
+    for name in names[:limit]:
+        summary = basket_progress(name[:-len(".json")])
+        if summary is not None:
+            summaries.append({key: summary.get(key) for key in
+                              ("basket_id", "account", "file", "status", "rows_done", "total_rows", "counts", "updated_at")})
+    return summaries
@@ -0,0 +1,143 @@
+# benchmarks/bench_codec.py
+# JSON handling of large synthetic order books, before and after codec.py:
+#
+# - decoding a response body: requests' Response.json() against
+#   CodecResponse.json() with each backend, and the saving of parsing once
+#   when several consumers read the same response
+# - building records: the whole list of dicts first, or iter_array while the
+#   body is parsed (time and peak memory)
+# - encoding a tool result: FastMCP's pydantic indent=2 encoding against
+#   codec.encode_result
+# - re-sending an unchanged cached payload: building and encoding it again
+#   against splicing the bytes kept by PayloadCache
+# - encoding order request bodies: requests' json= against codec.dumps
+#
+# Usage:
+#   python benchmarks/bench_codec.py [--rows 100000] [--repeat 3]
+import argparse
+import gc
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import pydantic_core
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import codec
+from bench_records import synthetic_rows
+from records import Order, to_dicts
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def peak_bytes(func):
+    """Peak traced allocation while func runs"""
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+def make_response(body, cls=requests.Response, stream=False):
+    """A response for body, as requests returns it; stream=True leaves the body unread"""
+    response = cls()
+    response.status_code = 200
+    if stream:
+        response.raw = io.BytesIO(body)
+    else:
+        response._content = body
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+def row(label, seconds, baseline=None, extra=""):
+    speedup = f"{baseline / seconds:6.1f}x" if baseline else ""
+    print(f"  {label:<44} {seconds * 1000:9.1f} ms {speedup:>8} {extra}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark codec.py on large synthetic order books")
+    parser.add_argument("--rows", type=int, default=100000, help="Orders in the synthetic book")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions, the best time is reported")
+    args = parser.parse_args()
+    backends = list(codec.BACKENDS)
+
+    orders = synthetic_rows("orders", args.rows)
+    body = codec.dumps(orders)
+    print(f"{args.rows} orders, {len(body) / 2**20:.1f} MiB body, backends: {', '.join(backends)}")
+
+    print("Decode the order book response")
+    base = best_of(args.repeat, lambda: make_response(body).json())
+    row("requests Response.json()", base)
+    for name in backends:
+        codec.use_backend(name)
+        row(f"CodecResponse.json() [{name}]", best_of(args.repeat, lambda: make_response(body, codec.CodecResponse).json()), base)
+
+    def three_reads(cls):
+        response = make_response(body, cls)
+        for _ in range(3):
+            response.json()
+    codec.use_backend("auto")
+    base = best_of(args.repeat, lambda: three_reads(requests.Response))
+    row("3 consumers, requests Response.json()", base)
+    row(f"3 consumers, CodecResponse.json() [{codec.backend}]", best_of(args.repeat, lambda: three_reads(codec.CodecResponse)), base)
+
+    print("Build Order records")
+    for name in backends:
+        codec.use_backend(name)
+        build = lambda: Order.from_rows(make_response(body, codec.CodecResponse).json())
+        row(f"json() then from_rows [{name}]", best_of(args.repeat, build), extra=f"peak {peak_bytes(build) / 2**20:7.1f} MiB")
+    stream = lambda: Order.from_rows(codec.iter_array(make_response(body, stream=True)))
+    row("iter_array into from_rows", best_of(args.repeat, stream), extra=f"peak {peak_bytes(stream) / 2**20:7.1f} MiB")
+
+    print("Encode the get_order_book result for MCP")
+    result = {"status": "success", "orders_count": len(orders), "orders": to_dicts(Order.from_rows(orders))}
+    fastmcp = lambda: pydantic_core.to_json(result, fallback=str, indent=2).decode()
+    base = best_of(args.repeat, fastmcp)
+    row("pydantic to_json indent=2 (FastMCP)", base, extra=f"{len(fastmcp()) / 2**20:7.1f} MiB")
+    for name in backends:
+        codec.use_backend(name)
+        row(f"codec.encode_result [{name}]", best_of(args.repeat, lambda: codec.encode_result(result)), base,
+            f"{len(codec.encode_result(result)) / 2**20:7.1f} MiB")
+
+    print("Re-send an unchanged payload (10 years of daily candles)")
+    codec.use_backend("auto")
+    days = 2500
+    candles = {"date": [f"2015-{1 + i % 12:02d}-{1 + i % 28:02d}" for i in range(days)],
+               **{name: [100.0 + i * 0.37 for i in range(days)] for name in ("open", "high", "low", "close", "volume")}}
+    build = lambda: {name: list(values) for name, values in candles.items()}
+    cache = codec.PayloadCache()
+    cache.get_or_encode("candles", build)
+    base = best_of(args.repeat, lambda: [codec.dumps({"status": "success", "candles": build()}) for _ in range(100)])
+    row("build and encode, 100 calls", base)
+    row("PayloadCache hit and splice, 100 calls",
+        best_of(args.repeat, lambda: [codec.dumps({"status": "success", "candles": cache.get_or_encode("candles", build)})
+                                      for _ in range(100)]), base)
+
+    print("Encode 10,000 order request bodies")
+    bodies = [{"dhanClientId": "1000000001", "correlationId": f"cid{i}", "transactionType": "BUY",
+               "exchangeSegment": "NSE_EQ", "productType": "CNC", "orderType": "LIMIT", "validity": "DAY",
+               "securityId": str(i), "quantity": 10, "price": 101.5} for i in range(10000)]
+    url = "https://api.dhan.co/v2/orders"
+    base = best_of(args.repeat, lambda: [requests.Request("POST", url, json=body).prepare() for body in bodies])
+    row("requests json=", base)
+    row(f"data=codec.dumps() [{codec.backend}]",
+        best_of(args.repeat, lambda: [requests.Request("POST", url, data=codec.dumps(body),
+                                                       headers={"Content-Type": "application/json"}).prepare()
+                                      for body in bodies]), base)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_execution_scheduler.py
+# Many TWAP parents running at once in one execution scheduler.
+#
+# Schedules --parents parent orders of --slices slices each over
+# --duration seconds against the paper trading broker, then waits for all
+# of them to finish. Reports how late child orders were created after
+# their slice was due (p50/p99/max, in ms; rate limiter waits come after
+# this), child orders sent, order book polls and the time from the last
+# slice to the last parent finishing.
+# Client-side rate limits are off unless --order-rate is given.
+#
+# Usage:
+#   python benchmarks/bench_execution_scheduler.py [--parents 200] [--slices 10] [--duration 20]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+
+def configure_environment(order_rate, poll_seconds):
+    """Paper trading with a balance large enough for every parent; config is read at import time"""
+    os.environ["DHAN_PAPER_TRADING"] = "1"
+    os.environ["DHAN_PAPER_STARTING_BALANCE"] = "1e15"
+    os.environ["DHAN_EXECUTION_POLL_SECONDS"] = str(poll_seconds)
+    os.environ.setdefault("DHAN_JOURNAL_PATH", os.path.join(tempfile.gettempdir(), "dhan_benchmark_journal.db"))
+    os.environ["DHAN_ORDER_RATE_PER_SECOND"] = str(order_rate)
+    os.environ["DHAN_ORDER_RATE_PER_MINUTE"] = "0"
+    os.environ["DHAN_NON_TRADING_RATE_PER_SECOND"] = "0"
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the TWAP/VWAP execution scheduler")
+    parser.add_argument("--parents", type=int, default=200, help="Parent orders (default: 200)")
+    parser.add_argument("--slices", type=int, default=10, help="Slices per parent (default: 10)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds from first to last slice")
+    parser.add_argument("--freeze", type=int, default=0, help="Freeze quantity (default: no limit)")
+    parser.add_argument("--order-rate", type=float, default=0, help="Orders per second (default: no limit)")
+    parser.add_argument("--poll-seconds", type=float, default=0.5, help="Seconds between order book polls")
+    args = parser.parse_args()
+
+    configure_environment(args.order_rate, args.poll_seconds)
+    import order_idempotency
+    from execution_scheduler import scheduler
+
+    # Keep benchmark orders out of the real order ledger
+    ledger_dir = tempfile.mkdtemp(prefix="dhan_bench_ledger_")
+    order_idempotency.ledger = order_idempotency.OrderLedger(path=os.path.join(ledger_dir, "ledger.jsonl"))
+
+    duration_minutes = args.duration / 60
+    start = time.perf_counter()
+    parents = [
+        scheduler.schedule(f"BENCH{i}", str(1000 + i % 500), "BUY" if i % 2 else "SELL", 100 * args.slices,
+                           duration_minutes=duration_minutes, slices=args.slices, start_in_seconds=1,
+                           freeze_quantity=args.freeze)
+        for i in range(args.parents)
+    ]
+    scheduled = time.perf_counter() - start
+    last_slice = max(parent.starts[-1] for parent in parents)
+
+    while any(not parent.finished_at for parent in parents):
+        time.sleep(0.05)
+    settled = max(parent.finished_at for parent in parents) - last_slice
+
+    lateness = [(child["sent_at"] - parent.starts[child["slice"] - 1]) * 1000
+                for parent in parents for child in parent.children]
+    children = len(lateness)
+    statuses = {}
+    for parent in parents:
+        statuses[parent.status] = statuses.get(parent.status, 0) + 1
+
+    print(f"Execution scheduler: {args.parents} parents x {args.slices} slices over {args.duration:g} s "
+          f"(freeze {args.freeze or 'none'}, order rate {args.order_rate or 'unlimited'})")
+    print(f"  schedule() calls          {scheduled * 1000:10.1f} ms total  "
+          f"({scheduled * 1e6 / args.parents:.0f} us/parent)")
+    print(f"  child orders              {children:10d}")
+    print(f"  slice lateness            p50 {percentile(lateness, 0.5):7.1f} ms  "
+          f"p99 {percentile(lateness, 0.99):7.1f} ms  max {max(lateness):7.1f} ms")
+    print(f"  order book polls          {scheduler.polls:10d}")
+    print(f"  last slice to all done    {settled * 1000:10.1f} ms")
+    print(f"  parent status             {statuses}")
+
+
+if __name__ == "__main__":
+    main()
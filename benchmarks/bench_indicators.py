@@ -0,0 +1,80 @@
+# benchmarks/bench_indicators.py
+# Benchmark the vectorized indicator engine over the whole stocks.json universe.
+#
+# Usage:
+#   python benchmarks/bench_indicators.py [--bars 2500] [--repeat 5]
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from indicators import SUPPORTED_INDICATORS, IndicatorEngine
+
+
+def synthetic_candles(symbols, bars, seed=7):
+    """Random-walk OHLCV candles with shape (symbols, bars)"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, (symbols, bars)), axis=1))
+    spread = np.abs(rng.normal(0, 0.01, (symbols, bars))) * close
+    return {
+        "open": close + rng.normal(0, 0.3, (symbols, bars)),
+        "high": close + spread,
+        "low": close - spread,
+        "close": close,
+        "volume": rng.integers(10_000, 5_000_000, (symbols, bars)).astype(np.float64)
+    }
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the indicator engine over stocks.json")
+    parser.add_argument("--bars", type=int, default=2500, help="Bars per symbol (default: 2500, about 10 years)")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions, the best time is reported")
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT_DIR, "stocks.json"), 'r') as file:
+        symbols = len(json.load(file).get("companies", []))
+
+    candles = synthetic_candles(symbols, args.bars)
+
+    # One 2-D pass over the whole universe
+    batched = best_of(args.repeat, lambda: IndicatorEngine(SUPPORTED_INDICATORS).compute(candles))
+
+    # One pass per symbol
+    def per_symbol():
+        for row in range(symbols):
+            IndicatorEngine(SUPPORTED_INDICATORS).compute({k: v[row] for k, v in candles.items()})
+    looped = best_of(args.repeat, per_symbol)
+
+    # Appending one new bar to every symbol versus recomputing everything
+    history = {k: v[:, :-1] for k, v in candles.items()}
+    new_bar = {k: v[:, -1:] for k, v in candles.items()}
+
+    def incremental():
+        engine = IndicatorEngine(SUPPORTED_INDICATORS)
+        engine.compute(history)
+        start = time.perf_counter()
+        engine.update(new_bar)
+        return time.perf_counter() - start
+    update = min(incremental() for _ in range(args.repeat))
+
+    total_bars = symbols * args.bars
+    print(f"Universe: {symbols} symbols x {args.bars} bars, indicators: {', '.join(SUPPORTED_INDICATORS)}")
+    print(f"  batched full compute    {batched * 1000:9.2f} ms  ({total_bars / batched / 1e6:.1f} M bars/s)")
+    print(f"  per-symbol full compute {looped * 1000:9.2f} ms  ({total_bars / looped / 1e6:.1f} M bars/s)")
+    print(f"  incremental one bar     {update * 1000:9.2f} ms  ({batched / update:.0f}x faster than full)")
+
+if __name__ == "__main__":
+    main()
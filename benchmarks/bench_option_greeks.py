@@ -0,0 +1,213 @@
+# benchmarks/bench_option_greeks.py
+# Implied volatility and Greeks for whole option chains: the vectorized pass
+# of option_greeks.py against solving each call and put on its own with the
+# math module, for synthetic chains shaped like Dhan's option chain response.
+# Also times get_option_chain end to end with the chain cached.
+#
+# --write-fixtures DIR writes a NIFTY chain and a matching instrument master
+# extract for offline use:
+#   DHAN_OPTION_CHAIN_FIXTURES=DIR/option_chains
+#   DHAN_SCRIP_MASTER_PATH=DIR/api-scrip-master-sample.csv DHAN_SCRIP_MASTER_MAX_AGE_HOURS=0
+#
+# Usage:
+#   python benchmarks/bench_option_greeks.py [--strikes 100,500,2000] [--repeat 5]
+import argparse
+import csv
+import datetime
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from option_chain_tool import IST_OFFSET, OptionChain, analyse
+from option_greeks import bs_price
+
+# Fixture: NIFTY weekly expiry, valued a week before
+FIXTURE_UNDERLYING = "NIFTY"
+FIXTURE_EXPIRY = "2024-10-31"
+FIXTURE_AS_OF = "2024-10-24 10:00"
+FIXTURE_SPOT = 24435.5
+FIXTURE_LOT_SIZE = 25
+FIXTURE_FIRST_SECURITY_ID = 35000
+
+MASTER_COLUMNS = [
+    "SEM_EXM_EXCH_ID", "SEM_SEGMENT", "SEM_SMST_SECURITY_ID", "SEM_INSTRUMENT_NAME", "SEM_EXPIRY_CODE",
+    "SEM_TRADING_SYMBOL", "SEM_LOT_UNITS", "SEM_CUSTOM_SYMBOL", "SEM_EXPIRY_DATE", "SEM_STRIKE_PRICE",
+    "SEM_OPTION_TYPE", "SEM_TICK_SIZE", "SEM_EXPIRY_FLAG", "SEM_EXCH_INSTRUMENT_TYPE", "SEM_SERIES",
+    "SM_SYMBOL_NAME"
+]
+
+
+def tick(value):
+    return round(max(round(value / 0.05) * 0.05, 0.05), 2)
+
+def synthetic_chain(spot, expiry, as_of, strikes=101, step=50.0, rate=0.065, seed=7,
+                    first_security_id=FIXTURE_FIRST_SECURITY_ID):
+    """
+    A Dhan option chain response for `strikes` strikes around spot, priced
+    from a volatility smile with a tick-wide spread around the model price.
+    """
+    rng = random.Random(seed)
+    expiry_time = datetime.datetime.combine(datetime.date.fromisoformat(expiry), datetime.time(15, 30), IST_OFFSET)
+    years = (expiry_time - as_of).total_seconds() / (365 * 86400)
+    center = round(spot / step) * step
+    chain = {}
+    for i in range(strikes):
+        strike = center + (i - strikes // 2) * step
+        sigma = 0.13 + 0.6 * math.log(strike / spot) ** 2 - 0.05 * math.log(strike / spot)
+        legs = {}
+        for side, is_call in (("ce", True), ("pe", False)):
+            model = float(bs_price(spot, strike, years, rate, sigma, is_call))
+            price = tick(model)
+            distance = abs(strike - spot) / step
+            oi = int(rng.uniform(0.5, 1.5) * 4e6 / (1 + distance) ** 1.5) // 25 * 25
+            legs[side] = {
+                "greeks": {"delta": 0.0, "theta": 0.0, "gamma": 0.0, "vega": 0.0},
+                "implied_volatility": round(sigma * 100, 4),
+                "last_price": price,
+                "oi": oi,
+                "previous_close_price": tick(model * rng.uniform(0.8, 1.2)),
+                "previous_oi": int(oi * rng.uniform(0.7, 1.1)) // 25 * 25,
+                "previous_volume": int(oi * rng.uniform(2, 8)),
+                "security_id": first_security_id + 2 * i + (0 if is_call else 1),
+                "top_ask_price": tick(model + 0.05),
+                "top_ask_quantity": 25 * rng.randrange(1, 80),
+                "top_bid_price": tick(model - 0.05) if model > 0.1 else 0.0,
+                "top_bid_quantity": 25 * rng.randrange(1, 80),
+                "volume": int(oi * rng.uniform(5, 30)) // 25 * 25
+            }
+        chain[f"{strike:.6f}"] = legs
+    return {"data": {"last_price": spot, "oc": chain}, "status": "success"}
+
+def master_rows(response, underlying, expiry, lot_size):
+    """Instrument master rows for the contracts of a synthetic chain"""
+    expiry_date = datetime.date.fromisoformat(expiry)
+    for key, legs in response["data"]["oc"].items():
+        strike = float(key)
+        for side, name in (("ce", "CALL"), ("pe", "PUT")):
+            yield {
+                "SEM_EXM_EXCH_ID": "NSE", "SEM_SEGMENT": "D", "SEM_SMST_SECURITY_ID": legs[side]["security_id"],
+                "SEM_INSTRUMENT_NAME": "OPTIDX", "SEM_EXPIRY_CODE": 0,
+                "SEM_TRADING_SYMBOL": f"{underlying}-{expiry_date:%b%Y}-{strike:g}-{side.upper()}",
+                "SEM_LOT_UNITS": f"{lot_size:.1f}",
+                "SEM_CUSTOM_SYMBOL": f"{underlying} {expiry_date:%d %b}".upper() + f" {strike:g} {name}",
+                "SEM_EXPIRY_DATE": f"{expiry} 14:30:00", "SEM_STRIKE_PRICE": f"{strike:.5f}",
+                "SEM_OPTION_TYPE": side.upper(), "SEM_TICK_SIZE": "5.0000", "SEM_EXPIRY_FLAG": "W",
+                "SEM_EXCH_INSTRUMENT_TYPE": "OP", "SEM_SERIES": "NA", "SM_SYMBOL_NAME": underlying
+            }
+
+def write_fixtures(directory):
+    as_of = datetime.datetime.strptime(FIXTURE_AS_OF, "%Y-%m-%d %H:%M").replace(tzinfo=IST_OFFSET)
+    response = synthetic_chain(FIXTURE_SPOT, FIXTURE_EXPIRY, as_of)
+    chains_dir = os.path.join(directory, "option_chains")
+    os.makedirs(chains_dir, exist_ok=True)
+    with open(os.path.join(chains_dir, f"{FIXTURE_UNDERLYING}_{FIXTURE_EXPIRY}.json"), "w") as file:
+        json.dump(response, file, indent=1)
+    with open(os.path.join(directory, "api-scrip-master-sample.csv"), "w", newline="") as file:
+        writer = csv.DictWriter(file, MASTER_COLUMNS)
+        writer.writeheader()
+        writer.writerows(master_rows(response, FIXTURE_UNDERLYING, FIXTURE_EXPIRY, FIXTURE_LOT_SIZE))
+    print(f"Wrote fixtures to {directory}")
+
+
+def _cdf(x):
+    return 0.5 * math.erfc(-x / math.sqrt(2))
+
+def scalar_price(spot, strike, t, rate, sigma, is_call, dividend):
+    root_t = math.sqrt(t)
+    d1 = (math.log(spot / strike) + (rate - dividend + 0.5 * sigma * sigma) * t) / (sigma * root_t)
+    d2 = d1 - sigma * root_t
+    forward_value, strike_value = spot * math.exp(-dividend * t), strike * math.exp(-rate * t)
+    if is_call:
+        return forward_value * _cdf(d1) - strike_value * _cdf(d2), d1
+    return strike_value * _cdf(-d2) - forward_value * _cdf(-d1), d1
+
+def scalar_analysis(price, spot, strike, t, rate, is_call, dividend, tol=1e-6):
+    """One option at a time: Newton with bisection fallback, then the Greeks"""
+    if not price > 0:
+        return None
+    low, high, sigma = 1e-4, 5.0, 0.3
+    for _ in range(100):
+        model, d1 = scalar_price(spot, strike, t, rate, sigma, is_call, dividend)
+        error = model - price
+        if abs(error) < tol:
+            break
+        if error > 0:
+            high = sigma
+        else:
+            low = sigma
+        vega = spot * math.exp(-dividend * t) * math.exp(-0.5 * d1 * d1) / math.sqrt(2 * math.pi) * math.sqrt(t)
+        step = sigma - error / vega if vega > 1e-12 else low
+        sigma = step if low < step < high else 0.5 * (low + high)
+    else:
+        return None
+    density = math.exp(-0.5 * d1 * d1) / math.sqrt(2 * math.pi)
+    carry = math.exp(-dividend * t)
+    delta = carry * _cdf(d1) if is_call else carry * (_cdf(d1) - 1)
+    gamma = carry * density / (spot * sigma * math.sqrt(t))
+    vega = spot * carry * density * math.sqrt(t) / 100
+    return sigma, delta, gamma, vega
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vectorized option chain IV and Greeks")
+    parser.add_argument("--strikes", default="100,500,2000", help="Comma separated chain sizes (strikes)")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions, the best time is reported")
+    parser.add_argument("--write-fixtures", metavar="DIR", help="Write offline fixtures to DIR and exit")
+    args = parser.parse_args()
+
+    if args.write_fixtures:
+        write_fixtures(args.write_fixtures)
+        return
+
+    as_of = datetime.datetime.strptime(FIXTURE_AS_OF, "%Y-%m-%d %H:%M").replace(tzinfo=IST_OFFSET)
+    rate = 0.065
+    print(f"{'strikes':>8} {'options':>8} {'vectorized ms':>14} {'scalar ms':>14} {'speedup':>8}"
+          f" {'max IV diff':>12}")
+    for strikes in [int(value) for value in args.strikes.split(",")]:
+        chain = OptionChain(FIXTURE_UNDERLYING, FIXTURE_EXPIRY,
+                            synthetic_chain(FIXTURE_SPOT, FIXTURE_EXPIRY, as_of, strikes=strikes,
+                                            step=max(5000.0 / strikes, 1.0))["data"])
+        vectorized = best_of(args.repeat, lambda: analyse(chain, as_of, rate))
+        analysis = analyse(chain, as_of, rate)
+        years, forward = analysis["years"], analysis["forward"]
+        dividend = rate - math.log(forward / chain.spot) / years
+        prices = analysis["price"]
+
+        def per_option():
+            return [[scalar_analysis(prices[side][i], chain.spot, strike, years, rate, side == 0, dividend)
+                     for i, strike in enumerate(chain.strikes.tolist())] for side in (0, 1)]
+
+        scalar = best_of(max(1, args.repeat // 2), per_option)
+        results = per_option()
+        scalar_iv = np.array([[np.nan if r is None else r[0] for r in side] for side in results])
+        difference = np.nanmax(np.abs(scalar_iv - analysis["iv"]))
+        print(f"{strikes:>8} {2 * strikes:>8} {vectorized * 1000:>14.2f} {scalar * 1000:>14.2f}"
+              f" {scalar / vectorized:>7.1f}x {difference:>12.1e}")
+
+    import option_chain_tool
+    response = synthetic_chain(FIXTURE_SPOT, FIXTURE_EXPIRY, as_of, strikes=201)
+    option_chain_tool.fetch_chain = lambda name, security_id, segment, expiry: response["data"]
+    call = lambda: option_chain_tool.get_option_chain(FIXTURE_UNDERLYING, FIXTURE_EXPIRY, as_of=FIXTURE_AS_OF)
+    call()
+    print(f"get_option_chain, 201 strikes, cached chain: {best_of(args.repeat, call) * 1000:.2f} ms")
+    filtered = lambda: option_chain_tool.get_option_chain(FIXTURE_UNDERLYING, FIXTURE_EXPIRY, strikes_around_atm=10,
+                                                          as_of=FIXTURE_AS_OF)
+    print(f"get_option_chain, ATM +/- 10 strikes, cached chain: {best_of(args.repeat, filtered) * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
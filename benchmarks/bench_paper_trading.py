@@ -0,0 +1,84 @@
+# benchmarks/bench_paper_trading.py
+# Throughput of the paper trading matching engine.
+#
+# Usage:
+#   python benchmarks/bench_paper_trading.py [--orders 50000]
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from dhan_client import DhanClient
+from paper_trading import PaperBroker
+
+
+def order_bodies(count, securities, seed=11):
+    """Mix of market and resting limit orders around each instrument's price"""
+    rng = random.Random(seed)
+    bodies = []
+    for _ in range(count):
+        security_id, price = rng.choice(securities)
+        side = rng.choice(["BUY", "SELL"])
+        if rng.random() < 0.3:
+            body = {"orderType": "MARKET", "price": ""}
+        else:
+            offset = rng.uniform(0.001, 0.02) * price
+            limit = price - offset if side == "BUY" else price + offset
+            body = {"orderType": "LIMIT", "price": str(round(limit, 2))}
+        body.update({
+            "transactionType": side,
+            "exchangeSegment": "NSE_EQ",
+            "productType": "INTRADAY",
+            "validity": "DAY",
+            "securityId": security_id,
+            "quantity": str(rng.randint(1, 20))
+        })
+        bodies.append(body)
+    return bodies
+
+def run(label, bodies, submit):
+    start = time.perf_counter()
+    for body in bodies:
+        submit(body)
+    elapsed = time.perf_counter() - start
+    count = len(bodies)
+    print(f"  {label:32s} {count / elapsed:12,.0f} orders/s  ({elapsed * 1e6 / count:.1f} us/order)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the paper trading engine")
+    parser.add_argument("--orders", type=int, default=50000, help="Orders per run (default: 50000)")
+    parser.add_argument("--instruments", type=int, default=100, help="Instruments to spread orders over")
+    args = parser.parse_args()
+
+    securities = [(str(1000 + i), 100.0 + 25 * i) for i in range(args.instruments)]
+    prices = dict(securities)
+    bodies = order_bodies(args.orders, securities)
+    balance = 1e15
+
+    print(f"{args.orders:,} orders over {args.instruments} instruments")
+
+    broker = PaperBroker(starting_balance=balance, prices=prices)
+    run("PaperBroker.handle", bodies, lambda body: broker.handle("POST", "/orders", body))
+
+    broker = PaperBroker(starting_balance=balance, prices=prices)
+    client = DhanClient(base_url="https://paper", paper_broker=broker)
+    run("DhanClient.post (tool path)", bodies, lambda body: client.post("https://paper/orders", json=body))
+
+    # Sweep the resting books with random-walk ticks
+    rng = random.Random(5)
+    ticks = [
+        (security_id, round(price * (1 + rng.gauss(0, 0.01)), 2))
+        for _ in range(20) for security_id, price in securities
+    ]
+    start = time.perf_counter()
+    broker.replay(ticks)
+    elapsed = time.perf_counter() - start
+    filled = sum(1 for order in broker.orders.values() if order.status == "TRADED")
+    print(f"  {'tick replay':32s} {len(ticks) / elapsed:12,.0f} ticks/s   ({filled:,} orders filled in total)")
+
+if __name__ == "__main__":
+    main()
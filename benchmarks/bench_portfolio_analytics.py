@@ -0,0 +1,88 @@
+# benchmarks/bench_portfolio_analytics.py
+# Benchmark portfolio_analytics over synthetic accounts of growing size,
+# against a plain Python loop computing the same per-symbol and per-sector
+# totals.
+#
+# Usage:
+#   python benchmarks/bench_portfolio_analytics.py [--lines 100,1000,10000,100000] [--repeat 5]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from portfolio_analytics import PortfolioFrame, analyze, load_stock_metadata
+
+
+def synthetic_rows(lines, seed=7):
+    """Holdings and positions rows spread over the stocks.json universe"""
+    rng = np.random.default_rng(seed)
+    security_ids = list(load_stock_metadata())
+    holdings, positions = [], []
+    for i in range(lines):
+        security_id = security_ids[rng.integers(len(security_ids))]
+        cost = float(rng.uniform(100, 3000))
+        price = round(cost * float(rng.lognormal(0, 0.2)), 2)
+        if i % 2:
+            holdings.append({"securityId": security_id, "totalQty": int(rng.integers(1, 500)),
+                             "avgCostPrice": round(cost, 2), "lastTradedPrice": price})
+        else:
+            net = int(rng.integers(-200, 200))
+            positions.append({"securityId": security_id, "netQty": net, "costPrice": round(cost, 2),
+                              "realizedProfit": round(float(rng.normal(0, 500)), 2),
+                              "unrealizedProfit": round((price - cost) * net, 2)})
+    return holdings, positions
+
+def python_reference(holdings, positions):
+    """Per-row loop computing the totals analyze() reports"""
+    metadata = load_stock_metadata()
+    symbols, sectors = {}, {}
+    gross = 0.0
+    for kind, rows in (("holding", holdings), ("position", positions)):
+        for row in rows:
+            if kind == "holding":
+                quantity, cost, price, realized = row["totalQty"], row["avgCostPrice"], row["lastTradedPrice"], 0.0
+            else:
+                quantity, cost, realized = row["netQty"], row["costPrice"], row["realizedProfit"]
+                price = cost + row["unrealizedProfit"] / quantity if quantity else cost
+            name, sector = metadata[row["securityId"]]
+            value = quantity * price
+            gross += abs(value)
+            for table, key in ((symbols, name), (sectors, sector)):
+                totals = table.setdefault(key, [0.0, 0.0, 0.0])
+                totals[0] += value
+                totals[1] += value - quantity * cost
+                totals[2] += realized
+    weights = {key: totals[0] / gross for key, totals in symbols.items()}
+    return symbols, sectors, sorted(weights.items(), key=lambda item: -abs(item[1]))
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark portfolio analytics")
+    parser.add_argument("--lines", default="100,1000,10000,100000", help="Comma separated account sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions, the best time is reported")
+    args = parser.parse_args()
+
+    print(f"{'lines':>8}  {'load':>9}  {'analyze':>9}  {'total':>9}  {'python loop, totals only':>25}")
+    for lines in [int(value) for value in args.lines.split(",")]:
+        holdings, positions = synthetic_rows(lines)
+        load = best_of(args.repeat, lambda: PortfolioFrame.from_rows(holdings, positions))
+        frame = PortfolioFrame.from_rows(holdings, positions)
+        compute = best_of(args.repeat, lambda: analyze(frame, sector_shocks={"Financial Services": -8}))
+        looped = best_of(args.repeat, lambda: python_reference(holdings, positions))
+        print(f"{lines:>8}  {load * 1000:7.2f}ms  {compute * 1000:7.2f}ms  {(load + compute) * 1000:7.2f}ms  "
+              f"{looped * 1000:23.2f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/bench_reconciliation.py
+# Time of reconciliation.Reconciler for a busy day in a temporary trade
+# journal: a full rebuild from the day's first row, a run with nothing new,
+# and a run after a few new fills, against the same positions.
+#
+# Usage:
+#   python benchmarks/bench_reconciliation.py [--orders 20000] [--securities 500] [--new-trades 50]
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from reconciliation import Reconciler
+from records import Position
+from trade_journal import TradeJournal
+
+
+def fill_journal(journal, orders, securities, date, seed=7):
+    """Placed orders, one or two fills each, and the positions they add up to"""
+    rng = random.Random(seed)
+    order_rows, trade_rows, net = [], [], {}
+    now = time.time()
+    for i in range(orders):
+        security_id = str(1000 + rng.randrange(securities))
+        side = rng.choice(("BUY", "SELL"))
+        quantity = rng.randrange(1, 20) * 5
+        order_id = str(10**11 + i)
+        order_rows.append((now, date, "live", "placed", "order", order_id, security_id, f"SYM{security_id}", side,
+                           quantity, "TRANSIT"))
+        first = quantity if rng.random() < 0.7 else quantity // 5 * 2
+        for n, part in enumerate((first, quantity - first)):
+            if part:
+                trade_rows.append((now, date, "live", order_id, f"{order_id}-{n}", security_id, f"SYM{security_id}",
+                                   side, part, 100.0))
+        net[security_id] = net.get(security_id, 0) + (quantity if side == "BUY" else -quantity)
+    connection = journal.connect()
+    with connection:
+        connection.executemany(
+            "INSERT INTO orders (recorded_at, date, source, event, kind, order_id, security_id, symbol, side, quantity, "
+            "status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", order_rows)
+        connection.executemany(
+            "INSERT INTO trades (recorded_at, date, source, order_id, trade_id, security_id, symbol, side, quantity, "
+            "price) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", trade_rows)
+    connection.close()
+    return len(trade_rows), net
+
+def positions_for(net):
+    return Position.from_rows([
+        {"securityId": security_id, "tradingSymbol": f"SYM{security_id}", "productType": "INTRADAY",
+         "dayBuyQty": max(quantity, 0), "daySellQty": max(-quantity, 0), "netQty": quantity}
+        for security_id, quantity in net.items()
+    ])
+
+def add_trades(journal, count, date, net, seed=11):
+    """New orders filled after the last run; net is updated to match"""
+    rng = random.Random(seed)
+    connection = journal.connect()
+    with connection:
+        for i in range(count):
+            security_id = str(1000 + rng.randrange(len(net)))
+            order_id = f"new-{seed}-{i}"
+            connection.execute(
+                "INSERT INTO orders (recorded_at, date, source, event, kind, order_id, security_id, symbol, side, "
+                "quantity, status) VALUES (?, ?, 'live', 'placed', 'order', ?, ?, ?, 'BUY', 10, 'TRANSIT')",
+                (time.time(), date, order_id, security_id, f"SYM{security_id}"))
+            connection.execute(
+                "INSERT INTO trades (recorded_at, date, source, order_id, trade_id, security_id, symbol, side, "
+                "quantity, price) VALUES (?, ?, 'live', ?, ?, ?, ?, 'BUY', 10, 100.0)",
+                (time.time(), date, order_id, order_id, security_id, f"SYM{security_id}"))
+            net[security_id] = net.get(security_id, 0) + 10
+    connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark incremental reconciliation")
+    parser.add_argument("--orders", type=int, default=20000, help="Orders placed during the day")
+    parser.add_argument("--securities", type=int, default=500, help="Distinct securities traded")
+    parser.add_argument("--new-trades", type=int, default=50, help="Fills added before the incremental run")
+    args = parser.parse_args()
+
+    date = datetime.date.today().isoformat()
+    with tempfile.TemporaryDirectory() as directory:
+        journal = TradeJournal(os.path.join(directory, "journal.db"))
+        trades, net = fill_journal(journal, args.orders, args.securities, date)
+        positions = positions_for(net)
+        reconciler = Reconciler(journal, source="live")
+        print(f"{args.orders} orders, {trades} fills, {len(net)} securities")
+
+        def timed(label, reconciler, positions, **kwargs):
+            start = time.perf_counter()
+            report = reconciler.reconcile(positions, today=date, **kwargs)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"{label:<24} {elapsed:>9.1f} ms  order events {report['new_order_events']:>6}  "
+                  f"fills {report['new_trades']:>6}  securities checked {report['securities_checked']:>4}  "
+                  f"discrepancies {report['discrepancies_count']}")
+
+        timed("full rebuild", reconciler, positions, full=True)
+        timed("nothing new", reconciler, positions)
+        add_trades(journal, args.new_trades, date, net)
+        positions = positions_for(net)
+        timed(f"{args.new_trades} new fills", reconciler, positions)
+        # A new process loads the saved order state instead of replaying the day
+        timed("after restart", Reconciler(journal, source="live"), positions)
+
+if __name__ == "__main__":
+    main()
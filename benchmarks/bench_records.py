@@ -0,0 +1,132 @@
+# benchmarks/bench_records.py
+# Memory and parse time of the records in records.py against the plain dicts
+# json.loads returns, for synthetic Dhan order, trade, holding, position and
+# fund limit responses. from_rows is the time added on top of json.loads,
+# to_dicts the time to shape the records back into tool response rows.
+#
+# Usage:
+#   python benchmarks/bench_records.py [--rows 100000] [--repeat 3]
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from records import FundLimits, Holding, Order, Position, Trade, to_dicts
+
+
+def synthetic_rows(kind, count, seed=7):
+    """Rows shaped like the Dhan response for `kind`"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        security_id = str(rng.randrange(1, 30000))
+        symbol = f"SYM{security_id}"
+        side = rng.choice(("BUY", "SELL"))
+        product = rng.choice(("CNC", "INTRADAY", "MARGIN"))
+        price = round(rng.uniform(50, 5000), 2)
+        quantity = rng.randrange(1, 500)
+        stamp = f"2024-06-{1 + i % 28:02d} {9 + i % 6:02d}:{i % 60:02d}:{(i * 7) % 60:02d}"
+        if kind == "orders":
+            filled = rng.choice((0, quantity))
+            rows.append({
+                "dhanClientId": "1000000001", "orderId": str(10**11 + i), "exchangeOrderId": str(10**15 + i),
+                "correlationId": f"cid{i}", "orderStatus": "TRADED" if filled else rng.choice(("PENDING", "CANCELLED")),
+                "transactionType": side, "exchangeSegment": "NSE_EQ", "productType": product,
+                "orderType": rng.choice(("MARKET", "LIMIT")), "validity": "DAY", "tradingSymbol": symbol,
+                "securityId": security_id, "quantity": quantity, "disclosedQuantity": 0, "price": price,
+                "triggerPrice": 0.0, "afterMarketOrder": False, "boProfitValue": 0.0, "boStopLossValue": 0.0,
+                "legName": None, "createTime": stamp, "updateTime": stamp, "exchangeTime": stamp,
+                "drvExpiryDate": None, "drvOptionType": None, "drvStrikePrice": 0.0, "omsErrorCode": None,
+                "omsErrorDescription": "", "algoId": "", "remainingQuantity": quantity - filled,
+                "averageTradedPrice": price if filled else 0.0, "filledQty": filled
+            })
+        elif kind == "trades":
+            rows.append({
+                "dhanClientId": "1000000001", "orderId": str(10**11 + i), "exchangeOrderId": str(10**15 + i),
+                "exchangeTradeId": str(5 * 10**14 + i), "transactionType": side, "exchangeSegment": "NSE_EQ",
+                "productType": product, "orderType": "MARKET", "tradingSymbol": symbol, "customSymbol": symbol,
+                "securityId": security_id, "tradedQuantity": quantity, "tradedPrice": price, "createTime": stamp,
+                "updateTime": stamp, "exchangeTime": stamp, "drvExpiryDate": None, "drvOptionType": None,
+                "drvStrikePrice": 0.0
+            })
+        elif kind == "holdings":
+            rows.append({
+                "exchange": "ALL", "tradingSymbol": symbol, "securityId": security_id, "isin": f"INE{i:09d}",
+                "totalQty": quantity, "dpQty": quantity, "t1Qty": 0, "availableQty": quantity, "collateralQty": 0,
+                "avgCostPrice": price, "lastTradedPrice": round(price * rng.uniform(0.8, 1.2), 2)
+            })
+        elif kind == "positions":
+            net = rng.randrange(-200, 200)
+            rows.append({
+                "dhanClientId": "1000000001", "tradingSymbol": symbol, "securityId": security_id,
+                "positionType": "LONG" if net > 0 else "SHORT" if net < 0 else "CLOSED",
+                "exchangeSegment": "NSE_EQ", "productType": product, "buyAvg": price, "buyQty": max(net, 0),
+                "costPrice": price, "sellAvg": 0.0, "sellQty": max(-net, 0), "netQty": net,
+                "realizedProfit": 0.0, "unrealizedProfit": round(rng.uniform(-500, 500), 2),
+                "rbiReferenceRate": 1.0, "multiplier": 1, "carryForwardBuyQty": 0, "carryForwardSellQty": 0,
+                "carryForwardBuyValue": 0.0, "carryForwardSellValue": 0.0, "dayBuyQty": max(net, 0),
+                "daySellQty": max(-net, 0), "dayBuyValue": round(price * max(net, 0), 2),
+                "daySellValue": round(price * max(-net, 0), 2), "drvExpiryDate": None, "drvOptionType": None,
+                "drvStrikePrice": 0.0, "crossCurrency": False
+            })
+        else:
+            rows.append({
+                "dhanClientId": "1000000001", "availabelBalance": price * 100, "sodLimit": price * 120,
+                "collateralAmount": 0.0, "receiveableAmount": 0.0, "utilizedAmount": price * 20,
+                "blockedPayoutAmount": 0.0, "withdrawableBalance": price * 100
+            })
+    return rows
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def retained_bytes(build):
+    """Bytes still allocated by what build() returns, once its temporaries are freed"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compact Dhan records against plain dicts")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows per response")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions, the best time is reported")
+    args = parser.parse_args()
+
+    kinds = [("orders", Order), ("trades", Trade), ("holdings", Holding), ("positions", Position),
+             ("fund limits", FundLimits)]
+    print(f"{args.rows} rows per response")
+    print(f"{'':<12} {'dict MiB':>9} {'record MiB':>11} {'saved':>6}   {'json.loads':>10} {'from_rows':>10}"
+          f" {'to_dicts':>9}")
+    for kind, record_type in kinds:
+        text = json.dumps(synthetic_rows(kind.split()[0], args.rows))
+        dict_bytes = retained_bytes(lambda: json.loads(text))
+        record_bytes = retained_bytes(lambda: record_type.from_rows(json.loads(text)))
+        loads = best_of(args.repeat, lambda: json.loads(text))
+        rows = json.loads(text)
+        parse = best_of(args.repeat, lambda: record_type.from_rows(rows))
+        records = record_type.from_rows(rows)
+        shape = best_of(args.repeat, lambda: to_dicts(records))
+        del rows, records
+        print(f"{kind:<12} {dict_bytes / 2**20:9.1f} {record_bytes / 2**20:11.1f} {1 - record_bytes / dict_bytes:6.0%}"
+              f"   {loads * 1000:8.0f}ms {parse * 1000:8.0f}ms {shape * 1000:7.0f}ms")
+
+if __name__ == "__main__":
+    main()
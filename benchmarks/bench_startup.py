@@ -0,0 +1,96 @@
+# benchmarks/bench_startup.py
+# Time to first tool call of the stdio tool servers.
+#
+# Each run starts `python <module>.py` the way an MCP client does, then
+# times the handshake (initialize), tools/list and one tool call in paper
+# trading mode. "cold" runs start with an empty reference cache (as after
+# stocks.json or the instrument master changed), "warm" runs reuse the cache
+# written by the first run. Times are medians in milliseconds from process
+# start.
+#
+# Usage:
+#   python benchmarks/bench_startup.py [--repeat 5] [--modules order_placement_tool,option_chain_tool]
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import anyio
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+
+# Tool called first on each server, with its arguments
+FIRST_CALLS = {
+    "order_placement_tool": ("place_order", {"stock_name": "TCS", "quantity": 1, "transaction_type": "BUY"}),
+    "margin_calculator_tool": ("calculate_margin_by_stock_name",
+                               {"stock_name": "TCS", "transaction_type": "BUY", "quantity": 10}),
+    "order_book_tool": ("get_order_book", {}),
+    "holdings_positions_tool": ("get_positions", {}),
+    "option_chain_tool": ("get_option_chain", {"underlying": "NIFTY", "expiry": "2024-10-31",
+                                               "strikes_around_atm": 5, "as_of": "2024-10-24 10:00"}),
+    "price_alert_tool": ("list_alerts", {"stock_name": "TCS"})
+}
+
+
+async def start_and_call(module, env):
+    """(initialize, tools/list, first call) times in ms from process start"""
+    name, arguments = FIRST_CALLS[module]
+    params = StdioServerParameters(command=sys.executable, args=[f"{module}.py"], env=env, cwd=ROOT_DIR)
+    start = time.perf_counter()
+    async with stdio_client(params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            initialized = time.perf_counter()
+            await session.list_tools()
+            listed = time.perf_counter()
+            result = await session.call_tool(name, arguments)
+            called = time.perf_counter()
+    if result.isError:
+        raise RuntimeError(f"{module}.{name} failed: {result.content[0].text}")
+    return [(point - start) * 1000 for point in (initialized, listed, called)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tool server startup")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per module and cache state")
+    parser.add_argument("--modules", default=",".join(FIRST_CALLS), help="Comma separated tool modules")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="dhan-startup-")
+    cache_dir = os.path.join(work_dir, "reference")
+    env = dict(os.environ)
+    env.update({
+        "DHAN_PAPER_TRADING": "1",
+        "DHAN_JOURNAL_PATH": os.path.join(work_dir, "trade_journal.db"),
+        "DHAN_REFERENCE_CACHE_DIR": cache_dir,
+        "DHAN_OPTION_CHAIN_FIXTURES": os.path.join(FIXTURES_DIR, "option_chains"),
+        "DHAN_SCRIP_MASTER_PATH": os.path.join(FIXTURES_DIR, "api-scrip-master-sample.csv"),
+        "DHAN_SCRIP_MASTER_MAX_AGE_HOURS": "0",
+        "PYTHONPATH": ROOT_DIR
+    })
+
+    print(f"{'module':<26} {'cache':<6} {'initialize':>11} {'tools/list':>11} {'first call':>11}")
+    try:
+        for module in args.modules.split(","):
+            for state in ("cold", "warm"):
+                runs = []
+                for _ in range(args.repeat):
+                    if state == "cold":
+                        shutil.rmtree(cache_dir, ignore_errors=True)
+                    runs.append(anyio.run(start_and_call, module, env))
+                medians = [statistics.median(run[i] for run in runs) for i in range(3)]
+                print(f"{module:<26} {state:<6} {medians[0]:>11.0f} {medians[1]:>11.0f} {medians[2]:>11.0f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+# benchmarks/mcp_load.py
+# End-to-end load generator for the MCP servers.
+#
+# Starts the tool servers against the local mock Dhan API, opens many MCP
+# client sessions over stdio or streamable HTTP, replays a workload of tool
+# calls from benchmarks/workloads/ and reports end-to-end latency together
+# with server CPU and RSS sampled over the run.
+#
+# With stdio every session gets its own server processes; with HTTP all
+# sessions share one server process per module; with "server" all sessions
+# go to http_server.py, which mounts every module in one app served by
+# --workers processes.
+#
+# Usage:
+#   python benchmarks/mcp_load.py --transport stdio --sessions 4 --calls 50
+#   python benchmarks/mcp_load.py --transport http --sessions 32 --calls 100 --latency-ms 20
+#   python benchmarks/mcp_load.py --transport server --workers 4 --sessions 32 --calls 100 --latency-ms 20
+#   python benchmarks/mcp_load.py --workload benchmarks/workloads/default.json --output report.json
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import AsyncExitStack
+
+import anyio
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from mock_dhan_server import MockSettings, start_mock_server
+from http_server import SERVERS
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+DEFAULT_WORKLOAD = os.path.join(BENCH_DIR, "workloads", "default.json")
+
+# Client-side rate limits switched off for runs against the mock API
+RATE_LIMIT_SETTINGS = [
+    "DHAN_ORDER_RATE_PER_SECOND", "DHAN_ORDER_RATE_PER_MINUTE", "DHAN_DATA_RATE_PER_SECOND",
+    "DHAN_QUOTE_RATE_PER_SECOND", "DHAN_NON_TRADING_RATE_PER_SECOND", "DHAN_OPTION_CHAIN_INTERVAL_SECONDS"
+]
+
+# Runs a tool module's FastMCP server: python -c SERVE_SNIPPET <module> <transport> [port]
+SERVE_SNIPPET = (
+    "import importlib, logging, sys; "
+    "server = importlib.import_module(sys.argv[1]).mcp; "
+    "logging.getLogger().setLevel(logging.WARNING); "
+    "server.settings.host = '127.0.0.1'; "
+    "server.settings.port = int(sys.argv[3]) if len(sys.argv) > 3 else server.settings.port; "
+    "server.run(transport=sys.argv[2])"
+)
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def load_workload(path):
+    """
+    Load a workload file.
+
+    A workload has a "mode" ("mix" samples calls by weight, "sequence"
+    replays them in order) and a list of calls, each with "server" (tool
+    module), "tool", "arguments" and optional "weight". Argument values of
+    the form "$<tool>.<key>" are replaced with <key> from the latest result
+    of <tool> in the same session; calls with "consume": true use that
+    result up so it is not reused.
+    """
+    with open(path, 'r') as file:
+        workload = json.load(file)
+    workload.setdefault("mode", "mix")
+    for call in workload["calls"]:
+        call.setdefault("arguments", {})
+        call.setdefault("weight", 1)
+    return workload
+
+def find_key(value, key):
+    """Depth-first search for a key in a decoded tool result"""
+    if isinstance(value, dict):
+        if key in value:
+            return value[key]
+        value = list(value.values())
+    if isinstance(value, list):
+        for item in value:
+            found = find_key(item, key)
+            if found is not None:
+                return found
+    return None
+
+def placeholders(call):
+    return [value[1:].split(".", 1) for value in call["arguments"].values()
+            if isinstance(value, str) and value.startswith("$")]
+
+def resolve_arguments(call, results):
+    """Substitute placeholders, or return None if a referenced result is missing"""
+    arguments = {}
+    for name, value in call["arguments"].items():
+        if isinstance(value, str) and value.startswith("$"):
+            tool, key = value[1:].split(".", 1)
+            history = results.get(tool)
+            found = find_key(history[-1], key) if history else None
+            if found is None:
+                return None
+            value = found
+        arguments[name] = value
+    return arguments
+
+def decode_result(result):
+    """Decode the JSON text returned by a tool, if any"""
+    for content in result.content:
+        text = getattr(content, "text", None)
+        if text is not None:
+            try:
+                return json.loads(text)
+            except ValueError:
+                return text
+    return None
+
+def next_calls(workload, rng):
+    """Endless iterator over workload calls"""
+    calls = workload["calls"]
+    if workload["mode"] == "sequence":
+        while True:
+            yield from calls
+    weights = [call["weight"] for call in calls]
+    while True:
+        yield rng.choices(calls, weights)[0]
+
+
+class Stats:
+    """Latencies and errors collected from all sessions"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.skipped = 0
+
+    def record(self, tool, latency, error=None):
+        self.latencies[tool].append(latency)
+        if error:
+            self.errors[tool][error] += 1
+
+    def summary(self, elapsed):
+        rows = []
+        everything = []
+        for tool in sorted(self.latencies):
+            latencies = sorted(self.latencies[tool])
+            everything.extend(latencies)
+            rows.append(summarize(tool, latencies, sum(self.errors[tool].values()), elapsed))
+        everything.sort()
+        total = summarize("ALL", everything, sum(sum(errors.values()) for errors in self.errors.values()), elapsed)
+        return rows, total
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def summarize(tool, latencies, errors, elapsed):
+    return {
+        "tool": tool,
+        "calls": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0
+    }
+
+
+class ResourceSampler:
+    """
+    Samples CPU and RSS of the server processes (all children of this process).
+
+    Uses psutil when installed and falls back to /proc on Linux.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = []
+        self._previous_cpu = None
+
+    def _children(self):
+        if psutil is not None:
+            return [(child.pid, child) for child in psutil.Process().children(recursive=True)]
+        parents = {}
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    with open(f"/proc/{entry}/stat", 'r') as file:
+                        fields = file.read().rsplit(")", 1)[1].split()
+                    parents[int(entry)] = int(fields[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+        pids, frontier = [], {os.getpid()}
+        while frontier:
+            frontier = {pid for pid, parent in parents.items() if parent in frontier}
+            pids.extend(frontier)
+        return [(pid, None) for pid in pids]
+
+    @staticmethod
+    def _usage(pid, process):
+        """Return (cpu seconds, rss bytes) for a process"""
+        if process is not None:
+            times = process.cpu_times()
+            return times.user + times.system, process.memory_info().rss
+        with open(f"/proc/{pid}/stat", 'r') as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        with open(f"/proc/{pid}/status", 'r') as file:
+            rss = next(int(line.split()[1]) * 1024 for line in file if line.startswith("VmRSS:"))
+        return cpu, rss
+
+    def sample(self, elapsed):
+        cpu_total = rss_total = processes = 0
+        for pid, process in self._children():
+            try:
+                cpu, rss = self._usage(pid, process)
+            except Exception:
+                continue
+            cpu_total += cpu
+            rss_total += rss
+            processes += 1
+        now = time.perf_counter()
+        cpu_percent = None
+        if self._previous_cpu is not None:
+            previous_time, previous_cpu = self._previous_cpu
+            cpu_percent = round(100 * max(cpu_total - previous_cpu, 0) / (now - previous_time), 1)
+        self._previous_cpu = (now, cpu_total)
+        self.samples.append({
+            "t": round(elapsed, 2),
+            "processes": processes,
+            "cpu_percent": cpu_percent,
+            "rss_mib": round(rss_total / 2**20, 1)
+        })
+
+    async def run(self, start, done):
+        while not done.is_set():
+            self.sample(time.perf_counter() - start)
+            with anyio.move_on_after(self.interval):
+                await done.wait()
+        self.sample(time.perf_counter() - start)
+
+    def summary(self):
+        cpu = [sample["cpu_percent"] for sample in self.samples if sample["cpu_percent"] is not None]
+        rss = [sample["rss_mib"] for sample in self.samples]
+        return {
+            "mean_cpu_percent": round(sum(cpu) / len(cpu), 1) if cpu else None,
+            "peak_cpu_percent": max(cpu) if cpu else None,
+            "peak_rss_mib": max(rss) if rss else None,
+            "final_rss_mib": rss[-1] if rss else None
+        }
+
+
+def server_environment(base_url):
+    env = dict(os.environ)
+    env.pop("DHAN_PAPER_TRADING", None)
+    env["DHAN_API_BASE_URL"] = base_url
+    env.setdefault("DHAN_CLIENT_ID", "1000000001")
+    env.setdefault("DHAN_ACCESS_TOKEN", "mock-access-token")
+    # Keep mock orders out of the real trade journal
+    env.setdefault("DHAN_JOURNAL_PATH", os.path.join(tempfile.gettempdir(), "dhan_benchmark_journal.db"))
+    # The mock API has no rate limits, so measure the tools without client-side pacing
+    for name in RATE_LIMIT_SETTINGS:
+        env.setdefault(name, "0")
+    return env
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_http_servers(servers, env, timeout=60):
+    """Start one streamable HTTP server per module and wait until they accept connections"""
+    processes, urls = [], {}
+    for server in servers:
+        port = free_port()
+        processes.append(subprocess.Popen(
+            [sys.executable, "-c", SERVE_SNIPPET, server, "streamable-http", str(port)],
+            cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL
+        ))
+        urls[server] = (port, f"http://127.0.0.1:{port}/mcp")
+
+    deadline = time.monotonic() + timeout
+    for process, (server, (port, _)) in zip(processes, urls.items()):
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{server} exited with code {process.returncode}")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{server} did not start listening on port {port}")
+                time.sleep(0.1)
+    return processes, {server: url for server, (_, url) in urls.items()}
+
+def start_combined_server(servers, env, workers, timeout=60):
+    """Start http_server.py with the workload's modules mounted and wait until it is ready"""
+    mounts = {module: name for name, module in SERVERS.items()}
+    store = os.path.join(tempfile.gettempdir(), "dhan_benchmark_shared_store.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(store + suffix):
+            os.remove(store + suffix)
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT_DIR, "http_server.py"), "--port", str(port), "--workers", str(workers),
+         "--servers", ",".join(mounts[server] for server in servers), "--shared-store", store],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+
+    deadline = time.monotonic() + timeout
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError(f"http_server.py exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=1) as response:
+                if response.status == 200:
+                    break
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"http_server.py did not become ready on port {port}")
+        time.sleep(0.1)
+    return [process], {server: f"http://127.0.0.1:{port}/{mounts[server]}/mcp" for server in servers}
+
+async def open_sessions(stack, transport, servers, env, urls):
+    sessions = {}
+    for server in servers:
+        if transport == "stdio":
+            params = StdioServerParameters(
+                command=sys.executable, args=["-c", SERVE_SNIPPET, server, "stdio"], env=env, cwd=ROOT_DIR
+            )
+            read, write = await stack.enter_async_context(stdio_client(params))
+        else:
+            read, write, _ = await stack.enter_async_context(streamablehttp_client(urls[server]))
+        session = await stack.enter_async_context(ClientSession(read, write))
+        await session.initialize()
+        sessions[server] = session
+    return sessions
+
+async def run_session(index, args, workload, servers, env, urls, stats, state):
+    rng = random.Random(args.seed + index)
+    async with AsyncExitStack() as stack:
+        sessions = await open_sessions(stack, args.transport, servers, env, urls)
+        state["ready"] += 1
+        await state["go"].wait()
+
+        results = {}
+        calls = next_calls(workload, rng)
+        completed = 0
+        while completed < args.calls:
+            call = next(calls)
+            arguments = resolve_arguments(call, results)
+            if arguments is None:
+                stats.skipped += 1
+                continue
+
+            start = time.perf_counter()
+            error = None
+            try:
+                result = await sessions[call["server"]].call_tool(call["tool"], arguments)
+                decoded = decode_result(result)
+                if result.isError:
+                    error = "tool_exception"
+                elif isinstance(decoded, dict) and decoded.get("status") == "error":
+                    error = "status_error"
+            except Exception as e:
+                decoded, error = None, type(e).__name__
+            stats.record(call["tool"], time.perf_counter() - start, error)
+            completed += 1
+
+            if error is None:
+                results.setdefault(call["tool"], []).append(decoded)
+            if call.get("consume"):
+                for tool, _ in placeholders(call):
+                    if results.get(tool):
+                        results[tool].pop()
+
+            if args.think_ms:
+                await anyio.sleep(rng.expovariate(1000 / args.think_ms))
+
+async def run_load(args, workload, base_url):
+    servers = sorted({call["server"] for call in workload["calls"]})
+    env = server_environment(base_url)
+    processes, urls = [], {}
+    if args.transport == "http":
+        processes, urls = start_http_servers(servers, env)
+    elif args.transport == "server":
+        processes, urls = start_combined_server(servers, env, args.workers)
+
+    stats = Stats()
+    sampler = ResourceSampler(args.sample_interval)
+    state = {"ready": 0, "go": anyio.Event()}
+    finished = anyio.Event()
+    done = anyio.Event()
+
+    async def drive_sessions():
+        async with anyio.create_task_group() as group:
+            for index in range(args.sessions):
+                group.start_soon(run_session, index, args, workload, servers, env, urls, stats, state)
+        finished.set()
+
+    try:
+        async with anyio.create_task_group() as group:
+            group.start_soon(drive_sessions)
+
+            # Open every session before starting the clock
+            setup_start = time.perf_counter()
+            while state["ready"] < args.sessions:
+                await anyio.sleep(0.05)
+            setup = time.perf_counter() - setup_start
+
+            start = time.perf_counter()
+            group.start_soon(sampler.run, start, done)
+            state["go"].set()
+            await finished.wait()
+            elapsed = time.perf_counter() - start
+            done.set()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    return stats, sampler, setup, elapsed
+
+def print_report(rows, total, resources, setup, elapsed, args):
+    transport = f"{args.transport} ({args.workers} workers)" if args.transport == "server" else args.transport
+    print(f"{args.sessions} {transport} sessions x {args.calls} calls, "
+          f"session setup {setup:.2f} s, run {elapsed:.2f} s")
+    header = f"{'tool':28s} {'calls':>6s} {'errors':>6s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'max ms':>9s} {'calls/s':>9s}"
+    print(header)
+    print("-" * len(header))
+    for row in rows + [total]:
+        print(f"{row['tool']:28s} {row['calls']:6d} {row['errors']:6d} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f} "
+              f"{row['p99_ms']:9.2f} {row['max_ms']:9.2f} {row['throughput']:9.1f}")
+    print(f"\nServer processes: mean CPU {resources['mean_cpu_percent']}%, peak CPU {resources['peak_cpu_percent']}%, "
+          f"peak RSS {resources['peak_rss_mib']} MiB (sampler: {'psutil' if psutil else '/proc'})")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end MCP load generator against a mock Dhan API")
+    parser.add_argument("--transport", choices=["stdio", "http", "server"], default="stdio")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes of http_server.py (--transport server)")
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent MCP client sessions")
+    parser.add_argument("--calls", type=int, default=50, help="Tool calls per session")
+    parser.add_argument("--workload", default=DEFAULT_WORKLOAD, help="Workload JSON file")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause between calls in a session")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Mock API base latency")
+    parser.add_argument("--jitter-ms", type=float, default=1.0, help="Mock API latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock API requests that fail")
+    parser.add_argument("--mock-url", default=None, help="Use an already running mock server instead of starting one")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="Seconds between CPU/RSS samples")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="Write the full report (including the resource timeline) as JSON")
+    args = parser.parse_args()
+
+    workload = load_workload(args.workload)
+    server = None
+    base_url = args.mock_url
+    if base_url is None:
+        settings = MockSettings(args.latency_ms, args.jitter_ms, args.error_rate, seed=args.seed)
+        server, _, base_url = start_mock_server(settings=settings)
+
+    try:
+        stats, sampler, setup, elapsed = anyio.run(run_load, args, workload, base_url)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    rows, total = stats.summary(elapsed)
+    resources = sampler.summary()
+    print_report(rows, total, resources, setup, elapsed, args)
+    if stats.skipped:
+        print(f"{stats.skipped} calls skipped because their placeholder had no result yet")
+
+    if args.output:
+        report = {
+            "transport": args.transport,
+            "workers": args.workers if args.transport == "server" else None,
+            "sessions": args.sessions,
+            "calls_per_session": args.calls,
+            "workload": os.path.basename(args.workload),
+            "session_setup_seconds": round(setup, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "tools": rows,
+            "total": total,
+            "resources": resources,
+            "timeline": sampler.samples,
+            "errors": {tool: dict(errors) for tool, errors in stats.errors.items()}
+        }
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
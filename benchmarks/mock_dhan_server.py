@@ -0,0 +1,189 @@
+# benchmarks/mock_dhan_server.py
+# Local mock of the Dhan REST API for benchmarks and load tests.
+#
+# Requests are answered by a PaperBroker, so orders, trades, positions,
+# holdings, funds, margins and super orders behave consistently across calls.
+# Every response can be delayed by a fixed latency plus random jitter, and a
+# fraction of requests can be failed with upstream-style errors.
+#
+# Usage:
+#   python benchmarks/mock_dhan_server.py --port 8765 --latency-ms 20 --jitter-ms 5 --error-rate 0.01
+#   DHAN_API_BASE_URL=http://127.0.0.1:8765/v2 python order_book_tool.py
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from paper_trading import PaperBroker
+
+# Path prefix of the real API, e.g. https://api.dhan.co/v2
+API_PREFIX = "/v2"
+
+# Status codes returned for injected errors
+INJECTED_ERRORS = [
+    (500, "Internal Server Error"),
+    (502, "Bad Gateway"),
+    (503, "Service Unavailable"),
+    (429, "Too Many Requests")
+]
+
+# Securities seeded into the mock account (HDFCBANK, ADANIENT, TCS, INFY, RELIANCE)
+SEED_PRICES = {"1333": 1650.0, "25": 2450.0, "11536": 3500.0, "1594": 1500.0, "2885": 2900.0}
+SEED_HOLDINGS = [("1333", 50, 1500.0), ("11536", 10, 3300.0), ("2885", 25, 2600.0)]
+
+
+class MockSettings:
+    """
+    Latency, jitter and error injection settings.
+
+    Args:
+        latency_ms: Base latency added to every response
+        jitter_ms: Standard deviation of normally distributed extra latency
+        error_rate: Fraction of requests answered with an injected error
+        endpoint_latency_ms: Optional mapping of path prefix (e.g. "/orders") to base latency
+        seed: Random seed for jitter and error injection
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, endpoint_latency_ms=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.endpoint_latency_ms = endpoint_latency_ms or {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.injected_errors = 0
+
+    def delay_for(self, path):
+        base = self.latency_ms
+        for prefix, latency in self.endpoint_latency_ms.items():
+            if path.startswith(prefix):
+                base = latency
+                break
+        with self._lock:
+            jitter = self._random.gauss(0, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(base + jitter, 0.0) / 1000.0
+
+    def injected_error(self):
+        with self._lock:
+            self.requests += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.injected_errors += 1
+                return self._random.choice(INJECTED_ERRORS)
+        return None
+
+
+def make_handler(broker, settings):
+    class MockDhanHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without TCP_NODELAY
+        # Nagle's algorithm adds ~40 ms per keep-alive response
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _handle(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            path = self.path[len(API_PREFIX):] if self.path.startswith(API_PREFIX) else self.path
+
+            time.sleep(settings.delay_for(path))
+
+            error = settings.injected_error()
+            if error is not None:
+                status, message = error
+                payload = json.dumps({"errorType": "Server_Error", "errorCode": str(status), "errorMessage": message}).encode()
+            else:
+                try:
+                    body = json.loads(raw) if raw else None
+                except ValueError:
+                    body = None
+                response = broker.handle(self.command, path, body)
+                status, payload = response.status_code, response.content
+
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up (e.g. a read timeout) before the delayed response
+                self.close_connection = True
+
+        do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    return MockDhanHandler
+
+def seeded_broker(seed=None):
+    """Paper broker with a few holdings and prices so read endpoints return data"""
+    return PaperBroker(starting_balance=1e12, prices=SEED_PRICES, holdings=SEED_HOLDINGS, seed=seed)
+
+def start_mock_server(host="127.0.0.1", port=0, settings=None, broker=None):
+    """
+    Start the mock server in a background thread.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+        settings: MockSettings (default: no latency, no errors)
+        broker: PaperBroker backing the API (default: a seeded broker)
+
+    Returns:
+        Tuple of (server, broker, base URL to use as DHAN_API_BASE_URL)
+    """
+    settings = settings or MockSettings()
+    broker = broker or seeded_broker()
+    server = ThreadingHTTPServer((host, port), make_handler(broker, settings))
+    server.daemon_threads = True
+    server.settings = settings
+    thread = threading.Thread(target=server.serve_forever, name="mock-dhan-server", daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}{API_PREFIX}"
+    return server, broker, base_url
+
+def parse_endpoint_latency(values):
+    """Parse ["/orders=50", "/holdings=10"] into a mapping"""
+    latencies = {}
+    for value in values or []:
+        prefix, _, latency = value.partition("=")
+        latencies[prefix] = float(latency)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the Dhan REST API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Base latency per response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Standard deviation of extra latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failed with 5xx/429")
+    parser.add_argument("--endpoint-latency", action="append", metavar="PATH=MS",
+                        help="Base latency override for a path prefix, e.g. /orders=50 (repeatable)")
+    parser.add_argument("--tick-interval", type=float, default=1.0,
+                        help="Seconds between synthetic price ticks (0 disables the price stream)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency_ms, args.jitter_ms, args.error_rate,
+                            parse_endpoint_latency(args.endpoint_latency), args.seed)
+    broker = seeded_broker(args.seed)
+    if args.tick_interval > 0:
+        broker.start_price_stream(args.tick_interval)
+
+    server, _, base_url = start_mock_server(args.host, args.port, settings, broker)
+    print(f"Mock Dhan API listening, set DHAN_API_BASE_URL={base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+# benchmarks/run_benchmarks.py
+# Latency, throughput and allocation benchmarks for every MCP tool, run
+# against the local mock Dhan API in mock_dhan_server.py.
+#
+# Usage:
+#   python benchmarks/run_benchmarks.py
+#   python benchmarks/run_benchmarks.py --concurrency 1,8,32 --calls 500 --latency-ms 20 --jitter-ms 5
+#   python benchmarks/run_benchmarks.py --save-baseline main
+#   python benchmarks/run_benchmarks.py --compare main --tolerance 0.2
+import argparse
+import importlib
+import itertools
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+
+# Client-side rate limits switched off for runs against the mock API
+RATE_LIMIT_SETTINGS = [
+    "DHAN_ORDER_RATE_PER_SECOND", "DHAN_ORDER_RATE_PER_MINUTE", "DHAN_DATA_RATE_PER_SECOND",
+    "DHAN_QUOTE_RATE_PER_SECOND", "DHAN_NON_TRADING_RATE_PER_SECOND", "DHAN_OPTION_CHAIN_INTERVAL_SECONDS"
+]
+
+TOOL_MODULES = [
+    "holdings_positions_tool",
+    "fund_balance_tool",
+    "margin_calculator_tool",
+    "order_placement_tool",
+    "after_market_order_tool",
+    "super-order",
+    "order_book_tool",
+    "portfolio_server"
+]
+
+
+class Scenario:
+    """
+    One tool to benchmark.
+
+    Args:
+        name: Name shown in reports and baselines
+        func: Tool function
+        make_kwargs: Callable returning the arguments for call number i;
+            any setup it does is not included in the measured latency
+    """
+
+    def __init__(self, name, func, make_kwargs=None):
+        self.name = name
+        self.func = func
+        self.make_kwargs = make_kwargs or (lambda i: {})
+
+
+def free_port(host):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+def configure_environment(host, port):
+    """
+    Point config.py at the mock server.
+
+    config is read once at import time, so this must run before the mock
+    server or any tool module is imported.
+    """
+    os.environ["DHAN_API_BASE_URL"] = f"http://{host}:{port}/v2"
+    os.environ.setdefault("DHAN_CLIENT_ID", "1000000001")
+    os.environ.setdefault("DHAN_ACCESS_TOKEN", "mock-access-token")
+    os.environ.pop("DHAN_PAPER_TRADING", None)
+    # Keep mock orders out of the real trade journal
+    os.environ.setdefault("DHAN_JOURNAL_PATH", os.path.join(tempfile.gettempdir(), "dhan_benchmark_journal.db"))
+    # The mock API has no rate limits, so measure the tools without client-side pacing
+    for name in RATE_LIMIT_SETTINGS:
+        os.environ.setdefault(name, "0")
+
+def load_tool_modules():
+    return {name: importlib.import_module(name) for name in TOOL_MODULES}
+
+def build_scenarios(modules, broker):
+    """Scenarios for every tool, with server-side setup through the broker"""
+    holdings = modules["holdings_positions_tool"]
+    funds = modules["fund_balance_tool"]
+    margin = modules["margin_calculator_tool"]
+    placement = modules["order_placement_tool"]
+    amo = modules["after_market_order_tool"]
+    super_order = modules["super-order"]
+    order_book = modules["order_book_tool"]
+    portfolio = modules["portfolio_server"]
+
+    def server_order(body):
+        return json.loads(broker.handle("POST", "/orders", body).content)["orderId"]
+
+    # A traded order for status/trade lookups and an intraday position to convert
+    traded_id = server_order({
+        "transactionType": "BUY", "orderType": "MARKET", "productType": "INTRADAY",
+        "securityId": "25", "quantity": 1_000_000
+    })
+
+    def resting_order(i):
+        order_id = server_order({
+            "transactionType": "BUY", "orderType": "LIMIT", "productType": "INTRADAY",
+            "securityId": "1594", "quantity": 1, "price": 1.0
+        })
+        return {"order_id": order_id}
+
+    def resting_super_order(i):
+        response = broker.handle("POST", "/super/orders", {
+            "transactionType": "BUY", "orderType": "LIMIT", "productType": "INTRADAY",
+            "securityId": "1594", "quantity": 1, "price": 1.0,
+            "targetPrice": 2.0, "stopLossPrice": 0.5
+        })
+        return {"order_id": json.loads(response.content)["orderId"], "leg_name": "ENTRY_LEG"}
+
+    return [
+        Scenario("get_holdings", holdings.get_holdings),
+        Scenario("get_positions", holdings.get_positions),
+        Scenario("convert_position", holdings.convert_position, lambda i: {
+            "from_product_type": "INTRADAY", "to_product_type": "CNC", "exchange_segment": "NSE_EQ",
+            "position_type": "LONG", "security_id": "25", "convert_qty": 1
+        }),
+        Scenario("check_fund_balance", funds.check_fund_balance),
+        Scenario("calculate_margin", funds.calculate_margin, lambda i: {
+            "security_id": "11536", "exchange_segment": "NSE_EQ", "transaction_type": "BUY",
+            "quantity": 10, "product_type": "INTRADAY", "price": 3500
+        }),
+        Scenario("calculate_margin_by_stock_name", margin.calculate_margin_by_stock_name, lambda i: {
+            "stock_name": "TCS", "transaction_type": "BUY", "quantity": 10, "price": 3500
+        }),
+        Scenario("place_order", placement.place_order, lambda i: {
+            "stock_name": "INFY", "quantity": 1, "transaction_type": "BUY" if i % 2 else "SELL"
+        }),
+        Scenario("list_available_stocks", placement.list_available_stocks),
+        Scenario("place_after_market_order", amo.place_after_market_order, lambda i: {
+            "stock_name": "INFY", "quantity": 1, "transaction_type": "BUY", "price": 1.0
+        }),
+        Scenario("place_super_order", super_order.place_super_order, lambda i: {
+            "stock_name": "INFY", "quantity": 1, "transaction_type": "BUY", "price": 1.0,
+            "target_type": "percentage", "target_value": 2, "stoploss_type": "percentage", "stoploss_value": 1
+        }),
+        Scenario("list_super_orders", super_order.list_super_orders),
+        Scenario("cancel_super_order", super_order.cancel_super_order, resting_super_order),
+        Scenario("get_order_book", order_book.get_order_book),
+        Scenario("get_order_status", order_book.get_order_status, lambda i: {"order_id": traded_id}),
+        Scenario("get_trade_book", order_book.get_trade_book),
+        Scenario("get_order_trades", order_book.get_order_trades, lambda i: {"order_id": traded_id}),
+        Scenario("cancel_order", order_book.cancel_order, resting_order),
+        Scenario("portfolio_get_holdings", portfolio.get_holdings),
+        Scenario("portfolio_get_positions", portfolio.get_positions)
+    ]
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def is_error(result):
+    return isinstance(result, dict) and result.get("status") == "error"
+
+def measure(scenario, concurrency, calls):
+    """Run `calls` tool calls with `concurrency` threads and summarize latencies"""
+    counter = itertools.count()
+
+    def worker():
+        latencies = []
+        errors = 0
+        while True:
+            i = next(counter)
+            if i >= calls:
+                return latencies, errors
+            kwargs = scenario.make_kwargs(i)
+            start = time.perf_counter()
+            result = scenario.func(**kwargs)
+            latencies.append(time.perf_counter() - start)
+            errors += is_error(result)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = [future.result() for future in [pool.submit(worker) for _ in range(concurrency)]]
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for worker_latencies, _ in outcomes for latency in worker_latencies)
+    return {
+        "tool": scenario.name,
+        "concurrency": concurrency,
+        "calls": len(latencies),
+        "errors": sum(errors for _, errors in outcomes),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "throughput": round(len(latencies) / elapsed, 1)
+    }
+
+def measure_allocations(scenario, calls):
+    """Peak and retained traced memory for a sequential batch of calls"""
+    kwargs = [scenario.make_kwargs(i) for i in range(calls)]
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for arguments in kwargs:
+        scenario.func(**arguments)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "peak_kib": round((peak - before) / 1024, 1),
+        "retained_bytes_per_call": round((after - before) / calls, 1)
+    }
+
+def compare(results, baseline, tolerance):
+    """Return rows whose p95 latency or throughput regressed beyond the tolerance"""
+    previous = {(row["tool"], row["concurrency"]): row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        old = previous.get((row["tool"], row["concurrency"]))
+        if old is None:
+            continue
+        slower = old["p95_ms"] and row["p95_ms"] > old["p95_ms"] * (1 + tolerance)
+        weaker = old["throughput"] and row["throughput"] < old["throughput"] / (1 + tolerance)
+        if slower or weaker:
+            regressions.append((row, old))
+    return regressions
+
+def print_table(results):
+    header = f"{'tool':32s} {'conc':>4s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'calls/s':>10s} {'errors':>6s} {'peak KiB':>9s} {'B/call':>8s}"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        print(
+            f"{row['tool']:32s} {row['concurrency']:4d} {row['p50_ms']:9.3f} {row['p95_ms']:9.3f} "
+            f"{row['p99_ms']:9.3f} {row['throughput']:10.1f} {row['errors']:6d} "
+            f"{row.get('peak_kib', 0):9.1f} {row.get('retained_bytes_per_call', 0):8.1f}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every MCP tool against a local mock Dhan API")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma separated concurrency levels")
+    parser.add_argument("--calls", type=int, default=200, help="Calls per tool and concurrency level")
+    parser.add_argument("--alloc-calls", type=int, default=20, help="Sequential calls traced for allocations")
+    parser.add_argument("--tools", default=None, help="Comma separated subset of tools to run")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface for the mock server")
+    parser.add_argument("--port", type=int, default=0, help="Port for the mock server (default: any free port)")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="Mock base latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.5, help="Mock latency jitter (standard deviation)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock responses that fail")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save-baseline", metavar="NAME", help="Save results to benchmarks/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="Compare with benchmarks/baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression before failing (default: 0.2)")
+    args = parser.parse_args()
+
+    port = args.port or free_port(args.host)
+    configure_environment(args.host, port)
+    from mock_dhan_server import MockSettings, start_mock_server
+
+    settings = MockSettings(args.latency_ms, args.jitter_ms, args.error_rate, seed=args.seed)
+    server, broker, base_url = start_mock_server(args.host, port, settings)
+    modules = load_tool_modules()
+    scenarios = build_scenarios(modules, broker)
+    if args.tools:
+        wanted = set(args.tools.split(","))
+        scenarios = [scenario for scenario in scenarios if scenario.name in wanted]
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    print(f"Mock API at {base_url}: latency {args.latency_ms} ms, jitter {args.jitter_ms} ms, error rate {args.error_rate}")
+
+    results = []
+    for scenario in scenarios:
+        allocations = measure_allocations(scenario, args.alloc_calls)
+        for level in levels:
+            row = measure(scenario, level, args.calls)
+            row.update(allocations)
+            results.append(row)
+    server.shutdown()
+
+    print_table(results)
+
+    metadata = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "settings": {
+            "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate,
+            "calls": args.calls, "concurrency": levels
+        },
+        "python": sys.version.split()[0],
+        "results": results
+    }
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, 'w') as file:
+            json.dump(metadata, file, indent=2)
+        print(f"\nBaseline saved to {path}")
+
+    if args.compare:
+        path = os.path.join(BASELINE_DIR, f"{args.compare}.json")
+        with open(path, 'r') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {path}:")
+            for row, old in regressions:
+                print(
+                    f"  {row['tool']} @ {row['concurrency']}: p95 {old['p95_ms']} -> {row['p95_ms']} ms, "
+                    f"throughput {old['throughput']} -> {row['throughput']} calls/s"
+                )
+            sys.exit(1)
+        print(f"\nNo regressions against {path} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+# codec.py
+# JSON encoding and decoding for Dhan API bodies and tool results.
+#
+# Every body used to be encoded by requests (json=), decoded again by each
+# caller of response.json(), and every tool result encoded a second time by
+# FastMCP with pydantic and indent=2. This module does all of it in one
+# place:
+#
+# - dumps/loads use orjson when it is installed, then pydantic_core (which
+#   comes with mcp), then the standard library
+#   (DHAN_JSON_BACKEND=auto|orjson|pydantic|json)
+# - responses returned by dhan_client are CodecResponse objects, which parse
+#   their body once however many times json() is called
+# - iter_array parses a large array response element by element, so records
+#   can be built without the whole list of dicts existing at once
+# - Raw holds an already encoded fragment that dumps copies into its output
+#   as is; PayloadCache keeps such fragments for payloads that do not change
+#   between calls
+# - encode_result turns a tool's result dict into compact JSON text for
+#   FastMCP, which passes text through unchanged
+import codecs
+import collections
+import datetime
+import functools
+import inspect
+import itertools
+import json
+import re
+import sys
+import threading
+import uuid
+
+import requests
+from config import DHAN_JSON_BACKEND, DHAN_PAYLOAD_CACHE_MB
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pydantic_core
+except ImportError:
+    pydantic_core = None
+
+# Bytes read from a streamed response at a time by iter_array
+STREAM_CHUNK_BYTES = 64 * 1024
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def _fallback(value):
+    """Values JSON has no type for, converted the way FastMCP's fallback does"""
+    # numpy is not imported here: a value can only be a numpy one if a
+    # module that uses numpy already imported it
+    np = sys.modules.get("numpy")
+    if np is not None:
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+def _stdlib_dumps(obj, default):
+    return json.dumps(obj, default=default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def _orjson_dumps(obj, default):
+    return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+def _pydantic_dumps(obj, default):
+    return pydantic_core.to_json(obj, fallback=default)
+
+# name -> (dumps(obj, default) -> bytes, loads(bytes or str)), fastest first
+BACKENDS = {}
+if orjson is not None:
+    BACKENDS["orjson"] = (_orjson_dumps, orjson.loads)
+if pydantic_core is not None:
+    BACKENDS["pydantic"] = (_pydantic_dumps, pydantic_core.from_json)
+BACKENDS["json"] = (_stdlib_dumps, json.loads)
+
+def use_backend(name="auto"):
+    """
+    Select the JSON backend for this process.
+
+    Args:
+        name: "orjson", "pydantic", "json" or "auto" (the fastest installed)
+
+    Raises:
+        ValueError for a backend that is unknown or not installed
+    """
+    global backend, _dumps, _loads
+    if name == "auto":
+        name = next(iter(BACKENDS))
+    if name not in BACKENDS:
+        raise ValueError(f"JSON backend {name!r} is not available. Available: {', '.join(BACKENDS)}")
+    backend = name
+    _dumps, _loads = BACKENDS[name]
+    return name
+
+backend = None
+use_backend(DHAN_JSON_BACKEND)
+
+
+class Raw:
+    """
+    An encoded JSON fragment, copied into the output of dumps() unchanged.
+
+    Attributes:
+        encoded: UTF-8 JSON bytes
+    """
+
+    __slots__ = ("encoded",)
+
+    def __init__(self, encoded):
+        self.encoded = encoded
+
+    def decode(self):
+        """The fragment as Python values"""
+        return loads(self.encoded)
+
+    def __len__(self):
+        return len(self.encoded)
+
+    def __repr__(self):
+        return f"Raw({len(self.encoded)} bytes)"
+
+
+def dumps(obj):
+    """Compact UTF-8 JSON bytes for obj, with Raw fragments spliced in"""
+    fragments = []
+    token = None
+
+    def default(value):
+        nonlocal token
+        if isinstance(value, Raw):
+            if token is None:
+                token = uuid.uuid4().hex
+            fragments.append(value.encoded)
+            return f"{token}:{len(fragments) - 1}"
+        return _fallback(value)
+
+    data = _dumps(obj, default)
+    if not fragments:
+        return data
+    # Each fragment was written as the string "<token>:<index>"; swap the
+    # quoted placeholders for the fragments themselves
+    placeholder = re.compile(b'"' + token.encode("ascii") + rb':(\d+)"')
+    return placeholder.sub(lambda match: fragments[int(match.group(1))], data)
+
+def loads(data):
+    """Parse JSON bytes or text"""
+    return _loads(data)
+
+def encode_result(result):
+    """
+    A tool result as FastMCP should send it: dicts become compact JSON text
+    (FastMCP would otherwise encode them again with indent=2); anything else
+    is returned unchanged.
+    """
+    if isinstance(result, dict):
+        return dumps(result).decode("utf-8")
+    return result
+
+
+def encoded_tool(fn):
+    """The version of a tool function FastMCP calls: its result goes through encode_result"""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            return encode_result(await fn(*args, **kwargs))
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return encode_result(fn(*args, **kwargs))
+    return wrapper
+
+
+_MISSING = object()
+
+class CodecResponse(requests.Response):
+    """requests.Response whose json() parses the body once, with the codec backend"""
+
+    def json(self, **kwargs):
+        """
+        The decoded body. Without arguments the same object is returned on
+        every call, so copy it before changing it.
+        """
+        if kwargs:
+            return super().json(**kwargs)
+        value = self.__dict__.get("_codec_json", _MISSING)
+        if value is _MISSING:
+            try:
+                value = loads(self.content)
+            except ValueError:
+                # Let requests decode what the backend rejects, or raise its usual error
+                value = super().json()
+            self._codec_json = value
+        return value
+
+def adopt(response):
+    """Make a requests.Response a CodecResponse (in place) and return it"""
+    if response is not None and type(response) is requests.Response:
+        response.__class__ = CodecResponse
+    return response
+
+def body_length(response):
+    """
+    Size of a response body without reading a streamed body just to count it
+    (Content-Length is used until the body has been read)
+    """
+    if response._content is False:
+        try:
+            return int(response.headers.get("Content-Length") or 0)
+        except ValueError:
+            return 0
+    return len(response.content or b"")
+
+
+_scan = json.JSONDecoder().raw_decode
+
+def iter_array(source, chunk_size=STREAM_CHUNK_BYTES):
+    """
+    Parse a JSON array incrementally, yielding one element at a time.
+
+    A body that is not an array (e.g. a single object) is yielded as one
+    element; an empty body or null yields nothing.
+
+    Args:
+        source: requests.Response (ideally sent with stream=True), bytes or str
+
+    Raises:
+        requests.exceptions.JSONDecodeError (a ValueError and a
+        RequestException) if the body is not valid JSON
+    """
+    if isinstance(source, (bytes, str)):
+        chunks = [source]
+    elif source._content is not False or 0 < body_length(source) <= chunk_size:
+        # Already read, or small enough that parsing it whole is cheaper
+        try:
+            value = loads(source.content) if source.content else None
+        except ValueError as e:
+            raise requests.exceptions.JSONDecodeError(str(e), "", 0)
+        if isinstance(value, list):
+            yield from value
+        elif value is not None:
+            yield value
+        return
+    else:
+        chunks = source.iter_content(chunk_size)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer, position = "", 0
+    state = "start"  # start, first (after '['), value (after ','), next (after a value), single, done
+    for chunk in itertools.chain(chunks, [None]):
+        final = chunk is None
+        if final:
+            text = decoder.decode(b"", True)
+        else:
+            text = chunk if isinstance(chunk, str) else decoder.decode(chunk)
+        buffer = buffer[position:] + text
+        position = 0
+        while state not in ("single", "done"):
+            position = WHITESPACE.match(buffer, position).end()
+            if position >= len(buffer):
+                break
+            char = buffer[position]
+            if state == "start":
+                if char == "[":
+                    position += 1
+                    state = "first"
+                else:
+                    state = "single"
+                continue
+            if state in ("first", "next") and char == "]":
+                position += 1
+                state = "done"
+                break
+            if state == "next":
+                if char != ",":
+                    raise requests.exceptions.JSONDecodeError("Expecting ',' delimiter", buffer, position)
+                position += 1
+                state = "value"
+                continue
+            try:
+                value, end = _scan(buffer, position)
+            except json.JSONDecodeError as e:
+                if final:
+                    raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos)
+                break
+            if end == len(buffer) and not final:
+                # A number at the end of the chunk may continue in the next one
+                break
+            yield value
+            position = end
+            state = "next"
+    if state == "single":
+        try:
+            value = loads(buffer[position:])
+        except ValueError as e:
+            raise requests.exceptions.JSONDecodeError(str(e), buffer, position)
+        if value is not None:
+            yield value
+    elif state not in ("start", "done"):
+        raise requests.exceptions.JSONDecodeError("Unterminated array", buffer, len(buffer))
+
+
+class PayloadCache:
+    """
+    Encoded payloads kept for reuse, least recently used evicted first.
+
+    Key entries by everything the payload depends on (e.g. a data version),
+    so a changed payload gets a new key instead of being served stale.
+
+    Args:
+        max_bytes: Total encoded size kept
+    """
+
+    def __init__(self, max_bytes=DHAN_PAYLOAD_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_encode(self, key, build):
+        """
+        The cached Raw fragment for key, or encode build() and keep it.
+
+        Args:
+            key: Hashable key
+            build: Called without arguments to produce the payload on a miss
+        """
+        with self._lock:
+            raw = self._entries.get(key)
+            if raw is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return raw
+            self.misses += 1
+        raw = Raw(dumps(build()))
+        if len(raw) > self.max_bytes:
+            return raw
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = raw
+            self.size += len(raw)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+        return raw
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
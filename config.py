@@ -1,11 +1,104 @@
 # config.py
 # Add your DhanHQ credentials here
+import os
 
-# Your DhanHQ client ID
-DHAN_CLIENT_ID = " "
+# Your DhanHQ client ID (or set DHAN_CLIENT_ID)
+DHAN_CLIENT_ID = os.environ.get("DHAN_CLIENT_ID", " ")
 
-# Your DhanHQ access token
-DHAN_ACCESS_TOKEN = " "
+# Your DhanHQ access token (or set DHAN_ACCESS_TOKEN)
+DHAN_ACCESS_TOKEN = os.environ.get("DHAN_ACCESS_TOKEN", " ")
 
-# API Base URL
-DHAN_API_BASE_URL = "https://api.dhan.co/v2"
+# API Base URL (override with DHAN_API_BASE_URL, e.g. to point at a mock server)
+DHAN_API_BASE_URL = os.environ.get("DHAN_API_BASE_URL", "https://api.dhan.co/v2")
+
+# Maximum pooled HTTP connections kept open to the API host
+DHAN_HTTP_POOL_SIZE = int(os.environ.get("DHAN_HTTP_POOL_SIZE", "32"))
+
+# Timeouts for Dhan API calls in seconds: (connect, read) per attempt, and
+# the overall deadline of a call including retries
+DHAN_HTTP_TIMEOUT = (float(os.environ.get("DHAN_HTTP_CONNECT_TIMEOUT", "3.05")), float(os.environ.get("DHAN_HTTP_READ_TIMEOUT", "10")))
+DHAN_HTTP_DEADLINE = float(os.environ.get("DHAN_HTTP_DEADLINE", "20"))
+
+# Order placement uses tighter limits; timed out orders are resolved by
+# correlation ID (see order_idempotency.py) rather than sent again
+DHAN_ORDER_TIMEOUT = (float(os.environ.get("DHAN_ORDER_CONNECT_TIMEOUT", "2")), float(os.environ.get("DHAN_ORDER_READ_TIMEOUT", "3")))
+DHAN_ORDER_DEADLINE = float(os.environ.get("DHAN_ORDER_DEADLINE", "5"))
+
+# Retries of idempotent (GET) calls and the base of their exponential backoff
+DHAN_HTTP_MAX_RETRIES = int(os.environ.get("DHAN_HTTP_MAX_RETRIES", "3"))
+DHAN_HTTP_BACKOFF_SECONDS = float(os.environ.get("DHAN_HTTP_BACKOFF_SECONDS", "0.2"))
+
+# Circuit breaker: consecutive failures before an endpoint fails fast, and
+# seconds before a trial call is let through again
+DHAN_BREAKER_FAILURE_THRESHOLD = int(os.environ.get("DHAN_BREAKER_FAILURE_THRESHOLD", "5"))
+DHAN_BREAKER_RESET_SECONDS = float(os.environ.get("DHAN_BREAKER_RESET_SECONDS", "30"))
+
+# Port for the HTTP metrics endpoint of tool_metrics.py (unset to disable)
+DHAN_METRICS_PORT = int(os.environ.get("DHAN_METRICS_PORT") or 0)
+
+# Directory for collapsed-stack profiles written by tool_profiler.py
+DHAN_PROFILE_DIR = os.environ.get("DHAN_PROFILE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+
+# Paper trading: set DHAN_PAPER_TRADING=1 to send every tool call to the
+# in-memory matching engine in paper_trading.py instead of the Dhan API
+DHAN_PAPER_TRADING = os.environ.get("DHAN_PAPER_TRADING", "").lower() in ("1", "true", "yes")
+
+# Starting fund balance of the paper trading account
+DHAN_PAPER_STARTING_BALANCE = float(os.environ.get("DHAN_PAPER_STARTING_BALANCE", "1000000"))
+
+# Local trade journal (trade_journal.py): every order, trade and position
+# conversion seen through dhan_client is written to this SQLite file
+DHAN_JOURNAL_ENABLED = os.environ.get("DHAN_JOURNAL_ENABLED", "1").lower() in ("1", "true", "yes")
+DHAN_JOURNAL_PATH = os.environ.get("DHAN_JOURNAL_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cache", "trade_journal.db")
+
+# Client-side rate limits per Dhan API category (requests per second or
+# minute, 0 to disable); calls wait for a slot instead of getting a 429
+DHAN_ORDER_RATE_PER_SECOND = float(os.environ.get("DHAN_ORDER_RATE_PER_SECOND", "10"))
+DHAN_ORDER_RATE_PER_MINUTE = float(os.environ.get("DHAN_ORDER_RATE_PER_MINUTE", "250"))
+DHAN_DATA_RATE_PER_SECOND = float(os.environ.get("DHAN_DATA_RATE_PER_SECOND", "5"))
+DHAN_QUOTE_RATE_PER_SECOND = float(os.environ.get("DHAN_QUOTE_RATE_PER_SECOND", "1"))
+DHAN_NON_TRADING_RATE_PER_SECOND = float(os.environ.get("DHAN_NON_TRADING_RATE_PER_SECOND", "20"))
+
+# Seconds between option chain requests (Dhan allows one every 3; 0 to disable)
+DHAN_OPTION_CHAIN_INTERVAL_SECONDS = float(os.environ.get("DHAN_OPTION_CHAIN_INTERVAL_SECONDS", "3"))
+
+# Additional client accounts (see accounts.py); the account above is "default"
+DHAN_ACCOUNTS_FILE = os.environ.get("DHAN_ACCOUNTS_FILE") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "accounts.json")
+
+# SQLite file for rate limits and order ledger records shared between
+# processes (set by http_server.py for its workers; unset keeps them in memory)
+DHAN_SHARED_STORE = os.environ.get("DHAN_SHARED_STORE") or None
+
+# Host headers accepted by http_server.py besides localhost, e.g.
+# "mcp.internal:*,10.0.0.5:8000" (DNS rebinding protection)
+DHAN_HTTP_ALLOWED_HOSTS = [host.strip() for host in os.environ.get("DHAN_HTTP_ALLOWED_HOSTS", "").split(",") if host.strip()]
+
+# JSON backend of codec.py: orjson, pydantic or json; "auto" picks the fastest installed
+DHAN_JSON_BACKEND = os.environ.get("DHAN_JSON_BACKEND", "auto").lower()
+
+# Memory for encoded tool payloads kept for reuse (codec.PayloadCache), in MiB
+DHAN_PAYLOAD_CACHE_MB = float(os.environ.get("DHAN_PAYLOAD_CACHE_MB", "32"))
+
+# Option chains (option_chain_tool.py): seconds a fetched chain is reused, and
+# a directory of saved chain responses (<UNDERLYING>_<YYYY-MM-DD>.json) to
+# read instead of calling the API
+DHAN_OPTION_CHAIN_TTL_SECONDS = float(os.environ.get("DHAN_OPTION_CHAIN_TTL_SECONDS", "3"))
+DHAN_OPTION_CHAIN_FIXTURES = os.environ.get("DHAN_OPTION_CHAIN_FIXTURES") or None
+
+# Annual risk-free rate (continuously compounded) for implied volatility and Greeks
+DHAN_RISK_FREE_RATE = float(os.environ.get("DHAN_RISK_FREE_RATE", "0.065"))
+
+# Local copy of Dhan's instrument master (instrument_master.py), downloaded
+# again when older than this many hours (0: never download, use the file as is)
+DHAN_SCRIP_MASTER_PATH = os.environ.get("DHAN_SCRIP_MASTER_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cache", "api-scrip-master.csv")
+DHAN_SCRIP_MASTER_MAX_AGE_HOURS = float(os.environ.get("DHAN_SCRIP_MASTER_MAX_AGE_HOURS", "24"))
+
+# Prebuilt indexes of stocks.json and the instrument master (reference_cache.py),
+# rebuilt whenever their source file changes
+DHAN_REFERENCE_CACHE_DIR = os.environ.get("DHAN_REFERENCE_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cache", "reference")
+
+# Execution scheduler (execution_scheduler.py): largest quantity of one child
+# order (the exchange freeze quantity; 0: no limit), and seconds between
+# order book polls for child fills
+DHAN_FREEZE_QUANTITY = int(os.environ.get("DHAN_FREEZE_QUANTITY", "0"))
+DHAN_EXECUTION_POLL_SECONDS = float(os.environ.get("DHAN_EXECUTION_POLL_SECONDS", "2"))
@@ -0,0 +1,498 @@
+# dhan_client.py
+# Single HTTP entry point for every Dhan API call made by the tools.
+#
+# Tools call dhan_client.get/post/put/delete with the same arguments they
+# would pass to requests. Calls go through a pooled requests.Session, or to
+# the in-memory paper trading broker when paper trading is enabled.
+#
+# Network calls get a timeout and an overall deadline, GET requests are
+# retried with jittered exponential backoff on connection errors, timeouts
+# and 429/5xx responses, and each endpoint has a circuit breaker that fails
+# fast with CircuitOpenError after repeated failures. Order placement and
+# other non-GET calls are only retried when the connection was never
+# established, so an order is never sent twice. Every network attempt first
+# takes a slot from the client's rate limiter (see rate_limiter.py). JSON
+# bodies are encoded and responses decoded through codec.py.
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    DHAN_API_BASE_URL, DHAN_BREAKER_FAILURE_THRESHOLD, DHAN_BREAKER_RESET_SECONDS, DHAN_HTTP_BACKOFF_SECONDS,
+    DHAN_HTTP_DEADLINE, DHAN_HTTP_MAX_RETRIES, DHAN_HTTP_POOL_SIZE, DHAN_HTTP_TIMEOUT, DHAN_JOURNAL_ENABLED,
+    DHAN_PAPER_TRADING
+)
+import codec
+from rate_limiter import RateLimiter, RateLimitTimeout
+
+# Methods that are safe to send again after a failure
+RETRY_METHODS = {"GET"}
+
+# Responses worth retrying; 5xx responses also count as breaker failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Errors on the way to or from the API; other RequestExceptions (an invalid
+# header or URL) are local mistakes that are raised at once, not retried and
+# not counted against the endpoint
+NETWORK_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                  requests.exceptions.ChunkedEncodingError)
+
+# Longest single backoff sleep
+MAX_BACKOFF_SECONDS = 5.0
+
+# Path segments containing digits are IDs, e.g. /orders/112111182198 -> /orders/{id}
+ID_SEGMENT = re.compile(r"[^/]*\d[^/]*")
+
+
+def endpoint_name(method, url):
+    """Group URLs by endpoint, e.g. ("GET", ".../v2/orders/123") -> "GET /orders/{id}" """
+    path = urlsplit(url).path
+    if path.startswith("/v2/"):
+        path = path[3:]
+    return f"{method.upper()} {ID_SEGMENT.sub('{id}', path)}"
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without calling the API while an endpoint's circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one endpoint.
+
+    After `failure_threshold` failures in a row the breaker opens and calls
+    fail immediately. Once `reset_seconds` have passed a single trial call is
+    let through (half open): success closes the breaker, failure opens it again.
+    A trial that ends without reaching the API hands its slot back (release).
+    """
+
+    def __init__(self, failure_threshold=DHAN_BREAKER_FAILURE_THRESHOLD, reset_seconds=DHAN_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def release(self):
+        """Let another call be the half open trial (the trial was never sent)"""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+
+    def retry_after(self):
+        """Seconds until a trial call will be allowed"""
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(self.reset_seconds - (time.monotonic() - self.opened_at), 0.0)
+
+
+class EndpointHealth:
+    """Breaker and retry counters of one endpoint"""
+
+    def __init__(self, breaker):
+        self.breaker = breaker
+        self.retries = 0
+        self.short_circuits = 0
+
+    def snapshot(self):
+        return {
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "times_opened": self.breaker.times_opened,
+            "retries": self.retries,
+            "short_circuits": self.short_circuits
+        }
+
+
+# Per-thread list of retried or short-circuited calls made during a tool call
+_call_reports = threading.local()
+
+def start_call_report():
+    """Start collecting upstream call reports on this thread; returns the previous collector"""
+    previous = getattr(_call_reports, "calls", None)
+    _call_reports.calls = []
+    return previous
+
+def finish_call_report(previous=None):
+    """Stop collecting and return the reports gathered since start_call_report()"""
+    calls = getattr(_call_reports, "calls", None) or []
+    _call_reports.calls = previous
+    return calls
+
+def _report_call(entry):
+    calls = getattr(_call_reports, "calls", None)
+    if calls is not None:
+        calls.append(entry)
+
+
+class DhanClient:
+    """
+    HTTP client for the Dhan API.
+
+    Args:
+        base_url: API base URL; only URLs under it are sent to the paper broker
+        paper_broker: Backend with a handle(method, path, body) method returning
+            a requests.Response; when set, no network calls are made
+        timeout: Default requests timeout, seconds or (connect, read)
+        deadline: Default overall seconds for a call including retries
+        max_retries: Retries after the first attempt
+        backoff: Base of the exponential backoff in seconds
+        rate_limiter: RateLimiter for this client's account (default: a new
+            one with the limits from config.py)
+    """
+
+    def __init__(self, base_url=DHAN_API_BASE_URL, paper_broker=None, timeout=DHAN_HTTP_TIMEOUT,
+                 deadline=DHAN_HTTP_DEADLINE, max_retries=DHAN_HTTP_MAX_RETRIES, backoff=DHAN_HTTP_BACKOFF_SECONDS,
+                 rate_limiter=None):
+        self.base_url = base_url.rstrip("/")
+        self.paper_broker = paper_broker
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._health = {}
+        self._health_lock = threading.Lock()
+        self._random = random.Random()
+        self.listeners = []
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+
+    @property
+    def session(self):
+        """Lazily created pooled session"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    # Keep enough connections for concurrent tool calls
+                    adapter = HTTPAdapter(pool_maxsize=DHAN_HTTP_POOL_SIZE)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def add_listener(self, listener):
+        """
+        Call a function after every request.
+
+        The listener is called as listener(method, url, kwargs, response,
+        elapsed, error) where response is None and error is the exception
+        when the request raised. Listeners run on the calling thread and
+        should return quickly.
+        """
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request to the Dhan API.
+
+        Args:
+            method: HTTP method
+            url: Full URL, normally built from DHAN_API_BASE_URL
+            **kwargs: Passed to requests (headers, json, params, timeout,
+                stream, ...); deadline overrides the overall time budget of
+                this call, and expected_statuses lists error statuses that
+                are an answer rather than a failure (returned at once, not
+                retried and not counted by the circuit breaker)
+
+        Returns:
+            codec.CodecResponse (a requests.Response decoding its body once)
+        """
+        if not self.listeners and not client_listeners:
+            return self._send(method, url, kwargs)
+
+        start = time.perf_counter()
+        try:
+            response = self._send(method, url, kwargs)
+        except Exception as e:
+            self._notify(method, url, kwargs, None, time.perf_counter() - start, e)
+            raise
+        self._notify(method, url, kwargs, response, time.perf_counter() - start, None)
+        return response
+
+    def _send(self, method, url, kwargs):
+        if self.paper_broker is not None and url.startswith(self.base_url):
+            path = url[len(self.base_url):]
+            return codec.adopt(self.paper_broker.handle(method.upper(), path, kwargs.get("json")))
+        return codec.adopt(self._send_resilient(method.upper(), url, kwargs))
+
+    def health(self, endpoint):
+        health = self._health.get(endpoint)
+        if health is None:
+            with self._health_lock:
+                health = self._health.setdefault(endpoint, EndpointHealth(CircuitBreaker()))
+        return health
+
+    def health_snapshot(self):
+        """Breaker state and retry counters per endpoint"""
+        with self._health_lock:
+            items = sorted(self._health.items())
+        return {endpoint: health.snapshot() for endpoint, health in items}
+
+    def _attempt_timeout(self, timeout, remaining):
+        remaining = max(remaining, 0.001)
+        if isinstance(timeout, tuple):
+            return tuple(min(part, remaining) if part is not None else remaining for part in timeout)
+        return min(timeout, remaining) if timeout is not None else remaining
+
+    def _backoff_delay(self, attempt, response):
+        """Full-jitter exponential backoff, honouring Retry-After when given"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(float(retry_after), MAX_BACKOFF_SECONDS)
+                except ValueError:
+                    pass
+        return self._random.uniform(0, min(self.backoff * 2 ** attempt, MAX_BACKOFF_SECONDS))
+
+    def _send_resilient(self, method, url, kwargs):
+        endpoint = endpoint_name(method, url)
+        health = self.health(endpoint)
+        breaker = health.breaker
+        if not breaker.allow():
+            health.short_circuits += 1
+            _report_call({"endpoint": endpoint, "attempts": 0, "breaker": breaker.state})
+            raise CircuitOpenError(
+                f"Circuit breaker open for {endpoint} after repeated failures; "
+                f"retrying in {breaker.retry_after():.0f} seconds"
+            )
+
+        kwargs = dict(kwargs)
+        if kwargs.get("json") is not None:
+            # Encode with the codec backend; listeners still see the json argument
+            kwargs["data"] = codec.dumps(kwargs.pop("json"))
+            headers = dict(kwargs.get("headers") or {})
+            if not any(name.lower() == "content-type" for name in headers):
+                headers["Content-Type"] = "application/json"
+            kwargs["headers"] = headers
+        deadline = time.monotonic() + kwargs.pop("deadline", self.deadline)
+        expected_statuses = kwargs.pop("expected_statuses", ())
+        timeout = kwargs.pop("timeout", self.timeout)
+        idempotent = method in RETRY_METHODS
+        path = endpoint.split(" ", 1)[1]
+        try:
+            self.rate_limiter.acquire(method, path, timeout=deadline - time.monotonic())
+        except BaseException:
+            breaker.release()
+            raise
+        attempt = 0
+        while True:
+            response = error = None
+            try:
+                response = self.session.request(
+                    method, url, timeout=self._attempt_timeout(timeout, deadline - time.monotonic()), **kwargs
+                )
+            except NETWORK_ERRORS as e:
+                error = e
+            except BaseException:
+                breaker.release()
+                raise
+
+            if error is None and response.status_code in expected_statuses:
+                # Says nothing about the endpoint's health either way
+                breaker.release()
+                break
+            if error is None and response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                break
+            if error is not None or response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                # 429: the API is up, only throttling this client
+                breaker.record_success()
+
+            # A connect timeout means nothing reached the server, so even an order can be resent
+            retryable = idempotent or isinstance(error, requests.exceptions.ConnectTimeout)
+            delay = self._backoff_delay(attempt, response)
+            if (not retryable or attempt >= self.max_retries or breaker.state != "closed"
+                    or time.monotonic() + delay >= deadline):
+                break
+            time.sleep(delay)
+            try:
+                self.rate_limiter.acquire(method, path, timeout=deadline - time.monotonic())
+            except RateLimitTimeout:
+                break
+            attempt += 1
+            health.retries += 1
+
+        if attempt or breaker.state != "closed":
+            _report_call({"endpoint": endpoint, "attempts": attempt + 1, "breaker": breaker.state})
+        if error is not None:
+            raise error
+        return response
+
+    def warm_up(self, connections=4, timeout=5.0):
+        """
+        Open pooled connections to the API host ahead of a burst of calls.
+
+        Connections are established (TCP and TLS) and returned to the pool
+        without sending a request, so they count against no rate limit.
+
+        Args:
+            connections: Connections to open, at most the pool size
+            timeout: Connect timeout per connection in seconds
+
+        Returns:
+            Number of connections opened
+        """
+        if self.paper_broker is not None:
+            return 0
+        adapter = self.session.get_adapter(self.base_url)
+        request = requests.Request("GET", self.base_url).prepare()
+        if hasattr(adapter, "get_connection_with_tls_context"):
+            pool = adapter.get_connection_with_tls_context(request, verify=True)
+        else:
+            pool = adapter.get_connection(self.base_url)
+
+        # Take all connections out first so each one is a new socket
+        conns = [pool._get_conn() for _ in range(max(1, min(connections, DHAN_HTTP_POOL_SIZE)))]
+
+        def connect(conn):
+            try:
+                if conn.sock is None:
+                    conn.timeout = timeout
+                    conn.connect()
+                return True
+            except Exception:
+                return False
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(conns)) as executor:
+                return sum(executor.map(connect, conns))
+        finally:
+            for conn in conns:
+                pool._put_conn(conn)
+
+    def _notify(self, method, url, kwargs, response, elapsed, error):
+        for listener in self.listeners + client_listeners:
+            try:
+                listener(method.upper(), url, kwargs, response, elapsed, error)
+            except Exception as e:
+                print(f"Error in Dhan client listener: {e}", file=sys.stderr)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+
+# Listeners called after requests of every client (the default client and
+# per-account clients alike); see add_client_listener
+client_listeners = []
+
+# Client used by the module level helpers
+default_client = DhanClient()
+
+def use_paper_trading(broker=None):
+    """
+    Route all calls made through this module to a paper trading broker.
+
+    Args:
+        broker: PaperBroker instance (default: a new broker with a synthetic price stream)
+
+    Returns:
+        The broker in use
+    """
+    if broker is None:
+        from paper_trading import PaperBroker
+        broker = PaperBroker()
+        broker.start_price_stream()
+    default_client.paper_broker = broker
+    return broker
+
+def use_live_trading():
+    """Send calls to the real Dhan API again"""
+    default_client.paper_broker = None
+
+def health_snapshot():
+    """Breaker state and retry counters of the default client"""
+    return default_client.health_snapshot()
+
+def rate_limit_snapshot():
+    """Rate limiter counters of the default client per API category"""
+    return default_client.rate_limiter.snapshot()
+
+def warm_up(connections=4, timeout=5.0):
+    """Open pooled connections of the default client (see DhanClient.warm_up)"""
+    return default_client.warm_up(connections, timeout)
+
+def add_listener(listener):
+    """Register a request listener on the default client (see DhanClient.add_listener)"""
+    default_client.add_listener(listener)
+
+def remove_listener(listener):
+    default_client.remove_listener(listener)
+
+def add_client_listener(listener):
+    """Register a request listener on every client, including per-account clients created later"""
+    if listener not in client_listeners:
+        client_listeners.append(listener)
+
+def remove_client_listener(listener):
+    if listener in client_listeners:
+        client_listeners.remove(listener)
+
+def get(url, **kwargs):
+    return default_client.get(url, **kwargs)
+
+def post(url, **kwargs):
+    return default_client.post(url, **kwargs)
+
+def put(url, **kwargs):
+    return default_client.put(url, **kwargs)
+
+def delete(url, **kwargs):
+    return default_client.delete(url, **kwargs)
+
+
+if DHAN_PAPER_TRADING:
+    use_paper_trading()
+
+if DHAN_JOURNAL_ENABLED:
+    from trade_journal import journal
+    add_listener(journal.record_response)
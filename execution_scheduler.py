@@ -0,0 +1,526 @@
+# execution_scheduler.py
+# TWAP and VWAP execution of large orders as a schedule of child orders.
+#
+# A parent order is split over a time window into slices. Each slice has a
+# cumulative target: an equal share of the quantity per slice (TWAP), or a
+# share that follows the intraday volume profile (VWAP). When a slice is
+# due, the child quantity is the target minus what has filled or is still
+# working. Rejected or partly filled children are therefore made up by the
+# next slices, and slices never send more than the target. Child quantity
+# is limited to:
+#
+# - whole lots
+# - the freeze quantity, with larger slices sent as several children
+# - optionally, a share of the volume expected in the slice ("exposure":
+#   max_participation of the average daily volume in the candle cache,
+#   spread by the intraday profile)
+#
+# The last slice sends whatever is left. Children are MARKET orders placed
+# through submit_order, so the rate limiter and the idempotency ledger apply.
+#
+# All parents run as tasks of one asyncio event loop in a background thread.
+# A single poller fetches the order book for all of them and updates child
+# fills, so polling cost does not grow with the number of parents. Parents
+# live in memory in the process that scheduled them.
+import asyncio
+import datetime
+import itertools
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from config import (
+    DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL, DHAN_CLIENT_ID, DHAN_EXECUTION_POLL_SECONDS, DHAN_FREEZE_QUANTITY
+)
+import dhan_client
+from order_idempotency import lookup_order, submit_order
+
+STRATEGIES = ["TWAP", "VWAP"]
+
+IST_OFFSET = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+# NSE cash session and the share of a day's volume in each 15-minute bucket
+# from the open (a typical U-shaped profile: busy open and close, quiet
+# middle of the day)
+SESSION_OPEN = datetime.time(9, 15)
+BUCKET_MINUTES = 15
+INTRADAY_VOLUME_PROFILE = np.array([
+    9.0, 6.0, 5.0, 4.4, 4.0, 3.7, 3.4, 3.2, 3.0, 2.9, 2.8, 2.7, 2.7,
+    2.7, 2.8, 2.9, 3.0, 3.2, 3.4, 3.6, 3.9, 4.3, 4.9, 6.0, 8.0
+])
+INTRADAY_VOLUME_PROFILE = INTRADAY_VOLUME_PROFILE / INTRADAY_VOLUME_PROFILE.sum()
+
+# Trading days averaged for the expected daily volume
+ADV_DAYS = 20
+
+# Slices are at least this far apart, and a schedule has at most this many
+MIN_SLICE_SECONDS = 2.0
+MAX_SLICES = 500
+
+# Children sent at the same time across all parents
+SUBMIT_CONCURRENCY = 8
+
+# Order statuses after which a child gets no more fills. NOT_FOUND is a
+# child whose submission could not be confirmed, that the order book did not
+# show in UNKNOWN_POLLS polls and that a lookup by correlation ID did not
+# find; later polls still match it in case the order book was lagging
+CLOSED_STATUSES = ("TRADED", "CANCELLED", "REJECTED", "EXPIRED", "NOT_FOUND")
+UNKNOWN_POLLS = 3
+
+# Finished parents kept for get_execution_progress
+FINISHED_HISTORY = 200
+
+
+def new_parent_id():
+    return f"exe{uuid.uuid4().hex[:12]}"
+
+def slice_profile(starts, interval):
+    """
+    Share of a day's volume expected in each slice [start, start + interval),
+    from the intraday profile (0 outside the session).
+
+    Args:
+        starts: Slice start times, epoch seconds
+        interval: Slice length in seconds
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    # Minutes after the open (IST) at the middle of each slice
+    first = datetime.datetime.fromtimestamp(float(starts[0]), IST_OFFSET)
+    open_time = datetime.datetime.combine(first.date(), SESSION_OPEN, IST_OFFSET).timestamp()
+    minutes = (starts + interval / 2 - open_time) / 60.0
+    bucket = np.floor(minutes / BUCKET_MINUTES).astype(np.int64)
+    inside = (bucket >= 0) & (bucket < len(INTRADAY_VOLUME_PROFILE))
+    share = np.zeros(len(starts))
+    share[inside] = INTRADAY_VOLUME_PROFILE[bucket[inside]] * (interval / 60.0) / BUCKET_MINUTES
+    return share
+
+def schedule_targets(strategy, quantity, starts, interval, lot_size=1):
+    """
+    Cumulative quantity due by each slice, in whole lots; the last is the
+    whole quantity.
+
+    VWAP follows the intraday profile; slices outside the session (or a
+    schedule entirely outside it) fall back to equal shares.
+    """
+    slices = len(starts)
+    weights = np.ones(slices)
+    if strategy == "VWAP":
+        share = slice_profile(starts, interval)
+        if share.sum() > 0:
+            weights = share
+    cumulative = np.cumsum(weights) / weights.sum()
+    targets = np.floor(cumulative * (quantity // lot_size)).astype(np.int64) * lot_size
+    targets[-1] = quantity
+    return targets
+
+def average_daily_volume(security_id, days=ADV_DAYS):
+    """Mean volume of the last `days` cached daily candles, or None if nothing is cached"""
+    from historical_data_tool import candle_cache
+    today = datetime.date.today()
+    candles = candle_cache.get_cached(security_id, today - datetime.timedelta(days=days * 2), today)
+    volume = candles["volume"][-days:]
+    return float(volume.mean()) if len(volume) else None
+
+def split_child(quantity, freeze_quantity, lot_size=1):
+    """Child quantities of one slice, none above the freeze quantity (in whole lots)"""
+    if freeze_quantity <= 0:
+        return [quantity] if quantity > 0 else []
+    largest = max(freeze_quantity // lot_size, 1) * lot_size
+    full, rest = divmod(quantity, largest)
+    return [largest] * full + ([rest] if rest else [])
+
+
+class ParentOrder:
+    """A parent order, its schedule and its child orders"""
+
+    def __init__(self, parent_id, stock_name, security_id, transaction_type, quantity, strategy, starts,
+                 targets, caps=None, product_type="INTRADAY", lot_size=1, freeze_quantity=0,
+                 max_participation=None, adv=None):
+        self.parent_id = parent_id
+        self.stock_name = stock_name
+        self.security_id = str(security_id)
+        self.transaction_type = transaction_type
+        self.quantity = quantity
+        self.strategy = strategy
+        self.starts = [float(start) for start in starts]
+        self.targets = [int(target) for target in targets]
+        self.caps = caps
+        self.product_type = product_type
+        self.lot_size = lot_size
+        self.freeze_quantity = freeze_quantity
+        self.max_participation = max_participation
+        self.adv = adv
+        self.status = "scheduled"
+        self.message = ""
+        self.next_slice = 0
+        self.children = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self._numbers = itertools.count(1)
+        self._wake = None
+
+    def filled(self):
+        return sum(child["filled"] for child in self.children)
+
+    def working(self):
+        """Quantity of children that may still fill (unconfirmed children count in full)"""
+        return sum(child["quantity"] - child["filled"] for child in self.children
+                   if child["status"] not in CLOSED_STATUSES)
+
+    def correlation_id(self):
+        return f"{self.parent_id}{next(self._numbers):03d}"
+
+    def to_dict(self, include_children=False):
+        filled = self.filled()
+        value = sum(child["filled"] * child["average_price"] for child in self.children)
+        slices = len(self.starts)
+        due_index = min(self.next_slice, slices) - 1
+        result = {
+            "parent_id": self.parent_id,
+            "stock_name": self.stock_name,
+            "security_id": self.security_id,
+            "transaction_type": self.transaction_type,
+            "strategy": self.strategy,
+            "status": self.status,
+            "quantity": self.quantity,
+            "filled": filled,
+            "working": self.working(),
+            "remaining": self.quantity - filled,
+            "percent_filled": round(100.0 * filled / self.quantity, 2),
+            "average_price": round(value / filled, 2) if filled else None,
+            "scheduled_by_now": self.targets[due_index] if due_index >= 0 else 0,
+            "slices_sent": min(self.next_slice, slices),
+            "slices": slices,
+            "start": datetime.datetime.fromtimestamp(self.starts[0], IST_OFFSET).strftime("%Y-%m-%d %H:%M:%S"),
+            "end": datetime.datetime.fromtimestamp(self.starts[-1], IST_OFFSET).strftime("%Y-%m-%d %H:%M:%S"),
+            "next_slice_at": (datetime.datetime.fromtimestamp(self.starts[self.next_slice], IST_OFFSET)
+                              .strftime("%H:%M:%S") if self.next_slice < slices and self.status == "running" else None),
+            "child_orders": len(self.children),
+            "freeze_quantity": self.freeze_quantity or None,
+            "max_participation": self.max_participation,
+            "average_daily_volume": self.adv
+        }
+        if self.message:
+            result["message"] = self.message
+        if include_children:
+            result["children"] = [dict(child) for child in self.children]
+        return result
+
+
+class ExecutionScheduler:
+    """
+    Runs parent orders as tasks of one asyncio event loop in a daemon thread.
+
+    Args:
+        poll_seconds: Seconds between order book polls while children are working
+    """
+
+    def __init__(self, poll_seconds=DHAN_EXECUTION_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self.parents = {}
+        self.polls = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=SUBMIT_CONCURRENCY, thread_name_prefix="execution")
+
+    @staticmethod
+    def _headers():
+        return {
+            "Content-Type": "application/json",
+            "access-token": DHAN_ACCESS_TOKEN
+        }
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.create_task(self._poll_forever())
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name="execution-scheduler", daemon=True)
+            self._thread.start()
+            started.wait()
+            self._loop = loop
+            return loop
+
+    # Scheduling
+
+    def schedule(self, stock_name, security_id, transaction_type, quantity, strategy="TWAP", duration_minutes=30,
+                 slices=None, start_in_seconds=0, product_type="INTRADAY", lot_size=1,
+                 freeze_quantity=DHAN_FREEZE_QUANTITY, max_participation=None):
+        """
+        Schedule a parent order and start running it.
+
+        Args:
+            stock_name, security_id: Stock to trade
+            transaction_type: "BUY" or "SELL"
+            quantity: Total quantity
+            strategy: "TWAP" or "VWAP"
+            duration_minutes: Time from the first slice to the last
+            slices: Number of slices (default: one a minute)
+            start_in_seconds: Delay before the first slice
+            lot_size: Child quantities are whole multiples of this
+            freeze_quantity: Largest quantity of one child order (0: no limit)
+            max_participation: Largest fraction of the volume expected in a
+                slice that one slice may send (None: no limit; needs cached candles)
+
+        Returns:
+            The ParentOrder
+
+        Raises:
+            ValueError if the order or the schedule is not valid
+        """
+        side = transaction_type.upper()
+        strategy = strategy.upper()
+        if side not in ("BUY", "SELL"):
+            raise ValueError("Transaction type must be either 'BUY' or 'SELL'")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {STRATEGIES}")
+        if quantity <= 0 or quantity % lot_size:
+            raise ValueError(f"quantity must be a positive multiple of the lot size ({lot_size})")
+        duration = float(duration_minutes) * 60
+        if duration < 0:
+            raise ValueError("duration_minutes must not be negative")
+        if slices is None:
+            slices = max(1, round(duration / 60))
+        slices = max(1, min(int(slices), MAX_SLICES, quantity // lot_size))
+        if slices > 1 and duration / (slices - 1) < MIN_SLICE_SECONDS:
+            slices = max(1, int(duration // MIN_SLICE_SECONDS) + 1)
+        interval = duration / (slices - 1) if slices > 1 else 0.0
+
+        start = time.time() + max(float(start_in_seconds), 0.0)
+        starts = start + interval * np.arange(slices)
+        targets = schedule_targets(strategy, quantity, starts, max(interval, 60.0), lot_size)
+
+        caps, adv = None, None
+        if max_participation is not None:
+            if not 0 < float(max_participation) <= 1:
+                raise ValueError("max_participation must be a fraction between 0 and 1")
+            try:
+                adv = average_daily_volume(security_id)
+            except Exception:
+                adv = None
+            if adv:
+                expected = adv * slice_profile(starts, max(interval, 60.0))
+                caps = [int(cap) for cap in np.floor(expected * float(max_participation) / lot_size) * lot_size]
+
+        parent = ParentOrder(new_parent_id(), stock_name, security_id, side, quantity, strategy, starts, targets,
+                             caps, product_type.upper(), lot_size, int(freeze_quantity or 0),
+                             float(max_participation) if max_participation is not None else None, adv)
+        if max_participation is not None and caps is None:
+            parent.message = "No cached daily candles for this stock; max_participation is not applied"
+        loop = self._ensure_loop()
+        with self._lock:
+            self.parents[parent.parent_id] = parent
+            self._trim()
+        asyncio.run_coroutine_threadsafe(self._run(parent), loop)
+        return parent
+
+    def _trim(self):
+        finished = sorted((parent for parent in self.parents.values() if parent.finished_at),
+                          key=lambda parent: parent.finished_at)
+        for parent in finished[:max(0, len(finished) - FINISHED_HISTORY)]:
+            del self.parents[parent.parent_id]
+
+    def cancel(self, parent_id):
+        """
+        Stop sending children for a parent. Children already sent are left
+        to fill (they are market orders).
+
+        Returns:
+            The ParentOrder, or None if there is no such parent
+        """
+        with self._lock:
+            parent = self.parents.get(parent_id)
+            if parent is None or parent.finished_at:
+                return parent
+            parent.status = "cancelled"
+            parent.finished_at = time.time()
+            wake = parent._wake
+        if wake is not None:
+            self._loop.call_soon_threadsafe(wake.set)
+        return parent
+
+    def progress(self, parent_id=None):
+        """to_dict of one parent (with its children) or of all of them, newest first"""
+        with self._lock:
+            if parent_id is not None:
+                parent = self.parents.get(parent_id)
+                return parent.to_dict(include_children=True) if parent else None
+            parents = sorted(self.parents.values(), key=lambda parent: parent.created_at, reverse=True)
+            return [parent.to_dict() for parent in parents]
+
+    # Running
+
+    async def _sleep_until(self, parent, at):
+        """Sleep until `at` (epoch seconds); False if the parent was cancelled meanwhile"""
+        delay = at - time.time()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(parent._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+        return parent.status != "cancelled"
+
+    async def _run(self, parent):
+        parent._wake = asyncio.Event()
+        with self._lock:
+            if parent.status == "scheduled":
+                parent.status = "running"
+        last = len(parent.starts) - 1
+        for index, at in enumerate(parent.starts):
+            if not await self._sleep_until(parent, at):
+                return
+            await self._send_slice(parent, index, index == last)
+            parent.next_slice = index + 1
+        # Wait for the children still working
+        while parent.working() > 0 and parent.status != "cancelled":
+            await asyncio.sleep(self.poll_seconds / 2)
+        with self._lock:
+            if parent.status == "cancelled":
+                return
+            filled = parent.filled()
+            parent.status = "completed" if filled >= parent.quantity else "incomplete"
+            if filled < parent.quantity:
+                parent.message = f"{parent.quantity - filled} of {parent.quantity} were not filled"
+            parent.finished_at = time.time()
+
+    async def _send_slice(self, parent, index, final):
+        with self._lock:
+            due = parent.targets[index] - parent.filled() - parent.working()
+            if not final and parent.caps is not None:
+                due = min(due, parent.caps[index])
+            due = due // parent.lot_size * parent.lot_size
+            children = []
+            for quantity in split_child(due, parent.freeze_quantity, parent.lot_size):
+                child = {"correlation_id": parent.correlation_id(), "order_id": None, "slice": index + 1,
+                         "quantity": quantity, "filled": 0, "average_price": 0.0, "status": "SENDING",
+                         "sent_at": time.time()}
+                parent.children.append(child)
+                children.append(child)
+        if not children:
+            return
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*[
+            loop.run_in_executor(self._executor, self._submit_child, parent, child) for child in children
+        ])
+        with self._lock:
+            for child, (status, order_id, error) in zip(children, results):
+                child["status"], child["order_id"] = status, order_id
+                if error:
+                    child["error"] = error
+
+    def _submit_child(self, parent, child):
+        """Place one child order; returns (status, order ID, error)"""
+        body = {
+            "dhanClientId": DHAN_CLIENT_ID,
+            "transactionType": parent.transaction_type,
+            "exchangeSegment": "NSE_EQ",
+            "productType": parent.product_type,
+            "orderType": "MARKET",
+            "validity": "DAY",
+            "securityId": parent.security_id,
+            "quantity": str(child["quantity"]),
+            "disclosedQuantity": "",
+            "price": "",
+            "triggerPrice": "",
+            "afterMarketOrder": False
+        }
+        try:
+            response, _, submission = submit_order(f"{DHAN_API_BASE_URL}/orders", self._headers(), body,
+                                                   child["correlation_id"])
+        except requests.exceptions.RequestException as e:
+            # Not sent (circuit open, rate limit deadline, connect timeout)
+            return "REJECTED", None, str(e)
+        if response.status_code in [200, 201, 202]:
+            data = response.json()
+            # Fills are only counted from the order book
+            status = data.get("orderStatus") or "TRANSIT"
+            return ("PENDING" if status == "TRADED" else status), data.get("orderId"), None
+        if submission == "unresolved":
+            # May exist: keep it working until the order book shows it
+            return "UNKNOWN", None, response.text[:500]
+        return "REJECTED", None, response.text[:500]
+
+    async def _poll_forever(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            with self._lock:
+                working = any(parent.working() > 0 for parent in self.parents.values())
+            if not working:
+                continue
+            try:
+                await loop.run_in_executor(self._executor, self.poll_once)
+            except Exception as e:
+                # Keep polling: parents only finish once their children are seen closed
+                print(f"Error polling the order book: {e}", file=sys.stderr)
+
+    def poll_once(self):
+        """Update every working child from one order book fetch"""
+        response = dhan_client.get(f"{DHAN_API_BASE_URL}/orders", headers=self._headers())
+        response.raise_for_status()
+        self.polls += 1
+        by_order_id, by_correlation = {}, {}
+        for row in response.json() or []:
+            by_order_id[str(row.get("orderId"))] = row
+            if row.get("correlationId"):
+                by_correlation[row["correlationId"]] = row
+        unconfirmed = []
+        with self._lock:
+            for parent in self.parents.values():
+                for child in parent.children:
+                    if child["status"] == "SENDING" or (child["status"] in CLOSED_STATUSES
+                                                        and child["status"] != "NOT_FOUND"):
+                        continue
+                    row = by_order_id.get(str(child["order_id"])) or by_correlation.get(child["correlation_id"])
+                    if row is None:
+                        if child["status"] == "UNKNOWN":
+                            child["misses"] = child.get("misses", 0) + 1
+                            if child["misses"] >= UNKNOWN_POLLS:
+                                unconfirmed.append(child)
+                        continue
+                    self._apply_row(child, row)
+
+        # Only a lookup by correlation ID settles that an order does not exist;
+        # until then its quantity stays working and is not sent again
+        for child in unconfirmed:
+            try:
+                order = lookup_order(child["correlation_id"])
+            except requests.exceptions.RequestException:
+                continue
+            with self._lock:
+                if child["status"] != "UNKNOWN":
+                    continue
+                if order is None:
+                    child["status"] = "NOT_FOUND"
+                else:
+                    self._apply_row(child, order)
+
+    @staticmethod
+    def _apply_row(child, row):
+        """Copy an order book row's status and fills to a child"""
+        try:
+            filled = int(row.get("filledQty") or 0)
+            average_price = float(row.get("averageTradedPrice") or 0.0)
+        except (TypeError, ValueError):
+            # Malformed row: keep the child as it was until a later poll
+            return
+        child["order_id"] = row.get("orderId")
+        child["status"] = row.get("orderStatus") or child["status"]
+        child["filled"] = filled
+        child["average_price"] = average_price
+
+# Scheduler shared by the order placement tools
+scheduler = ExecutionScheduler()
@@ -2,41 +2,60 @@
 import requests
 from mcp.server.fastmcp import FastMCP
 from config import DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL
+import dhan_client
+from accounts import fan_out, fan_out_response, get_account, is_fan_out
+from records import FundLimits
+from tool_metrics import instrument_server
 
 # Create the MCP server
 mcp = FastMCP("DhanHQ Fund Balance")
+instrument_server(mcp)
+
+# Fund fields returned by check_fund_balance (FundLimits attributes)
+FUND_FIELDS = tuple(name for name in FundLimits.FIELDS.values() if name != "client_id")
+
+def fetch_funds(account):
+    """Fund limits of one account"""
+    response = account.client.get(account.url("/fundlimit"), headers=account.headers())
+    response.raise_for_status()
+    funds = FundLimits.from_json(response.json())
+    return {name: getattr(funds, name) for name in FUND_FIELDS}
 
 @mcp.tool()
-def check_fund_balance():
+def check_fund_balance(account=None):
     """
     Get trading account fund information including available balance and margin details
     
+    Args:
+        account: Account name from accounts.json, several names separated by
+            commas, or "all" (default: the account in config.py)
+    
     Returns:
-        Dictionary containing fund information
+        Dictionary containing fund information; for several accounts, the
+        funds of each account, their totals and each account's latency
     """
-    url = f"{DHAN_API_BASE_URL}/fundlimit"
-    headers = {
-        "Content-Type": "application/json",
-        "access-token": DHAN_ACCESS_TOKEN
-    }
-    
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        data = response.json()
+        if is_fan_out(account):
+            summaries, totals = [], dict.fromkeys(FUND_FIELDS, 0.0)
+            for selected, funds, error, latency in fan_out(account, fetch_funds):
+                summary = {"account": selected.name, "latency_ms": latency}
+                if error is not None:
+                    summary.update(status="error", message=f"Failed to fetch fund balance: {str(error)}")
+                else:
+                    summary.update(status="success", funds=funds)
+                    for name, value in funds.items():
+                        totals[name] += float(value or 0)
+                summaries.append(summary)
+            return fan_out_response(summaries, total_funds={name: round(value, 2) for name, value in totals.items()})
         
         return {
             "status": "success",
-            "funds": {
-                "available_balance": data.get("availabelBalance"),
-                "start_of_day_limit": data.get("sodLimit"),
-                "collateral_amount": data.get("collateralAmount"),
-                "receiveable_amount": data.get("receiveableAmount"),
-                "utilized_amount": data.get("utilizedAmount"),
-                "blocked_payout_amount": data.get("blockedPayoutAmount"),
-                "withdrawable_balance": data.get("withdrawableBalance")
-            }
+            "funds": fetch_funds(get_account(account))
+        }
+    except KeyError as e:
+        return {
+            "status": "error",
+            "message": e.args[0]
         }
     except requests.exceptions.RequestException as e:
         return {
@@ -91,7 +110,7 @@ def calculate_margin(
         data["triggerPrice"] = trigger_price
     
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = dhan_client.post(url, headers=headers, json=data)
         response.raise_for_status()
         
         margin_data = response.json()
@@ -0,0 +1,465 @@
+# historical_data_tool.py
+import datetime
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+import requests
+from mcp.server.fastmcp import FastMCP
+from config import DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL
+import codec
+import dhan_client
+from reference_cache import find_stock_code
+from tool_metrics import instrument_server
+
+# Create the MCP server
+mcp = FastMCP("DhanHQ Historical Data")
+instrument_server(mcp)
+
+# Columns stored for every security, one .npy file each
+CANDLE_COLUMNS = {
+    "timestamp": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.float64
+}
+
+# Default on-disk cache location
+CANDLE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cache", "candles")
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD string into a date"""
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value, DATE_FORMAT).date()
+
+def subtract_ranges(start, end, covered):
+    """
+    Return the parts of [start, end) that are not inside any covered range.
+
+    Args:
+        start: Range start date (inclusive)
+        end: Range end date (exclusive)
+        covered: Sorted list of non-overlapping (start, end) date pairs
+
+    Returns:
+        List of missing (start, end) date pairs
+    """
+    missing = []
+    cursor = start
+    for covered_start, covered_end in covered:
+        if covered_end <= cursor:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > cursor:
+            missing.append((cursor, covered_start))
+        cursor = max(cursor, covered_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        missing.append((cursor, end))
+    return missing
+
+def merge_ranges(ranges):
+    """Merge overlapping or touching (start, end) date pairs"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class CandleCache:
+    """
+    Columnar on-disk cache of daily candles.
+
+    Each security has its own directory holding one .npy file per column and a
+    meta.json listing the date ranges already fetched. Ranges are tracked
+    separately from the bars so that holidays inside a fetched range are not
+    requested again. Reads memory-map the column files and return slices
+    (views) of them, so repeated queries do not copy data.
+
+    Every write saves the columns under a new generation (name.<generation>.npy)
+    and then replaces meta.json, which names the generation together with its
+    ranges. Processes sharing the directory therefore always read a complete
+    set of columns matching the ranges, and map the files again once another
+    process has written a newer generation.
+    """
+
+    def __init__(self, cache_dir=CANDLE_CACHE_DIR, fetcher=None):
+        self.cache_dir = cache_dir
+        self.fetcher = fetcher or fetch_daily_candles
+        self._lock = threading.Lock()
+        self._mapped = {}
+        self.stats = {
+            "queries": 0,
+            "hits": 0,
+            "partial_hits": 0,
+            "misses": 0,
+            "upstream_requests": 0,
+            "bytes_fetched": 0,
+            "bytes_served": 0
+        }
+
+    def version(self, security_id):
+        """Generation of the cached candles of a security; changes whenever any process rewrites them"""
+        return self._read_meta(security_id)[1]
+
+    def _security_dir(self, security_id):
+        return os.path.join(self.cache_dir, str(security_id))
+
+    def _column_path(self, security_id, name, generation):
+        # Caches written before generations have plain name.npy files (generation "")
+        suffix = f".{generation}" if generation else ""
+        return os.path.join(self._security_dir(security_id), f"{name}{suffix}.npy")
+
+    def _read_meta(self, security_id):
+        """(covered ranges, generation) of a security ([] and "" if nothing is cached)"""
+        path = os.path.join(self._security_dir(security_id), "meta.json")
+        if not os.path.exists(path):
+            return [], ""
+        with open(path, 'r') as file:
+            meta = json.load(file)
+        ranges = [(parse_date(start), parse_date(end)) for start, end in meta.get("ranges", [])]
+        return ranges, meta.get("generation", "")
+
+    def _load_columns(self, security_id, generation):
+        """
+        Return memory-mapped columns of one generation, or None if not cached.
+
+        Raises:
+            FileNotFoundError if another process replaced the generation meanwhile
+        """
+        security_id = str(security_id)
+        mapped = self._mapped.get(security_id)
+        if mapped is not None and mapped[0] == generation:
+            return mapped[1]
+
+        if not os.path.exists(self._column_path(security_id, "timestamp", generation)):
+            if generation:
+                raise FileNotFoundError(f"Candle generation {generation} of {security_id} was replaced")
+            return None
+        columns = {
+            name: np.load(self._column_path(security_id, name, generation), mmap_mode='r')
+            for name in CANDLE_COLUMNS
+        }
+        self._mapped[security_id] = (generation, columns)
+        return columns
+
+    def _current_columns(self, security_id, attempts=3):
+        """(ranges, generation, columns) as of the latest complete write"""
+        for attempt in range(attempts):
+            ranges, generation = self._read_meta(security_id)
+            try:
+                return ranges, generation, self._load_columns(security_id, generation)
+            except FileNotFoundError:
+                if attempt == attempts - 1:
+                    raise
+
+    def _write(self, security_id, columns, ranges, previous):
+        """Write the columns as a new generation, then point meta.json at it"""
+        directory = self._security_dir(security_id)
+        os.makedirs(directory, exist_ok=True)
+
+        # Nobody reads the new files until meta.json names them
+        generation = uuid.uuid4().hex[:12]
+        for name, dtype in CANDLE_COLUMNS.items():
+            np.save(self._column_path(security_id, name, generation), np.ascontiguousarray(columns[name], dtype=dtype))
+
+        meta = {"generation": generation,
+                "ranges": [[s.strftime(DATE_FORMAT), e.strftime(DATE_FORMAT)] for s, e in ranges]}
+        tmp_path = os.path.join(directory, f"meta.json.{generation}.tmp")
+        with open(tmp_path, 'w') as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+        # Processes still mapping the previous generation keep their views
+        # (where the platform lets open files be removed)
+        for name in CANDLE_COLUMNS:
+            try:
+                os.remove(self._column_path(security_id, name, previous))
+            except OSError:
+                pass
+        return generation
+
+    def _append(self, security_id, fetched, fetched_ranges, ranges, generation, existing):
+        """Merge freshly fetched candles into the cache; returns the new generation"""
+        merged = {}
+        for name, dtype in CANDLE_COLUMNS.items():
+            parts = [np.asarray(batch[name], dtype=dtype) for batch in fetched]
+            if existing is not None:
+                parts.append(np.asarray(existing[name]))
+            merged[name] = np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+        # Sort by time; re-fetched bars (today's forming candle) replace cached ones
+        timestamps, first_index = np.unique(merged["timestamp"], return_index=True)
+        merged = {name: values[first_index] for name, values in merged.items()}
+        merged["timestamp"] = timestamps
+
+        return self._write(security_id, merged, merge_ranges(ranges + fetched_ranges), generation)
+
+    def get(self, security_id, from_date, to_date):
+        """
+        Return candles for [from_date, to_date], fetching only missing ranges.
+
+        Args:
+            security_id: Security ID of the instrument
+            from_date: First date (inclusive)
+            to_date: Last date (inclusive)
+
+        Returns:
+            Dictionary of column name to read-only NumPy view
+        """
+        with self._lock:
+            return self._get(security_id, from_date, to_date)[0]
+
+    def get_versioned(self, security_id, from_date, to_date):
+        """get() together with the version() of the candles it returned"""
+        with self._lock:
+            return self._get(security_id, from_date, to_date)
+
+    def _get(self, security_id, from_date, to_date):
+        start = parse_date(from_date)
+        end = parse_date(to_date) + datetime.timedelta(days=1)
+        # Today's candle is still forming, so it is never marked as covered
+        today = datetime.date.today()
+
+        self.stats["queries"] += 1
+        ranges, generation, columns = self._current_columns(security_id)
+        missing = subtract_ranges(start, end, ranges)
+
+        if not missing:
+            self.stats["hits"] += 1
+        else:
+            missing_days = sum((e - s).days for s, e in missing)
+            self.stats["partial_hits" if missing_days < (end - start).days else "misses"] += 1
+            fetched = []
+            fetched_ranges = []
+            for missing_start, missing_end in missing:
+                candles, size = self.fetcher(security_id, missing_start, missing_end)
+                self.stats["upstream_requests"] += 1
+                self.stats["bytes_fetched"] += size
+                fetched.append(candles)
+                if missing_start < today:
+                    fetched_ranges.append((missing_start, min(missing_end, today)))
+            generation = self._append(security_id, fetched, fetched_ranges, ranges, generation, columns)
+            columns = self._load_columns(security_id, generation)
+
+        return self._slice(columns, start, end), generation
+
+    def get_cached(self, security_id, from_date, to_date):
+        """
+        Return cached candles for [from_date, to_date] without fetching anything.
+
+        Args:
+            security_id: Security ID of the instrument
+            from_date: First date (inclusive)
+            to_date: Last date (inclusive)
+
+        Returns:
+            Dictionary of column name to read-only NumPy view, empty if nothing is cached
+        """
+        start = parse_date(from_date)
+        end = parse_date(to_date) + datetime.timedelta(days=1)
+        with self._lock:
+            return self._slice(self._current_columns(security_id)[2], start, end)
+
+    def _slice(self, columns, start, end):
+        """Slice memory-mapped columns (None if nothing is cached) to [start, end)"""
+        if columns is None:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in CANDLE_COLUMNS.items()}
+
+        # Timestamps are epoch seconds, bound the slice in IST calendar days
+        lower = _ist_epoch(start)
+        upper = _ist_epoch(end)
+        timestamps = columns["timestamp"]
+        first = int(np.searchsorted(timestamps, lower, side='left'))
+        last = int(np.searchsorted(timestamps, upper, side='left'))
+        view = {name: values[first:last] for name, values in columns.items()}
+        self.stats["bytes_served"] += sum(v.nbytes for v in view.values())
+        return view
+
+    def get_stats(self):
+        """Return cache statistics including the hit rate"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["hit_rate"] = round(stats["hits"] / stats["queries"], 4) if stats["queries"] else 0.0
+        return stats
+
+
+# IST is UTC+05:30, Dhan candle timestamps are epoch seconds
+IST_OFFSET = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+def _ist_epoch(date):
+    return int(datetime.datetime(date.year, date.month, date.day, tzinfo=IST_OFFSET).timestamp())
+
+def fetch_daily_candles(security_id, from_date, to_date):
+    """
+    Fetch daily candles from Dhan for [from_date, to_date).
+
+    Args:
+        security_id: Security ID of the instrument
+        from_date: First date (inclusive)
+        to_date: End date (exclusive)
+
+    Returns:
+        Tuple of (candle columns, response size in bytes)
+    """
+    url = f"{DHAN_API_BASE_URL}/charts/historical"
+    headers = {
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "access-token": DHAN_ACCESS_TOKEN
+    }
+
+    data = {
+        "securityId": str(security_id),
+        "exchangeSegment": "NSE_EQ",
+        "instrument": "EQUITY",
+        "expiryCode": 0,
+        "oi": False,
+        "fromDate": from_date.strftime(DATE_FORMAT),
+        "toDate": to_date.strftime(DATE_FORMAT)
+    }
+
+    response = dhan_client.post(url, headers=headers, json=data)
+    response.raise_for_status()
+
+    payload = response.json()
+    candles = {name: payload.get(name, []) for name in CANDLE_COLUMNS}
+    return candles, len(response.content)
+
+
+# Shared cache for this server
+candle_cache = CandleCache()
+
+# Encoded "candles" sections of get_historical_data results, by security,
+# date range and cache generation
+candle_payloads = codec.PayloadCache()
+
+def load_candles(stock_name, from_date, to_date):
+    """
+    Load cached daily candles for a stock by name.
+
+    Args:
+        stock_name: The name of the stock (e.g., "TCS")
+        from_date: First date (YYYY-MM-DD, inclusive)
+        to_date: Last date (YYYY-MM-DD, inclusive)
+
+    Returns:
+        Dictionary of column name to NumPy array, or None if the stock is unknown
+    """
+    stock_code = find_stock_code(stock_name)
+    if not stock_code:
+        return None
+    return candle_cache.get(stock_code, from_date, to_date)
+
+def candle_columns(candles):
+    """The candles section of get_historical_data: dates and OHLCV lists"""
+    return {
+        "date": [
+            datetime.datetime.fromtimestamp(int(ts), IST_OFFSET).strftime(DATE_FORMAT)
+            for ts in candles["timestamp"]
+        ],
+        **{name: candles[name].tolist() for name in ("open", "high", "low", "close", "volume")}
+    }
+
+@mcp.tool()
+def get_historical_data(stock_name, from_date, to_date, include_candles=True):
+    """
+    Get daily OHLCV candles for a stock.
+
+    Args:
+        stock_name: The name of the stock (e.g., "TCS")
+        from_date: First date in YYYY-MM-DD format (inclusive)
+        to_date: Last date in YYYY-MM-DD format (inclusive)
+        include_candles: Include the individual candles, not just the summary (default: True)
+
+    Returns:
+        Candle summary, candles and cache statistics
+    """
+    try:
+        start = parse_date(from_date)
+        end = parse_date(to_date)
+    except ValueError:
+        return {
+            "status": "error",
+            "message": "Dates must be in YYYY-MM-DD format"
+        }
+    if start > end:
+        return {
+            "status": "error",
+            "message": "from_date must not be after to_date"
+        }
+
+    stock_code = find_stock_code(stock_name)
+    if not stock_code:
+        return {
+            "status": "error",
+            "message": f"Stock '{stock_name}' not found in stocks.json"
+        }
+    try:
+        candles, version = candle_cache.get_versioned(stock_code, start, end)
+    except requests.exceptions.RequestException as e:
+        return {
+            "status": "error",
+            "message": f"Failed to fetch historical data: {str(e)}"
+        }
+
+    count = len(candles["timestamp"])
+    result = {
+        "status": "success",
+        "stock_name": stock_name.upper(),
+        "candles_count": count,
+        "cache": candle_cache.get_stats()
+    }
+
+    if count:
+        first_open = float(candles["open"][0])
+        last_close = float(candles["close"][-1])
+        result["summary"] = {
+            "first_date": datetime.datetime.fromtimestamp(int(candles["timestamp"][0]), IST_OFFSET).strftime(DATE_FORMAT),
+            "last_date": datetime.datetime.fromtimestamp(int(candles["timestamp"][-1]), IST_OFFSET).strftime(DATE_FORMAT),
+            "open": first_open,
+            "close": last_close,
+            "high": float(candles["high"].max()),
+            "low": float(candles["low"].min()),
+            "change_percent": round((last_close / first_open - 1) * 100, 2) if first_open else None,
+            "total_volume": float(candles["volume"].sum())
+        }
+
+    if include_candles:
+        # Unchanged ranges reuse their encoded candles (a codec.Raw fragment)
+        result["candles"] = candle_payloads.get_or_encode(
+            (str(stock_code), start, end, version), lambda: candle_columns(candles))
+
+    return result
+
+@mcp.tool()
+def get_candle_cache_stats():
+    """
+    Get statistics for the local candle cache.
+
+    Returns:
+        Query counts, hit rate and bytes fetched from and served by the cache
+    """
+    return {
+        "status": "success",
+        "cache_dir": candle_cache.cache_dir,
+        "cache": candle_cache.get_stats(),
+        "encoded_payloads": candle_payloads.stats()
+    }
+
+# Run the server if executed directly
+if __name__ == "__main__":
+    mcp.run()
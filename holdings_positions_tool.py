@@ -1,35 +1,55 @@
 # holdings_positions_tool.py
+import json
+import time
+
 import requests
 from mcp.server.fastmcp import FastMCP
 from config import DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL
+import codec
+import dhan_client
+from accounts import fan_out, fetch_holding_rows, get_account, is_fan_out, merge_rows
+from market_quotes import fetch_last_prices
+from records import Holding, Position, to_dicts
+from tool_metrics import instrument_server
 
 # Create the MCP server
 mcp = FastMCP("DhanHQ Holdings & Positions")
+instrument_server(mcp)
+
+def fetch_records(account, path, record_type):
+    """GET a list endpoint for one account, as records parsed while the body streams in"""
+    response = account.client.get(account.url(path), headers=account.headers(), stream=True)
+    response.raise_for_status()
+    return record_type.from_rows(codec.iter_array(response))
 
 @mcp.tool()
-def get_holdings():
+def get_holdings(account=None):
     """
     Get a list of all holdings in your demat account
     
+    Args:
+        account: Account name from accounts.json, several names separated by
+            commas, or "all" (default: the account in config.py)
+    
     Returns:
-        Dictionary containing holdings information
+        Dictionary containing holdings information; for several accounts the
+        rows carry their account and "accounts" gives each account's latency
     """
-    url = f"{DHAN_API_BASE_URL}/holdings"
-    headers = {
-        "Content-Type": "application/json",
-        "access-token": DHAN_ACCESS_TOKEN
-    }
-    
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        holdings_data = response.json()
+        if is_fan_out(account):
+            return merge_rows(fan_out(account, lambda selected: fetch_records(selected, "/holdings", Holding)),
+                              "holdings")
+        holdings = fetch_records(get_account(account), "/holdings", Holding)
         
         return {
             "status": "success",
-            "holdings_count": len(holdings_data),
-            "holdings": holdings_data
+            "holdings_count": len(holdings),
+            "holdings": to_dicts(holdings)
+        }
+    except KeyError as e:
+        return {
+            "status": "error",
+            "message": e.args[0]
         }
     except requests.exceptions.RequestException as e:
         return {
@@ -38,29 +58,33 @@ def get_holdings():
         }
 
 @mcp.tool()
-def get_positions():
+def get_positions(account=None):
     """
     Get a list of all open positions for the day
     
+    Args:
+        account: Account name from accounts.json, several names separated by
+            commas, or "all" (default: the account in config.py)
+    
     Returns:
-        Dictionary containing positions information
+        Dictionary containing positions information; for several accounts the
+        rows carry their account and "accounts" gives each account's latency
     """
-    url = f"{DHAN_API_BASE_URL}/positions"
-    headers = {
-        "Content-Type": "application/json",
-        "access-token": DHAN_ACCESS_TOKEN
-    }
-    
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        positions_data = response.json()
+        if is_fan_out(account):
+            return merge_rows(fan_out(account, lambda selected: fetch_records(selected, "/positions", Position)),
+                              "positions")
+        positions = fetch_records(get_account(account), "/positions", Position)
         
         return {
             "status": "success",
-            "positions_count": len(positions_data),
-            "positions": positions_data
+            "positions_count": len(positions),
+            "positions": to_dicts(positions)
+        }
+    except KeyError as e:
+        return {
+            "status": "error",
+            "message": e.args[0]
         }
     except requests.exceptions.RequestException as e:
         return {
@@ -112,7 +136,7 @@ def convert_position(
     }
     
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = dhan_client.post(url, headers=headers, json=data)
         
         if response.status_code == 202:
             return {
@@ -131,6 +155,97 @@ def convert_position(
             "message": f"Failed to convert position: {str(e)}"
         }
 
+def parse_shocks(value):
+    """Accept a list of numbers or a comma separated string"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [float(item) for item in value.split(",") if item.strip()]
+    return [float(item) for item in value]
+
+@mcp.tool()
+def portfolio_analytics(shocks=None, sector_shocks=None, include_holdings=True, include_positions=True, top=5):
+    """
+    Analyse holdings and open positions: P&L, weights, sector exposure,
+    concentration, top contributors and what-if price shocks.
+
+    Args:
+        shocks: Uniform price moves in percent to evaluate, as a list or a comma
+            separated string (default: "-10,-5,5,10")
+        sector_shocks: Moves in percent per sector evaluated together as one
+            scenario, e.g. {"Financial Services": -8, "Information Technology": 3}
+            (optional)
+        include_holdings: Include demat holdings (default: True)
+        include_positions: Include the day's positions (default: True)
+        top: Number of top and bottom contributors returned (default: 5)
+
+    Returns:
+        Portfolio summary, per-symbol and per-sector breakdowns, concentration
+        measures, top/bottom contributors and scenario P&L
+    """
+    # NumPy is only needed here, so it is not imported with the positions and
+    # holdings tools
+    from portfolio_analytics import PortfolioFrame, analyze
+
+    headers = {
+        "Content-Type": "application/json",
+        "access-token": DHAN_ACCESS_TOKEN
+    }
+
+    try:
+        shocks = parse_shocks(shocks)
+        if isinstance(sector_shocks, str):
+            sector_shocks = json.loads(sector_shocks)
+    except (TypeError, ValueError) as e:
+        return {
+            "status": "error",
+            "message": f"Invalid shocks: {str(e)}"
+        }
+
+    try:
+        holdings, positions, holdings_warning = [], [], None
+        if include_holdings:
+            try:
+                holdings = fetch_holding_rows(get_account())
+            except dhan_client.CircuitOpenError as e:
+                # Still analyse the positions while the holdings endpoint is failing
+                holdings_warning = f"Holdings unavailable, analysing positions only: {str(e)}"
+        if include_positions:
+            response = dhan_client.get(f"{DHAN_API_BASE_URL}/positions", headers=headers)
+            response.raise_for_status()
+            positions = [row for row in response.json() or [] if row.get("positionType") != "CLOSED" or row.get("realizedProfit")]
+
+    except requests.exceptions.RequestException as e:
+        return {
+            "status": "error",
+            "message": f"Failed to fetch portfolio: {str(e)}"
+        }
+
+    # Quote only what the rows do not price themselves; without quotes,
+    # positions are priced from their unrealized P&L
+    unpriced = {str(row.get("securityId")) for row in holdings if not row.get("lastTradedPrice")}
+    unpriced.update(str(row.get("securityId")) for row in positions if row.get("netQty"))
+    prices, price_warning = {}, None
+    if unpriced:
+        try:
+            prices = fetch_last_prices(unpriced)
+        except requests.exceptions.RequestException as e:
+            price_warning = f"Live prices unavailable, using prices implied by the rows: {str(e)}"
+
+    start = time.perf_counter()
+    frame = PortfolioFrame.from_rows(holdings, positions, prices)
+    analytics = analyze(frame, shocks=shocks, sector_shocks=sector_shocks, top=int(top))
+
+    result = {
+        "status": "success",
+        **analytics,
+        "compute_ms": round((time.perf_counter() - start) * 1000, 3)
+    }
+    warnings = [warning for warning in (holdings_warning, price_warning) if warning]
+    if warnings:
+        result["warning"] = "; ".join(warnings)
+    return result
+
 # Run the server if executed directly
 if __name__ == "__main__":
     mcp.run()
\ No newline at end of file
@@ -0,0 +1,254 @@
+# http_server.py
+# Network deployment of the tool servers.
+#
+# Serves every FastMCP tool server from one ASGI app over streamable HTTP
+# and SSE, with several uvicorn worker processes:
+#
+#   python http_server.py --workers 4 --port 8000
+#
+# Each server is mounted under its own path, e.g. /order_placement/mcp
+# (streamable HTTP) and /order_placement/sse (SSE). Streamable HTTP runs
+# stateless, so any worker can answer any request. SSE sessions live in the
+# worker that opened them and only work with --workers 1.
+#
+# Workers share state through local files: rate limit buckets and the order
+# ledger through the shared store (DHAN_SHARED_STORE, see shared_store.py),
+# the trade journal through its SQLite database and the candle cache through
+# its directory (each write is a new generation of column files named in
+# meta.json, so workers see each other's writes). The price alert and AMO staging servers keep their state in
+# process memory and are left out when there is more than one worker; run
+# them in a separate single-worker instance.
+#
+#   /healthz   liveness
+#   /readyz    readiness: 503 while starting, draining or if the shared
+#              store cannot be read
+#   /metrics   tool metrics of the answering worker (Prometheus text)
+#
+# On SIGTERM or Ctrl+C uvicorn stops accepting connections, waits up to
+# --graceful-timeout seconds for requests in flight, and the workers then
+# flush the trade journal before exiting.
+import argparse
+import contextlib
+import functools
+import importlib
+import logging
+import os
+import sys
+import time
+
+# Mount path -> tool module
+SERVERS = {
+    "order_placement": "order_placement_tool",
+    "super_order": "super-order",
+    "after_market_order": "after_market_order_tool",
+    "fund_balance": "fund_balance_tool",
+    "holdings_positions": "holdings_positions_tool",
+    "margin_calculator": "margin_calculator_tool",
+    "order_book": "order_book_tool",
+    "portfolio": "portfolio_server",
+    "historical_data": "historical_data_tool",
+    "indicator": "indicator_tool",
+    "price_alert": "price_alert_tool",
+    "backtest": "backtest_tool",
+    "option_chain": "option_chain_tool"
+}
+
+# Servers whose tools keep state in process memory
+PROCESS_LOCAL_SERVERS = {"after_market_order", "price_alert"}
+
+DEFAULT_SHARED_STORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cache", "shared_store.db")
+
+# Seconds a worker waits for the trade journal to be written on shutdown
+JOURNAL_FLUSH_SECONDS = 5.0
+
+
+def selected_servers(names=None, workers=1):
+    """
+    Mount names to serve.
+
+    Args:
+        names: Comma-separated mount names (default: every server, without
+            the process-local ones when workers > 1)
+        workers: Number of worker processes
+
+    Raises:
+        ValueError for unknown names
+    """
+    if not names:
+        return [name for name in SERVERS if workers == 1 or name not in PROCESS_LOCAL_SERVERS]
+    selected = [name.strip() for name in names.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in SERVERS]
+    if unknown:
+        raise ValueError(f"Unknown servers {unknown}. Available: {', '.join(SERVERS)}")
+    return selected
+
+def transport_security():
+    """Host header allowlist: localhost plus DHAN_HTTP_ALLOWED_HOSTS"""
+    from mcp.server.transport_security import TransportSecuritySettings
+    from config import DHAN_HTTP_ALLOWED_HOSTS
+
+    hosts = ["127.0.0.1:*", "localhost:*", "[::1]:*"] + DHAN_HTTP_ALLOWED_HOSTS
+    return TransportSecuritySettings(
+        enable_dns_rebinding_protection=True,
+        allowed_hosts=hosts,
+        allowed_origins=[f"{scheme}://{host}" for host in hosts for scheme in ("http", "https")]
+    )
+
+def run_sync_tools_in_threads(server):
+    """
+    Make a server's plain (def) tools run in worker threads.
+
+    FastMCP calls them on the event loop, which is fine for one stdio client
+    but lets a single slow Dhan API call hold up every other request the
+    worker is serving.
+    """
+    import anyio
+
+    def offload(fn):
+        @functools.wraps(fn)
+        async def call(**kwargs):
+            return await anyio.to_thread.run_sync(functools.partial(fn, **kwargs))
+        return call
+
+    for tool in server._tool_manager.list_tools():
+        if not tool.is_async:
+            tool.fn = offload(tool.fn)
+            tool.is_async = True
+
+def create_app():
+    """
+    Build the ASGI app for one worker (uvicorn factory).
+
+    Reads the servers to mount from DHAN_HTTP_SERVERS, the response mode
+    from DHAN_HTTP_JSON_RESPONSE and the log level from DHAN_HTTP_LOG_LEVEL,
+    all set by main().
+    """
+    import anyio
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, PlainTextResponse
+    from starlette.routing import Mount, Route
+
+    import shared_store
+    from config import DHAN_JOURNAL_ENABLED
+    import dhan_client
+    from tool_metrics import metrics
+
+    names = selected_servers(os.environ.get("DHAN_HTTP_SERVERS"))
+    json_response = os.environ.get("DHAN_HTTP_JSON_RESPONSE", "").lower() in ("1", "true", "yes")
+    security = transport_security()
+    servers = {}
+    for name in names:
+        server = importlib.import_module(SERVERS[name]).mcp
+        server.settings.stateless_http = True
+        server.settings.json_response = json_response
+        server.settings.transport_security = security
+        run_sync_tools_in_threads(server)
+        servers[name] = server
+    # After the imports: FastMCP configures the root logger when first imported
+    logging.getLogger().setLevel(os.environ.get("DHAN_HTTP_LOG_LEVEL", "warning").upper())
+
+    state = {"ready": False, "started_at": time.time()}
+
+    def shutdown():
+        if "after_market_order" in servers:
+            from amo_queue import amo_queue
+            # Stop the timer but keep the saved schedule for the next start
+            amo_queue.cancel_schedule(save=False)
+        if DHAN_JOURNAL_ENABLED:
+            from trade_journal import journal
+            journal.flush(JOURNAL_FLUSH_SECONDS)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        async with contextlib.AsyncExitStack() as stack:
+            for server in servers.values():
+                await stack.enter_async_context(server.session_manager.run())
+            state["ready"] = True
+            try:
+                yield
+            finally:
+                state["ready"] = False
+                await anyio.to_thread.run_sync(shutdown)
+
+    async def healthz(request):
+        return JSONResponse({
+            "status": "ok",
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - state["started_at"], 1)
+        })
+
+    async def readyz(request):
+        checks = {"started": state["ready"]}
+        if shared_store.store is not None:
+            checks["shared_store"] = await anyio.to_thread.run_sync(shared_store.store.ping)
+        open_breakers = [endpoint for endpoint, health in dhan_client.health_snapshot().items()
+                         if health["breaker"] != "closed"]
+        ready = all(checks.values())
+        return JSONResponse({
+            "status": "ready" if ready else "not_ready",
+            "pid": os.getpid(),
+            "checks": checks,
+            "servers": list(servers),
+            "open_breakers": open_breakers
+        }, status_code=200 if ready else 503)
+
+    async def prometheus(request):
+        return PlainTextResponse(metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+    routes = [
+        Route("/healthz", healthz),
+        Route("/readyz", readyz),
+        Route("/metrics", prometheus)
+    ]
+    for name, server in servers.items():
+        http_app = server.streamable_http_app()
+        sse_app = server.sse_app(mount_path=f"/{name}")
+        routes.append(Mount(f"/{name}", routes=list(http_app.routes) + list(sse_app.routes)))
+    return Starlette(routes=routes, lifespan=lifespan)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the DhanHQ MCP tool servers over streamable HTTP and SSE")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=max(os.cpu_count() or 1, 1),
+                        help="Worker processes (default: one per CPU)")
+    parser.add_argument("--servers", default=None,
+                        help=f"Comma-separated servers to mount (default: all). Available: {', '.join(SERVERS)}")
+    parser.add_argument("--shared-store", default=None,
+                        help="SQLite file for state shared by the workers (default: DHAN_SHARED_STORE or "
+                             "data_cache/shared_store.db)")
+    parser.add_argument("--json-response", action="store_true",
+                        help="Answer with plain JSON instead of SSE streams (no progress notifications)")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0,
+                        help="Seconds to wait for requests in flight on shutdown")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    try:
+        names = selected_servers(args.servers, args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+    local = sorted(PROCESS_LOCAL_SERVERS.intersection(names))
+    if args.workers > 1 and local:
+        print(f"Warning: {', '.join(local)} keep state per worker; serve them with --workers 1", file=sys.stderr)
+
+    # Workers read their settings from the environment when they import the app
+    os.environ["DHAN_HTTP_SERVERS"] = ",".join(names)
+    os.environ["DHAN_HTTP_JSON_RESPONSE"] = "1" if args.json_response else ""
+    os.environ["DHAN_HTTP_LOG_LEVEL"] = args.log_level
+    os.environ["DHAN_SHARED_STORE"] = args.shared_store or os.environ.get("DHAN_SHARED_STORE") or DEFAULT_SHARED_STORE
+
+    import uvicorn
+    uvicorn.run(
+        "http_server:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+        app_dir=os.path.dirname(os.path.abspath(__file__))
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# indicator_tool.py
+import collections
+import datetime
+import threading
+
+import numpy as np
+import requests
+from mcp.server.fastmcp import FastMCP
+
+from historical_data_tool import CANDLE_COLUMNS, DATE_FORMAT, IST_OFFSET, candle_cache
+from indicators import SUPPORTED_INDICATORS, IndicatorEngine
+from reference_cache import find_stock_code, load_stocks_data
+from tool_metrics import instrument_server
+
+# Create the MCP server
+mcp = FastMCP("DhanHQ Technical Indicators")
+instrument_server(mcp)
+
+# Most recent indicator values kept per engine for the `points` argument
+MAX_POINTS = 100
+
+# Engines kept between calls so new bars are applied incrementally, least
+# recently used first; one per stock group, indicator set and window
+MAX_ENGINES = 256
+_engines = collections.OrderedDict()
+_engines_lock = threading.Lock()
+
+
+def parse_list(value):
+    """Accept a list or a comma separated string"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    return [str(item).strip() for item in value]
+
+def resolve_stocks(stock_name):
+    """
+    Resolve one or many stock names to security IDs.
+
+    Args:
+        stock_name: A stock name, a comma separated list, or "ALL" for every stock in stocks.json
+
+    Returns:
+        Tuple of (list of (name, security ID), list of unknown names)
+    """
+    names = parse_list(stock_name)
+    if len(names) == 1 and names[0].upper() == "ALL":
+        return [(s.get('stock_name'), s.get('stock_code')) for s in load_stocks_data()], []
+
+    resolved = []
+    unknown = []
+    for name in names:
+        stock_code = find_stock_code(name)
+        if stock_code:
+            resolved.append((name.upper(), stock_code))
+        else:
+            unknown.append(name)
+    return resolved, unknown
+
+
+class _EngineEntry:
+    """Indicator engine plus the last bar it has consumed"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.last_timestamps = None
+        self.recent = {}
+
+    def _resume_position(self, timestamps):
+        """Index of the first unseen bar, or None if the history does not line up"""
+        if self.last_timestamps is None:
+            return None
+        positions = {
+            int(np.searchsorted(row, last, side='right'))
+            for row, last in zip(timestamps, self.last_timestamps)
+        }
+        if len(positions) != 1:
+            return None
+        position = positions.pop()
+        if position == 0 or not np.array_equal(timestamps[:, position - 1], self.last_timestamps):
+            return None
+        return position
+
+    def run(self, stacked):
+        """Apply the stacked candles, computing only bars not seen before"""
+        timestamps = stacked["timestamp"]
+        position = self._resume_position(timestamps)
+
+        if position is not None:
+            new = {name: values[:, position:] for name, values in stacked.items()}
+            if new["close"].shape[1]:
+                outputs = self.engine.update(new)
+                self.recent = {
+                    name: np.concatenate([self.recent[name], values], axis=1)[:, -MAX_POINTS:]
+                    for name, values in outputs.items()
+                }
+            mode = "incremental"
+        else:
+            outputs = self.engine.compute(stacked)
+            self.recent = {name: values[:, -MAX_POINTS:] for name, values in outputs.items()}
+            mode = "full"
+
+        self.last_timestamps = timestamps[:, -1].copy()
+        return mode
+
+
+def _rounded(values):
+    return [None if np.isnan(v) else round(float(v), 4) for v in values]
+
+def compute_for_stocks(stocks, indicators, window, from_date, to_date):
+    """
+    Compute indicators for many stocks, one vectorized pass per bar count.
+
+    Args:
+        stocks: List of (name, security ID)
+        indicators: Indicator names
+        window: Period override, or None for defaults
+        from_date: First date (inclusive)
+        to_date: Last date (inclusive)
+
+    Returns:
+        Tuple of (per stock results dict, list of stocks without candles, compute modes)
+    """
+    # Symbols with the same number of bars are stacked into one 2-D array
+    groups = {}
+    empty = []
+    for name, security_id in stocks:
+        candles = candle_cache.get(security_id, from_date, to_date)
+        if len(candles["timestamp"]) == 0:
+            empty.append(name)
+            continue
+        groups.setdefault(len(candles["timestamp"]), []).append((name, security_id, candles))
+
+    results = {}
+    modes = {}
+    for members in groups.values():
+        stacked = {
+            column: np.stack([candles[column] for _, _, candles in members])
+            for column in CANDLE_COLUMNS
+        }
+        key = (tuple(sid for _, sid, _ in members), tuple(indicators), window)
+        with _engines_lock:
+            entry = _engines.get(key)
+            if entry is None:
+                entry = _engines[key] = _EngineEntry(IndicatorEngine(indicators, window))
+                while len(_engines) > MAX_ENGINES:
+                    _engines.popitem(last=False)
+            else:
+                _engines.move_to_end(key)
+            mode = entry.run(stacked)
+            recent = entry.recent
+
+        for row, (name, _, candles) in enumerate(members):
+            modes[name] = mode
+            results[name] = {
+                "last_date": datetime.datetime.fromtimestamp(int(candles["timestamp"][-1]), IST_OFFSET).strftime(DATE_FORMAT),
+                "last_close": float(candles["close"][-1]),
+                "bars": len(candles["timestamp"]),
+                "values": {output: _rounded(values[row]) for output, values in recent.items()}
+            }
+    return results, empty, modes
+
+def latest_atr(stock_name, period=14, days=120):
+    """
+    Return the latest ATR for a stock from cached daily candles.
+
+    Args:
+        stock_name: The name of the stock (e.g., "ADANIENT")
+        period: ATR period (default: 14)
+        days: Calendar days of history to use (default: 120)
+
+    Returns:
+        Latest ATR value, or None if not enough history is available
+    """
+    stocks, unknown = resolve_stocks(stock_name)
+    if unknown or not stocks:
+        return None
+    to_date = datetime.date.today()
+    from_date = to_date - datetime.timedelta(days=days)
+    results, _, _ = compute_for_stocks(stocks, ["atr"], period, from_date, to_date)
+    values = results.get(stocks[0][0], {}).get("values", {}).get("atr")
+    return values[-1] if values else None
+
+@mcp.tool()
+def compute_indicators(stock_name, indicators="sma,ema,rsi,macd,atr,bollinger,vwap", window=None, days=365, points=1):
+    """
+    Compute technical indicators from daily candles.
+
+    Args:
+        stock_name: Stock name, comma separated list of names, or "ALL" for every stock
+        indicators: Comma separated list from sma, ema, rsi, macd, atr, bollinger, vwap
+        window: Period for the indicators (default: 20 for sma/ema/bollinger/vwap, 14 for rsi/atr;
+            MACD always uses 12/26/9)
+        days: Calendar days of history to load (default: 365)
+        points: Number of most recent values to return per indicator (default: 1, max 100)
+
+    Returns:
+        Latest indicator values for each stock
+    """
+    names = [name.lower() for name in parse_list(indicators)]
+    unsupported = [name for name in names if name not in SUPPORTED_INDICATORS]
+    if not names or unsupported:
+        return {
+            "status": "error",
+            "message": f"Indicators must be chosen from {SUPPORTED_INDICATORS}"
+        }
+
+    if window is not None:
+        try:
+            window = int(window)
+        except (TypeError, ValueError):
+            window = 0
+        if window < 2:
+            return {
+                "status": "error",
+                "message": "Window must be an integer of at least 2"
+            }
+
+    try:
+        days = int(days)
+        points = int(points)
+    except (TypeError, ValueError):
+        days = points = 0
+    if days < 1 or points < 1:
+        return {
+            "status": "error",
+            "message": "days and points must be positive integers"
+        }
+
+    stocks, unknown = resolve_stocks(stock_name)
+    if unknown:
+        return {
+            "status": "error",
+            "message": f"Stocks not found in stocks.json: {unknown}"
+        }
+
+    points = min(points, MAX_POINTS)
+    to_date = datetime.date.today()
+    from_date = to_date - datetime.timedelta(days=days)
+
+    try:
+        results, empty, modes = compute_for_stocks(stocks, names, window, from_date, to_date)
+    except requests.exceptions.RequestException as e:
+        return {
+            "status": "error",
+            "message": f"Failed to fetch historical data: {str(e)}"
+        }
+
+    for result in results.values():
+        result["values"] = {
+            output: values[-points:] if points > 1 else values[-1]
+            for output, values in result["values"].items()
+        }
+
+    return {
+        "status": "success",
+        "stocks_count": len(results),
+        "indicators": results,
+        "no_data": empty,
+        "incremental_updates": sum(1 for mode in modes.values() if mode == "incremental"),
+        "cache": candle_cache.get_stats()
+    }
+
+# Run the server if executed directly
+if __name__ == "__main__":
+    mcp.run()
@@ -0,0 +1,296 @@
+# indicators.py
+# Vectorized technical indicator kernels.
+#
+# Every kernel works along the last axis, so a 1-D array is one symbol and a
+# 2-D array of shape (symbols, bars) computes many symbols in a single pass.
+# Recursive indicators (EMA, RSI, ATR, MACD) carry their last value in a state
+# dictionary so new bars can be appended without recomputing history.
+import numpy as np
+
+# Default periods used when no window is given
+DEFAULT_PERIODS = {
+    "sma": 20,
+    "ema": 20,
+    "rsi": 14,
+    "atr": 14,
+    "bollinger": 20,
+    "vwap": 20
+}
+
+MACD_PERIODS = (12, 26, 9)
+
+BOLLINGER_WIDTH = 2.0
+
+SUPPORTED_INDICATORS = ["sma", "ema", "rsi", "macd", "atr", "bollinger", "vwap"]
+
+# Largest decay ratio allowed inside one EMA block, keeps the scaled
+# cumulative sum well inside float64 range
+_EMA_BLOCK_RANGE = 1e12
+
+
+def _nan_like(x):
+    return np.full(x.shape, np.nan)
+
+def ema(x, alpha, seed=None):
+    """
+    Exponential moving average along the last axis.
+
+    The recursion y[t] = (1 - alpha) * y[t-1] + alpha * x[t] is evaluated in
+    closed form on blocks of bars: inside a block every output is a scaled
+    cumulative sum of the inputs, so the only Python loop is over blocks.
+
+    Args:
+        x: Input array, time on the last axis
+        alpha: Smoothing factor in (0, 1]
+        seed: Value of y before the first bar (default: the first input)
+
+    Returns:
+        Array of the same shape as x
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[-1]
+    if n == 0:
+        return x.copy()
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        return x.copy()
+
+    prev = x[..., 0] if seed is None else np.broadcast_to(np.asarray(seed, dtype=np.float64), x.shape[:-1])
+    block = max(1, min(n, int(np.log(_EMA_BLOCK_RANGE) / -np.log(decay))))
+    steps = np.arange(block, dtype=np.float64)
+    growth = decay ** -steps
+    shrink = decay ** steps
+
+    out = np.empty_like(x)
+    for start in range(0, n, block):
+        chunk = x[..., start:start + block]
+        size = chunk.shape[-1]
+        scaled = np.cumsum(chunk * growth[:size], axis=-1)
+        out[..., start:start + size] = (
+            shrink[:size] * (alpha * scaled + decay * prev[..., None])
+        )
+        prev = out[..., start + size - 1]
+    return out
+
+def sma(x, period):
+    """Simple moving average along the last axis, NaN for the warm-up bars"""
+    x = np.asarray(x, dtype=np.float64)
+    out = _nan_like(x)
+    if x.shape[-1] < period:
+        return out
+    totals = np.cumsum(x, axis=-1)
+    out[..., period - 1] = totals[..., period - 1]
+    out[..., period:] = totals[..., period:] - totals[..., :-period]
+    out[..., period - 1:] /= period
+    return out
+
+def rolling_std(x, period):
+    """Population standard deviation over a rolling window"""
+    x = np.asarray(x, dtype=np.float64)
+    out = _nan_like(x)
+    if x.shape[-1] < period:
+        return out
+    # Center on the first value to limit cancellation in the squared sums
+    centered = x - x[..., :1]
+    mean = sma(centered, period)
+    mean_sq = sma(centered * centered, period)
+    variance = np.maximum(mean_sq - mean * mean, 0.0)
+    out[..., period - 1:] = np.sqrt(variance[..., period - 1:])
+    return out
+
+def wilder(x, period, seed=None):
+    """
+    Wilder smoothing (alpha = 1 / period) along the last axis.
+
+    Without a seed the first output is the mean of the first `period` inputs
+    and the bars before it are NaN, as in Wilder's original definition.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    alpha = 1.0 / period
+    if seed is not None:
+        return ema(x, alpha, seed)
+    out = _nan_like(x)
+    if x.shape[-1] < period:
+        return out
+    first = x[..., :period].mean(axis=-1)
+    out[..., period - 1] = first
+    out[..., period:] = ema(x[..., period:], alpha, first)
+    return out
+
+def true_range(high, low, close, prev_close=None):
+    """True range; the first bar uses high - low unless prev_close is given"""
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    previous = np.empty_like(close)
+    previous[..., 1:] = close[..., :-1]
+    previous[..., 0] = close[..., 0] if prev_close is None else prev_close
+    ranges = np.maximum(high - low, np.abs(high - previous))
+    ranges = np.maximum(ranges, np.abs(low - previous))
+    if prev_close is None:
+        ranges[..., 0] = high[..., 0] - low[..., 0]
+    return ranges
+
+def price_changes(close, prev_close=None):
+    """Bar-to-bar gains and losses; the first bar is zero unless prev_close is given"""
+    close = np.asarray(close, dtype=np.float64)
+    previous = np.empty_like(close)
+    previous[..., 1:] = close[..., :-1]
+    previous[..., 0] = close[..., 0] if prev_close is None else prev_close
+    delta = close - previous
+    return np.maximum(delta, 0.0), np.maximum(-delta, 0.0)
+
+def rsi_from_averages(avg_gain, avg_loss):
+    """Relative strength index from smoothed gains and losses"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        values = 100.0 - 100.0 / (1.0 + rs)
+    values = np.where(avg_loss == 0, np.where(avg_gain == 0, 50.0, 100.0), values)
+    return np.where(np.isnan(avg_gain), np.nan, values)
+
+
+class IndicatorEngine:
+    """
+    Computes a set of indicators over candle columns and updates them in place
+    as new bars arrive.
+
+    `compute` runs the full history once; `update` only processes the new bars,
+    using the recursive state of EMA-type indicators and a short tail of recent
+    bars for windowed ones.
+    """
+
+    def __init__(self, indicators, window=None):
+        unknown = [name for name in indicators if name not in SUPPORTED_INDICATORS]
+        if unknown:
+            raise ValueError(f"Unsupported indicators: {unknown}. Supported: {SUPPORTED_INDICATORS}")
+        self.indicators = list(indicators)
+        self.periods = {
+            name: int(window) if window else DEFAULT_PERIODS.get(name)
+            for name in self.indicators
+        }
+        self.state = None
+
+    @property
+    def tail_size(self):
+        """Number of trailing bars kept for windowed indicators"""
+        windowed = [self.periods[name] for name in ("sma", "bollinger", "vwap") if name in self.periods]
+        return max(windowed + [1])
+
+    def compute(self, candles):
+        """
+        Compute indicators over full candle history.
+
+        Args:
+            candles: Dictionary with open/high/low/close/volume arrays, time on the last axis
+
+        Returns:
+            Dictionary of indicator output name to array
+        """
+        self.state = {}
+        return self._run(candles, fresh=True)
+
+    def update(self, candles):
+        """
+        Compute indicators for new bars only, continuing from the last call.
+
+        Args:
+            candles: Dictionary with open/high/low/close/volume arrays for the new bars
+
+        Returns:
+            Dictionary of indicator output name to array covering the new bars
+        """
+        if self.state is None:
+            return self.compute(candles)
+        return self._run(candles, fresh=False)
+
+    def _windowed_input(self, name, values):
+        """Prepend the stored tail so rolling windows span the update boundary"""
+        tail = self.state.get("tail", {}).get(name)
+        if tail is None:
+            return values, 0
+        return np.concatenate([tail, values], axis=-1), tail.shape[-1]
+
+    def _run(self, candles, fresh):
+        close = np.asarray(candles["close"], dtype=np.float64)
+        state = self.state
+        prev_close = None if fresh else state["last_close"]
+        out = {}
+
+        if "sma" in self.indicators:
+            values, skip = self._windowed_input("close", close)
+            out["sma"] = sma(values, self.periods["sma"])[..., skip:]
+
+        if "ema" in self.indicators:
+            period = self.periods["ema"]
+            out["ema"] = ema(close, 2.0 / (period + 1), state.get("ema"))
+            state["ema"] = out["ema"][..., -1]
+
+        if "rsi" in self.indicators:
+            period = self.periods["rsi"]
+            gains, losses = price_changes(close, prev_close)
+            if fresh:
+                # The first bar has no change, Wilder averages start after it
+                avg_gain = np.concatenate([_nan_like(gains[..., :1]), wilder(gains[..., 1:], period)], axis=-1)
+                avg_loss = np.concatenate([_nan_like(losses[..., :1]), wilder(losses[..., 1:], period)], axis=-1)
+            else:
+                avg_gain = wilder(gains, period, state["rsi_gain"])
+                avg_loss = wilder(losses, period, state["rsi_loss"])
+            out["rsi"] = rsi_from_averages(avg_gain, avg_loss)
+            state["rsi_gain"] = avg_gain[..., -1]
+            state["rsi_loss"] = avg_loss[..., -1]
+
+        if "macd" in self.indicators:
+            fast, slow, signal = MACD_PERIODS
+            fast_ema = ema(close, 2.0 / (fast + 1), state.get("macd_fast"))
+            slow_ema = ema(close, 2.0 / (slow + 1), state.get("macd_slow"))
+            line = fast_ema - slow_ema
+            signal_line = ema(line, 2.0 / (signal + 1), state.get("macd_signal"))
+            out["macd"] = line
+            out["macd_signal"] = signal_line
+            out["macd_histogram"] = line - signal_line
+            state["macd_fast"] = fast_ema[..., -1]
+            state["macd_slow"] = slow_ema[..., -1]
+            state["macd_signal"] = signal_line[..., -1]
+
+        if "atr" in self.indicators:
+            ranges = true_range(candles["high"], candles["low"], close, prev_close)
+            out["atr"] = wilder(ranges, self.periods["atr"], None if fresh else state["atr"])
+            state["atr"] = out["atr"][..., -1]
+
+        if "bollinger" in self.indicators:
+            period = self.periods["bollinger"]
+            values, skip = self._windowed_input("close", close)
+            middle = sma(values, period)[..., skip:]
+            width = BOLLINGER_WIDTH * rolling_std(values, period)[..., skip:]
+            out["bollinger_middle"] = middle
+            out["bollinger_upper"] = middle + width
+            out["bollinger_lower"] = middle - width
+
+        if "vwap" in self.indicators:
+            period = self.periods["vwap"]
+            typical = (
+                np.asarray(candles["high"], dtype=np.float64)
+                + np.asarray(candles["low"], dtype=np.float64)
+                + close
+            ) / 3.0
+            volume = np.asarray(candles["volume"], dtype=np.float64)
+            weighted, skip = self._windowed_input("weighted", typical * volume)
+            volumes, _ = self._windowed_input("volume", volume)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out["vwap"] = (sma(weighted, period) / sma(volumes, period))[..., skip:]
+
+        # Keep the trailing bars needed by windowed indicators
+        tail_size = self.tail_size
+        tail = {"close": self._extend_tail("close", close, tail_size)}
+        if "vwap" in self.indicators:
+            tail["weighted"] = self._extend_tail("weighted", typical * volume, tail_size)
+            tail["volume"] = self._extend_tail("volume", volume, tail_size)
+        state["tail"] = tail
+        state["last_close"] = close[..., -1]
+        return out
+
+    def _extend_tail(self, name, values, size):
+        previous = self.state.get("tail", {}).get(name)
+        if previous is not None:
+            values = np.concatenate([previous, values], axis=-1)
+        return values[..., -size:].copy()
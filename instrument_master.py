@@ -0,0 +1,239 @@
+# instrument_master.py
+# Option contracts, lot sizes and tick sizes from Dhan's instrument master
+# (the scrip master CSV).
+#
+# The option chain API reports prices, OI and Greeks per strike, but an order
+# also needs the contract's security ID, its lot size (F&O quantities are
+# whole lots) and its tick size. Dhan publishes these daily in the instrument
+# master. The file is downloaded to DHAN_SCRIP_MASTER_PATH when it is missing
+# or older than DHAN_SCRIP_MASTER_MAX_AGE_HOURS. Its rows are indexed once
+# per version of the file into a reference_cache index, which later processes
+# map instead of parsing the CSV again. To work offline, point
+# DHAN_SCRIP_MASTER_PATH at a saved copy and set the max age to 0 so it is
+# never downloaded.
+import csv
+import os
+import threading
+import time
+
+import requests
+from config import DHAN_SCRIP_MASTER_MAX_AGE_HOURS, DHAN_SCRIP_MASTER_PATH
+from reference_cache import ReferenceCache
+
+SCRIP_MASTER_URL = "https://images.dhan.co/api-data/api-scrip-master.csv"
+
+# (connect, read) timeout of the download in seconds
+DOWNLOAD_TIMEOUT = (5, 60)
+
+# Instrument types of index and stock options
+OPTION_INSTRUMENTS = ("OPTIDX", "OPTSTK")
+
+# Tick size of options when the master does not give one
+DEFAULT_TICK_SIZE = 0.05
+
+# Order segment of F&O contracts by exchange
+FNO_SEGMENTS = {
+    "NSE": "NSE_FNO",
+    "BSE": "BSE_FNO"
+}
+
+# Order segment by exchange and master segment (E equity, D derivatives,
+# C currency, M commodity)
+ORDER_SEGMENTS = {
+    ("NSE", "E"): "NSE_EQ",
+    ("BSE", "E"): "BSE_EQ",
+    ("NSE", "D"): "NSE_FNO",
+    ("BSE", "D"): "BSE_FNO",
+    ("NSE", "C"): "NSE_CURRENCY",
+    ("BSE", "C"): "BSE_CURRENCY",
+    ("MCX", "M"): "MCX_COMM"
+}
+
+
+class OptionContract:
+    """One option contract of the instrument master"""
+
+    __slots__ = ("security_id", "exchange_segment", "trading_symbol", "underlying", "expiry", "strike",
+                 "option_type", "lot_size", "tick_size")
+
+    def __init__(self, security_id, exchange_segment, trading_symbol, underlying, expiry, strike, option_type,
+                 lot_size, tick_size):
+        self.security_id = security_id
+        self.exchange_segment = exchange_segment
+        self.trading_symbol = trading_symbol
+        self.underlying = underlying
+        self.expiry = expiry
+        self.strike = strike
+        self.option_type = option_type
+        self.lot_size = lot_size
+        self.tick_size = tick_size
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def tick_size(row):
+    """Tick size of a master row in rupees, DEFAULT_TICK_SIZE if it gives none"""
+    try:
+        tick = float(row.get("SEM_TICK_SIZE") or 0)
+    except ValueError:
+        return DEFAULT_TICK_SIZE
+    # Tick sizes are given in paise (5.0 is 0.05 rupees)
+    return (tick / 100 if tick >= 1 else tick) or DEFAULT_TICK_SIZE
+
+def parse_option_contracts(lines):
+    """
+    Option contracts in instrument master CSV rows.
+
+    Args:
+        lines: Iterable of CSV lines, header first
+
+    Yields:
+        OptionContract for every NSE/BSE index or stock option row
+    """
+    for row in csv.DictReader(lines):
+        if row.get("SEM_INSTRUMENT_NAME") not in OPTION_INSTRUMENTS:
+            continue
+        segment = FNO_SEGMENTS.get(row.get("SEM_EXM_EXCH_ID"))
+        if segment is None:
+            continue
+        symbol = row.get("SEM_TRADING_SYMBOL") or ""
+        # e.g. NIFTY-Oct2024-25650-CE; the underlying may itself contain a hyphen (BAJAJ-AUTO)
+        parts = symbol.rsplit("-", 3)
+        try:
+            yield OptionContract(
+                str(row["SEM_SMST_SECURITY_ID"]), segment, symbol, parts[0].upper(),
+                row["SEM_EXPIRY_DATE"][:10], round(float(row["SEM_STRIKE_PRICE"]), 2),
+                row["SEM_OPTION_TYPE"].upper(), int(float(row["SEM_LOT_UNITS"])), tick_size(row)
+            )
+        except (KeyError, ValueError):
+            continue
+
+def option_key(underlying, expiry, strike, option_type):
+    return f"{str(underlying).upper()}|{expiry}|{round(float(strike), 2):.2f}|{str(option_type).upper()}"
+
+def build_instrument_index(path):
+    """
+    Sections of the instrument master index:
+
+        options      "NIFTY|2024-10-31|24500.00|CE" -> [security ID, segment,
+                     trading symbol, lot size, tick size]
+        instruments  "NSE_EQ|11536" -> [tick size, lot size, trading symbol]
+    """
+    options, instruments = {}, {}
+    with open(path, "r", newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            segment = ORDER_SEGMENTS.get((row.get("SEM_EXM_EXCH_ID"), row.get("SEM_SEGMENT")))
+            if segment is None or not row.get("SEM_SMST_SECURITY_ID"):
+                continue
+            try:
+                lot_size = int(float(row.get("SEM_LOT_UNITS") or 1))
+            except ValueError:
+                lot_size = 1
+            instruments[f"{segment}|{row['SEM_SMST_SECURITY_ID']}"] = [
+                tick_size(row), lot_size, row.get("SEM_TRADING_SYMBOL") or ""
+            ]
+    with open(path, "r", newline="", encoding="utf-8") as file:
+        for contract in parse_option_contracts(file):
+            options[option_key(contract.underlying, contract.expiry, contract.strike, contract.option_type)] = [
+                contract.security_id, contract.exchange_segment, contract.trading_symbol, contract.lot_size,
+                contract.tick_size
+            ]
+    return {"options": options, "instruments": instruments}
+
+
+class InstrumentMaster:
+    """
+    Option contracts, lot sizes and tick sizes of the instrument master.
+
+    Args:
+        path: Local copy of the master CSV
+        max_age_hours: Download again when the copy is older than this
+            (0: never download)
+        url: Where to download the master from
+    """
+
+    def __init__(self, path=DHAN_SCRIP_MASTER_PATH, max_age_hours=DHAN_SCRIP_MASTER_MAX_AGE_HOURS,
+                 url=SCRIP_MASTER_URL):
+        self.path = path
+        self.max_age_hours = max_age_hours
+        self.url = url
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._cache = ReferenceCache("instrument_master", [path], build_instrument_index)
+
+    def _download(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        partial = f"{self.path}.part"
+        with requests.get(self.url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            with open(partial, "wb") as file:
+                for chunk in response.iter_content(1024 * 1024):
+                    file.write(chunk)
+        os.replace(partial, self.path)
+
+    def _is_stale(self):
+        if not os.path.exists(self.path):
+            return True
+        return self.max_age_hours > 0 and time.time() - os.path.getmtime(self.path) > self.max_age_hours * 3600
+
+    def _refresh(self):
+        """Download the master if it is missing or stale (checked at most once a minute)"""
+        if self.max_age_hours <= 0 or time.monotonic() - self._checked < 60:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked < 60:
+                return
+            if self._is_stale():
+                try:
+                    self._download()
+                except (OSError, requests.exceptions.RequestException):
+                    # A stale copy is better than none
+                    if not os.path.exists(self.path):
+                        raise
+            self._checked = time.monotonic()
+
+    def section(self, name):
+        """
+        A section of the master's index, downloading the master or
+        rebuilding the index if needed.
+
+        Raises:
+            OSError or requests.exceptions.RequestException if there is no
+            local copy and it cannot be downloaded
+        """
+        self._refresh()
+        return self._cache.section(name)
+
+    def option_contract(self, underlying, expiry, strike, option_type):
+        """
+        The contract for an option, or None if the master does not list it.
+
+        Args:
+            underlying: Underlying symbol, e.g. "NIFTY"
+            expiry: Expiry date, YYYY-MM-DD
+            strike: Strike price
+            option_type: "CE" or "PE"
+        """
+        entry = self.section("options").get(option_key(underlying, expiry, strike, option_type))
+        if entry is None:
+            return None
+        security_id, segment, trading_symbol, lot_size, tick = entry
+        return OptionContract(security_id, segment, trading_symbol, str(underlying).upper(), str(expiry),
+                              round(float(strike), 2), str(option_type).upper(), lot_size, tick)
+
+    def instrument(self, exchange_segment, security_id):
+        """
+        (tick size, lot size, trading symbol) of any instrument, or None if
+        the master does not list it.
+
+        Args:
+            exchange_segment: Order segment, e.g. "NSE_EQ"
+            security_id: Dhan security ID
+        """
+        entry = self.section("instruments").get(f"{exchange_segment}|{security_id}")
+        return tuple(entry) if entry is not None else None
+
+
+# Shared instrument master for this process
+master = InstrumentMaster()
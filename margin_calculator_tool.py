@@ -1,37 +1,14 @@
 # margin_calculator_tool.py
-import json
-import os
 import requests
 from mcp.server.fastmcp import FastMCP
 from config import DHAN_CLIENT_ID, DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL
+import dhan_client
+from reference_cache import find_stock_code
+from tool_metrics import instrument_server
 
 # Create the MCP server
 mcp = FastMCP("DhanHQ Margin Calculator")
-
-# Helper function to load stocks data
-def load_stocks_data():
-    """Load the stocks data from stocks.json file"""
-    try:
-        # Get the directory of the current script
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        # Construct the path to stocks.json
-        stocks_file_path = os.path.join(script_dir, "stocks.json")
-        
-        with open(stocks_file_path, 'r') as file:
-            data = json.load(file)
-            return data.get('companies', [])
-    except Exception as e:
-        print(f"Error loading stocks data: {e}")
-        return []
-
-# Find stock code by name
-def find_stock_code(stock_name):
-    """Find the stock code for a given stock name"""
-    stocks = load_stocks_data()
-    for stock in stocks:
-        if stock.get('stock_name', '').lower() == stock_name.lower():
-            return stock.get('stock_code')
-    return None
+instrument_server(mcp)
 
 @mcp.tool()
 def calculate_margin_by_stock_name(
@@ -96,7 +73,7 @@ def calculate_margin_by_stock_name(
         data["triggerPrice"] = trigger_price
     
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = dhan_client.post(url, headers=headers, json=data)
         response.raise_for_status()
         
         margin_data = response.json()
@@ -0,0 +1,43 @@
+# market_quotes.py
+# Last traded prices from Dhan's market quote API, shared by the tools that
+# price securities (price alerts, portfolio analytics) without importing
+# each other's servers.
+from config import DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL, DHAN_CLIENT_ID
+import dhan_client
+
+# Maximum number of instruments per market quote request
+QUOTE_BATCH_SIZE = 1000
+
+
+def fetch_last_prices(security_ids):
+    """
+    Fetch last traded prices for NSE_EQ securities in batches.
+
+    Args:
+        security_ids: Iterable of security IDs
+
+    Returns:
+        Dictionary mapping security ID to last traded price
+    """
+    url = f"{DHAN_API_BASE_URL}/marketfeed/ltp"
+    headers = {
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "access-token": DHAN_ACCESS_TOKEN,
+        "client-id": DHAN_CLIENT_ID
+    }
+
+    security_ids = list(security_ids)
+    prices = {}
+    for start in range(0, len(security_ids), QUOTE_BATCH_SIZE):
+        batch = security_ids[start:start + QUOTE_BATCH_SIZE]
+        data = {"NSE_EQ": [int(security_id) for security_id in batch]}
+
+        response = dhan_client.post(url, headers=headers, json=data)
+        response.raise_for_status()
+
+        quotes = response.json().get("data", {}).get("NSE_EQ", {})
+        for security_id, quote in quotes.items():
+            if quote.get("last_price") is not None:
+                prices[str(security_id)] = float(quote["last_price"])
+    return prices
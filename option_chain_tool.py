@@ -0,0 +1,561 @@
+# option_chain_tool.py
+import datetime
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+import requests
+from mcp.server.fastmcp import FastMCP
+from config import (
+    DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL, DHAN_CLIENT_ID, DHAN_OPTION_CHAIN_FIXTURES, DHAN_OPTION_CHAIN_TTL_SECONDS,
+    DHAN_RISK_FREE_RATE
+)
+import dhan_client
+import shared_store
+from instrument_master import master
+from option_greeks import greeks, implied_forward, implied_volatility
+from order_idempotency import submit_order
+from reference_cache import find_stock_code
+from tool_metrics import instrument_server
+
+# Create the MCP server
+mcp = FastMCP("DhanHQ Option Chain")
+instrument_server(mcp)
+
+# Index underlyings and their security IDs (segment IDX_I); other names are
+# looked up in stocks.json (segment NSE_EQ)
+INDEX_UNDERLYINGS = {
+    "NIFTY": "13",
+    "BANKNIFTY": "25",
+    "FINNIFTY": "27",
+    "MIDCPNIFTY": "442",
+    "SENSEX": "51",
+    "BANKEX": "69"
+}
+
+# Options expire at the close of their expiry day
+IST_OFFSET = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+EXPIRY_TIME = datetime.time(15, 30)
+
+# Columns kept for each call and put, by the Dhan field they come from
+LEG_FIELDS = {
+    "last_price": "last_price",
+    "bid": "top_bid_price",
+    "ask": "top_ask_price",
+    "oi": "oi",
+    "previous_oi": "previous_oi",
+    "volume": "volume"
+}
+
+# Expiry lists change once a day at most
+EXPIRY_LIST_TTL_SECONDS = 3600
+
+
+def resolve_underlying(underlying):
+    """(name, security ID, segment) of an index or a stock in stocks.json, or None"""
+    name = str(underlying).strip().upper()
+    if name in INDEX_UNDERLYINGS:
+        return name, INDEX_UNDERLYINGS[name], "IDX_I"
+    stock_code = find_stock_code(name)
+    if stock_code:
+        return name, str(stock_code), "NSE_EQ"
+    return None
+
+def parse_time(value):
+    """Parse "YYYY-MM-DD" or "YYYY-MM-DD HH:MM" in IST (default: now)"""
+    if value is None or str(value).strip() == "":
+        return datetime.datetime.now(IST_OFFSET)
+    value = str(value).strip()
+    format = "%Y-%m-%d %H:%M" if " " in value else "%Y-%m-%d"
+    return datetime.datetime.strptime(value, format).replace(tzinfo=IST_OFFSET)
+
+
+class ResponseCache:
+    """
+    Upstream response data reused for `ttl` seconds.
+
+    Concurrent callers asking for the same key wait for a single fetch. With
+    a shared store the data is also kept there, so the worker processes of
+    a deployment share one fetch (Dhan allows one option chain request every
+    3 seconds).
+
+    Args:
+        namespace: Shared store namespace
+        ttl: Seconds a response is reused
+        store: SharedStore, or None to cache in this process only
+    """
+
+    def __init__(self, namespace, ttl, store=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.store = store
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def get(self, key, fetch, parse=None):
+        """
+        The cached value for key, or parse(fetch()) kept for `ttl` seconds.
+
+        Args:
+            key: Tuple of strings
+            fetch: Called without arguments on a miss; returns JSON data
+            parse: Turns the data into the value returned (default: the data)
+        """
+        with self._lock:
+            value = self._cached(key)
+            if value is not None:
+                return value
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                # Fetched by another caller while this one waited
+                value = self._cached(key)
+                if value is not None:
+                    return value
+            store_key = "|".join(key)
+            data = self.store.get(self.namespace, store_key) if self.store is not None else None
+            if data is None:
+                data = fetch()
+                if self.store is not None and self.ttl > 0:
+                    self.store.set(self.namespace, store_key, data, ttl=self.ttl)
+                with self._lock:
+                    self.misses += 1
+            else:
+                with self._lock:
+                    self.hits += 1
+            value = parse(data) if parse is not None else data
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+            return value
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "ttl_seconds": self.ttl}
+
+
+class OptionChain:
+    """
+    One option chain as NumPy columns, strikes ascending.
+
+    Attributes:
+        underlying: Underlying name
+        expiry: Expiry date, YYYY-MM-DD
+        spot: Last price of the underlying
+        strikes: Strike prices
+        calls, puts: Column name (LEG_FIELDS, security_id) -> values per strike
+    """
+
+    def __init__(self, underlying, expiry, data):
+        self.underlying = underlying
+        self.expiry = expiry
+        self.spot = float(data.get("last_price") or 0.0)
+        entries = sorted(((float(strike), entry) for strike, entry in (data.get("oc") or {}).items()),
+                         key=lambda item: item[0])
+        self.strikes = np.array([strike for strike, _ in entries], dtype=np.float64)
+        self.calls = self._columns([entry.get("ce") or {} for _, entry in entries])
+        self.puts = self._columns([entry.get("pe") or {} for _, entry in entries])
+
+    @staticmethod
+    def _columns(legs):
+        columns = {
+            name: np.fromiter((leg.get(key) or 0.0 for leg in legs), dtype=np.float64, count=len(legs))
+            for name, key in LEG_FIELDS.items()
+        }
+        # Recent chain responses name each contract; older ones need the instrument master
+        columns["security_id"] = [str(leg["security_id"]) if leg.get("security_id") else None for leg in legs]
+        return columns
+
+    def prices(self, columns):
+        """Mid price where both sides are quoted, otherwise the last price (NaN if neither)"""
+        bid, ask, last = columns["bid"], columns["ask"], columns["last_price"]
+        price = np.where((bid > 0) & (ask >= bid), 0.5 * (bid + ask), last)
+        return np.where(price > 0, price, np.nan)
+
+
+def analyse(chain, as_of, rate):
+    """
+    Implied volatility and Greeks of every call and put of a chain in one
+    vectorized pass.
+
+    The forward is implied from put-call parity near the money, and the
+    carry it implies is used for every strike, so calls and puts of a strike
+    give the same volatility.
+
+    Args:
+        chain: OptionChain
+        as_of: Valuation time (aware datetime)
+        rate: Risk-free rate
+
+    Returns:
+        Dictionary with years to expiry, the forward, and arrays of shape
+        (2, strikes) (calls first) for price, iv and each Greek
+    """
+    expiry = datetime.datetime.combine(datetime.date.fromisoformat(chain.expiry), EXPIRY_TIME, IST_OFFSET)
+    years = max((expiry - as_of).total_seconds(), 0.0) / (365 * 86400)
+    prices = np.vstack([chain.prices(chain.calls), chain.prices(chain.puts)])
+    forward = implied_forward(chain.strikes, prices[0], prices[1], years, rate) if years > 0 else float("nan")
+    if not forward > 0:
+        forward = chain.spot * math.exp(rate * years)
+    dividend = rate - math.log(forward / chain.spot) / years if years > 0 else 0.0
+
+    is_call = np.array([[True], [False]])
+    iv = implied_volatility(prices, chain.spot, chain.strikes, years, rate, is_call, dividend)
+    analysis = greeks(chain.spot, chain.strikes, years, rate, iv, is_call, dividend)
+    analysis.update({"years": years, "forward": forward, "price": prices, "iv": iv})
+    return analysis
+
+def select_strikes(chain, strikes_around_atm=None, min_oi=0):
+    """
+    Indices of the strikes that pass the filters, and the at-the-money index.
+
+    Args:
+        strikes_around_atm: Keep this many strikes on each side of the money
+        min_oi: Keep strikes where the call or the put has at least this open interest
+    """
+    count = chain.strikes.size
+    atm = int(np.argmin(np.abs(chain.strikes - chain.spot))) if count else 0
+    keep = np.ones(count, dtype=bool)
+    if strikes_around_atm is not None:
+        keep &= np.abs(np.arange(count) - atm) <= int(strikes_around_atm)
+    if min_oi:
+        keep &= np.maximum(chain.calls["oi"], chain.puts["oi"]) >= float(min_oi)
+    return np.flatnonzero(keep), atm
+
+def _values(array, digits):
+    """Rounded values for a JSON result, None for NaN"""
+    return [None if value != value else value for value in np.round(array, digits).tolist()]
+
+def leg_rows(columns, analysis, side, index):
+    """One result row per selected strike for the calls (side 0) or puts (side 1)"""
+    fields = {
+        "last_price": _values(columns["last_price"][index], 2),
+        "bid": _values(columns["bid"][index], 2),
+        "ask": _values(columns["ask"][index], 2),
+        "oi": _values(columns["oi"][index], 0),
+        "oi_change": _values(columns["oi"][index] - columns["previous_oi"][index], 0),
+        "volume": _values(columns["volume"][index], 0),
+        "iv": _values(analysis["iv"][side][index] * 100, 2),
+        "delta": _values(analysis["delta"][side][index], 4),
+        "gamma": _values(analysis["gamma"][side][index], 6),
+        "theta": _values(analysis["theta"][side][index], 2),
+        "vega": _values(analysis["vega"][side][index], 2)
+    }
+    security_ids = [columns["security_id"][i] for i in index.tolist()]
+    rows = [dict(zip(fields, values)) for values in zip(*fields.values())]
+    for row, security_id in zip(rows, security_ids):
+        if security_id:
+            row["security_id"] = security_id
+    return rows
+
+def _headers():
+    return {
+        "Content-Type": "application/json",
+        "access-token": DHAN_ACCESS_TOKEN,
+        "client-id": DHAN_CLIENT_ID
+    }
+
+def fetch_expiries(name, security_id, segment):
+    """Expiry dates of the options on an underlying, from the API or the fixture directory"""
+    if DHAN_OPTION_CHAIN_FIXTURES:
+        prefix = f"{name}_"
+        return sorted(file[len(prefix):-len(".json")] for file in os.listdir(DHAN_OPTION_CHAIN_FIXTURES)
+                      if file.startswith(prefix) and file.endswith(".json"))
+    response = dhan_client.post(f"{DHAN_API_BASE_URL}/optionchain/expirylist", headers=_headers(),
+                                json={"UnderlyingScrip": int(security_id), "UnderlyingSeg": segment})
+    response.raise_for_status()
+    return list(response.json().get("data") or [])
+
+def fetch_chain(name, security_id, segment, expiry):
+    """The data of an option chain response (last_price, oc), from the API or the fixture directory"""
+    if DHAN_OPTION_CHAIN_FIXTURES:
+        with open(os.path.join(DHAN_OPTION_CHAIN_FIXTURES, f"{name}_{expiry}.json"), 'r') as file:
+            payload = json.load(file)
+    else:
+        response = dhan_client.post(f"{DHAN_API_BASE_URL}/optionchain", headers=_headers(),
+                                    json={"UnderlyingScrip": int(security_id), "UnderlyingSeg": segment,
+                                          "Expiry": expiry})
+        response.raise_for_status()
+        payload = response.json()
+    return payload.get("data") or {}
+
+
+# Shared caches for this server
+chain_cache = ResponseCache("option_chain", DHAN_OPTION_CHAIN_TTL_SECONDS, shared_store.store)
+expiry_cache = ResponseCache("option_expiries", EXPIRY_LIST_TTL_SECONDS, shared_store.store)
+
+def get_expiries(name, security_id, segment):
+    return expiry_cache.get((name,), lambda: fetch_expiries(name, security_id, segment))
+
+@mcp.tool()
+def get_option_expiries(underlying):
+    """
+    List the option expiry dates of an index or stock.
+
+    Args:
+        underlying: Index (NIFTY, BANKNIFTY, FINNIFTY, MIDCPNIFTY, SENSEX,
+            BANKEX) or stock name (e.g. "RELIANCE")
+
+    Returns:
+        Expiry dates in YYYY-MM-DD format, nearest first
+    """
+    resolved = resolve_underlying(underlying)
+    if resolved is None:
+        return {
+            "status": "error",
+            "message": f"Unknown underlying '{underlying}'. Use an index ({', '.join(INDEX_UNDERLYINGS)}) or a stock in stocks.json"
+        }
+    try:
+        expiries = get_expiries(*resolved)
+    except (OSError, requests.exceptions.RequestException) as e:
+        return {
+            "status": "error",
+            "message": f"Failed to fetch expiries: {str(e)}"
+        }
+    return {
+        "status": "success",
+        "underlying": resolved[0],
+        "expiries": expiries
+    }
+
+@mcp.tool()
+def get_option_chain(underlying, expiry=None, strikes_around_atm=None, min_oi=0, rate=None, as_of=None):
+    """
+    Get an option chain with implied volatility and Greeks for every strike.
+
+    The chain is fetched once and reused for a few seconds; implied
+    volatility (from the bid/ask mid, or the last price) and Greeks are
+    computed for all calls and puts together.
+
+    Args:
+        underlying: Index (NIFTY, BANKNIFTY, FINNIFTY, MIDCPNIFTY, SENSEX,
+            BANKEX) or stock name (e.g. "RELIANCE")
+        expiry: Expiry date in YYYY-MM-DD format (default: the nearest expiry)
+        strikes_around_atm: Only return this many strikes on each side of
+            the at-the-money strike (default: all strikes)
+        min_oi: Only return strikes where the call or the put has at least
+            this open interest (default: 0)
+        rate: Annual risk-free rate (default: DHAN_RISK_FREE_RATE, 0.065)
+        as_of: Valuation time "YYYY-MM-DD HH:MM" IST (default: now); set it
+            to value a saved chain at the time it was captured
+
+    Returns:
+        Spot, implied forward, put-call ratio and one row per strike with
+        price, OI, volume, IV (percent), delta, gamma, theta (per day) and
+        vega (per volatility point) of the call and the put
+    """
+    resolved = resolve_underlying(underlying)
+    if resolved is None:
+        return {
+            "status": "error",
+            "message": f"Unknown underlying '{underlying}'. Use an index ({', '.join(INDEX_UNDERLYINGS)}) or a stock in stocks.json"
+        }
+    name, security_id, segment = resolved
+    try:
+        valuation_time = parse_time(as_of)
+        if expiry is not None:
+            expiry = datetime.date.fromisoformat(str(expiry).strip()).isoformat()
+        rate = DHAN_RISK_FREE_RATE if rate is None else float(rate)
+        if strikes_around_atm is not None and int(strikes_around_atm) < 0:
+            raise ValueError("strikes_around_atm must not be negative")
+    except ValueError as e:
+        return {
+            "status": "error",
+            "message": f"Invalid argument: {str(e)}. Dates are YYYY-MM-DD (as_of: YYYY-MM-DD HH:MM)"
+        }
+
+    try:
+        if expiry is None:
+            upcoming = [date for date in get_expiries(name, security_id, segment)
+                        if date >= valuation_time.date().isoformat()]
+            if not upcoming:
+                return {
+                    "status": "error",
+                    "message": f"No upcoming option expiries for {name}"
+                }
+            expiry = upcoming[0]
+        chain = chain_cache.get((name, expiry), lambda: fetch_chain(name, security_id, segment, expiry),
+                                lambda data: OptionChain(name, expiry, data))
+    except FileNotFoundError:
+        return {
+            "status": "error",
+            "message": f"No saved option chain for {name} {expiry} in {DHAN_OPTION_CHAIN_FIXTURES}"
+        }
+    except (OSError, ValueError, requests.exceptions.RequestException) as e:
+        return {
+            "status": "error",
+            "message": f"Failed to fetch option chain: {str(e)}"
+        }
+
+    if chain.strikes.size == 0 or chain.spot <= 0:
+        return {
+            "status": "error",
+            "message": f"The option chain for {name} {expiry} is empty"
+        }
+    analysis = analyse(chain, valuation_time, rate)
+    if analysis["years"] <= 0:
+        return {
+            "status": "error",
+            "message": f"The {expiry} expiry has passed"
+        }
+
+    index, atm = select_strikes(chain, strikes_around_atm, min_oi)
+    calls = leg_rows(chain.calls, analysis, 0, index)
+    puts = leg_rows(chain.puts, analysis, 1, index)
+    call_oi = float(chain.calls["oi"].sum())
+    return {
+        "status": "success",
+        "underlying": name,
+        "expiry": expiry,
+        "spot": chain.spot,
+        "forward": round(analysis["forward"], 2),
+        "atm_strike": float(chain.strikes[atm]),
+        "days_to_expiry": round(analysis["years"] * 365, 2),
+        "risk_free_rate": rate,
+        "put_call_ratio": round(float(chain.puts["oi"].sum()) / call_oi, 3) if call_oi else None,
+        "strikes_total": int(chain.strikes.size),
+        "strikes_count": int(index.size),
+        "strikes": [
+            {"strike": strike, "call": call, "put": put}
+            for strike, call, put in zip(chain.strikes[index].tolist(), calls, puts)
+        ],
+        "cache": chain_cache.stats()
+    }
+
+@mcp.tool()
+def place_option_order(underlying, expiry, strike, option_type, lots, transaction_type, product_type="INTRADAY",
+                       order_type="MARKET", price=None, correlation_id=None):
+    """
+    Place an order for an option contract, sized in lots.
+
+    The contract's security ID, exchange segment (NSE_FNO or BSE_FNO) and
+    lot size come from Dhan's instrument master, so the quantity sent is
+    always a whole number of lots.
+
+    Args:
+        underlying: Index (e.g. "NIFTY") or stock name (e.g. "RELIANCE")
+        expiry: Expiry date in YYYY-MM-DD format
+        strike: Strike price
+        option_type: "CE" (call) or "PE" (put)
+        lots: Number of lots
+        transaction_type: "BUY" or "SELL"
+        product_type: "INTRADAY" or "MARGIN" to carry forward (default: "INTRADAY")
+        order_type: "MARKET" or "LIMIT" (default: "MARKET")
+        price: Limit price for LIMIT orders, rounded to the contract's tick size
+        correlation_id: Client ID for this order (optional). Reusing it returns
+            the order it already placed instead of placing a new one
+
+    Returns:
+        Order status information with the contract and quantity sent
+    """
+    if transaction_type.upper() not in ["BUY", "SELL"]:
+        return {
+            "status": "error",
+            "message": "Transaction type must be either 'BUY' or 'SELL'"
+        }
+    option_type = {"CALL": "CE", "PUT": "PE"}.get(str(option_type).upper(), str(option_type).upper())
+    if option_type not in ("CE", "PE"):
+        return {
+            "status": "error",
+            "message": "Option type must be 'CE' or 'PE'"
+        }
+    try:
+        lots = int(lots)
+        strike = float(strike)
+        price = float(price) if price not in (None, "") else None
+    except (TypeError, ValueError):
+        return {
+            "status": "error",
+            "message": "lots, strike and price must be numbers"
+        }
+    if lots <= 0:
+        return {
+            "status": "error",
+            "message": "lots must be a positive whole number"
+        }
+    if order_type.upper() == "LIMIT" and not price:
+        return {
+            "status": "error",
+            "message": "LIMIT orders need a price"
+        }
+
+    try:
+        contract = master.option_contract(underlying, expiry, strike, option_type)
+    except (OSError, requests.exceptions.RequestException) as e:
+        return {
+            "status": "error",
+            "message": f"Instrument master unavailable: {str(e)}"
+        }
+    if contract is None:
+        return {
+            "status": "error",
+            "message": f"No {str(underlying).upper()} {expiry} {strike:g} {option_type} contract in the instrument master"
+        }
+
+    quantity = lots * contract.lot_size
+    if price is not None:
+        price = round(round(price / contract.tick_size) * contract.tick_size, 2)
+    url = f"{DHAN_API_BASE_URL}/orders"
+    headers = {
+        "Content-Type": "application/json",
+        "access-token": DHAN_ACCESS_TOKEN
+    }
+    order_data = {
+        "dhanClientId": DHAN_CLIENT_ID,
+        "transactionType": transaction_type.upper(),
+        "exchangeSegment": contract.exchange_segment,
+        "productType": product_type.upper(),
+        "orderType": order_type.upper(),
+        "validity": "DAY",
+        "securityId": contract.security_id,
+        "quantity": str(quantity),
+        "disclosedQuantity": "",
+        "price": str(price) if price is not None and order_type.upper() == "LIMIT" else "",
+        "triggerPrice": "",
+        "afterMarketOrder": False
+    }
+
+    try:
+        response, correlation_id, outcome = submit_order(url, headers, order_data, correlation_id)
+
+        if response.status_code in [200, 201, 202]:
+            return {
+                "status": "success",
+                "message": f"Order placed for {lots} lots ({quantity} units) of {contract.trading_symbol}",
+                "order_details": response.json(),
+                "contract": contract.to_dict(),
+                "quantity": quantity,
+                "correlation_id": correlation_id,
+                "submission": outcome
+            }
+        else:
+            return {
+                "status": "error",
+                "message": f"Failed to place order. Status code: {response.status_code}",
+                "details": response.text,
+                "contract": contract.to_dict(),
+                "correlation_id": correlation_id,
+                "submission": outcome
+            }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Error placing order: {str(e)}"
+        }
+
+# Run the server if executed directly
+if __name__ == "__main__":
+    mcp.run()
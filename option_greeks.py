@@ -0,0 +1,184 @@
+# option_greeks.py
+# Vectorized Black-Scholes prices, Greeks and implied volatility.
+#
+# Every function takes NumPy arrays (or scalars) that broadcast together, so
+# the calls and puts of a whole option chain are priced in one pass. Implied
+# volatility is solved for all options at once: Newton steps on the options
+# that have not converged yet, falling back to bisection inside a bracket
+# that tightens every iteration wherever a Newton step would leave it, so
+# deep in- and out-of-the-money strikes with almost no vega still converge.
+import numpy as np
+
+# Bracket of the implied volatility solver (annualised)
+MIN_VOLATILITY = 1e-4
+MAX_VOLATILITY = 5.0
+
+# Prices are solved to this absolute tolerance
+IV_TOLERANCE = 1e-6
+IV_MAX_ITERATIONS = 100
+
+_SQRT_2PI = np.sqrt(2.0 * np.pi)
+
+
+def norm_pdf(x):
+    """Standard normal density"""
+    x = np.asarray(x, dtype=np.float64)
+    return np.exp(-0.5 * x * x) / _SQRT_2PI
+
+def norm_cdf(x):
+    """
+    Standard normal distribution function (Hart's double precision
+    approximation, as given by West, absolute error below 1e-14).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    z = np.abs(x)
+    exponential = np.exp(-0.5 * z * z)
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        numerator = ((((((0.0352624965998911 * z + 0.700383064443688) * z + 6.37396220353165) * z
+                        + 33.912866078383) * z + 112.079291497871) * z + 221.213596169931) * z + 220.206867912376)
+        denominator = (((((((0.0883883476483184 * z + 1.75566716318264) * z + 16.064177579207) * z
+                           + 86.7807322029461) * z + 296.564248779674) * z + 637.333633378831) * z
+                        + 793.826512519948) * z + 440.413735824752)
+        central = exponential * numerator / denominator
+        tail = exponential / (z + 1 / (z + 2 / (z + 3 / (z + 4 / (z + 0.65))))) / _SQRT_2PI
+    lower = np.where(z < 7.07106781186547, central, tail)
+    lower = np.where(z > 37.0, 0.0, lower)
+    return np.where(x > 0, 1.0 - lower, lower)
+
+def _d1_d2(spot, strike, t, rate, sigma, dividend):
+    root_t = np.sqrt(t)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1 = (np.log(spot / strike) + (rate - dividend + 0.5 * sigma * sigma) * t) / (sigma * root_t)
+    return d1, d1 - sigma * root_t
+
+def bs_price(spot, strike, t, rate, sigma, is_call, dividend=0.0):
+    """
+    Black-Scholes-Merton price of European options.
+
+    Args:
+        spot: Price of the underlying
+        strike: Strike price
+        t: Time to expiry in years
+        rate: Continuously compounded risk-free rate
+        sigma: Annualised volatility
+        is_call: True for calls, False for puts
+        dividend: Continuous dividend (carry) yield
+
+    Returns:
+        Array of option prices
+    """
+    spot, strike, t, sigma = (np.asarray(v, dtype=np.float64) for v in (spot, strike, t, sigma))
+    d1, d2 = _d1_d2(spot, strike, t, rate, sigma, dividend)
+    forward_value = spot * np.exp(-dividend * t)
+    strike_value = strike * np.exp(-rate * t)
+    call = forward_value * norm_cdf(d1) - strike_value * norm_cdf(d2)
+    put = strike_value * norm_cdf(-d2) - forward_value * norm_cdf(-d1)
+    return np.where(is_call, call, put)
+
+def greeks(spot, strike, t, rate, sigma, is_call, dividend=0.0):
+    """
+    Black-Scholes-Merton Greeks of European options.
+
+    Args:
+        Same as bs_price
+
+    Returns:
+        Dictionary of arrays: delta, gamma, theta (per calendar day), vega
+        (per volatility point) and rho (per rate point)
+    """
+    spot, strike, t, sigma = (np.asarray(v, dtype=np.float64) for v in (spot, strike, t, sigma))
+    d1, d2 = _d1_d2(spot, strike, t, rate, sigma, dividend)
+    root_t = np.sqrt(t)
+    carry = np.exp(-dividend * t)
+    discount = np.exp(-rate * t)
+    density = norm_pdf(d1)
+    cdf_d1, cdf_d2 = norm_cdf(d1), norm_cdf(d2)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gamma = carry * density / (spot * sigma * root_t)
+        decay = -spot * carry * density * sigma / (2 * root_t)
+    call_theta = decay - rate * strike * discount * cdf_d2 + dividend * spot * carry * cdf_d1
+    put_theta = decay + rate * strike * discount * (1 - cdf_d2) - dividend * spot * carry * (1 - cdf_d1)
+    return {
+        "delta": np.where(is_call, carry * cdf_d1, carry * (cdf_d1 - 1)),
+        "gamma": gamma,
+        "theta": np.where(is_call, call_theta, put_theta) / 365.0,
+        "vega": spot * carry * density * root_t / 100.0,
+        "rho": np.where(is_call, strike * t * discount * cdf_d2, -strike * t * discount * (1 - cdf_d2)) / 100.0
+    }
+
+def implied_volatility(price, spot, strike, t, rate, is_call, dividend=0.0, tol=IV_TOLERANCE,
+                       max_iterations=IV_MAX_ITERATIONS):
+    """
+    Implied volatility of European options from their prices.
+
+    Args:
+        price: Option prices
+        tol: Absolute price tolerance
+        max_iterations: Newton/bisection iterations before giving up
+        Others as in bs_price
+
+    Returns:
+        Array of volatilities, NaN where the price is outside the no-arbitrage
+        bounds, the option has expired, or the solver did not converge
+    """
+    price, spot, strike, t, is_call = np.broadcast_arrays(
+        np.asarray(price, dtype=np.float64), np.asarray(spot, dtype=np.float64),
+        np.asarray(strike, dtype=np.float64), np.asarray(t, dtype=np.float64), np.asarray(is_call, dtype=bool))
+    shape = price.shape
+    price, spot, strike, t, is_call = (a.ravel() for a in (price, spot, strike, t, is_call))
+
+    forward_value = spot * np.exp(-dividend * t)
+    strike_value = strike * np.exp(-rate * t)
+    with np.errstate(invalid="ignore"):
+        lower = np.maximum(np.where(is_call, forward_value - strike_value, strike_value - forward_value), 0.0)
+        upper = np.where(is_call, forward_value, strike_value)
+        valid = np.isfinite(price) & (t > 0) & (strike > 0) & (spot > 0) & (price > lower) & (price < upper)
+
+    result = np.full(price.shape, np.nan)
+    active = np.flatnonzero(valid)
+    if active.size == 0:
+        return result.reshape(shape)
+
+    # Brenner-Subrahmanyam start, inside the bracket
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma = np.clip(_SQRT_2PI / np.sqrt(t[active]) * price[active] / spot[active], 0.05, 1.0)
+    low = np.full(active.size, MIN_VOLATILITY)
+    high = np.full(active.size, MAX_VOLATILITY)
+
+    for _ in range(max_iterations):
+        p, s, k, tt, call = price[active], spot[active], strike[active], t[active], is_call[active]
+        error = bs_price(s, k, tt, rate, sigma, call, dividend) - p
+        done = np.abs(error) < tol
+        result[active[done]] = sigma[done]
+        keep = ~done
+        if not keep.any():
+            break
+        active, sigma, error, low, high = active[keep], sigma[keep], error[keep], low[keep], high[keep]
+        s, k, tt = s[keep], k[keep], tt[keep]
+
+        high = np.where(error > 0, sigma, high)
+        low = np.where(error < 0, sigma, low)
+        d1, _ = _d1_d2(s, k, tt, rate, sigma, dividend)
+        vega = s * np.exp(-dividend * tt) * norm_pdf(d1) * np.sqrt(tt)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = sigma - error / vega
+        outside = ~((step > low) & (step < high))
+        sigma = np.where(outside, 0.5 * (low + high), step)
+
+    return result.reshape(shape)
+
+def implied_forward(strikes, call_prices, put_prices, t, rate):
+    """
+    Forward price implied by put-call parity, F = K + (C - P) * e^(rt), at
+    the strike where the call and put prices are closest.
+
+    Returns:
+        The forward, or NaN when no strike has both a call and a put price
+    """
+    strikes, call_prices, put_prices = (np.asarray(v, dtype=np.float64) for v in (strikes, call_prices, put_prices))
+    quoted = np.isfinite(call_prices) & np.isfinite(put_prices) & (call_prices > 0) & (put_prices > 0)
+    if not quoted.any():
+        return float("nan")
+    index = np.flatnonzero(quoted)[np.argmin(np.abs(call_prices[quoted] - put_prices[quoted]))]
+    return float(strikes[index] + (call_prices[index] - put_prices[index]) * np.exp(rate * t))
@@ -1,10 +1,19 @@
 # order_book_tool.py
+import time
+
 import requests
 from mcp.server.fastmcp import FastMCP
-from config import DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL
+from config import DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL, DHAN_JOURNAL_ENABLED
+import codec
+import dhan_client
+from reconciliation import reconciler
+from records import Order, Position, Trade, to_dicts
+from trade_journal import journal
+from tool_metrics import instrument_server
 
 # Create the MCP server
 mcp = FastMCP("DhanHQ Order Book")
+instrument_server(mcp)
 
 @mcp.tool()
 def get_order_book():
@@ -21,15 +30,15 @@ def get_order_book():
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = dhan_client.get(url, headers=headers, stream=True)
         response.raise_for_status()
         
-        orders_data = response.json()
+        orders = Order.from_rows(codec.iter_array(response))
         
         return {
             "status": "success",
-            "orders_count": len(orders_data),
-            "orders": orders_data
+            "orders_count": len(orders),
+            "orders": to_dicts(orders)
         }
     except requests.exceptions.RequestException as e:
         return {
@@ -55,7 +64,7 @@ def get_order_status(order_id):
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = dhan_client.get(url, headers=headers)
         response.raise_for_status()
         
         order_data = response.json()
@@ -85,15 +94,15 @@ def get_trade_book():
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = dhan_client.get(url, headers=headers, stream=True)
         response.raise_for_status()
         
-        trades_data = response.json()
+        trades = Trade.from_rows(codec.iter_array(response))
         
         return {
             "status": "success",
-            "trades_count": len(trades_data),
-            "trades": trades_data
+            "trades_count": len(trades),
+            "trades": to_dicts(trades)
         }
     except requests.exceptions.RequestException as e:
         return {
@@ -119,15 +128,15 @@ def get_order_trades(order_id):
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = dhan_client.get(url, headers=headers)
         response.raise_for_status()
         
-        trades_data = response.json()
+        trades = Trade.from_rows(response.json())
         
         return {
             "status": "success",
             "order_id": order_id,
-            "trades": trades_data
+            "trades": to_dicts(trades)
         }
     except requests.exceptions.RequestException as e:
         return {
@@ -153,7 +162,7 @@ def cancel_order(order_id):
     }
     
     try:
-        response = requests.delete(url, headers=headers)
+        response = dhan_client.delete(url, headers=headers)
         
         if response.status_code in [200, 202]:
             return {
@@ -173,6 +182,186 @@ def cancel_order(order_id):
             "message": f"Failed to cancel order: {str(e)}"
         }
 
+# Columns returned by query_journal, and the aggregates it computes per group
+JOURNAL_COLUMNS = {
+    "trades": "date, traded_at, source, symbol, security_id, side, quantity, price, product_type, order_id, trade_id",
+    "orders": "date, datetime(recorded_at, 'unixepoch', 'localtime') AS recorded_at, source, event, kind, symbol, "
+              "security_id, side, quantity, price, order_type, product_type, status, order_id, correlation_id",
+    "conversions": "date, datetime(recorded_at, 'unixepoch', 'localtime') AS recorded_at, source, symbol, "
+                   "security_id, from_product_type, to_product_type, position_type, quantity, status"
+}
+JOURNAL_AGGREGATES = {
+    "trades": (
+        "COUNT(*) AS trades, "
+        "SUM(CASE WHEN side = 'BUY' THEN quantity ELSE 0 END) AS buy_quantity, "
+        "SUM(CASE WHEN side = 'SELL' THEN quantity ELSE 0 END) AS sell_quantity, "
+        "ROUND(SUM(CASE WHEN side = 'BUY' THEN quantity * price ELSE 0 END), 2) AS buy_value, "
+        "ROUND(SUM(CASE WHEN side = 'SELL' THEN quantity * price ELSE 0 END), 2) AS sell_value, "
+        "ROUND(SUM(quantity * price), 2) AS turnover"
+    ),
+    "orders": (
+        "COUNT(*) AS events, "
+        "SUM(event = 'placed') AS placed, "
+        "SUM(event = 'rejected') AS rejected, "
+        "SUM(event = 'cancelled') AS cancelled, "
+        "SUM(CASE WHEN event = 'placed' THEN quantity ELSE 0 END) AS placed_quantity"
+    ),
+    "conversions": "COUNT(*) AS conversions, SUM(quantity) AS quantity"
+}
+JOURNAL_GROUPS = {
+    "symbol": "symbol",
+    "date": "date",
+    "month": "substr(date, 1, 7)",
+    "side": "side",
+    "order_id": "order_id",
+    "status": "status",
+    "product_type": "product_type"
+}
+
+@mcp.tool()
+def query_journal(stock_name=None, from_date=None, to_date=None, record_type="trades", transaction_type=None,
+                  group_by=None, limit=100):
+    """
+    Answer history questions from the local trade journal without calling the API.
+
+    Every order, trade and position conversion made through the tools is
+    journaled locally, including fills seen in the trade book.
+
+    Args:
+        stock_name: Only records for this stock (optional)
+        from_date: First date to include, YYYY-MM-DD (optional)
+        to_date: Last date to include, YYYY-MM-DD (optional)
+        record_type: "trades", "orders" or "conversions" (default: "trades")
+        transaction_type: Only "BUY" or "SELL" records (optional)
+        group_by: Aggregate per "symbol", "date", "month", "side", "order_id",
+            "status" or "product_type" instead of listing records (optional)
+        limit: Maximum records or groups returned (default: 100)
+
+    Returns:
+        Matching records, or aggregates per group, newest first
+    """
+    record_type = record_type.lower()
+    if record_type not in JOURNAL_COLUMNS:
+        return {
+            "status": "error",
+            "message": f"Invalid record type: {record_type}. Use one of: {', '.join(JOURNAL_COLUMNS)}"
+        }
+    if group_by is not None and group_by.lower() not in JOURNAL_GROUPS:
+        return {
+            "status": "error",
+            "message": f"Invalid group_by: {group_by}. Use one of: {', '.join(JOURNAL_GROUPS)}"
+        }
+
+    conditions, params = [], []
+    if stock_name:
+        conditions.append("symbol = ?")
+        params.append(journal.symbol_for(stock_name))
+    if from_date:
+        conditions.append("date >= ?")
+        params.append(from_date)
+    if to_date:
+        conditions.append("date <= ?")
+        params.append(to_date)
+    if transaction_type:
+        if record_type == "conversions":
+            return {"status": "error", "message": "transaction_type does not apply to conversions"}
+        conditions.append("side = ?")
+        params.append(transaction_type.upper())
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit = max(1, int(limit))
+
+    # Include writes still queued from this process
+    journal.flush(timeout=1.0)
+    start = time.perf_counter()
+    try:
+        if group_by:
+            group = JOURNAL_GROUPS[group_by.lower()]
+            rows = journal.query(
+                f"SELECT {group} AS {group_by.lower()}, {JOURNAL_AGGREGATES[record_type]} FROM {record_type} {where} "
+                f"GROUP BY {group} ORDER BY {group} DESC LIMIT ?", params + [limit])
+        else:
+            rows = journal.query(
+                f"SELECT {JOURNAL_COLUMNS[record_type]} FROM {record_type} {where} ORDER BY id DESC LIMIT ?",
+                params + [limit])
+        totals = journal.query(f"SELECT {JOURNAL_AGGREGATES[record_type]} FROM {record_type} {where}", params)[0]
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Failed to query trade journal: {str(e)}"
+        }
+
+    if record_type == "trades":
+        for row in (rows if group_by else []) + [totals]:
+            row["avg_buy_price"] = round(row["buy_value"] / row["buy_quantity"], 2) if row.get("buy_quantity") else None
+            row["avg_sell_price"] = round(row["sell_value"] / row["sell_quantity"], 2) if row.get("sell_quantity") else None
+
+    return {
+        "status": "success",
+        "record_type": record_type,
+        "group_by": group_by,
+        "count": len(rows),
+        "groups" if group_by else "records": rows,
+        "totals": totals,
+        "query_ms": round((time.perf_counter() - start) * 1000, 3)
+    }
+
+@mcp.tool()
+def reconcile_positions(full=False):
+    """
+    Check the day's orders placed and cancelled through the tools against
+    the trade book and positions reported by Dhan.
+
+    Only fills and order events since the previous call are processed, and
+    only securities they (or their positions) changed are checked again.
+
+    Args:
+        full: Rebuild from the start of the day instead (default: False)
+
+    Returns:
+        Per security with a discrepancy: the net quantity expected from the
+        local orders (and the quantity still open on them), the trade book
+        net, the day net of the positions, and the issues found
+    """
+    if not DHAN_JOURNAL_ENABLED:
+        return {
+            "status": "error",
+            "message": "Reconciliation reads the trade journal; set DHAN_JOURNAL_ENABLED=1"
+        }
+    headers = {
+        "Content-Type": "application/json",
+        "access-token": DHAN_ACCESS_TOKEN
+    }
+
+    try:
+        # Read through dhan_client so new fills are journaled
+        response = dhan_client.get(f"{DHAN_API_BASE_URL}/trades", headers=headers)
+        response.raise_for_status()
+        response = dhan_client.get(f"{DHAN_API_BASE_URL}/positions", headers=headers, stream=True)
+        response.raise_for_status()
+        positions = Position.from_rows(codec.iter_array(response))
+    except requests.exceptions.RequestException as e:
+        return {
+            "status": "error",
+            "message": f"Failed to fetch trades and positions: {str(e)}"
+        }
+
+    if not journal.flush(timeout=5.0):
+        return {
+            "status": "error",
+            "message": "The trade journal is still writing; try again"
+        }
+    try:
+        report = reconciler.reconcile(positions, full=bool(full))
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Failed to reconcile: {str(e)}"
+        }
+    return {
+        "status": "success",
+        **report
+    }
+
 # Run the server if executed directly
 if __name__ == "__main__":
     mcp.run()
\ No newline at end of file
@@ -0,0 +1,343 @@
+# order_idempotency.py
+# Idempotent order submission with client correlation IDs.
+#
+# Every order placed by the tools carries a correlationId that is recorded in
+# an append-only ledger (in memory and data_cache/order_ledger.jsonl) before
+# the request is sent. When a submission times out or gets an ambiguous 5xx,
+# the order is looked up by correlation ID instead of being sent again, so
+# orders can use tight deadlines without risking duplicates. Submitting again
+# with a correlation ID that already placed an order returns that order.
+import http
+import json
+import os
+import threading
+import time
+import uuid
+
+import requests
+from config import DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL, DHAN_ORDER_DEADLINE, DHAN_ORDER_TIMEOUT
+import dhan_client
+import shared_store
+
+LEDGER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_cache", "order_ledger.jsonl")
+
+# Ledger lines kept when the file is compacted
+LEDGER_MAX_RECORDS = 5000
+
+# Records in a shared store live this long (orders are day orders; lookups
+# by correlation ID are only needed around the time of submission)
+LEDGER_STORE_NAMESPACE = "order_ledger"
+LEDGER_STORE_TTL_SECONDS = 7 * 24 * 3600
+
+# Responses after which the order may or may not have been accepted
+AMBIGUOUS_STATUSES = {500, 502, 503, 504}
+
+# Lookups of an ambiguous submission before giving up, and the pause between them
+RESOLVE_ATTEMPTS = 3
+RESOLVE_INTERVAL_SECONDS = 0.5
+
+# A pending claim younger than this may still be in flight on another
+# thread or worker: the order deadline plus time for the submitter to
+# record the outcome or look the order up
+PENDING_IN_FLIGHT_SECONDS = DHAN_ORDER_DEADLINE + 10
+
+# Dhan accepts correlation IDs of up to 25 characters
+CORRELATION_ID_LENGTH = 20
+
+
+def new_correlation_id():
+    return uuid.uuid4().hex[:CORRELATION_ID_LENGTH]
+
+def json_response(status_code, payload):
+    """Build a requests.Response carrying a JSON payload"""
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = http.HTTPStatus(status_code).phrase
+    response._content = json.dumps(payload).encode("utf-8")
+    response.headers["Content-Type"] = "application/json"
+    response.encoding = "utf-8"
+    return response
+
+
+class OrderLedger:
+    """
+    Dedup table of order submissions keyed by correlation ID.
+
+    Records move through "pending" (written before the request is sent),
+    then "placed", "rejected", "not_found" (timed out and no order exists)
+    or "unknown" (timed out and the lookup failed too). Each change is
+    appended to a JSONL file and flushed to disk, and the file is replayed
+    on start so a restarted server still knows about earlier submissions.
+
+    With a SharedStore, records are kept in the store instead, so processes
+    serving the same accounts share one ledger and a correlation ID can only
+    be claimed once across all of them. The JSONL file is still replayed
+    for records written before the store was used.
+    """
+
+    def __init__(self, path=LEDGER_PATH, max_records=LEDGER_MAX_RECORDS, store=None):
+        self.path = path
+        self.store = store
+        self.max_records = max_records
+        self._records = {}
+        self._lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._records[record["correlation_id"]] = record
+                self._lines += 1
+
+    def _append(self, record):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self._lines >= 2 * self.max_records:
+            self._compact()
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self._lines += 1
+
+    def _compact(self):
+        """Rewrite the file with the latest state of the newest records"""
+        records = sorted(self._records.values(), key=lambda record: record["updated_at"])[-self.max_records:]
+        self._records = {record["correlation_id"]: record for record in records}
+        temporary = self.path + ".tmp"
+        with open(temporary, 'w') as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+        self._lines = len(records)
+
+    def get(self, correlation_id):
+        if self.store is not None:
+            record = self.store.get(LEDGER_STORE_NAMESPACE, correlation_id)
+            if record is not None:
+                return record
+        with self._lock:
+            record = self._records.get(correlation_id)
+            return dict(record) if record else None
+
+    def update(self, correlation_id, **fields):
+        """Create or update a record and persist it"""
+        with self._lock:
+            return self._update(correlation_id, fields)
+
+    def _merge(self, existing, correlation_id, fields):
+        record = dict(existing or {"correlation_id": correlation_id, "created_at": time.strftime("%Y-%m-%d %H:%M:%S")})
+        record.update(fields)
+        record["updated_at"] = time.time()
+        return record
+
+    def _update(self, correlation_id, fields):
+        if self.store is not None:
+            def change(current):
+                record = self._merge(current or self._records.get(correlation_id), correlation_id, fields)
+                return record, dict(record)
+            return self.store.update(LEDGER_STORE_NAMESPACE, correlation_id, change, ttl=LEDGER_STORE_TTL_SECONDS)
+        record = self._merge(self._records.get(correlation_id), correlation_id, fields)
+        self._records[correlation_id] = record
+        self._append(record)
+        return dict(record)
+
+    def claim(self, correlation_id, kind, body, account=None):
+        """
+        Mark a correlation ID as being submitted by `account` (None for the
+        account in config.py).
+
+        Returns None if the caller should send the order, or the existing
+        record if this correlation ID was already used.
+        """
+        fields = {
+            "kind": kind,
+            "status": "pending",
+            "security_id": body.get("securityId"),
+            "transaction_type": body.get("transactionType"),
+            "quantity": body.get("quantity")
+        }
+        if account is not None:
+            fields["account"] = account
+
+        if self.store is not None:
+            def claim(current):
+                current = current or self._records.get(correlation_id)
+                if current is not None and current["status"] != "rejected":
+                    return None, dict(current)
+                return self._merge(current, correlation_id, fields), None
+            return self.store.update(LEDGER_STORE_NAMESPACE, correlation_id, claim, ttl=LEDGER_STORE_TTL_SECONDS)
+
+        with self._lock:
+            existing = self._records.get(correlation_id)
+            if existing is not None and existing["status"] != "rejected":
+                return dict(existing)
+            self._update(correlation_id, fields)
+            return None
+
+
+# Ledger shared by the order tools
+ledger = OrderLedger(store=shared_store.store)
+
+def lookup_order(correlation_id, kind="order", account=None):
+    """
+    Find an order by correlation ID.
+
+    Args:
+        correlation_id: Correlation ID the order was placed with
+        kind: "order" or "super"
+        account: accounts.Account that placed the order (default: the account in config.py)
+
+    Returns:
+        The order details, or None if Dhan has no order with this ID
+
+    Raises:
+        requests.exceptions.RequestException if the lookup itself failed
+    """
+    if account is None:
+        client, base_url = dhan_client.default_client, DHAN_API_BASE_URL
+        headers = {
+            "Content-Type": "application/json",
+            "access-token": DHAN_ACCESS_TOKEN
+        }
+    else:
+        client, base_url, headers = account.client, account.base_url, account.headers()
+    response = client.get(f"{base_url}/orders/external/{correlation_id}", headers=headers)
+    if response.status_code == 200:
+        data = response.json()
+        if isinstance(data, list):
+            data = data[0] if data else None
+        if data:
+            return data
+    elif response.status_code not in (400, 404):
+        response.raise_for_status()
+
+    if kind == "super":
+        response = client.get(f"{base_url}/super/orders", headers=headers)
+        response.raise_for_status()
+        for order in response.json() or []:
+            if order.get("correlationId") == correlation_id:
+                return order
+    return None
+
+def resolve(correlation_id, kind="order", attempts=RESOLVE_ATTEMPTS, account=None):
+    """
+    Settle an ambiguous submission by looking the order up.
+
+    Returns:
+        The updated ledger record
+    """
+    last_error = None
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(RESOLVE_INTERVAL_SECONDS)
+        try:
+            order = lookup_order(correlation_id, kind, account)
+        except requests.exceptions.RequestException as e:
+            last_error = e
+            continue
+        if order is not None:
+            return ledger.update(correlation_id, status="placed", order_id=order.get("orderId"), response=order)
+        last_error = None
+    if last_error is not None:
+        return ledger.update(correlation_id, status="unknown", error=str(last_error))
+    return ledger.update(correlation_id, status="not_found")
+
+def submit_order(url, headers, body, correlation_id=None, kind="order", account=None):
+    """
+    Send an order with a correlation ID, resolving ambiguous outcomes by lookup.
+
+    Args:
+        url: Order endpoint (/orders or /super/orders)
+        headers: Request headers
+        body: Order request body; correlationId is added to it
+        correlation_id: Client correlation ID (default: a new one)
+        kind: "order" or "super", used for the lookup
+        account: accounts.Account to send with (default: the account in config.py)
+
+    Returns:
+        Tuple of (requests.Response, correlation ID, outcome). The outcome is
+        "placed" (answered directly), "resolved" (confirmed by lookup after a
+        timeout), "duplicate" (this correlation ID had already placed an
+        order) or "unresolved" (the order may or may not exist)
+
+    Raises:
+        requests.exceptions.RequestException if the order was definitely not placed
+    """
+    correlation_id = correlation_id or new_correlation_id()
+    body = dict(body, correlationId=correlation_id)
+
+    existing = ledger.claim(correlation_id, kind, body, account.name if account is not None else None)
+    if existing is not None:
+        if in_flight(existing):
+            # The broker may not show the order yet; resolving now could send it twice
+            return unresolved_response(correlation_id), correlation_id, "unresolved"
+        if existing["status"] in ("pending", "unknown", "not_found"):
+            existing = resolve(correlation_id, kind, account=account)
+        if existing["status"] == "placed":
+            return json_response(200, existing.get("response") or {"orderId": existing.get("order_id")}), correlation_id, "duplicate"
+        if existing["status"] == "unknown":
+            return unresolved_response(correlation_id), correlation_id, "unresolved"
+        ledger.update(correlation_id, status="pending")
+
+    client = dhan_client.default_client if account is None else account.client
+    try:
+        response = client.post(url, headers=headers, json=body, timeout=DHAN_ORDER_TIMEOUT, deadline=DHAN_ORDER_DEADLINE)
+    except dhan_client.CircuitOpenError:
+        ledger.update(correlation_id, status="rejected", error="circuit open")
+        raise
+    except dhan_client.RateLimitTimeout:
+        ledger.update(correlation_id, status="rejected", error="rate limited")
+        raise
+    except requests.exceptions.ConnectTimeout:
+        # The connection was never established, so nothing was sent
+        ledger.update(correlation_id, status="rejected", error="connect timeout")
+        raise
+    except requests.exceptions.RequestException:
+        record = resolve(correlation_id, kind, account=account)
+        return settled_response(record, correlation_id)
+
+    if response.status_code in AMBIGUOUS_STATUSES:
+        record = resolve(correlation_id, kind, account=account)
+        if record["status"] == "not_found":
+            return response, correlation_id, "placed"
+        return settled_response(record, correlation_id)
+
+    if response.status_code in (200, 201, 202):
+        data = response.json()
+        ledger.update(correlation_id, status="placed", order_id=data.get("orderId"), response=data)
+    else:
+        ledger.update(correlation_id, status="rejected", error=response.text[:500])
+    return response, correlation_id, "placed"
+
+def in_flight(record):
+    """Whether a ledger record is a pending submission that may not have finished yet"""
+    return record["status"] == "pending" and time.time() - record.get("updated_at", 0) < PENDING_IN_FLIGHT_SECONDS
+
+def settled_response(record, correlation_id):
+    if record["status"] == "placed":
+        return json_response(200, record["response"]), correlation_id, "resolved"
+    if record["status"] == "not_found":
+        return json_response(504, {
+            "errorType": "Timeout",
+            "errorMessage": f"Order submission timed out and no order with correlation ID {correlation_id} was found. "
+                            "Submitting again with the same correlation ID checks once more before sending"
+        }), correlation_id, "resolved"
+    return unresolved_response(correlation_id), correlation_id, "unresolved"
+
+def unresolved_response(correlation_id):
+    return json_response(504, {
+        "errorType": "Timeout",
+        "errorMessage": f"Order submission timed out and could not be confirmed. Check it later with correlation ID "
+                        f"{correlation_id} before placing it again"
+    })
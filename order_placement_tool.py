@@ -1,40 +1,22 @@
 # order_placement_tool.py
-import json
 import os
+import time
+import anyio
 import requests
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 from config import DHAN_CLIENT_ID, DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL
+from accounts import fan_out_response, get_account, is_fan_out, select_accounts
+from basket_orders import DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY, basket_progress, run_basket
+from order_idempotency import ledger, lookup_order, submit_order
+from reference_cache import find_stock_code, load_stocks_data, search_stocks
+from tool_metrics import instrument_server
 
 # Create the MCP server
 mcp = FastMCP("DhanHQ Order Placement")
-
-# Helper function to load stocks data
-def load_stocks_data():
-    """Load the stocks data from stocks.json file"""
-    try:
-        # Get the directory of the current script
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        # Construct the path to stocks.json
-        stocks_file_path = os.path.join(script_dir, "stocks.json")
-        
-        with open(stocks_file_path, 'r') as file:
-            data = json.load(file)
-            return data.get('companies', [])
-    except Exception as e:
-        print(f"Error loading stocks data: {e}")
-        return []
-
-# Find stock code by name
-def find_stock_code(stock_name):
-    """Find the stock code for a given stock name"""
-    stocks = load_stocks_data()
-    for stock in stocks:
-        if stock.get('stock_name', '').lower() == stock_name.lower():
-            return stock.get('stock_code')
-    return None
+instrument_server(mcp)
 
 @mcp.tool()
-def place_order(stock_name, quantity, transaction_type, product_type="INTRADAY", order_type="MARKET"):
+def place_order(stock_name, quantity, transaction_type, product_type="INTRADAY", order_type="MARKET", correlation_id=None):
     """
     Place a new order for a stock.
     
@@ -44,6 +26,8 @@ def place_order(stock_name, quantity, transaction_type, product_type="INTRADAY",
         transaction_type: "BUY" or "SELL"
         product_type: Product type (default: "INTRADAY")
         order_type: Order type (default: "MARKET")
+        correlation_id: Client ID for this order (optional). Reusing it returns
+            the order it already placed instead of placing a new one
     
     Returns:
         Order status information
@@ -86,19 +70,23 @@ def place_order(stock_name, quantity, transaction_type, product_type="INTRADAY",
     }
     
     try:
-        response = requests.post(url, headers=headers, json=order_data)
+        response, correlation_id, outcome = submit_order(url, headers, order_data, correlation_id)
         
         if response.status_code in [200, 201, 202]:
             return {
                 "status": "success",
                 "message": f"Order placed successfully for {quantity} shares of {stock_name}",
-                "order_details": response.json()
+                "order_details": response.json(),
+                "correlation_id": correlation_id,
+                "submission": outcome
             }
         else:
             return {
                 "status": "error",
                 "message": f"Failed to place order. Status code: {response.status_code}",
-                "details": response.text
+                "details": response.text,
+                "correlation_id": correlation_id,
+                "submission": outcome
             }
     except Exception as e:
         return {
@@ -107,14 +95,19 @@ def place_order(stock_name, quantity, transaction_type, product_type="INTRADAY",
         }
 
 @mcp.tool()
-def list_available_stocks():
+def list_available_stocks(query=None):
     """
     List all available stocks in the stocks.json file.
     
+    Args:
+        query: Optional search words; only stocks whose name, company name or
+            sector has words starting with every one of them are listed
+            (e.g. "tata", "hdfc bank", "pharma")
+    
     Returns:
         List of available stocks with their names and codes
     """
-    stocks = load_stocks_data()
+    stocks = search_stocks(query) if query else load_stocks_data()
     stock_list = [{"name": stock.get('stock_name'), "code": stock.get('stock_code')} 
                  for stock in stocks]
     
@@ -124,6 +117,355 @@ def list_available_stocks():
         "stocks": stock_list
     }
 
+@mcp.tool()
+def get_order_by_correlation_id(correlation_id):
+    """
+    Look up an order by the correlation ID it was placed with.
+    
+    Use this when an order placement timed out to see whether the order exists.
+    
+    Args:
+        correlation_id: Correlation ID returned by place_order,
+            place_after_market_order or place_super_order
+    
+    Returns:
+        Order details and the local submission record
+    """
+    record = ledger.get(correlation_id)
+    kind = record.get("kind", "order") if record else "order"
+    try:
+        account = get_account(record.get("account")) if record else None
+        order = lookup_order(correlation_id, kind, account)
+    except KeyError as e:
+        return {
+            "status": "error",
+            "message": e.args[0],
+            "submission_record": record
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Error looking up order: {str(e)}",
+            "submission_record": record
+        }
+    
+    if order is None:
+        return {
+            "status": "error",
+            "message": f"No order found with correlation ID {correlation_id}",
+            "submission_record": record
+        }
+    if record is not None and record.get("status") != "placed":
+        record = ledger.update(correlation_id, status="placed", order_id=order.get("orderId"), response=order)
+    return {
+        "status": "success",
+        "order_details": order,
+        "submission_record": record
+    }
+
+@mcp.tool()
+async def place_basket_order(ctx: Context, file_path, product_type="CNC", order_type="MARKET",
+                             concurrency=DEFAULT_CONCURRENCY, batch_size=DEFAULT_BATCH_SIZE, dry_run=False, resume=True,
+                             account=None):
+    """
+    Place a basket of orders from a local CSV or JSONL file.
+    
+    Each row names a stock (stock_name) and either an order (quantity and
+    transaction_type BUY/SELL) or a target holding (target_quantity), which is
+    turned into the BUY or SELL needed from current holdings and positions.
+    Rows may also set product_type, order_type, price and trigger_price.
+    The file is streamed row by row and orders are sent in rate-limited
+    concurrent batches with a checkpoint after each batch. Progress is
+    reported while the basket runs; if it stops early, calling this again
+    with the same file resumes after the last checkpoint without placing
+    any order twice.
+    
+    Args:
+        file_path: Path to the .csv or .jsonl basket file
+        product_type: Product type for rows that do not set one (default: "CNC")
+        order_type: Order type for rows that do not set one (default: "MARKET")
+        concurrency: Orders sent at once (default: 8)
+        batch_size: Rows per checkpoint (default: 50)
+        dry_run: Validate and compute deltas without placing orders (default: False)
+        resume: Resume an interrupted run of this file (default: True). Set to
+            False to place a completed basket again
+        account: Account name from accounts.json, several names separated by
+            commas, or "all" to place the basket in each of them concurrently
+            (default: the account in config.py)
+    
+    Returns:
+        Basket summary with counts per outcome, failed rows and the results
+        file; for several accounts, one summary and latency per account
+    """
+    path = os.path.expanduser(str(file_path))
+    if not os.path.isfile(path):
+        return {
+            "status": "error",
+            "message": f"Basket file not found: {file_path}"
+        }
+
+    try:
+        selected = select_accounts(account)
+    except KeyError as e:
+        return {
+            "status": "error",
+            "message": e.args[0]
+        }
+
+    if is_fan_out(account):
+        return await place_basket_for_accounts(ctx, path, selected, product_type, order_type, concurrency,
+                                               batch_size, dry_run, resume)
+
+    def report(done, total, message):
+        anyio.from_thread.run(ctx.report_progress, done, total, message)
+
+    try:
+        summary = await anyio.to_thread.run_sync(
+            lambda: run_basket(path, product_type, order_type, concurrency, batch_size, dry_run, resume, report,
+                               selected[0]))
+    except RuntimeError as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+    except requests.exceptions.RequestException as e:
+        return {
+            "status": "error",
+            "message": f"Failed to fetch holdings and positions: {str(e)}"
+        }
+    except (OSError, ValueError) as e:
+        return {
+            "status": "error",
+            "message": f"Error reading basket file: {str(e)}"
+        }
+
+    if summary["status"] == "interrupted":
+        return {
+            "status": "error",
+            "message": f"Basket {summary['basket_id']} stopped after {summary['rows_done']} rows: {summary.get('error')}",
+            "basket": summary
+        }
+    return {
+        "status": "success",
+        "message": summary.get("message") or f"Basket {summary['basket_id']} {summary['status']}: "
+                                             f"{summary['rows_done']} of {summary['total_rows']} rows",
+        "basket": summary
+    }
+
+async def place_basket_for_accounts(ctx, path, selected, product_type, order_type, concurrency, batch_size,
+                                    dry_run, resume):
+    """Run one basket per account concurrently, reporting their combined progress"""
+    progress = {}
+
+    def run(account):
+        def report(done, total, message):
+            progress[account.name] = (done, total)
+            done_all = sum(done for done, _ in progress.values())
+            total_all = sum(total for _, total in progress.values())
+            anyio.from_thread.run(ctx.report_progress, done_all, total_all, f"{account.name}: {message}")
+
+        start = time.perf_counter()
+        try:
+            summary = run_basket(path, product_type, order_type, concurrency, batch_size, dry_run, resume, report,
+                                 account)
+        except (RuntimeError, OSError, ValueError, requests.exceptions.RequestException) as e:
+            summary = {"status": "error", "error": str(e)}
+        return account, summary, round((time.perf_counter() - start) * 1000, 1)
+
+    # Each account runs in an anyio worker thread so its progress can be sent from there
+    async with anyio.create_task_group() as group:
+        results = [None] * len(selected)
+
+        async def run_one(index, account):
+            results[index] = await anyio.to_thread.run_sync(run, account)
+
+        for index, account in enumerate(selected):
+            group.start_soon(run_one, index, account)
+
+    summaries = []
+    for account, summary, latency in results:
+        failed = summary["status"] in ("error", "interrupted")
+        summaries.append({
+            "account": account.name,
+            "status": "error" if failed else "success",
+            "latency_ms": latency,
+            "basket": summary
+        })
+    return fan_out_response(summaries)
+
+@mcp.tool()
+def get_basket_progress(basket_id=None):
+    """
+    Show the progress of a basket import, or list recent baskets.
+    
+    Args:
+        basket_id: Basket ID returned by place_basket_order (optional)
+    
+    Returns:
+        Basket progress and counts per outcome
+    """
+    progress = basket_progress(basket_id)
+    if progress is None:
+        return {
+            "status": "error",
+            "message": f"No basket found with ID {basket_id}"
+        }
+    if basket_id is None:
+        return {
+            "status": "success",
+            "message": f"Found {len(progress)} baskets",
+            "baskets": progress
+        }
+    return {
+        "status": "success",
+        "basket": progress
+    }
+
+@mcp.tool()
+def schedule_execution(
+    stock_name,
+    quantity,
+    transaction_type,
+    strategy="TWAP",
+    duration_minutes=30,
+    slices=None,
+    start_in_seconds=0,
+    freeze_quantity=None,
+    max_participation=None,
+    product_type="INTRADAY"
+):
+    """
+    Work a large market order over time as a schedule of smaller child orders.
+    
+    Args:
+        stock_name: The name of the stock (e.g., "ADANIGREEN")
+        quantity: Total number of shares to buy/sell
+        transaction_type: "BUY" or "SELL"
+        strategy: "TWAP" (equal slices) or "VWAP" (slices follow the intraday
+            volume profile) (default: "TWAP")
+        duration_minutes: Minutes from the first slice to the last (default: 30)
+        slices: Number of slices (default: one a minute)
+        start_in_seconds: Delay before the first slice (default: 0)
+        freeze_quantity: Largest quantity of one child order; bigger slices are
+            sent as several orders (default: DHAN_FREEZE_QUANTITY, 0 for no limit)
+        max_participation: Largest fraction (0-1) of the volume expected in a
+            slice that the slice may send, from the average daily volume in the
+            candle cache (optional). Shortfalls move to later slices; the last
+            slice sends whatever is left
+        product_type: Product type (default: "INTRADAY")
+    
+    Returns:
+        The parent order's ID (for get_execution_progress and cancel_execution) and schedule
+    """
+    from execution_scheduler import scheduler
+    from super_order_ladder import instrument_ticks
+
+    # Checked before the instrument master lookup, which may download it
+    try:
+        quantity = int(quantity)
+        duration_minutes = float(duration_minutes)
+        start_in_seconds = float(start_in_seconds)
+        slices = int(slices) if slices is not None else None
+        max_participation = float(max_participation) if max_participation is not None else None
+        options = {} if freeze_quantity is None else {"freeze_quantity": int(freeze_quantity)}
+    except (TypeError, ValueError):
+        return {
+            "status": "error",
+            "message": "quantity, slices and freeze_quantity must be whole numbers, and duration_minutes, "
+                       "start_in_seconds and max_participation numbers"
+        }
+    if quantity <= 0:
+        return {
+            "status": "error",
+            "message": "Quantity must be positive"
+        }
+
+    stock_code = find_stock_code(stock_name)
+    if not stock_code:
+        return {
+            "status": "error",
+            "message": f"Stock '{stock_name}' not found in stocks.json"
+        }
+    _, lot_size, _ = instrument_ticks("NSE_EQ", stock_code)
+    try:
+        parent = scheduler.schedule(
+            stock_name, stock_code, transaction_type, quantity, strategy, duration_minutes, slices,
+            start_in_seconds, product_type, lot_size, max_participation=max_participation, **options
+        )
+    except (TypeError, ValueError) as e:
+        return {
+            "status": "error",
+            "message": f"Invalid execution: {str(e)}"
+        }
+    return {
+        "status": "success",
+        "message": f"Scheduled {parent.strategy} {parent.transaction_type} of {quantity} shares of {stock_name} "
+                   f"in {len(parent.starts)} slices",
+        "parent_id": parent.parent_id,
+        "execution": scheduler.progress(parent.parent_id)
+    }
+
+@mcp.tool()
+def get_execution_progress(parent_id=None):
+    """
+    Show the progress of a scheduled execution, or list all of them.
+    
+    Args:
+        parent_id: Parent ID returned by schedule_execution (optional)
+    
+    Returns:
+        Filled, working and remaining quantity, average fill price and the
+        schedule position (with the child orders when parent_id is given)
+    """
+    from execution_scheduler import scheduler
+
+    progress = scheduler.progress(parent_id)
+    if progress is None:
+        return {
+            "status": "error",
+            "message": f"No execution found with ID {parent_id}"
+        }
+    if parent_id is None:
+        return {
+            "status": "success",
+            "message": f"Found {len(progress)} executions",
+            "executions": progress
+        }
+    return {
+        "status": "success",
+        "execution": progress
+    }
+
+@mcp.tool()
+def cancel_execution(parent_id):
+    """
+    Stop a scheduled execution. Child orders already sent are not cancelled.
+    
+    Args:
+        parent_id: Parent ID returned by schedule_execution
+    
+    Returns:
+        The execution's progress when it was stopped
+    """
+    from execution_scheduler import scheduler
+
+    parent = scheduler.cancel(parent_id)
+    if parent is None:
+        return {
+            "status": "error",
+            "message": f"No execution found with ID {parent_id}"
+        }
+    if parent.status != "cancelled":
+        return {
+            "status": "error",
+            "message": f"Execution {parent_id} already finished ({parent.status})"
+        }
+    return {
+        "status": "success",
+        "message": f"Cancelled execution {parent_id}",
+        "execution": scheduler.progress(parent_id)
+    }
+
 # Run the server if executed directly
 if __name__ == "__main__":
     mcp.run()
\ No newline at end of file
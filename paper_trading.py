@@ -0,0 +1,834 @@
+# paper_trading.py
+# In-memory paper trading backend for the Dhan API.
+#
+# PaperBroker answers the same endpoints the tools call (/orders, /trades,
+# /positions, /holdings, /fundlimit, /margincalculator, /super/orders,
+# /marketfeed/ltp) with Dhan-shaped JSON responses. Each instrument has its
+# own order book; resting orders are kept in price-time priority and are
+# matched against a replayed or synthetic price stream. A fund ledger blocks
+# margin for open orders and tracks utilized margin and realized P&L.
+import heapq
+import http
+import itertools
+import math
+import random
+import threading
+import time
+
+import requests
+from config import DHAN_CLIENT_ID, DHAN_PAPER_STARTING_BALANCE
+import codec
+from reference_cache import stock_name_for
+from super_order_levels import trailed_stoploss_price
+
+# Fraction of order value blocked as margin, by product type
+MARGIN_RATES = {
+    "CNC": 1.0,
+    "INTRADAY": 0.2,
+    "MARGIN": 0.25,
+    "MTF": 0.25,
+    "CO": 0.2,
+    "BO": 0.2
+}
+
+VALID_ORDER_TYPES = ["MARKET", "LIMIT", "STOP_LOSS", "STOP_LOSS_MARKET"]
+
+OPEN_STATUSES = ("PENDING", "PART_TRADED", "TRIGGERED")
+
+
+def _now():
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+def _default_price(security_id):
+    """Deterministic starting price for instruments without a price yet"""
+    try:
+        seed = int(security_id)
+    except (TypeError, ValueError):
+        seed = sum(ord(c) for c in str(security_id))
+    return float(100 + (seed * 7919) % 2900)
+
+def make_response(status_code, payload):
+    """Build a requests.Response carrying a JSON payload"""
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = http.HTTPStatus(status_code).phrase
+    response._content = b"" if payload is None else codec.dumps(payload)
+    response.headers["Content-Type"] = "application/json"
+    response.encoding = "utf-8"
+    return response
+
+def error_response(status_code, message, code="DH-905"):
+    """Dhan-style error response"""
+    return make_response(status_code, {
+        "errorType": "Input_Exception" if status_code == 400 else "Invalid_Request",
+        "errorCode": code,
+        "errorMessage": message
+    })
+
+
+class PaperOrder:
+    """A single order or super order leg"""
+
+    __slots__ = (
+        "order_id", "correlation_id", "security_id", "trading_symbol", "segment",
+        "side", "product", "order_type", "validity", "quantity", "filled",
+        "price", "trigger_price", "status", "amo", "amo_time", "avg_price",
+        "blocked_per_unit", "create_time", "update_time", "seq", "super_id",
+        "leg_name", "reason"
+    )
+
+    def __init__(self, order_id, seq, security_id, trading_symbol, side, product, order_type, quantity, price, trigger_price):
+        self.order_id = order_id
+        self.seq = seq
+        self.correlation_id = None
+        self.security_id = security_id
+        self.trading_symbol = trading_symbol
+        self.segment = "NSE_EQ"
+        self.side = side
+        self.product = product
+        self.order_type = order_type
+        self.validity = "DAY"
+        self.quantity = quantity
+        self.filled = 0
+        self.price = price
+        self.trigger_price = trigger_price
+        self.status = "PENDING"
+        self.amo = False
+        self.amo_time = None
+        self.avg_price = 0.0
+        self.blocked_per_unit = 0.0
+        self.create_time = self.update_time = _now()
+        self.super_id = None
+        self.leg_name = None
+        self.reason = ""
+
+    @property
+    def remaining(self):
+        return self.quantity - self.filled
+
+    def to_dict(self):
+        return {
+            "dhanClientId": DHAN_CLIENT_ID,
+            "orderId": self.order_id,
+            "correlationId": self.correlation_id,
+            "orderStatus": self.status,
+            "transactionType": self.side,
+            "exchangeSegment": self.segment,
+            "productType": self.product,
+            "orderType": self.order_type,
+            "validity": self.validity,
+            "tradingSymbol": self.trading_symbol,
+            "securityId": self.security_id,
+            "quantity": self.quantity,
+            "disclosedQuantity": 0,
+            "price": self.price,
+            "triggerPrice": self.trigger_price,
+            "afterMarketOrder": self.amo,
+            "amoTime": self.amo_time,
+            "createTime": self.create_time,
+            "updateTime": self.update_time,
+            "exchangeTime": self.update_time,
+            "filledQty": self.filled,
+            "remainingQuantity": self.remaining,
+            "averageTradedPrice": round(self.avg_price, 2),
+            "legName": self.leg_name,
+            "omsErrorDescription": self.reason
+        }
+
+
+class InstrumentBook:
+    """
+    Resting orders of one instrument in price-time priority.
+
+    Limit orders sit in two heaps keyed by (price, arrival sequence); stop
+    orders sit in two heaps keyed by trigger price. Cancelled or modified
+    entries are skipped lazily when they reach the top of a heap.
+    """
+
+    __slots__ = ("security_id", "last_price", "bids", "asks", "buy_stops", "sell_stops", "trailing")
+
+    def __init__(self, security_id, last_price):
+        self.security_id = security_id
+        self.last_price = last_price
+        self.bids = []
+        self.asks = []
+        self.buy_stops = []
+        self.sell_stops = []
+        self.trailing = {}
+
+    def add_limit(self, order):
+        if order.side == "BUY":
+            heapq.heappush(self.bids, (-order.price, order.seq, order))
+        else:
+            heapq.heappush(self.asks, (order.price, order.seq, order))
+
+    def add_stop(self, order):
+        # Entries remember the trigger they were pushed with so moved stops
+        # (trailing) leave their old entries behind as stale
+        if order.side == "BUY":
+            heapq.heappush(self.buy_stops, (order.trigger_price, order.seq, order, order.trigger_price))
+        else:
+            heapq.heappush(self.sell_stops, (-order.trigger_price, order.seq, order, order.trigger_price))
+
+
+class PaperBroker:
+    """
+    Paper trading broker emulating the Dhan REST API in memory.
+
+    Args:
+        starting_balance: Opening fund balance
+        prices: Optional mapping of security ID to starting price
+        holdings: Optional list of (security ID, quantity, average cost) held in demat
+        seed: Seed for the synthetic price stream
+    """
+
+    def __init__(self, starting_balance=DHAN_PAPER_STARTING_BALANCE, prices=None, holdings=None, seed=None):
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self._trade_ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self._stream = None
+
+        self.starting_balance = float(starting_balance)
+        self.realized_pnl = 0.0
+        self.used_margin = 0.0
+        self.blocked_margin = 0.0
+
+        self.books = {}
+        self.orders = {}
+        self.orders_by_correlation = {}
+        self.trades = []
+        self.trades_by_order = {}
+        self.positions = {}
+        self.super_orders = {}
+        self.holdings = {}
+
+        for security_id, price in (prices or {}).items():
+            self.books[str(security_id)] = InstrumentBook(str(security_id), float(price))
+        for security_id, quantity, avg_cost in holdings or []:
+            self.holdings[str(security_id)] = {"quantity": int(quantity), "avg_cost": float(avg_cost)}
+
+    # ------------------------------------------------------------------
+    # Request routing
+
+    def handle(self, method, path, body=None):
+        """
+        Answer a Dhan API request.
+
+        Args:
+            method: HTTP method
+            path: Path below the API base URL, e.g. "/orders"
+            body: Decoded JSON body, if any
+
+        Returns:
+            requests.Response
+        """
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        body = body or {}
+        try:
+            with self._lock:
+                response = self._route(method, parts, body)
+        except (KeyError, TypeError, ValueError) as e:
+            response = error_response(400, f"Invalid request: {e}")
+        response.url = path
+        # Lets listeners such as trade_journal tell paper fills from live ones
+        response.headers["X-Paper-Trading"] = "1"
+        return response
+
+    def _route(self, method, parts, body):
+        head = parts[0] if parts else ""
+        rest = parts[1:]
+
+        if head == "orders":
+            if method == "POST" and not rest:
+                return self._place_order(body)
+            if method == "GET" and not rest:
+                return make_response(200, [order.to_dict() for order in self.orders.values() if order.super_id is None])
+            if method == "GET" and len(rest) == 2 and rest[0] == "external":
+                order = self.orders_by_correlation.get(rest[1])
+                if order is None:
+                    return error_response(404, f"No order with correlation ID {rest[1]}", "DH-908")
+                return make_response(200, order.to_dict())
+            if len(rest) == 1:
+                order = self.orders.get(rest[0])
+                if order is None or order.super_id is not None:
+                    return error_response(404, f"Order {rest[0]} not found", "DH-908")
+                if method == "GET":
+                    return make_response(200, order.to_dict())
+                if method == "DELETE":
+                    return self._cancel(order)
+
+        elif head == "super" and rest and rest[0] == "orders":
+            rest = rest[1:]
+            if method == "POST" and not rest:
+                return self._place_super_order(body)
+            if method == "GET" and not rest:
+                return make_response(200, [self._super_to_dict(super_id) for super_id in self.super_orders])
+            if method == "DELETE" and len(rest) == 2:
+                return self._cancel_super_leg(rest[0], rest[1])
+
+        elif head == "trades" and method == "GET":
+            if not rest:
+                return make_response(200, list(self.trades))
+            return make_response(200, list(self.trades_by_order.get(rest[0], [])))
+
+        elif head == "positions":
+            if method == "GET" and not rest:
+                return make_response(200, self._positions())
+            if method == "POST" and rest == ["convert"]:
+                return self._convert_position(body)
+
+        elif head == "holdings" and method == "GET":
+            return make_response(200, self._holdings())
+
+        elif head == "fundlimit" and method == "GET":
+            return make_response(200, self._fund_limit())
+
+        elif head == "margincalculator" and method == "POST":
+            return self._margin_calculator(body)
+
+        elif head == "marketfeed" and rest == ["ltp"] and method == "POST":
+            quotes = {}
+            for segment, security_ids in body.items():
+                quotes[segment] = {
+                    str(security_id): {"last_price": self._book(str(security_id)).last_price}
+                    for security_id in security_ids
+                }
+            return make_response(200, {"data": quotes, "status": "success"})
+
+        return error_response(404, f"{method} /{'/'.join(parts)} is not supported in paper trading", "DH-904")
+
+    # ------------------------------------------------------------------
+    # Orders
+
+    def _book(self, security_id):
+        book = self.books.get(security_id)
+        if book is None:
+            book = self.books[security_id] = InstrumentBook(security_id, _default_price(security_id))
+        return book
+
+    def _new_order(self, body, side, order_type, quantity, price, trigger_price):
+        security_id = str(body["securityId"])
+        number = next(self._ids)
+        order = PaperOrder(
+            str(number), number, security_id,
+            stock_name_for(security_id) or security_id,
+            side, str(body.get("productType", "INTRADAY")).upper(), order_type,
+            quantity, price, trigger_price
+        )
+        order.segment = body.get("exchangeSegment", "NSE_EQ")
+        order.validity = body.get("validity", "DAY")
+        order.correlation_id = body.get("correlationId") or None
+        return order
+
+    def _parse_order(self, body):
+        """Validate an order body, returning (side, type, quantity, price, trigger) or an error response"""
+        side = str(body.get("transactionType", "")).upper()
+        if side not in ("BUY", "SELL"):
+            return error_response(400, "transactionType must be BUY or SELL")
+        order_type = str(body.get("orderType", "MARKET")).upper()
+        if order_type not in VALID_ORDER_TYPES:
+            return error_response(400, f"orderType must be one of {VALID_ORDER_TYPES}")
+        if not body.get("securityId"):
+            return error_response(400, "securityId is required")
+        quantity = int(body.get("quantity") or 0)
+        if quantity <= 0:
+            return error_response(400, "quantity must be positive")
+        price = float(body.get("price") or 0)
+        trigger_price = float(body.get("triggerPrice") or 0)
+        if order_type in ("LIMIT", "STOP_LOSS") and price <= 0:
+            return error_response(400, "price is required for LIMIT and STOP_LOSS orders")
+        if order_type in ("STOP_LOSS", "STOP_LOSS_MARKET") and trigger_price <= 0:
+            return error_response(400, "triggerPrice is required for stop loss orders")
+        return side, order_type, quantity, price, trigger_price
+
+    def _place_order(self, body):
+        parsed = self._parse_order(body)
+        if isinstance(parsed, requests.Response):
+            return parsed
+        order = self._new_order(body, *parsed)
+        order.amo = bool(body.get("afterMarketOrder"))
+        order.amo_time = body.get("amoTime") if order.amo else None
+        self._submit(order)
+        return make_response(200, {"orderId": order.order_id, "orderStatus": order.status})
+
+    def _register(self, order):
+        self.orders[order.order_id] = order
+        # Super order legs share the entry's correlation ID; lookups return the entry
+        if order.correlation_id:
+            self.orders_by_correlation.setdefault(order.correlation_id, order)
+
+    def _submit(self, order):
+        """Block margin and route an order to its book"""
+        self._register(order)
+        book = self._book(order.security_id)
+
+        reference = order.price if order.order_type in ("LIMIT", "STOP_LOSS") else (order.trigger_price or book.last_price)
+        if not self._block_margin(order, reference):
+            order.status = "REJECTED"
+            order.reason = "Insufficient funds"
+            return
+
+        self._activate(order, book)
+
+    def _activate(self, order, book):
+        """Fill, rest or arm an order against the current price"""
+        price = book.last_price
+        if order.order_type in ("STOP_LOSS", "STOP_LOSS_MARKET"):
+            crossed = price >= order.trigger_price if order.side == "BUY" else price <= order.trigger_price
+            if not crossed:
+                book.add_stop(order)
+                return
+            order.status = "TRIGGERED"
+
+        if order.order_type in ("MARKET", "STOP_LOSS_MARKET"):
+            self._fill(order, order.remaining, price)
+            return
+
+        marketable = order.price >= price if order.side == "BUY" else order.price <= price
+        if marketable:
+            self._fill(order, order.remaining, price)
+        else:
+            book.add_limit(order)
+
+    def _cancel(self, order):
+        if order.status not in OPEN_STATUSES:
+            return error_response(400, f"Order {order.order_id} is {order.status} and cannot be cancelled", "DH-906")
+        self._close_order(order, "CANCELLED")
+        return make_response(202, {"orderId": order.order_id, "orderStatus": order.status})
+
+    def _close_order(self, order, status):
+        self._release_margin(order, order.remaining)
+        order.status = status
+        order.update_time = _now()
+        self._book(order.security_id).trailing.pop(order, None)
+
+    # ------------------------------------------------------------------
+    # Price stream and matching
+
+    def tick(self, security_id, price, volume=None):
+        """
+        Apply a trade print to an instrument and match resting orders.
+
+        Stop orders whose trigger is crossed are activated first, then resting
+        limit orders are filled best price first and, at the same price, in
+        arrival order. With a volume, fills stop once that volume is used up.
+
+        Args:
+            security_id: Security ID of the instrument
+            price: Traded price
+            volume: Quantity available at this print (default: unlimited)
+        """
+        with self._lock:
+            book = self._book(str(security_id))
+            book.last_price = price
+            remaining = math.inf if volume is None else volume
+
+            self._trail_stops(book, price)
+
+            while book.buy_stops and book.buy_stops[0][0] <= price:
+                _, _, order, trigger = heapq.heappop(book.buy_stops)
+                if order.status == "PENDING" and order.trigger_price == trigger:
+                    order.status = "TRIGGERED"
+                    self._activate(order, book)
+            while book.sell_stops and -book.sell_stops[0][0] >= price:
+                _, _, order, trigger = heapq.heappop(book.sell_stops)
+                if order.status == "PENDING" and order.trigger_price == trigger:
+                    order.status = "TRIGGERED"
+                    self._activate(order, book)
+
+            remaining = self._sweep(book.bids, lambda key: -key >= price, price, remaining)
+            self._sweep(book.asks, lambda key: key <= price, price, remaining)
+
+    def _sweep(self, heap, crosses, price, remaining):
+        while heap and remaining > 0 and crosses(heap[0][0]):
+            order = heap[0][2]
+            if order.status not in OPEN_STATUSES:
+                heapq.heappop(heap)
+                continue
+            quantity = min(order.remaining, remaining)
+            self._fill(order, quantity, price)
+            remaining -= quantity
+            if order.remaining == 0:
+                heapq.heappop(heap)
+        return remaining
+
+    def _trail_stops(self, book, price):
+        """Move trailing stop loss legs towards the price"""
+        for order, (entry, initial_stop, jump, best) in list(book.trailing.items()):
+            best = max(best, price) if order.side == "SELL" else min(best, price)
+            # The stop leg is on the opposite side of the entry
+            entry_side = "BUY" if order.side == "SELL" else "SELL"
+            trigger = trailed_stoploss_price(initial_stop, entry, best, entry_side, jump, math.floor)
+            book.trailing[order] = (entry, initial_stop, jump, best)
+            if trigger != order.trigger_price and order.status == "PENDING":
+                order.trigger_price = trigger
+                book.add_stop(order)
+
+    def replay(self, ticks):
+        """
+        Replay a sequence of ticks.
+
+        Args:
+            ticks: Iterable of (security_id, price) or (security_id, price, volume)
+        """
+        for tick in ticks:
+            self.tick(*tick)
+
+    def advance(self, volatility=0.002):
+        """Move every known instrument one random-walk step"""
+        with self._lock:
+            prices = {sid: book.last_price for sid, book in self.books.items()}
+        for security_id, price in prices.items():
+            step = self._random.gauss(0, volatility)
+            self.tick(security_id, round(max(price * (1 + step), 0.05), 2))
+
+    def start_price_stream(self, interval=1.0, volatility=0.002):
+        """Advance the synthetic price stream in a background thread"""
+        if self._stream is not None:
+            return
+
+        def run():
+            while self._stream is not None:
+                time.sleep(interval)
+                self.advance(volatility)
+
+        self._stream = threading.Thread(target=run, name="paper-price-stream", daemon=True)
+        self._stream.start()
+
+    def stop_price_stream(self):
+        self._stream = None
+
+    # ------------------------------------------------------------------
+    # Fills, positions and funds
+
+    def _fill(self, order, quantity, price):
+        order.avg_price = (order.avg_price * order.filled + price * quantity) / (order.filled + quantity)
+        order.filled += quantity
+        order.status = "TRADED" if order.remaining == 0 else "PART_TRADED"
+        order.update_time = _now()
+        self._release_margin(order, quantity)
+
+        trade = {
+            "dhanClientId": DHAN_CLIENT_ID,
+            "orderId": order.order_id,
+            "exchangeOrderId": order.order_id,
+            "exchangeTradeId": str(next(self._trade_ids)),
+            "transactionType": order.side,
+            "exchangeSegment": order.segment,
+            "productType": order.product,
+            "orderType": order.order_type,
+            "tradingSymbol": order.trading_symbol,
+            "securityId": order.security_id,
+            "tradedQuantity": quantity,
+            "tradedPrice": price,
+            "createTime": order.update_time,
+            "updateTime": order.update_time,
+            "exchangeTime": order.update_time
+        }
+        self.trades.append(trade)
+        self.trades_by_order.setdefault(order.order_id, []).append(trade)
+
+        self._update_position(order, quantity, price)
+
+        if order.super_id is not None and order.remaining == 0:
+            self._on_super_leg_filled(order)
+
+    def _position(self, security_id, product, segment="NSE_EQ"):
+        key = (security_id, product)
+        position = self.positions.get(key)
+        if position is None:
+            position = self.positions[key] = {
+                "security_id": security_id, "product": product, "segment": segment,
+                "net": 0, "avg": 0.0, "buy_qty": 0, "buy_value": 0.0,
+                "sell_qty": 0, "sell_value": 0.0, "realized": 0.0, "margin": 0.0
+            }
+        return position
+
+    def _apply_to_position(self, position, signed_quantity, price):
+        """Average-cost position update, returning the realized P&L"""
+        net = position["net"]
+        realized = 0.0
+        if net == 0 or (net > 0) == (signed_quantity > 0):
+            total = abs(net) + abs(signed_quantity)
+            position["avg"] = (position["avg"] * abs(net) + price * abs(signed_quantity)) / total
+        else:
+            closing = min(abs(signed_quantity), abs(net))
+            realized = closing * (price - position["avg"]) * (1 if net > 0 else -1)
+            if abs(signed_quantity) > abs(net):
+                position["avg"] = price
+        position["net"] = net + signed_quantity
+        if position["net"] == 0:
+            position["avg"] = 0.0
+        position["realized"] += realized
+        return realized
+
+    def _update_position(self, order, quantity, price):
+        position = self._position(order.security_id, order.product, order.segment)
+        if order.side == "BUY":
+            position["buy_qty"] += quantity
+            position["buy_value"] += quantity * price
+            signed = quantity
+        else:
+            position["sell_qty"] += quantity
+            position["sell_value"] += quantity * price
+            signed = -quantity
+
+        self.realized_pnl += self._apply_to_position(position, signed, price)
+        self._reprice_margin(position)
+
+    def _reprice_margin(self, position):
+        margin = abs(position["net"]) * position["avg"] * MARGIN_RATES.get(position["product"], 1.0)
+        self.used_margin += margin - position["margin"]
+        position["margin"] = margin
+
+    def available_balance(self):
+        return self.starting_balance + self.realized_pnl - self.used_margin - self.blocked_margin
+
+    def _opening_quantity(self, order):
+        """Quantity of an order that adds to, rather than reduces, the position"""
+        position = self.positions.get((order.security_id, order.product))
+        net = position["net"] if position else 0
+        if order.side == "BUY" and net < 0:
+            return max(order.quantity + net, 0)
+        if order.side == "SELL" and net > 0:
+            return max(order.quantity - net, 0)
+        return order.quantity
+
+    def _block_margin(self, order, reference_price):
+        rate = MARGIN_RATES.get(order.product, 1.0)
+        required = self._opening_quantity(order) * reference_price * rate
+        if required > self.available_balance():
+            return False
+        order.blocked_per_unit = required / order.quantity
+        self.blocked_margin += required
+        return True
+
+    def _release_margin(self, order, quantity):
+        self.blocked_margin -= order.blocked_per_unit * quantity
+        if self.blocked_margin < 1e-6:
+            self.blocked_margin = 0.0
+
+    def _positions(self):
+        rows = []
+        for (security_id, product), position in self.positions.items():
+            net = position["net"]
+            last_price = self._book(security_id).last_price
+            rows.append({
+                "dhanClientId": DHAN_CLIENT_ID,
+                "tradingSymbol": stock_name_for(security_id) or security_id,
+                "securityId": security_id,
+                "positionType": "LONG" if net > 0 else "SHORT" if net < 0 else "CLOSED",
+                "exchangeSegment": position["segment"],
+                "productType": product,
+                "buyAvg": round(position["buy_value"] / position["buy_qty"], 2) if position["buy_qty"] else 0,
+                "buyQty": position["buy_qty"],
+                "costPrice": round(position["avg"], 2),
+                "sellAvg": round(position["sell_value"] / position["sell_qty"], 2) if position["sell_qty"] else 0,
+                "sellQty": position["sell_qty"],
+                "netQty": net,
+                "realizedProfit": round(position["realized"], 2),
+                "unrealizedProfit": round((last_price - position["avg"]) * net, 2),
+                "dayBuyQty": position["buy_qty"],
+                "daySellQty": position["sell_qty"],
+                "dayBuyValue": round(position["buy_value"], 2),
+                "daySellValue": round(position["sell_value"], 2)
+            })
+        return rows
+
+    def _holdings(self):
+        rows = []
+        for security_id, holding in self.holdings.items():
+            rows.append({
+                "exchange": "ALL",
+                "tradingSymbol": stock_name_for(security_id) or security_id,
+                "securityId": security_id,
+                "isin": "",
+                "totalQty": holding["quantity"],
+                "dpQty": holding["quantity"],
+                "t1Qty": 0,
+                "availableQty": holding["quantity"],
+                "collateralQty": 0,
+                "avgCostPrice": round(holding["avg_cost"], 2),
+                "lastTradedPrice": self._book(security_id).last_price
+            })
+        return rows
+
+    def _fund_limit(self):
+        available = self.available_balance()
+        return {
+            "dhanClientId": DHAN_CLIENT_ID,
+            "availabelBalance": round(available, 2),
+            "sodLimit": round(self.starting_balance, 2),
+            "collateralAmount": 0.0,
+            "receiveableAmount": 0.0,
+            "utilizedAmount": round(self.used_margin + self.blocked_margin, 2),
+            "blockedPayoutAmount": 0.0,
+            "withdrawableBalance": round(max(available, 0.0), 2)
+        }
+
+    def _margin_calculator(self, body):
+        security_id = str(body["securityId"])
+        quantity = int(body.get("quantity") or 0)
+        price = float(body.get("price") or 0) or self._book(security_id).last_price
+        rate = MARGIN_RATES.get(str(body.get("productType", "INTRADAY")).upper(), 1.0)
+        total = quantity * price * rate
+        available = self.available_balance()
+        return make_response(200, {
+            "totalMargin": round(total, 2),
+            "spanMargin": 0.0,
+            "exposureMargin": 0.0,
+            "availableBalance": round(available, 2),
+            "variableMargin": round(total, 2),
+            "insufficientBalance": round(max(total - available, 0.0), 2),
+            "brokerage": 20.0,
+            "leverage": f"{1 / rate:.2f}"
+        })
+
+    def _convert_position(self, body):
+        security_id = str(body["securityId"])
+        from_product = str(body["fromProductType"]).upper()
+        to_product = str(body["toProductType"]).upper()
+        quantity = int(body["convertQty"])
+        source = self.positions.get((security_id, from_product))
+        if source is None or abs(source["net"]) < quantity or quantity <= 0:
+            return error_response(400, "Convert quantity exceeds the open position", "DH-906")
+
+        signed = quantity if source["net"] > 0 else -quantity
+        target = self._position(security_id, to_product, source["segment"])
+        price = source["avg"]
+        self.realized_pnl += self._apply_to_position(source, -signed, price)
+        self.realized_pnl += self._apply_to_position(target, signed, price)
+        self._reprice_margin(source)
+        self._reprice_margin(target)
+        return make_response(202, {"status": "success"})
+
+    def settle(self):
+        """End the trading day: move CNC positions into holdings and clear the day's books"""
+        with self._lock:
+            for (security_id, product), position in self.positions.items():
+                if product != "CNC" or position["net"] == 0:
+                    continue
+                holding = self.holdings.setdefault(security_id, {"quantity": 0, "avg_cost": 0.0})
+                quantity = holding["quantity"] + position["net"]
+                if quantity > 0 and position["net"] > 0:
+                    holding["avg_cost"] = (
+                        holding["avg_cost"] * holding["quantity"] + position["avg"] * position["net"]
+                    ) / quantity
+                holding["quantity"] = quantity
+                if quantity <= 0:
+                    del self.holdings[security_id]
+            for order in self.orders.values():
+                if order.status in OPEN_STATUSES:
+                    self._close_order(order, "EXPIRED")
+            self.starting_balance += self.realized_pnl - self.used_margin
+            self.realized_pnl = 0.0
+            self.used_margin = 0.0
+            self.positions.clear()
+            self.trades.clear()
+            self.trades_by_order.clear()
+            for book in self.books.values():
+                book.bids.clear()
+                book.asks.clear()
+                book.buy_stops.clear()
+                book.sell_stops.clear()
+                book.trailing.clear()
+
+    # ------------------------------------------------------------------
+    # Super orders
+
+    def _place_super_order(self, body):
+        parsed = self._parse_order(body)
+        if isinstance(parsed, requests.Response):
+            return parsed
+        side, order_type, quantity, price, _ = parsed
+        if order_type not in ("MARKET", "LIMIT"):
+            return error_response(400, "Super order entry must be MARKET or LIMIT")
+
+        entry = self._new_order(body, side, order_type, quantity, price, 0.0)
+        entry.super_id = entry.order_id
+        entry.leg_name = "ENTRY_LEG"
+        self.super_orders[entry.super_id] = {
+            "entry": entry,
+            "target_price": body.get("targetPrice"),
+            "stoploss_price": body.get("stopLossPrice"),
+            "trailing_jump": float(body.get("trailingJump") or 0),
+            "legs": {}
+        }
+        self._submit(entry)
+        return make_response(200, {"orderId": entry.order_id, "orderStatus": entry.status})
+
+    def _on_super_leg_filled(self, order):
+        group = self.super_orders[order.super_id]
+        if order.leg_name == "ENTRY_LEG":
+            exit_side = "SELL" if order.side == "BUY" else "BUY"
+            body = {"securityId": order.security_id, "productType": order.product, "exchangeSegment": order.segment}
+            book = self._book(order.security_id)
+
+            if group["target_price"] is not None:
+                target = self._new_order(body, exit_side, "LIMIT", order.quantity, float(group["target_price"]), 0.0)
+                target.super_id, target.leg_name = order.super_id, "TARGET_LEG"
+                group["legs"]["TARGET_LEG"] = target
+                self._register(target)
+                self._activate(target, book)
+
+            if group["stoploss_price"] is not None:
+                stop = self._new_order(body, exit_side, "STOP_LOSS_MARKET", order.quantity, 0.0, float(group["stoploss_price"]))
+                stop.super_id, stop.leg_name = order.super_id, "STOP_LOSS_LEG"
+                group["legs"]["STOP_LOSS_LEG"] = stop
+                self._register(stop)
+                if group["trailing_jump"] > 0:
+                    book.trailing[stop] = (order.avg_price, stop.trigger_price, group["trailing_jump"], order.avg_price)
+                # The target may already have filled on activation
+                if group["legs"].get("TARGET_LEG") is not None and group["legs"]["TARGET_LEG"].status == "TRADED":
+                    self._close_order(stop, "CANCELLED")
+                else:
+                    self._activate(stop, book)
+        else:
+            # One exit leg filled: cancel the other
+            for leg in group["legs"].values():
+                if leg is not order and leg.status in OPEN_STATUSES:
+                    self._close_order(leg, "CANCELLED")
+            self._book(order.security_id).trailing.pop(order, None)
+
+    def _cancel_super_leg(self, super_id, leg_name):
+        group = self.super_orders.get(super_id)
+        if group is None:
+            return error_response(404, f"Super order {super_id} not found", "DH-908")
+        leg_name = leg_name.upper()
+        if leg_name == "ENTRY_LEG":
+            orders = [group["entry"]] + list(group["legs"].values())
+        elif leg_name in group["legs"]:
+            orders = [group["legs"][leg_name]]
+        else:
+            return error_response(400, f"Leg {leg_name} is not active", "DH-906")
+
+        cancelled = False
+        for order in orders:
+            if order.status in OPEN_STATUSES:
+                self._close_order(order, "CANCELLED")
+                cancelled = True
+        if not cancelled:
+            return error_response(400, f"{leg_name} of super order {super_id} cannot be cancelled", "DH-906")
+        return make_response(202, {"orderId": super_id, "orderStatus": "CANCELLED"})
+
+    def _super_to_dict(self, super_id):
+        group = self.super_orders[super_id]
+        row = group["entry"].to_dict()
+        row["legDetails"] = [
+            {
+                "orderId": leg.order_id,
+                "legName": name,
+                "transactionType": leg.side,
+                "totalQuatity": leg.quantity,
+                "remainingQuantity": leg.remaining,
+                "triggeredQuantity": leg.filled,
+                "price": leg.price if name == "TARGET_LEG" else leg.trigger_price,
+                "orderStatus": leg.status,
+                "trailingJump": group["trailing_jump"] if name == "STOP_LOSS_LEG" else 0
+            }
+            for name, leg in group["legs"].items()
+        ]
+        row["targetPrice"] = group["target_price"]
+        row["stopLossPrice"] = group["stoploss_price"]
+        return row
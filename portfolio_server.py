@@ -1,10 +1,12 @@
 # portfolio_server.py
-import requests
 from mcp.server.fastmcp import FastMCP
 from config import DHAN_CLIENT_ID, DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL
+import dhan_client
+from tool_metrics import instrument_server
 
 # Create the MCP server
 mcp = FastMCP("DhanHQ Portfolio")
+instrument_server(mcp)
 
 # Holdings Tool
 @mcp.tool()
@@ -16,7 +18,7 @@ def get_holdings():
         "access-token": DHAN_ACCESS_TOKEN
     }
     
-    response = requests.get(url, headers=headers)
+    response = dhan_client.get(url, headers=headers)
     return response.json()
 
 # Positions Tool
@@ -29,7 +31,7 @@ def get_positions():
         "access-token": DHAN_ACCESS_TOKEN
     }
     
-    response = requests.get(url, headers=headers)
+    response = dhan_client.get(url, headers=headers)
     return response.json()
 
 # Position Conversion Tool
@@ -72,7 +74,7 @@ def convert_position(
         "toProductType": to_product_type
     }
     
-    response = requests.post(url, headers=headers, json=data)
+    response = dhan_client.post(url, headers=headers, json=data)
     if response.status_code == 202:
         return {"status": "success", "message": "Position conversion successful"}
     else:
@@ -0,0 +1,353 @@
+# price_alert_tool.py
+import asyncio
+import bisect
+import itertools
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+import anyio
+import requests
+from mcp.server.fastmcp import Context, FastMCP
+from market_quotes import fetch_last_prices
+from reference_cache import find_stock_code
+from tool_metrics import instrument_server
+
+# Create the MCP server
+mcp = FastMCP("DhanHQ Price Alerts")
+instrument_server(mcp)
+
+# Resource that clients subscribe to for alert notifications
+TRIGGERED_ALERTS_URI = "dhan://alerts/triggered"
+
+# Number of fired alerts kept for the triggered alerts resource
+TRIGGERED_HISTORY_SIZE = 500
+
+VALID_CONDITIONS = ["ABOVE", "BELOW"]
+
+
+class AlertStore:
+    """
+    In-memory price alert store indexed by security.
+
+    Each security keeps two sorted threshold lists: "ABOVE" alerts in
+    ascending order and "BELOW" alerts in ascending order. On every tick only
+    the ends of those lists are compared with the new price, so a security
+    without a crossing costs two comparisons regardless of how many alerts it
+    has. Crossed alerts form a contiguous prefix (ABOVE) or suffix (BELOW)
+    that is located with bisect and removed in one slice.
+    """
+
+    def __init__(self, history_size=TRIGGERED_HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._alerts = {}
+        self._above = {}
+        self._below = {}
+        self._last_prices = {}
+        self._seq = itertools.count()
+        self.triggered = deque(maxlen=history_size)
+
+    def add(self, security_id, stock_name, condition, threshold, note=""):
+        """Register an alert and return its record"""
+        alert = {
+            "alert_id": uuid.uuid4().hex[:12],
+            "stock_name": stock_name,
+            "security_id": str(security_id),
+            "condition": condition,
+            "threshold": float(threshold),
+            "note": note,
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        entry = (alert["threshold"], next(self._seq), alert["alert_id"])
+        index = self._above if condition == "ABOVE" else self._below
+        with self._lock:
+            self._alerts[alert["alert_id"]] = (alert, entry)
+            bisect.insort(index.setdefault(alert["security_id"], []), entry)
+        return alert
+
+    def remove(self, alert_id):
+        """Remove an alert by ID, returning its record or None"""
+        with self._lock:
+            item = self._alerts.pop(alert_id, None)
+            if item is None:
+                return None
+            alert, entry = item
+            index = self._above if alert["condition"] == "ABOVE" else self._below
+            thresholds = index.get(alert["security_id"], [])
+            position = bisect.bisect_left(thresholds, entry)
+            if position < len(thresholds) and thresholds[position] == entry:
+                del thresholds[position]
+            if not thresholds:
+                index.pop(alert["security_id"], None)
+            return alert
+
+    def list(self, security_id=None):
+        """Return active alerts, optionally for a single security"""
+        with self._lock:
+            alerts = [alert for alert, _ in self._alerts.values()]
+        if security_id is not None:
+            alerts = [a for a in alerts if a["security_id"] == str(security_id)]
+        return sorted(alerts, key=lambda a: (a["stock_name"], a["threshold"]))
+
+    def securities(self):
+        """Return the security IDs that have at least one active alert"""
+        with self._lock:
+            return sorted(set(self._above) | set(self._below))
+
+    def evaluate(self, prices):
+        """
+        Evaluate a batch of prices and fire every crossed alert.
+
+        Args:
+            prices: Mapping of security ID to last traded price
+
+        Returns:
+            List of fired alert records
+        """
+        fired = []
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            for security_id, price in prices.items():
+                security_id = str(security_id)
+                self._last_prices[security_id] = price
+                crossed = []
+
+                above = self._above.get(security_id)
+                if above and above[0][0] <= price:
+                    cut = bisect.bisect_right(above, (price, float("inf")))
+                    crossed.extend(above[:cut])
+                    del above[:cut]
+                    if not above:
+                        del self._above[security_id]
+
+                below = self._below.get(security_id)
+                if below and below[-1][0] >= price:
+                    cut = bisect.bisect_left(below, (price, -1))
+                    crossed.extend(below[cut:])
+                    del below[cut:]
+                    if not below:
+                        del self._below[security_id]
+
+                for _, _, alert_id in crossed:
+                    alert, _ = self._alerts.pop(alert_id)
+                    alert = dict(alert, triggered_at=now, triggered_price=price)
+                    self.triggered.append(alert)
+                    fired.append(alert)
+        return fired
+
+    def last_price(self, security_id):
+        """Return the last evaluated price for a security, if any"""
+        with self._lock:
+            return self._last_prices.get(str(security_id))
+
+
+# Shared alert store for this server
+alert_store = AlertStore()
+
+# Background monitor task, if running
+_monitor = {"task": None, "interval": None}
+
+def run_alert_check():
+    """Fetch quotes for every security with alerts and evaluate them"""
+    security_ids = alert_store.securities()
+    if not security_ids:
+        return 0, []
+    prices = fetch_last_prices(security_ids)
+    return len(prices), alert_store.evaluate(prices)
+
+async def notify_triggered(ctx, fired):
+    """Send a resource update notification when alerts fire"""
+    if fired:
+        await ctx.session.send_resource_updated(TRIGGERED_ALERTS_URI)
+
+@mcp.tool()
+def create_alert(stock_name, condition, threshold, note=""):
+    """
+    Create a price alert for a stock.
+
+    Args:
+        stock_name: The name of the stock (e.g., "ADANIENT")
+        condition: "ABOVE" to fire when the price rises to the threshold,
+            "BELOW" to fire when the price falls to the threshold
+        threshold: Price level to watch
+        note: Optional note returned with the alert when it fires
+
+    Returns:
+        The created alert
+    """
+    if condition.upper() not in VALID_CONDITIONS:
+        return {
+            "status": "error",
+            "message": f"Condition must be one of {VALID_CONDITIONS}"
+        }
+
+    try:
+        threshold = float(threshold)
+    except (TypeError, ValueError):
+        return {
+            "status": "error",
+            "message": "Threshold must be a number"
+        }
+
+    # Find the stock code
+    stock_code = find_stock_code(stock_name)
+    if not stock_code:
+        return {
+            "status": "error",
+            "message": f"Stock '{stock_name}' not found in stocks.json"
+        }
+
+    alert = alert_store.add(stock_code, stock_name.upper(), condition.upper(), threshold, note)
+    return {
+        "status": "success",
+        "message": f"Alert created for {stock_name} {condition.upper()} {threshold}",
+        "alert": alert
+    }
+
+@mcp.tool()
+def list_alerts(stock_name=None):
+    """
+    List active price alerts.
+
+    Args:
+        stock_name: Only list alerts for this stock (optional)
+
+    Returns:
+        Active alerts and the most recently triggered ones
+    """
+    security_id = None
+    if stock_name:
+        security_id = find_stock_code(stock_name)
+        if not security_id:
+            return {
+                "status": "error",
+                "message": f"Stock '{stock_name}' not found in stocks.json"
+            }
+
+    alerts = alert_store.list(security_id)
+    return {
+        "status": "success",
+        "alerts_count": len(alerts),
+        "alerts": alerts,
+        "recently_triggered": list(alert_store.triggered)[-20:],
+        "monitor_running": _monitor["task"] is not None and not _monitor["task"].done()
+    }
+
+@mcp.tool()
+def delete_alert(alert_id):
+    """
+    Delete an active price alert.
+
+    Args:
+        alert_id: ID of the alert to delete
+
+    Returns:
+        Deletion status
+    """
+    alert = alert_store.remove(alert_id)
+    if alert is None:
+        return {
+            "status": "error",
+            "message": f"Alert '{alert_id}' not found"
+        }
+    return {
+        "status": "success",
+        "message": f"Deleted alert {alert_id}",
+        "alert": alert
+    }
+
+@mcp.tool()
+async def check_alerts(ctx: Context):
+    """
+    Fetch current prices for all watched stocks and fire crossed alerts.
+
+    Returns:
+        Alerts fired during this check
+    """
+    try:
+        quoted, fired = await anyio.to_thread.run_sync(run_alert_check)
+    except requests.exceptions.RequestException as e:
+        return {
+            "status": "error",
+            "message": f"Failed to fetch quotes: {str(e)}"
+        }
+
+    await notify_triggered(ctx, fired)
+    return {
+        "status": "success",
+        "quoted_securities": quoted,
+        "fired_count": len(fired),
+        "fired": fired
+    }
+
+@mcp.tool()
+async def start_alert_monitor(ctx: Context, interval_seconds=5):
+    """
+    Start evaluating alerts in the background at a fixed interval.
+
+    Fired alerts are published as updates to the dhan://alerts/triggered resource.
+
+    Args:
+        interval_seconds: Seconds between quote checks (default: 5)
+
+    Returns:
+        Monitor status
+    """
+    interval = max(float(interval_seconds), 1.0)
+    if _monitor["task"] is not None and not _monitor["task"].done():
+        return {
+            "status": "error",
+            "message": f"Alert monitor already running every {_monitor['interval']} seconds"
+        }
+
+    async def monitor():
+        while True:
+            try:
+                _, fired = await anyio.to_thread.run_sync(run_alert_check)
+                await notify_triggered(ctx, fired)
+            except Exception as e:
+                # Keep monitoring; one failed check must not end the task
+                print(f"Error checking alerts: {e}", file=sys.stderr)
+            await asyncio.sleep(interval)
+
+    _monitor["task"] = asyncio.create_task(monitor())
+    _monitor["interval"] = interval
+    return {
+        "status": "success",
+        "message": f"Alert monitor started, checking every {interval} seconds"
+    }
+
+@mcp.tool()
+def stop_alert_monitor():
+    """
+    Stop the background alert monitor.
+
+    Returns:
+        Monitor status
+    """
+    task = _monitor["task"]
+    if task is None or task.done():
+        return {
+            "status": "error",
+            "message": "Alert monitor is not running"
+        }
+    task.cancel()
+    _monitor["task"] = None
+    return {
+        "status": "success",
+        "message": "Alert monitor stopped"
+    }
+
+@mcp.resource(TRIGGERED_ALERTS_URI)
+def triggered_alerts():
+    """
+    Recently triggered price alerts, newest last
+    """
+    return json.dumps(list(alert_store.triggered), indent=2)
+
+# Run the server if executed directly
+if __name__ == "__main__":
+    mcp.run()
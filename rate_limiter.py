@@ -0,0 +1,187 @@
+# rate_limiter.py
+# Client-side rate limits for the Dhan API.
+#
+# Dhan limits requests per API category: order placement, modification and
+# cancellation, historical data, market quotes, option chains, and
+# everything else. Each category here is a set of token buckets (for example
+# per second and per minute). A caller reserves one token from every bucket
+# of its category; if a bucket is empty the reservation takes it into debt
+# and the caller sleeps until the debt is repaid, so concurrent callers are
+# paced evenly instead of retrying in a burst and collecting 429s. With a shared store configured
+# (shared_store.py) the buckets live there, so every process serving the
+# same account draws from the same buckets.
+import re
+import threading
+import time
+
+import requests
+from config import (
+    DHAN_DATA_RATE_PER_SECOND, DHAN_NON_TRADING_RATE_PER_SECOND, DHAN_OPTION_CHAIN_INTERVAL_SECONDS,
+    DHAN_ORDER_RATE_PER_MINUTE, DHAN_ORDER_RATE_PER_SECOND, DHAN_QUOTE_RATE_PER_SECOND
+)
+import shared_store
+
+# (requests per window, window seconds) per category; a rate of 0 disables the bucket
+DEFAULT_LIMITS = {
+    "order": [(DHAN_ORDER_RATE_PER_SECOND, 1.0), (DHAN_ORDER_RATE_PER_MINUTE, 60.0)],
+    "data": [(DHAN_DATA_RATE_PER_SECOND, 1.0)],
+    "quote": [(DHAN_QUOTE_RATE_PER_SECOND, 1.0)],
+    "option_chain": [(1, DHAN_OPTION_CHAIN_INTERVAL_SECONDS)] if DHAN_OPTION_CHAIN_INTERVAL_SECONDS > 0 else [],
+    "non_trading": [(DHAN_NON_TRADING_RATE_PER_SECOND, 1.0)]
+}
+
+# Paths whose writes count as order API calls
+ORDER_PATHS = re.compile(r"^/(orders|super/orders|forever/orders)(/|$)")
+
+
+def category(method, path):
+    """Rate limit category of a request, from its method and path below /v2"""
+    if method != "GET" and ORDER_PATHS.match(path):
+        return "order"
+    if path.startswith("/charts"):
+        return "data"
+    if path.startswith("/marketfeed"):
+        return "quote"
+    if path.startswith("/optionchain"):
+        return "option_chain"
+    return "non_trading"
+
+
+class RateLimitTimeout(requests.exceptions.RequestException):
+    """A request could not get a rate limit token within its time budget"""
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `capacity`; tokens may go negative as debt"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until one more token is available"""
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class RateLimit:
+    """
+    All buckets of one category, reserved together.
+
+    Args:
+        windows: [(requests, window seconds), ...]
+        name: Key prefix of the buckets in a shared store
+        store: SharedStore holding the buckets (default: in this process)
+    """
+
+    def __init__(self, windows, name=None, store=None):
+        self.buckets = [TokenBucket(count / window, count) for count, window in windows if count > 0]
+        self.name = name
+        self.store = store
+        self.lock = threading.Lock()
+        self.acquired = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def reserve(self, timeout=None):
+        """
+        Take a token from every bucket.
+
+        Returns:
+            Seconds the caller must wait before sending
+
+        Raises:
+            RateLimitTimeout if the wait would exceed `timeout`
+        """
+        if self.store is not None and self.buckets:
+            wait = self.store.reserve([(f"{self.name}:{index}", bucket.rate, bucket.capacity)
+                                       for index, bucket in enumerate(self.buckets)], timeout)
+            with self.lock:
+                if wait is None:
+                    self.rejected += 1
+                    raise RateLimitTimeout("Rate limit would delay this request beyond its deadline")
+                return self._count(wait)
+
+        with self.lock:
+            now = time.monotonic()
+            wait = 0.0
+            for bucket in self.buckets:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time())
+            if timeout is not None and wait > timeout:
+                self.rejected += 1
+                raise RateLimitTimeout(f"Rate limit would delay this request by {wait:.2f}s, beyond its deadline")
+            for bucket in self.buckets:
+                bucket.tokens -= 1
+            return self._count(wait)
+
+    def _count(self, wait):
+        """Update the counters for a granted reservation (called with the lock held)"""
+        self.acquired += 1
+        if wait:
+            self.delayed += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        return wait
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "limits_per_second": [round(bucket.rate, 3) for bucket in self.buckets],
+                "acquired": self.acquired,
+                "delayed": self.delayed,
+                "rejected": self.rejected,
+                "total_wait_seconds": round(self.total_wait, 3),
+                "max_wait_seconds": round(self.max_wait, 3)
+            }
+
+
+class RateLimiter:
+    """
+    Rate limits per API category.
+
+    Args:
+        limits: Mapping of category to [(requests, window seconds), ...]
+            (default: DEFAULT_LIMITS, configured in config.py)
+        name: Account the limits belong to, naming its buckets in a shared store
+        store: SharedStore for the buckets (default: shared_store.store, which
+            is None unless DHAN_SHARED_STORE is set)
+    """
+
+    def __init__(self, limits=None, name="default", store=None):
+        limits = DEFAULT_LIMITS if limits is None else limits
+        store = shared_store.store if store is None else store
+        self.limits = {category: RateLimit(windows, f"{name}:{category}", store) for category, windows in limits.items()}
+
+    def acquire(self, method, path, timeout=None):
+        """
+        Block until a request may be sent.
+
+        Args:
+            method: HTTP method
+            path: Path below the API base URL
+            timeout: Longest acceptable wait in seconds (default: no limit)
+
+        Returns:
+            Seconds waited
+
+        Raises:
+            RateLimitTimeout if the request would wait longer than `timeout`
+        """
+        limit = self.limits.get(category(method, path))
+        if limit is None or not limit.buckets:
+            return 0.0
+        wait = limit.reserve(timeout)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def snapshot(self):
+        return {name: limit.snapshot() for name, limit in self.limits.items()}
@@ -0,0 +1,386 @@
+# reconciliation.py
+# Reconciles what the tools did with what Dhan reports.
+#
+# The trade journal (trade_journal.py) already records every order the tools
+# placed or cancelled, every status seen in the order book and every fill
+# seen in the trade book. The reconciler folds those rows into a state per
+# order (quantity, last known status and fills, quantity traded) and, per
+# security, compares three views of the day's net quantity:
+#
+#   expected   fills the local order events account for, plus the quantity
+#              still open on orders that may yet fill
+#   traded     fills in the trade book
+#   position   day buy minus day sell quantity in /positions
+#
+# Each run only reads journal rows past the cursor of the previous run and
+# only re-checks securities whose orders, fills or position changed. The
+# order state and cursors are kept in the journal database, so a restarted
+# server carries on where it stopped. State is per day and per source (live
+# or paper).
+import datetime
+import json
+import threading
+import time
+
+from config import DHAN_PAPER_TRADING
+from trade_journal import journal
+
+# Statuses after which an order's fills no longer change
+FILLED_STATUSES = ("TRADED",)
+CLOSED_STATUSES = ("CANCELLED", "REJECTED", "EXPIRED")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reconciliation_cursors (
+    source TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    order_event_id INTEGER NOT NULL,
+    trade_id INTEGER NOT NULL,
+    reconciled_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS reconciliation_orders (
+    source TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    origin TEXT,
+    kind TEXT,
+    security_id TEXT,
+    symbol TEXT,
+    side TEXT,
+    quantity REAL,
+    status TEXT,
+    filled REAL,
+    traded_buy REAL NOT NULL,
+    traded_sell REAL NOT NULL,
+    PRIMARY KEY (source, order_id)
+);
+"""
+
+
+def _quantity(value):
+    return f"{value:g}"
+
+
+class OrderState:
+    """
+    What is known about one order of the day.
+
+    origin is "tools" for orders placed through the tools, "order_book" for
+    orders first seen in the order book and None for orders only seen
+    through their fills (quantity and side unknown).
+    """
+
+    __slots__ = ("order_id", "origin", "kind", "security_id", "symbol", "side", "quantity", "status", "filled",
+                 "traded_buy", "traded_sell")
+
+    def __init__(self, order_id, origin=None, kind=None, security_id=None, symbol=None, side=None, quantity=None,
+                 status=None, filled=None, traded_buy=0.0, traded_sell=0.0):
+        self.order_id = order_id
+        self.origin = origin
+        self.kind = kind
+        self.security_id = security_id
+        self.symbol = symbol
+        self.side = side
+        self.quantity = quantity
+        self.status = status
+        self.filled = filled
+        self.traded_buy = traded_buy
+        self.traded_sell = traded_sell
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @property
+    def traded(self):
+        """Quantity traded on the order's own side"""
+        return self.traded_buy if self.side == "BUY" else self.traded_sell
+
+    @property
+    def exited(self):
+        """Quantity traded on the other side (target and stop-loss legs of super orders)"""
+        return self.traded_sell if self.side == "BUY" else self.traded_buy
+
+    def expected_range(self):
+        """(least, most) quantity the order is expected to fill on its own side"""
+        filled = self.filled or 0.0
+        if self.status in FILLED_STATUSES:
+            return self.quantity, self.quantity
+        if self.status in CLOSED_STATUSES:
+            return filled, filled
+        return filled, max(self.quantity, filled)
+
+    def issues(self):
+        """Discrepancies between the order's local state and its fills"""
+        if self.quantity is None or self.side not in ("BUY", "SELL"):
+            traded = self.traded_buy + self.traded_sell
+            return [self._issue("unknown_order", f"{_quantity(traded)} traded on order {self.order_id}, "
+                                                 "which was not placed or seen by the tools")]
+        issues = []
+        traded, (least, most) = self.traded, self.expected_range()
+        status = self.status or "PENDING"
+        if traded > self.quantity:
+            issues.append(self._issue("overfill", f"Order {self.order_id} for {_quantity(self.quantity)} has "
+                                                  f"{_quantity(traded)} traded"))
+        elif traded < least:
+            issues.append(self._issue("missing_fills", f"Order {self.order_id} is {status} with "
+                                                       f"{_quantity(least)} filled but the trade book has "
+                                                       f"{_quantity(traded)}"))
+        elif traded > most:
+            issues.append(self._issue("unexpected_fills", f"Order {self.order_id} is {status} with "
+                                                          f"{_quantity(most)} filled but the trade book has "
+                                                          f"{_quantity(traded)}"))
+        exit_limit = traded if self.kind == "super" else 0.0
+        if self.exited > exit_limit:
+            issues.append(self._issue("unexpected_fills", f"Order {self.order_id} ({self.side}) has "
+                                                          f"{_quantity(self.exited)} traded on the other side"))
+        return issues
+
+    def _issue(self, kind, message):
+        return {"type": kind, "order_id": self.order_id, "message": message}
+
+
+class Reconciler:
+    """
+    Incremental reconciliation of journaled orders and fills with positions.
+
+    Args:
+        journal: TradeJournal whose rows are reconciled
+        source: "live" or "paper" (default: from DHAN_PAPER_TRADING)
+    """
+
+    def __init__(self, journal=journal, source=None):
+        self.journal = journal
+        self.source = source or ("paper" if DHAN_PAPER_TRADING else "live")
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.date = None
+        self.order_cursor = 0
+        self.trade_cursor = 0
+        self.reconciled_at = None
+        self.orders = {}
+        self.by_security = {}
+        self.positions = {}
+        self.results = {}
+
+    # State
+
+    def _connect(self):
+        connection = self.journal.connect()
+        connection.executescript(SCHEMA)
+        return connection
+
+    def _reset(self, date):
+        self.date = date
+        self.order_cursor = self.trade_cursor = 0
+        self.orders, self.by_security, self.positions, self.results = {}, {}, {}, {}
+
+    def _load(self, connection, date):
+        self._reset(date)
+        row = connection.execute(
+            "SELECT date, order_event_id, trade_id, reconciled_at FROM reconciliation_cursors WHERE source = ?",
+            (self.source,)).fetchone()
+        if row is None or row[0] != date:
+            return
+        _, self.order_cursor, self.trade_cursor, self.reconciled_at = row
+        columns = ", ".join(OrderState.__slots__)
+        for values in connection.execute(f"SELECT {columns} FROM reconciliation_orders WHERE source = ? AND date = ?",
+                                         (self.source, date)):
+            self._index(OrderState(*values))
+
+    def _index(self, order):
+        self.orders[order.order_id] = order
+        if order.security_id is not None:
+            self.by_security.setdefault(order.security_id, set()).add(order.order_id)
+
+    def _order(self, order_id, security_id, symbol):
+        order = self.orders.get(order_id)
+        if order is None:
+            order = OrderState(order_id, security_id=security_id, symbol=symbol)
+            self._index(order)
+        elif order.security_id is None and security_id is not None:
+            order.security_id, order.symbol = security_id, symbol
+            self._index(order)
+        return order
+
+    def _save(self, connection, changed):
+        with connection:
+            if self.date is not None:
+                connection.execute("DELETE FROM reconciliation_orders WHERE source = ? AND date != ?",
+                                   (self.source, self.date))
+            columns = ", ".join(OrderState.__slots__)
+            connection.executemany(
+                f"INSERT OR REPLACE INTO reconciliation_orders (source, date, {columns}) "
+                f"VALUES (?, ?, {', '.join('?' * len(OrderState.__slots__))})",
+                [(self.source, self.date, *(getattr(order, name) for name in OrderState.__slots__))
+                 for order in (self.orders[order_id] for order_id in changed)])
+            connection.execute(
+                "INSERT OR REPLACE INTO reconciliation_cursors (source, date, order_event_id, trade_id, reconciled_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.source, self.date, self.order_cursor, self.trade_cursor, self.reconciled_at))
+
+    # Folding journal rows
+
+    def _apply_order_events(self, connection, changed, dirty):
+        rows = connection.execute(
+            "SELECT id, event, kind, order_id, security_id, symbol, side, quantity, status, raw FROM orders "
+            "WHERE id > ? AND source = ? AND date = ? ORDER BY id",
+            (self.order_cursor, self.source, self.date)).fetchall()
+        for event_id, event, kind, order_id, security_id, symbol, side, quantity, status, raw in rows:
+            self.order_cursor = event_id
+            if not order_id or event == "rejected":
+                continue
+            order = self._order(order_id, security_id, symbol)
+            if event == "placed" or order.quantity is None and quantity is not None:
+                order.origin = "tools" if event == "placed" else order.origin or "order_book"
+                order.kind, order.side, order.quantity = kind, side, quantity
+            if status:
+                order.status = status
+            if event == "status":
+                try:
+                    filled = json.loads(raw).get("filledQty") if raw else None
+                except ValueError:
+                    filled = None
+                if filled is not None:
+                    order.filled = float(filled)
+            changed.add(order_id)
+            if order.security_id is not None:
+                dirty.add(order.security_id)
+        return len(rows)
+
+    def _apply_trades(self, connection, changed, dirty):
+        rows = connection.execute(
+            "SELECT id, order_id, security_id, symbol, side, quantity FROM trades "
+            "WHERE id > ? AND source = ? AND date = ? ORDER BY id",
+            (self.trade_cursor, self.source, self.date)).fetchall()
+        for trade_id, order_id, security_id, symbol, side, quantity in rows:
+            self.trade_cursor = trade_id
+            order = self._order(order_id or f"trade-{trade_id}", security_id, symbol)
+            if side == "BUY":
+                order.traded_buy += quantity or 0.0
+            else:
+                order.traded_sell += quantity or 0.0
+            changed.add(order.order_id)
+            if order.security_id is not None:
+                dirty.add(order.security_id)
+        return len(rows)
+
+    def _apply_positions(self, positions, dirty):
+        current = {}
+        for position in positions:
+            security_id = str(position.security_id)
+            day_buy = position.day_buy_quantity if position.day_buy_quantity is not None else position.buy_quantity
+            day_sell = position.day_sell_quantity if position.day_sell_quantity is not None else position.sell_quantity
+            net, symbol = current.get(security_id, (0.0, position.trading_symbol))
+            current[security_id] = (net + float(day_buy or 0) - float(day_sell or 0), symbol)
+        for security_id in current.keys() | self.positions.keys():
+            if current.get(security_id, (0.0,))[0] != self.positions.get(security_id, (0.0,))[0]:
+                dirty.add(security_id)
+        self.positions = current
+
+    # Comparing
+
+    def _check(self, security_id):
+        orders = [self.orders[order_id] for order_id in self.by_security.get(security_id, ())]
+        position_net, position_symbol = self.positions.get(security_id, (0.0, None))
+        if not orders and not position_net:
+            return None
+
+        expected, open_buy, open_sell, traded_net, issues = 0.0, 0.0, 0.0, 0.0, []
+        for order in orders:
+            traded_net += order.traded_buy - order.traded_sell
+            issues.extend(order.issues())
+            if order.quantity is None:
+                continue
+            least, most = order.expected_range()
+            sign = 1 if order.side == "BUY" else -1
+            # Exits of super orders happen at the exchange, so their fills are taken as they come
+            expected += sign * (least - (order.exited if order.kind == "super" else 0.0))
+            if order.side == "BUY":
+                open_buy += most - least
+            else:
+                open_sell += most - least
+        if traded_net != position_net:
+            issues.append({
+                "type": "position_mismatch",
+                "order_id": None,
+                "message": f"The trade book nets {_quantity(traded_net)} but positions show a day net of "
+                           f"{_quantity(position_net)}"
+            })
+        symbol = next((order.symbol for order in orders if order.symbol), None) or position_symbol
+        return {
+            "security_id": security_id,
+            "symbol": symbol,
+            "expected_net": expected,
+            "open_buy": open_buy,
+            "open_sell": open_sell,
+            "traded_net": traded_net,
+            "position_net": position_net,
+            "orders": len([order for order in orders if order.quantity is not None]),
+            "issues": issues
+        }
+
+    def reconcile(self, positions, full=False, today=None):
+        """
+        Fold new journal rows into the order state and re-check the
+        securities they, or the positions, changed.
+
+        The trade book should have been read through dhan_client (and the
+        journal flushed) just before, so its fills are in the journal.
+
+        Args:
+            positions: Position records fetched from /positions
+            full: Rebuild the day's state from the first journal row
+            today: Date reconciled, YYYY-MM-DD (default: today)
+
+        Returns:
+            Dictionary with what was processed and every security with a
+            discrepancy
+        """
+        today = today or datetime.date.today().isoformat()
+        start = time.perf_counter()
+        with self._lock:
+            connection = self._connect()
+            try:
+                if not self._loaded or full or self.date != today:
+                    if full:
+                        self._reset(today)
+                    else:
+                        self._load(connection, today)
+                    self._loaded = True
+                    dirty = set(self.by_security) | set(self.positions)
+                else:
+                    dirty = set()
+                changed = set()
+                order_events = self._apply_order_events(connection, changed, dirty)
+                trades = self._apply_trades(connection, changed, dirty)
+                self._apply_positions(positions, dirty)
+
+                for security_id in dirty:
+                    result = self._check(security_id)
+                    if result is None:
+                        self.results.pop(security_id, None)
+                    else:
+                        self.results[security_id] = result
+                self.reconciled_at = time.time()
+                self._save(connection, changed)
+            finally:
+                connection.close()
+
+            discrepancies = [result for result in self.results.values() if result["issues"]]
+            return {
+                "date": self.date,
+                "source": self.source,
+                "new_order_events": order_events,
+                "new_trades": trades,
+                "securities_checked": len(dirty),
+                "securities_tracked": len(self.results),
+                "order_event_cursor": self.order_cursor,
+                "trade_cursor": self.trade_cursor,
+                "discrepancies_count": len(discrepancies),
+                "discrepancies": sorted(discrepancies, key=lambda result: str(result["symbol"])),
+                "reconcile_ms": round((time.perf_counter() - start) * 1000, 3)
+            }
+
+
+# Reconciler of this process's trade journal
+reconciler = Reconciler()
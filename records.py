@@ -0,0 +1,255 @@
+# records.py
+# Compact records for the rows Dhan returns for orders, trades, holdings,
+# positions and fund limits.
+#
+# response.json() gives one dict per row, each with its own hash table and
+# its own copy of every string value, so a list of rows held for a while
+# (several accounts fanned out, a day's order book) is mostly dict overhead
+# and repeated "NSE_EQ"/"BUY"/"TRADED" strings. The records here keep the
+# values in __slots__ instead, share the repeated codes through sys.intern,
+# and keep any field Dhan adds later in `extra` so nothing is lost.
+#
+# Parse with Order.from_json(row) or Order.from_rows(rows), work with the
+# attributes, and turn the records back into Dhan-shaped dicts with
+# to_dict()/to_dicts() only when building a tool response. Fields that are
+# None are left out of those dicts.
+import sys
+
+
+def _compile(cls, source, name, doc):
+    namespace = {"new": object.__new__, "intern": sys.intern, "keys": cls._keys}
+    exec(source, namespace)
+    function = namespace[name]
+    function.__doc__ = doc
+    return function
+
+def _compile_methods(cls):
+    """
+    from_json and to_dict for a record class, generated the way dataclasses
+    generates __init__: straight-line statements per field run about twice
+    as fast as looping over FIELDS with getattr/setattr.
+    """
+    lines = ["def from_json(cls, row):", "    record = new(cls)", "    get = row.get"]
+    for key, name in cls.FIELDS.items():
+        if key in cls.CODES:
+            lines.append(f"    value = get({key!r})")
+            lines.append(f"    record.{name} = intern(value) if value.__class__ is str else value")
+        else:
+            lines.append(f"    record.{name} = get({key!r})")
+    lines.append("    record.extra = None if row.keys() <= keys else {key: row[key] for key in row.keys() - keys}")
+    lines.append("    return record")
+    from_json = _compile(cls, "\n".join(lines), "from_json", f"Build a {cls.__name__} from one row of a Dhan response")
+
+    lines = ["def to_dict(self, **fields):", "    row = {}"]
+    for key, name in cls.FIELDS.items():
+        lines += [f"    value = self.{name}", "    if value is not None:", f"        row[{key!r}] = value"]
+    lines += ["    if self.extra:", "        row.update(self.extra)",
+              "    if fields:", "        row.update(fields)", "    return row"]
+    to_dict = _compile(cls, "\n".join(lines), "to_dict", Record.to_dict.__doc__)
+    return classmethod(from_json), to_dict
+
+
+class Record:
+    """
+    Base for the Dhan row records.
+
+    Subclasses define FIELDS (Dhan field name -> attribute name), CODES (the
+    Dhan fields holding short repeated codes, which are interned) and
+    __slots__ with every attribute in FIELDS.
+    """
+
+    __slots__ = ("extra",)
+
+    FIELDS = {}
+    CODES = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._keys = frozenset(cls.FIELDS)
+        cls.from_json, cls.to_dict = _compile_methods(cls)
+
+    @classmethod
+    def from_json(cls, row):
+        """Build a record from one row of a Dhan response (compiled per subclass)"""
+        raise NotImplementedError
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Records for the rows of a list response. None (as Dhan sends for an
+        empty book) gives [], a single row object gives one record.
+        """
+        if isinstance(rows, dict):
+            rows = [rows]
+        from_json = cls.from_json
+        return [from_json(row) for row in rows or []]
+
+    def to_dict(self, **fields):
+        """
+        The row as Dhan names its fields, without None values (compiled per
+        subclass).
+
+        Args:
+            **fields: Fields to add, e.g. account="family"
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={value!r}" for name in self.FIELDS.values()
+                           if (value := getattr(self, name)) is not None)
+        return f"{type(self).__name__}({values})"
+
+
+def to_dicts(records, **fields):
+    """Tool response rows for a list of records"""
+    return [record.to_dict(**fields) for record in records]
+
+
+class Order(Record):
+    """One order of the order book (GET /orders, /orders/{id})"""
+
+    FIELDS = {
+        "dhanClientId": "client_id",
+        "orderId": "order_id",
+        "exchangeOrderId": "exchange_order_id",
+        "correlationId": "correlation_id",
+        "orderStatus": "status",
+        "transactionType": "side",
+        "exchangeSegment": "segment",
+        "productType": "product",
+        "orderType": "order_type",
+        "validity": "validity",
+        "tradingSymbol": "trading_symbol",
+        "securityId": "security_id",
+        "quantity": "quantity",
+        "disclosedQuantity": "disclosed_quantity",
+        "price": "price",
+        "triggerPrice": "trigger_price",
+        "afterMarketOrder": "after_market",
+        "amoTime": "amo_time",
+        "boProfitValue": "bo_profit_value",
+        "boStopLossValue": "bo_stop_loss_value",
+        "legName": "leg_name",
+        "createTime": "create_time",
+        "updateTime": "update_time",
+        "exchangeTime": "exchange_time",
+        "drvExpiryDate": "expiry_date",
+        "drvOptionType": "option_type",
+        "drvStrikePrice": "strike_price",
+        "omsErrorCode": "error_code",
+        "omsErrorDescription": "error_description",
+        "algoId": "algo_id",
+        "remainingQuantity": "remaining_quantity",
+        "averageTradedPrice": "average_price",
+        "filledQty": "filled_quantity"
+    }
+    CODES = ("dhanClientId", "orderStatus", "transactionType", "exchangeSegment", "productType", "orderType",
+             "validity", "legName", "drvOptionType", "amoTime", "omsErrorCode")
+    __slots__ = tuple(FIELDS.values())
+
+
+class Trade(Record):
+    """One trade of the trade book (GET /trades, /trades/{order id})"""
+
+    FIELDS = {
+        "dhanClientId": "client_id",
+        "orderId": "order_id",
+        "exchangeOrderId": "exchange_order_id",
+        "exchangeTradeId": "exchange_trade_id",
+        "transactionType": "side",
+        "exchangeSegment": "segment",
+        "productType": "product",
+        "orderType": "order_type",
+        "tradingSymbol": "trading_symbol",
+        "customSymbol": "custom_symbol",
+        "securityId": "security_id",
+        "tradedQuantity": "quantity",
+        "tradedPrice": "price",
+        "createTime": "create_time",
+        "updateTime": "update_time",
+        "exchangeTime": "exchange_time",
+        "drvExpiryDate": "expiry_date",
+        "drvOptionType": "option_type",
+        "drvStrikePrice": "strike_price"
+    }
+    CODES = ("dhanClientId", "transactionType", "exchangeSegment", "productType", "orderType", "drvOptionType")
+    __slots__ = tuple(FIELDS.values())
+
+
+class Holding(Record):
+    """One demat holding (GET /holdings)"""
+
+    FIELDS = {
+        "exchange": "exchange",
+        "tradingSymbol": "trading_symbol",
+        "securityId": "security_id",
+        "isin": "isin",
+        "totalQty": "total_quantity",
+        "dpQty": "dp_quantity",
+        "t1Qty": "t1_quantity",
+        "availableQty": "available_quantity",
+        "collateralQty": "collateral_quantity",
+        "avgCostPrice": "average_cost",
+        "lastTradedPrice": "last_price"
+    }
+    CODES = ("exchange",)
+    __slots__ = tuple(FIELDS.values())
+
+
+class Position(Record):
+    """One position of the day (GET /positions)"""
+
+    FIELDS = {
+        "dhanClientId": "client_id",
+        "tradingSymbol": "trading_symbol",
+        "securityId": "security_id",
+        "positionType": "position_type",
+        "exchangeSegment": "segment",
+        "productType": "product",
+        "buyAvg": "buy_average",
+        "buyQty": "buy_quantity",
+        "costPrice": "cost_price",
+        "sellAvg": "sell_average",
+        "sellQty": "sell_quantity",
+        "netQty": "net_quantity",
+        "realizedProfit": "realized_profit",
+        "unrealizedProfit": "unrealized_profit",
+        "rbiReferenceRate": "rbi_reference_rate",
+        "multiplier": "multiplier",
+        "carryForwardBuyQty": "carry_forward_buy_quantity",
+        "carryForwardSellQty": "carry_forward_sell_quantity",
+        "carryForwardBuyValue": "carry_forward_buy_value",
+        "carryForwardSellValue": "carry_forward_sell_value",
+        "dayBuyQty": "day_buy_quantity",
+        "daySellQty": "day_sell_quantity",
+        "dayBuyValue": "day_buy_value",
+        "daySellValue": "day_sell_value",
+        "drvExpiryDate": "expiry_date",
+        "drvOptionType": "option_type",
+        "drvStrikePrice": "strike_price",
+        "crossCurrency": "cross_currency"
+    }
+    CODES = ("dhanClientId", "positionType", "exchangeSegment", "productType", "drvOptionType")
+    __slots__ = tuple(FIELDS.values())
+
+    @property
+    def is_open(self):
+        """False for a position closed out without realised P&L"""
+        return self.position_type != "CLOSED" or bool(self.realized_profit)
+
+
+class FundLimits(Record):
+    """Fund limits of the account (GET /fundlimit); Dhan spells two fields this way"""
+
+    FIELDS = {
+        "dhanClientId": "client_id",
+        "availabelBalance": "available_balance",
+        "sodLimit": "start_of_day_limit",
+        "collateralAmount": "collateral_amount",
+        "receiveableAmount": "receiveable_amount",
+        "utilizedAmount": "utilized_amount",
+        "blockedPayoutAmount": "blocked_payout_amount",
+        "withdrawableBalance": "withdrawable_balance"
+    }
+    CODES = ("dhanClientId",)
+    __slots__ = tuple(FIELDS.values())
@@ -0,0 +1,360 @@
+# reference_cache.py
+# Prebuilt indexes of reference data, kept on disk and memory-mapped.
+#
+# stocks.json and Dhan's instrument master change rarely but were parsed
+# again by every process, and stocks.json on every lookup. Here each source
+# is turned once into an index file under DHAN_REFERENCE_CACHE_DIR:
+#
+#   magic, format version, header length
+#   header (JSON)  format version, size and mtime of every source file, and
+#                  the offset, entry count, length and CRC-32 of each section
+#   sections       one sorted key -> value table each: a fixed-width entry
+#                  table (key offset/length, value offset/length) followed
+#                  by the UTF-8 keys and compact JSON values
+#
+# A process maps the file and looks keys up by binary search, so only the
+# pages it touches are read; a section's checksum is verified the first
+# time it is used. The file is rebuilt, and replaced atomically, when a
+# source file's size or mtime no longer matches the header, when the format
+# version changes, or when a checksum fails. Only the standard library is
+# used, so loading the cache adds nothing to a tool server's import time.
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+
+from config import DHAN_REFERENCE_CACHE_DIR
+
+# Bump when the file layout or the content of a section changes
+FORMAT_VERSION = 1
+
+MAGIC = b"DHANREF\n"
+PREAMBLE = struct.Struct("<8sII")
+ENTRY = struct.Struct("<IIII")
+
+STOCKS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stocks.json")
+
+# Fields of stocks.json whose words are searchable
+SEARCH_FIELDS = ("stock_name", "company_name", "sector")
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def encode_section(mapping):
+    """Bytes of one section: entries sorted by UTF-8 key, then keys and values"""
+    items = sorted((str(key).encode("utf-8"), json.dumps(value, separators=(",", ":")).encode("utf-8"))
+                   for key, value in mapping.items())
+    table, blob = bytearray(ENTRY.size * len(items)), bytearray()
+    base = len(table)
+    for i, (key, value) in enumerate(items):
+        key_offset = base + len(blob)
+        blob += key
+        ENTRY.pack_into(table, i * ENTRY.size, key_offset, len(key), key_offset + len(key), len(value))
+        blob += value
+    return bytes(table + blob), len(items)
+
+def encode_index(sources, sections):
+    """
+    Bytes of an index file.
+
+    Args:
+        sources: [size, mtime_ns] of each source file
+        sections: Section name -> {key: JSON value}
+    """
+    encoded = {name: encode_section(mapping) for name, mapping in sections.items()}
+    header = {"version": FORMAT_VERSION, "sources": sources, "sections": {}}
+    # Offsets depend on the header length, which depends on the offsets; a
+    # header shorter than the room left for it is padded with spaces
+    header_length = 0
+    while True:
+        offset = PREAMBLE.size + header_length
+        for name, (data, count) in encoded.items():
+            header["sections"][name] = {"offset": offset, "count": count, "length": len(data),
+                                        "crc32": zlib.crc32(data)}
+            offset += len(data)
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        if len(header_bytes) <= header_length:
+            header_bytes = header_bytes.ljust(header_length)
+            break
+        header_length = len(header_bytes)
+    return b"".join([PREAMBLE.pack(MAGIC, FORMAT_VERSION, header_length), header_bytes]
+                    + [data for data, _ in encoded.values()])
+
+
+class Section:
+    """One sorted key -> value table of an index file"""
+
+    def __init__(self, buffer, offset, count):
+        self._buffer = buffer
+        self._offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, i):
+        key_offset, key_length, value_offset, value_length = ENTRY.unpack_from(self._buffer, self._offset + i * ENTRY.size)
+        start = self._offset + key_offset
+        return start, key_length, self._offset + value_offset, value_length
+
+    def _key(self, i):
+        start, length, _, _ = self._entry(i)
+        return self._buffer[start:start + length]
+
+    def _value(self, i):
+        _, _, start, length = self._entry(i)
+        return json.loads(self._buffer[start:start + length])
+
+    def _lower_bound(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get(self, key, default=None):
+        """The value for key, or default"""
+        key = str(key).encode("utf-8")
+        i = self._lower_bound(key)
+        if i < self.count and self._key(i) == key:
+            return self._value(i)
+        return default
+
+    def prefix(self, prefix):
+        """(key, value) pairs whose key starts with prefix, in key order"""
+        prefix = str(prefix).encode("utf-8")
+        i = self._lower_bound(prefix)
+        while i < self.count:
+            key = self._key(i)
+            if not key.startswith(prefix):
+                break
+            yield key.decode("utf-8"), self._value(i)
+            i += 1
+
+    def items(self):
+        """All (key, value) pairs in key order"""
+        for i in range(self.count):
+            yield self._key(i).decode("utf-8"), self._value(i)
+
+
+class IndexFile:
+    """
+    A mapped index file (or its bytes, if it could not be written).
+
+    Raises:
+        ValueError if the data is not an index of this format version
+    """
+
+    def __init__(self, path=None, data=None):
+        if data is None:
+            with open(path, "rb") as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = data
+        try:
+            magic, version, header_length = PREAMBLE.unpack_from(data, 0)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"Not a version {FORMAT_VERSION} reference index")
+            header = json.loads(data[PREAMBLE.size:PREAMBLE.size + header_length])
+        except (struct.error, ValueError) as e:
+            self.close()
+            raise ValueError(f"Invalid reference index: {e}")
+        self.sources = header["sources"]
+        self._sections = header["sections"]
+        self._verified = {}
+
+    def section(self, name):
+        """
+        A section, checksummed on first use.
+
+        Raises:
+            KeyError if there is no such section, ValueError if its checksum fails
+        """
+        section = self._verified.get(name)
+        if section is None:
+            meta = self._sections[name]
+            start = meta["offset"]
+            if zlib.crc32(self._buffer[start:start + meta["length"]]) != meta["crc32"]:
+                raise ValueError(f"Checksum mismatch in section {name!r}")
+            section = self._verified[name] = Section(self._buffer, start, meta["count"])
+        return section
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+
+class ReferenceCache:
+    """
+    An index file built from source files by `build`, rebuilt when they change.
+
+    Args:
+        name: Cache name, part of the file name
+        sources: Paths of the source files
+        build: Called with the source paths; returns section name -> {key: value}
+        directory: Where index files are kept
+    """
+
+    def __init__(self, name, sources, build, directory=None):
+        self.name = name
+        self.sources = [os.path.abspath(path) for path in sources]
+        self.build = build
+        digest = hashlib.sha1("\0".join(self.sources).encode("utf-8")).hexdigest()[:10]
+        self.path = os.path.join(directory or DHAN_REFERENCE_CACHE_DIR, f"{name}-{digest}.v{FORMAT_VERSION}.idx")
+        self._lock = threading.Lock()
+        self._index = None
+        self.builds = 0
+
+    def _fingerprint(self):
+        """[size, mtime_ns] of every source (OSError if one is missing)"""
+        return [[stat.st_size, stat.st_mtime_ns] for stat in map(os.stat, self.sources)]
+
+    def _open(self, fingerprint):
+        try:
+            index = IndexFile(self.path)
+        except (OSError, ValueError):
+            return None
+        if index.sources != fingerprint:
+            index.close()
+            return None
+        return index
+
+    def _rebuild(self, fingerprint):
+        data = encode_index(fingerprint, self.build(*self.sources))
+        self.builds += 1
+        partial = f"{self.path}.{os.getpid()}.part"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(partial, "wb") as file:
+                file.write(data)
+            os.replace(partial, self.path)
+            return IndexFile(self.path)
+        except OSError:
+            # Read-only cache directory: keep the index in memory
+            return IndexFile(data=data)
+
+    def index(self, rebuild=False):
+        """
+        The current index, opening or rebuilding the file if needed.
+
+        Raises:
+            OSError if a source file cannot be read
+        """
+        fingerprint = self._fingerprint()
+        index = self._index
+        if index is not None and index.sources == fingerprint and not rebuild:
+            return index
+        with self._lock:
+            if self._index is not None and self._index.sources == fingerprint and not rebuild:
+                return self._index
+            index = None if rebuild else self._open(fingerprint)
+            # The previous mapping is left to the garbage collector; callers may still hold its sections
+            self._index = index or self._rebuild(fingerprint)
+            return self._index
+
+    def section(self, name):
+        """A verified section of the current index, rebuilding once on a checksum failure"""
+        try:
+            return self.index().section(name)
+        except ValueError:
+            return self.index(rebuild=True).section(name)
+
+    def get(self, section, key, default=None):
+        return self.section(section).get(key, default)
+
+
+# stocks.json
+
+def build_stock_index(path):
+    """
+    Sections of the stocks.json index:
+
+        companies  "000042" (position in the file) -> company record
+        names      lower-cased stock name -> [position, stock name, stock code]
+                   (the first one listed)
+        codes      stock code -> [position, stock name]
+        search     word of the name, company name or sector -> positions
+    """
+    with open(path, 'r') as file:
+        companies = json.load(file).get('companies', [])
+    sections = {"companies": {}, "names": {}, "codes": {}, "search": {}}
+    for number, stock in enumerate(companies):
+        position = f"{number:06d}"
+        sections["companies"][position] = stock
+        name, code = stock.get('stock_name'), stock.get('stock_code')
+        sections["names"].setdefault(str(name or '').lower(), [position, name, code])
+        sections["codes"].setdefault(str(code), [position, name])
+        text = " ".join(str(stock.get(field) or "") for field in SEARCH_FIELDS).lower()
+        for word in set(WORD.findall(text)):
+            sections["search"].setdefault(word, []).append(position)
+    return sections
+
+stocks = ReferenceCache("stocks", [STOCKS_PATH], build_stock_index)
+
+def load_stocks_data():
+    """All companies in stocks.json, in file order ([] if it cannot be read)"""
+    try:
+        return [stock for _, stock in stocks.section("companies").items()]
+    except (OSError, ValueError) as e:
+        print(f"Error loading stocks data: {e}")
+        return []
+
+def _lookup(section, key):
+    try:
+        return stocks.get(section, key)
+    except (OSError, ValueError) as e:
+        print(f"Error loading stocks data: {e}")
+        return None
+
+def find_stock(stock_name):
+    """The stocks.json record of a stock, matched case-insensitively by name, or None"""
+    entry = _lookup("names", str(stock_name).lower())
+    return _lookup("companies", entry[0]) if entry else None
+
+def find_stock_code(stock_name):
+    """Find the stock code for a given stock name"""
+    entry = _lookup("names", str(stock_name).lower())
+    return entry[2] if entry else None
+
+def stock_name_for(stock_code):
+    """The stock name of a stock code (security ID) in stocks.json, or None"""
+    entry = _lookup("codes", str(stock_code))
+    return entry[1] if entry else None
+
+def find_stock_by_code(stock_code):
+    """The stocks.json record with this stock code (security ID), or None"""
+    entry = _lookup("codes", str(stock_code))
+    return _lookup("companies", entry[0]) if entry else None
+
+def resolve_stock(stock):
+    """(stock name, stock code) of a stock name (any case) or stock code in stocks.json, or None"""
+    entry = _lookup("names", str(stock).lower())
+    if entry:
+        return entry[1], str(entry[2])
+    entry = _lookup("codes", str(stock))
+    return (entry[1], str(stock)) if entry else None
+
+def search_stocks(query, limit=None):
+    """
+    Stocks whose name, company name or sector has words starting with
+    every word of the query, in file order.
+    """
+    words = WORD.findall(str(query).lower())
+    if not words:
+        return []
+    try:
+        search = stocks.section("search")
+        matches = None
+        for word in words:
+            positions = {position for _, found in search.prefix(word) for position in found}
+            matches = positions if matches is None else matches & positions
+        companies = stocks.section("companies")
+        return [companies.get(position) for position in sorted(matches)[:limit]]
+    except (OSError, ValueError) as e:
+        print(f"Error loading stocks data: {e}")
+        return []
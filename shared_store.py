@@ -0,0 +1,183 @@
+# shared_store.py
+# State shared by the worker processes of one deployment.
+#
+# When the tools are served by several processes (see http_server.py), each
+# process would otherwise keep its own rate limit buckets, its own view of
+# the order ledger and its own caches. SharedStore keeps that state in one
+# local SQLite file in WAL mode instead: token buckets are refilled and
+# taken inside a single write transaction, so the processes together stay
+# within one set of limits, and keyed records are read and updated
+# atomically. Set DHAN_SHARED_STORE to the file to turn it on; http_server.py
+# does this for its workers.
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import DHAN_SHARED_STORE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires REAL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS records_expires ON records (expires);
+"""
+
+# Seconds a writer waits for another process's transaction to finish
+BUSY_TIMEOUT_SECONDS = 10
+
+
+class SharedStore:
+    """
+    Token buckets and keyed JSON records in a SQLite file shared by processes.
+
+    Args:
+        path: Database file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        # Threads of one process take turns at the write lock here; waiting
+        # in SQLite's busy handler instead means sleeping in growing steps
+        self._write_lock = threading.Lock()
+        self._schema_ready = False
+
+    def connection(self):
+        """This thread's connection (sqlite3 connections are not shared between threads)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.executescript(SCHEMA)
+                    self._schema_ready = True
+            self._local.connection = connection
+        return connection
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Write transaction; BEGIN IMMEDIATE takes the database lock up front so
+        read-modify-write sequences cannot interleave between processes"""
+        connection = self.connection()
+        with self._write_lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    # Token buckets
+
+    def reserve(self, buckets, timeout=None):
+        """
+        Take one token from each bucket, refilling them first.
+
+        Args:
+            buckets: List of (name, rate per second, capacity)
+            timeout: Longest acceptable wait in seconds (default: no limit)
+
+        Returns:
+            Seconds the caller must wait before sending, or None if the wait
+            would exceed `timeout` (nothing is taken then)
+        """
+        with self._transaction() as connection:
+            now = time.time()
+            states = []
+            wait = 0.0
+            for name, rate, capacity in buckets:
+                row = connection.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + max(now - row[1], 0.0) * rate)
+                states.append((name, tokens))
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+            if timeout is not None and wait > timeout:
+                return None
+            connection.executemany(
+                "INSERT INTO buckets (name, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                [(name, tokens - 1, now) for name, tokens in states])
+            return wait
+
+    # Records
+
+    def get(self, namespace, key):
+        """The record stored under a key, or None if missing or expired"""
+        row = self.connection().execute(
+            "SELECT value, expires FROM records WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        if row is None or row[1] is not None and row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl=None):
+        """Store a JSON-serialisable record, optionally expiring after `ttl` seconds"""
+        expires = time.time() + ttl if ttl else None
+        with self._write_lock:
+            self.connection().execute(
+                "INSERT INTO records (namespace, key, value, expires) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires = excluded.expires",
+                (namespace, key, json.dumps(value), expires))
+
+    def update(self, namespace, key, fn, ttl=None):
+        """
+        Atomically read, change and write one record.
+
+        Args:
+            fn: Called with the current record (or None); returns (new record
+                or None to leave it unchanged, result)
+
+        Returns:
+            The result returned by fn
+        """
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT value, expires FROM records WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            current = None if row is None or row[1] is not None and row[1] < time.time() else json.loads(row[0])
+            value, result = fn(current)
+            if value is not None:
+                expires = time.time() + ttl if ttl else None
+                connection.execute(
+                    "INSERT INTO records (namespace, key, value, expires) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires = excluded.expires",
+                    (namespace, key, json.dumps(value), expires))
+            return result
+
+    def delete(self, namespace, key):
+        with self._write_lock:
+            self.connection().execute("DELETE FROM records WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def purge_expired(self):
+        """Delete expired records; returns how many were removed"""
+        with self._write_lock:
+            cursor = self.connection().execute("DELETE FROM records WHERE expires IS NOT NULL AND expires < ?",
+                                               (time.time(),))
+        return cursor.rowcount
+
+    def ping(self):
+        """True if the store can be read"""
+        try:
+            self.connection().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+
+# Store shared with other processes, or None when DHAN_SHARED_STORE is unset
+store = SharedStore(DHAN_SHARED_STORE) if DHAN_SHARED_STORE else None
@@ -1,37 +1,15 @@
 # super_order_tool.py
-import json
-import os
-import requests
 from mcp.server.fastmcp import FastMCP
 from config import DHAN_CLIENT_ID, DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL
+import dhan_client
+from order_idempotency import submit_order
+from reference_cache import find_stock_code
+from super_order_levels import compute_stoploss_price, compute_target_price
+from tool_metrics import instrument_server
 
 # Create the MCP server
 mcp = FastMCP("DhanHQ Super Order")
-
-# Helper function to load stocks data
-def load_stocks_data():
-    """Load the stocks data from stocks.json file"""
-    try:
-        # Get the directory of the current script
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        # Construct the path to stocks.json
-        stocks_file_path = os.path.join(script_dir, "stocks.json")
-        
-        with open(stocks_file_path, 'r') as file:
-            data = json.load(file)
-            return data.get('companies', [])
-    except Exception as e:
-        print(f"Error loading stocks data: {e}")
-        return []
-
-# Find stock code by name
-def find_stock_code(stock_name):
-    """Find the stock code for a given stock name"""
-    stocks = load_stocks_data()
-    for stock in stocks:
-        if stock.get('stock_name', '').lower() == stock_name.lower():
-            return stock.get('stock_code')
-    return None
+instrument_server(mcp)
 
 @mcp.tool()
 def place_super_order(
@@ -39,13 +17,14 @@ def place_super_order(
     quantity, 
     transaction_type,
     price=None,
-    target_type="value",  # "value" or "percentage"
+    target_type="value",  # "value", "percentage" or "atr"
     target_value=None,
-    stoploss_type="value",  # "value" or "percentage"
+    stoploss_type="value",  # "value", "percentage" or "atr"
     stoploss_value=None,
     trailing_jump=0,
     product_type="INTRADAY",
-    order_type="LIMIT"
+    order_type="LIMIT",
+    correlation_id=None
 ):
     """
     Place a super order with target and stop loss.
@@ -55,13 +34,17 @@ def place_super_order(
         quantity: Number of shares to buy/sell
         transaction_type: "BUY" or "SELL"
         price: Order price (if None, will use market order)
-        target_type: "value" for absolute price, "percentage" for percentage gain/loss
-        target_value: Target value (either absolute price or percentage)
-        stoploss_type: "value" for absolute price, "percentage" for percentage gain/loss
-        stoploss_value: Stop loss value (either absolute price or percentage)
+        target_type: "value" for absolute price, "percentage" for percentage gain/loss,
+            "atr" for a multiple of the 14-day average true range
+        target_value: Target value (absolute price, percentage or ATR multiple)
+        stoploss_type: "value" for absolute price, "percentage" for percentage gain/loss,
+            "atr" for a multiple of the 14-day average true range
+        stoploss_value: Stop loss value (absolute price, percentage or ATR multiple)
         trailing_jump: Price jump for trailing stop loss (0 for no trailing)
         product_type: Product type (default: "INTRADAY")
         order_type: Order type (default: "LIMIT")
+        correlation_id: Client ID for this order (optional). Reusing it returns
+            the order it already placed instead of placing a new one
     
     Returns:
         Order status information
@@ -96,31 +79,32 @@ def place_super_order(
             "message": "For percentage targets/stoploss, a valid price must be provided"
         }
     
+    # ATR multiples use the latest 14-day ATR from cached daily candles
+    atr = None
+    if "atr" in (target_type, stoploss_type):
+        from indicator_tool import latest_atr
+        try:
+            atr = latest_atr(stock_name)
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": f"Error computing ATR: {str(e)}"
+            }
+        if atr is None:
+            return {
+                "status": "error",
+                "message": f"Not enough history to compute ATR for '{stock_name}'"
+            }
+    
     # Calculate target price
     target_price = None
     if target_value is not None:
-        if target_type == "percentage":
-            if transaction_type.upper() == "BUY":
-                # For buy, target is higher than entry price
-                target_price = current_price * (1 + target_value / 100)
-            else:
-                # For sell, target is lower than entry price
-                target_price = current_price * (1 - target_value / 100)
-        else:  # "value"
-            target_price = target_value
+        target_price = compute_target_price(current_price, transaction_type, target_type, target_value, atr)
     
     # Calculate stop loss price
     stoploss_price = None
     if stoploss_value is not None:
-        if stoploss_type == "percentage":
-            if transaction_type.upper() == "BUY":
-                # For buy, stop loss is lower than entry price
-                stoploss_price = current_price * (1 - stoploss_value / 100)
-            else:
-                # For sell, stop loss is higher than entry price
-                stoploss_price = current_price * (1 + stoploss_value / 100)
-        else:  # "value"
-            stoploss_price = stoploss_value
+        stoploss_price = compute_stoploss_price(current_price, transaction_type, stoploss_type, stoploss_value, atr)
     
     # Prepare super order request
     url = f"{DHAN_API_BASE_URL}/super/orders"
@@ -152,17 +136,20 @@ def place_super_order(
         order_data["trailingJump"] = trailing_jump
     
     try:
-        response = requests.post(url, headers=headers, json=order_data)
+        response, correlation_id, outcome = submit_order(url, headers, order_data, correlation_id, kind="super")
         
         if response.status_code in [200, 201, 202]:
             return {
                 "status": "success",
                 "message": f"Super order placed successfully for {quantity} shares of {stock_name}",
+                "correlation_id": correlation_id,
+                "submission": outcome,
                 "order_details": {
                     "entry_price": price,
                     "target_price": target_price,
                     "stoploss_price": stoploss_price,
                     "trailing_jump": trailing_jump,
+                    "atr": atr,
                     "response": response.json()
                 }
             }
@@ -170,7 +157,9 @@ def place_super_order(
             return {
                 "status": "error",
                 "message": f"Failed to place super order. Status code: {response.status_code}",
-                "details": response.text
+                "details": response.text,
+                "correlation_id": correlation_id,
+                "submission": outcome
             }
     except Exception as e:
         return {
@@ -193,7 +182,7 @@ def list_super_orders():
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = dhan_client.get(url, headers=headers)
         
         if response.status_code == 200:
             return {
@@ -231,7 +220,7 @@ def cancel_super_order(order_id, leg_name="ENTRY_LEG"):
     }
     
     try:
-        response = requests.delete(url, headers=headers)
+        response = dhan_client.delete(url, headers=headers)
         
         if response.status_code in [200, 202]:
             return {
@@ -251,6 +240,123 @@ def cancel_super_order(order_id, leg_name="ENTRY_LEG"):
             "message": f"Error cancelling order: {str(e)}"
         }
 
+@mcp.tool()
+def place_super_order_ladder(
+    stock_name,
+    quantity,
+    transaction_type,
+    entry_range,
+    tranches,
+    target_percent=None,
+    stoploss_percent=None,
+    trailing_jump=0,
+    product_type="INTRADAY",
+    group_id=None
+):
+    """
+    Scale into (or out of) a position with a ladder of LIMIT super orders.
+    
+    Args:
+        stock_name: The name of the stock (e.g., "ADANIENT")
+        quantity: Total number of shares, split as evenly as possible over the tranches
+        transaction_type: "BUY" or "SELL"
+        entry_range: Entry prices as "low,high" (e.g., "2450,2500") or [low, high].
+            BUY ladders start at the high end and step down, SELL ladders start
+            at the low end and step up
+        tranches: Number of super orders (1-50)
+        target_percent: Target in percent from each entry, or "first,last" to
+            spread targets across the tranches (e.g., "2,6") (optional)
+        stoploss_percent: Stop loss in percent from each entry, or "first,last" (optional)
+        trailing_jump: Price jump for trailing stop loss (0 for no trailing)
+        product_type: Product type (default: "INTRADAY")
+        group_id: Ladder ID (optional, letters and digits, up to 23 characters).
+            Placing a ladder again with the same ID does not place any leg twice
+    
+    Returns:
+        The ladder's group ID (for cancel_ladder) and the prices and outcome of every tranche
+    """
+    from super_order_ladder import (
+        GROUP_ID, instrument_ticks, ladder_legs, new_group_id, parse_range, place_ladder
+    )
+
+    stock_code = find_stock_code(stock_name)
+    if not stock_code:
+        return {
+            "status": "error",
+            "message": f"Stock '{stock_name}' not found in stocks.json"
+        }
+    group_id = group_id or new_group_id()
+    if not GROUP_ID.match(str(group_id)):
+        return {
+            "status": "error",
+            "message": "group_id must be 1-23 letters or digits"
+        }
+
+    tick_size, lot_size, tick_source = instrument_ticks("NSE_EQ", stock_code)
+    try:
+        entry_low, entry_high = parse_range(entry_range, "entry_range")
+        legs = ladder_legs(
+            transaction_type, int(quantity), entry_low, entry_high, int(tranches),
+            parse_range(target_percent, "target_percent") if target_percent is not None else None,
+            parse_range(stoploss_percent, "stoploss_percent") if stoploss_percent is not None else None,
+            tick_size, lot_size
+        )
+    except (TypeError, ValueError) as e:
+        return {
+            "status": "error",
+            "message": f"Invalid ladder: {str(e)}"
+        }
+
+    results = place_ladder(stock_code, transaction_type, legs, group_id, product_type, trailing_jump)
+    placed = sum(result["status"] == "placed" for result in results)
+    return {
+        "status": "success" if placed == len(results) else "error",
+        "message": f"Placed {placed} of {len(results)} super orders for {quantity} shares of {stock_name}",
+        "group_id": group_id,
+        "tick_size": tick_size,
+        "tick_size_source": tick_source,
+        "legs": results
+    }
+
+@mcp.tool()
+def cancel_ladder(group_id, leg_name="ENTRY_LEG"):
+    """
+    Cancel every open super order of a ladder.
+    
+    Args:
+        group_id: Group ID returned by place_super_order_ladder
+        leg_name: Leg to cancel in each super order (ENTRY_LEG cancels the
+            whole super order, TARGET_LEG or STOP_LOSS_LEG only that exit)
+    
+    Returns:
+        Cancellation status of every leg, and the legs that had nothing left to cancel
+    """
+    from super_order_ladder import cancel_ladder_orders, find_ladder_orders
+
+    try:
+        orders = find_ladder_orders(str(group_id))
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Error fetching super orders: {str(e)}"
+        }
+    if not orders:
+        return {
+            "status": "error",
+            "message": f"No super orders found for ladder {group_id}"
+        }
+
+    results, skipped = cancel_ladder_orders(orders, leg_name.upper())
+    failed = [result for result in results if result["status"] != "cancelled"]
+    return {
+        "status": "error" if failed else "success",
+        "message": f"Cancelled {leg_name.upper()} of {len(results) - len(failed)} of {len(orders)} super orders "
+                   f"in ladder {group_id}",
+        "group_id": group_id,
+        "cancelled": results,
+        "skipped": skipped
+    }
+
 # Run the server if executed directly
 if __name__ == "__main__":
     mcp.run()
\ No newline at end of file
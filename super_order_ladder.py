@@ -0,0 +1,282 @@
+# super_order_ladder.py
+# Ladders of super orders: one position entered (or exited) in tranches.
+#
+# A ladder spreads a total quantity over N super orders with entry prices
+# evenly spaced across a range. BUY ladders start at the top of the range
+# and buy lower, SELL ladders start at the bottom and sell higher. Target
+# and stop loss percentages can be one value for every tranche or a range
+# spread across the tranches (scaling out at staggered targets). All leg
+# prices are computed in one NumPy pass and rounded to the instrument's
+# tick size.
+#
+# Every leg's correlation ID is the ladder's group ID followed by the
+# tranche number, so the legs of a ladder can be found again (and placing
+# a ladder again with the same group ID does not place any leg twice).
+# Legs are sent concurrently; dhan_client's rate limiter paces them.
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from config import DHAN_ACCESS_TOKEN, DHAN_API_BASE_URL, DHAN_CLIENT_ID
+import dhan_client
+from order_idempotency import ledger, submit_order
+from super_order_levels import compute_stoploss_price, compute_target_price
+
+# Legs of one ladder; two digits of the correlation ID number them
+MAX_TRANCHES = 50
+
+# Legs sent or cancelled at the same time
+DEFAULT_CONCURRENCY = 8
+
+# Tick size used when the instrument master does not list the instrument
+DEFAULT_TICK_SIZE = 0.05
+
+# Group IDs leave room for the tranche number within Dhan's 25 characters
+GROUP_ID = re.compile(r"^[A-Za-z0-9]{1,23}$")
+
+# Super order statuses that can still be cancelled
+OPEN_STATUSES = ("TRANSIT", "PENDING", "PART_TRADED", "TRIGGERED")
+
+
+def new_group_id():
+    return f"lad{uuid.uuid4().hex[:12]}"
+
+def leg_correlation_id(group_id, tranche):
+    return f"{group_id}{tranche:02d}"
+
+def parse_range(value, name):
+    """
+    (low, high) of a number, a "low,high" string or a two-element list.
+
+    Raises:
+        ValueError if the value is not one of these
+    """
+    if isinstance(value, str):
+        value = [part for part in value.split(",") if part.strip()]
+    if isinstance(value, (list, tuple)):
+        if len(value) == 1:
+            value = value[0]
+        elif len(value) == 2:
+            return float(value[0]), float(value[1])
+        else:
+            raise ValueError(f"{name} must be a number or a low,high range")
+    return float(value), float(value)
+
+def tick_decimals(tick_size):
+    """Decimals needed to write multiples of a tick size exactly"""
+    return max(2, len(f"{tick_size:.10f}".rstrip("0").split(".")[1]))
+
+def round_to_tick(prices, tick_size):
+    return np.round(np.round(np.asarray(prices, dtype=np.float64) / tick_size) * tick_size, tick_decimals(tick_size))
+
+def split_quantity(quantity, tranches, lot_size=1):
+    """Whole lots per tranche, as even as possible with the remainder in the first tranches"""
+    lots, remainder = divmod(quantity // lot_size, tranches)
+    return (lots + (np.arange(tranches) < remainder)) * lot_size
+
+def ladder_legs(transaction_type, quantity, entry_low, entry_high, tranches, target_percent=None,
+                stoploss_percent=None, tick_size=DEFAULT_TICK_SIZE, lot_size=1):
+    """
+    Prices and quantities of every tranche of a ladder.
+
+    Args:
+        transaction_type: "BUY" or "SELL"
+        quantity: Total quantity, split over the tranches
+        entry_low, entry_high: Entry price range
+        tranches: Number of super orders
+        target_percent, stoploss_percent: (first, last) percentages, spread
+            evenly over the tranches (None for no target / stop loss)
+        tick_size: Prices are rounded to multiples of this
+        lot_size: Quantities are whole multiples of this
+
+    Returns:
+        Dictionary of arrays: quantity, entry, target and stoploss (the
+        last two None when not set), one element per tranche
+
+    Raises:
+        ValueError if the ladder is not valid
+    """
+    side = transaction_type.upper()
+    if side not in ("BUY", "SELL"):
+        raise ValueError("Transaction type must be either 'BUY' or 'SELL'")
+    if not 1 <= tranches <= MAX_TRANCHES:
+        raise ValueError(f"tranches must be between 1 and {MAX_TRANCHES}")
+    if quantity % lot_size:
+        raise ValueError(f"quantity must be a multiple of the lot size ({lot_size})")
+    if quantity // lot_size < tranches:
+        raise ValueError(f"quantity {quantity} is too small for {tranches} tranches of at least one lot ({lot_size})")
+    entry_low, entry_high = sorted((entry_low, entry_high))
+    if entry_low <= 0:
+        raise ValueError("Entry prices must be positive")
+
+    # BUY tranches step down from the top of the range, SELL tranches step up
+    first, last = (entry_high, entry_low) if side == "BUY" else (entry_low, entry_high)
+    entry = round_to_tick(np.linspace(first, last, tranches), tick_size)
+    legs = {"quantity": split_quantity(quantity, tranches, lot_size), "entry": entry, "target": None,
+            "stoploss": None}
+
+    # Exits are kept at least one tick from the entry, on the correct side of it
+    if target_percent is not None:
+        percent = np.linspace(target_percent[0], target_percent[1], tranches)
+        if np.any(percent <= 0):
+            raise ValueError("target_percent must be positive")
+        target = compute_target_price(entry, side, "percentage", percent)
+        target = np.maximum(target, entry + tick_size) if side == "BUY" else np.minimum(target, entry - tick_size)
+        legs["target"] = round_to_tick(target, tick_size)
+    if stoploss_percent is not None:
+        percent = np.linspace(stoploss_percent[0], stoploss_percent[1], tranches)
+        if np.any(percent <= 0):
+            raise ValueError("stoploss_percent must be positive")
+        stoploss = compute_stoploss_price(entry, side, "percentage", percent)
+        stoploss = np.minimum(stoploss, entry - tick_size) if side == "BUY" else np.maximum(stoploss, entry + tick_size)
+        stoploss = round_to_tick(stoploss, tick_size)
+        if np.any(stoploss <= 0):
+            raise ValueError("stoploss_percent puts a stop loss at or below zero")
+        legs["stoploss"] = stoploss
+    return legs
+
+def instrument_ticks(exchange_segment, security_id):
+    """(tick size, lot size, source) from the instrument master, or the defaults if it is unavailable"""
+    from instrument_master import master
+    try:
+        instrument = master.instrument(exchange_segment, security_id)
+    except (OSError, ValueError, requests.exceptions.RequestException):
+        instrument = None
+    if instrument is None:
+        return DEFAULT_TICK_SIZE, 1, "default"
+    tick_size, lot_size, _ = instrument
+    return tick_size, max(int(lot_size), 1), "instrument_master"
+
+def _headers():
+    return {
+        "Content-Type": "application/json",
+        "access-token": DHAN_ACCESS_TOKEN
+    }
+
+def _submit_leg(leg):
+    """Send one tranche and return its result"""
+    result = {key: leg[key] for key in ("tranche", "correlation_id", "quantity", "entry_price", "target_price",
+                                        "stoploss_price")}
+    try:
+        response, _, submission = submit_order(f"{DHAN_API_BASE_URL}/super/orders", _headers(), leg["body"],
+                                               leg["correlation_id"], kind="super")
+        result["submission"] = submission
+        if response.status_code in [200, 201, 202]:
+            data = response.json()
+            result.update(status="placed", order_id=data.get("orderId"), order_status=data.get("orderStatus"))
+        else:
+            result.update(status="unresolved" if submission == "unresolved" else "failed",
+                          error=response.text[:500])
+    except requests.exceptions.RequestException as e:
+        # Not sent at all (circuit open, rate limit deadline, connect timeout)
+        result.update(status="not_sent", error=str(e))
+    return result
+
+def place_ladder(security_id, transaction_type, legs, group_id, product_type="INTRADAY", trailing_jump=0,
+                 exchange_segment="NSE_EQ", concurrency=DEFAULT_CONCURRENCY):
+    """
+    Send every tranche of a ladder as a LIMIT super order.
+
+    Args:
+        security_id: Dhan security ID
+        transaction_type: "BUY" or "SELL"
+        legs: Arrays from ladder_legs
+        group_id: Ladder group ID, the prefix of every leg's correlation ID
+
+    Returns:
+        One result per tranche, in tranche order
+    """
+    orders = []
+    for i in range(len(legs["entry"])):
+        leg = {
+            "tranche": i + 1,
+            "correlation_id": leg_correlation_id(group_id, i + 1),
+            "quantity": int(legs["quantity"][i]),
+            "entry_price": float(legs["entry"][i]),
+            "target_price": float(legs["target"][i]) if legs["target"] is not None else None,
+            "stoploss_price": float(legs["stoploss"][i]) if legs["stoploss"] is not None else None
+        }
+        body = {
+            "dhanClientId": DHAN_CLIENT_ID,
+            "transactionType": transaction_type.upper(),
+            "exchangeSegment": exchange_segment,
+            "productType": product_type.upper(),
+            "orderType": "LIMIT",
+            "securityId": security_id,
+            "quantity": leg["quantity"],
+            "price": leg["entry_price"]
+        }
+        if leg["target_price"] is not None:
+            body["targetPrice"] = leg["target_price"]
+        if leg["stoploss_price"] is not None:
+            body["stopLossPrice"] = leg["stoploss_price"]
+        if trailing_jump > 0:
+            body["trailingJump"] = trailing_jump
+        leg["body"] = body
+        orders.append(leg)
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(orders)))) as executor:
+        return list(executor.map(_submit_leg, orders))
+
+def find_ladder_orders(group_id):
+    """
+    Super orders placed as legs of a ladder, by order ID.
+
+    Rows come from the super order list; legs that the ledger knows but
+    the list does not show are included with only their order ID.
+
+    Raises:
+        requests.exceptions.RequestException if the super order list could not be fetched
+    """
+    leg_pattern = re.compile(rf"^{re.escape(group_id)}(\d{{2}})$")
+    response = dhan_client.get(f"{DHAN_API_BASE_URL}/super/orders", headers=_headers())
+    response.raise_for_status()
+    orders = {}
+    for row in response.json() or []:
+        match = leg_pattern.match(str(row.get("correlationId") or ""))
+        if match:
+            orders[str(row.get("orderId"))] = dict(row, tranche=int(match.group(1)))
+    for tranche in range(1, MAX_TRANCHES + 1):
+        record = ledger.get(leg_correlation_id(group_id, tranche))
+        if record and record.get("order_id") and str(record["order_id"]) not in orders:
+            orders[str(record["order_id"])] = {"orderId": record["order_id"], "tranche": tranche,
+                                               "correlationId": record["correlation_id"]}
+    return orders
+
+def is_open(row):
+    """Whether a super order row still has a leg that can be cancelled (unknown rows count as open)"""
+    if "orderStatus" not in row:
+        return True
+    if row.get("orderStatus") in OPEN_STATUSES:
+        return True
+    return any(leg.get("orderStatus") in OPEN_STATUSES for leg in row.get("legDetails") or [])
+
+def _cancel_leg(args):
+    order_id, row, leg_name = args
+    result = {"tranche": row.get("tranche"), "order_id": order_id, "correlation_id": row.get("correlationId")}
+    try:
+        response = dhan_client.delete(f"{DHAN_API_BASE_URL}/super/orders/{order_id}/{leg_name}", headers=_headers())
+        if response.status_code in [200, 202]:
+            result["status"] = "cancelled"
+        else:
+            result.update(status="failed", http_status=response.status_code, error=response.text[:500])
+    except requests.exceptions.RequestException as e:
+        result.update(status="failed", error=str(e))
+    return result
+
+def cancel_ladder_orders(orders, leg_name="ENTRY_LEG", concurrency=DEFAULT_CONCURRENCY):
+    """
+    Cancel a leg of every open super order of a ladder.
+
+    Returns:
+        (results of the cancellations sent, rows skipped because nothing was open)
+    """
+    pending = [(order_id, row, leg_name) for order_id, row in orders.items() if is_open(row)]
+    skipped = [{"tranche": row.get("tranche"), "order_id": order_id, "order_status": row.get("orderStatus")}
+               for order_id, row in orders.items() if not is_open(row)]
+    if not pending:
+        return [], skipped
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(pending)))) as executor:
+        results = list(executor.map(_cancel_leg, pending))
+    return sorted(results, key=lambda result: result["tranche"] or 0), skipped
@@ -0,0 +1,90 @@
+# super_order_levels.py
+# Target, stop loss and trailing rules shared by super-order.py and the
+# backtest engine. The functions only use arithmetic, so they accept plain
+# floats as well as NumPy arrays (one element per parameter combination).
+
+LEVEL_TYPES = ["value", "percentage", "atr"]
+
+
+def compute_target_price(entry_price, transaction_type, target_type, target_value, atr=None):
+    """
+    Calculate the target price of a super order.
+
+    Args:
+        entry_price: Entry price of the order
+        transaction_type: "BUY" or "SELL"
+        target_type: "value" for absolute price, "percentage" for percentage gain,
+            "atr" for a multiple of the average true range
+        target_value: Absolute price, percentage or ATR multiple
+        atr: Average true range, required for "atr"
+
+    Returns:
+        Target price
+    """
+    if target_type == "percentage":
+        if transaction_type.upper() == "BUY":
+            # For buy, target is higher than entry price
+            return entry_price * (1 + target_value / 100)
+        # For sell, target is lower than entry price
+        return entry_price * (1 - target_value / 100)
+    if target_type == "atr":
+        if transaction_type.upper() == "BUY":
+            return entry_price + target_value * atr
+        return entry_price - target_value * atr
+    # "value"
+    return target_value
+
+def compute_stoploss_price(entry_price, transaction_type, stoploss_type, stoploss_value, atr=None):
+    """
+    Calculate the stop loss price of a super order.
+
+    Args:
+        entry_price: Entry price of the order
+        transaction_type: "BUY" or "SELL"
+        stoploss_type: "value" for absolute price, "percentage" for percentage loss,
+            "atr" for a multiple of the average true range
+        stoploss_value: Absolute price, percentage or ATR multiple
+        atr: Average true range, required for "atr"
+
+    Returns:
+        Stop loss price
+    """
+    if stoploss_type == "percentage":
+        if transaction_type.upper() == "BUY":
+            # For buy, stop loss is lower than entry price
+            return entry_price * (1 - stoploss_value / 100)
+        # For sell, stop loss is higher than entry price
+        return entry_price * (1 + stoploss_value / 100)
+    if stoploss_type == "atr":
+        if transaction_type.upper() == "BUY":
+            return entry_price - stoploss_value * atr
+        return entry_price + stoploss_value * atr
+    # "value"
+    return stoploss_value
+
+def trailed_stoploss_price(initial_stoploss, entry_price, best_price, transaction_type, trailing_jump, jumps_floor):
+    """
+    Move the stop loss by one trailing jump for every jump the price has moved in favour.
+
+    Args:
+        initial_stoploss: Stop loss price at entry
+        entry_price: Entry price of the order
+        best_price: Highest price since entry for BUY, lowest for SELL
+        transaction_type: "BUY" or "SELL"
+        trailing_jump: Trailing jump in price (0 for no trailing)
+        jumps_floor: Floor function to use (math.floor or numpy.floor)
+
+    Returns:
+        Current stop loss price
+    """
+    if transaction_type.upper() == "BUY":
+        favourable_move = best_price - entry_price
+        direction = 1
+    else:
+        favourable_move = entry_price - best_price
+        direction = -1
+    # A jump of 0 disables trailing; dividing by 1 keeps array inputs finite
+    safe_jump = trailing_jump + (trailing_jump == 0)
+    jumps = jumps_floor(favourable_move / safe_jump) * (trailing_jump > 0)
+    jumps = jumps * (jumps > 0)
+    return initial_stoploss + direction * jumps * trailing_jump
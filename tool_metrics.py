@@ -0,0 +1,467 @@
+# tool_metrics.py
+# Latency and error metrics for MCP tools and the Dhan API calls they make.
+#
+# instrument_server(mcp) wraps every tool registered afterwards with
+# @mcp.tool() and publishes the collected metrics as the dhan://metrics
+# (JSON) and dhan://metrics/prometheus (Prometheus text) resources. Upstream
+# calls are timed through a dhan_client listener on every client, including
+# per-account ones. Set DHAN_METRICS_PORT to also serve the metrics over
+# HTTP at /metrics and /metrics.json.
+import functools
+import inspect
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import DHAN_METRICS_PORT
+import codec
+import dhan_client
+from tool_profiler import profiler
+
+METRICS_URI = "dhan://metrics"
+PROMETHEUS_URI = "dhan://metrics/prometheus"
+
+# Histogram precision: values are kept in microseconds with 2**SUB_BUCKET_BITS
+# linear sub-buckets per power of two, i.e. a relative error below 1/64
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+
+# Largest recorded value, about 12 days in microseconds
+MAX_VALUE_US = (1 << 40) - 1
+
+REPORTED_PERCENTILES = [50, 90, 95, 99, 99.9]
+
+
+def bucket_index(value_us):
+    """Log-linear bucket of a non-negative integer value"""
+    if value_us < SUB_BUCKET_COUNT:
+        return value_us
+    shift = value_us.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + (value_us >> shift) - SUB_BUCKET_HALF
+
+def bucket_bounds(index):
+    """Inclusive (low, high) values covered by a bucket"""
+    if index < SUB_BUCKET_COUNT:
+        return index, index
+    shift, offset = divmod(index - SUB_BUCKET_COUNT, SUB_BUCKET_HALF)
+    shift += 1
+    mantissa = offset + SUB_BUCKET_HALF
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram.
+
+    Buckets are linear within each power of two and grow on demand, so
+    recording is a handful of integer operations and memory stays small for
+    the latencies actually seen. Not thread-safe on its own; callers hold a
+    lock.
+    """
+
+    __slots__ = ("counts", "count", "total", "minimum", "maximum")
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        value = min(max(int(seconds * 1e6), 0), MAX_VALUE_US)
+        index = bucket_index(value)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if self.minimum is None or seconds < self.minimum:
+            self.minimum = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def percentile(self, percent):
+        """Value in seconds at or below which `percent` of recorded values fall"""
+        if not self.count:
+            return 0.0
+        target = max(int(round(percent / 100 * self.count + 0.5)), 1)
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                low, high = bucket_bounds(index)
+                return min(max((low + high) / 2e6, self.minimum), self.maximum)
+        return self.maximum
+
+    def snapshot(self):
+        """Summary in milliseconds"""
+        summary = {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "min_ms": round((self.minimum or 0.0) * 1000, 3),
+            "max_ms": round(self.maximum * 1000, 3)
+        }
+        for percent in REPORTED_PERCENTILES:
+            summary[f"p{percent:g}_ms"] = round(self.percentile(percent) * 1000, 3)
+        return summary
+
+
+class ToolStats:
+    __slots__ = ("histogram", "errors", "lock")
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.errors = {}
+        self.lock = threading.Lock()
+
+
+class UpstreamStats:
+    __slots__ = ("histogram", "statuses", "errors", "request_bytes", "response_bytes", "lock")
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.statuses = {}
+        self.errors = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.lock = threading.Lock()
+
+
+def result_error(result):
+    """Error kind of a tool result, or None for success"""
+    if isinstance(result, dict) and result.get("status") == "error":
+        return "error_result"
+    return None
+
+def body_size(body):
+    if body is None:
+        return 0
+    return len(body) if isinstance(body, (bytes, str)) else 0
+
+
+class MetricsRegistry:
+    """Per-tool and per-endpoint latency histograms, error counts and byte counters"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._tools = {}
+        self._upstream = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, table, key, factory):
+        entry = table.get(key)
+        if entry is None:
+            with self._lock:
+                entry = table.setdefault(key, factory())
+        return entry
+
+    def record_tool(self, name, elapsed, error=None):
+        entry = self._entry(self._tools, name, ToolStats)
+        with entry.lock:
+            entry.histogram.record(elapsed)
+            if error is not None:
+                entry.errors[error] = entry.errors.get(error, 0) + 1
+
+    def record_upstream(self, method, url, kwargs, response, elapsed, error):
+        """dhan_client listener recording one API call"""
+        entry = self._entry(self._upstream, dhan_client.endpoint_name(method, url), UpstreamStats)
+        if response is not None:
+            request = getattr(response, "request", None)
+            sent = body_size(getattr(request, "body", None))
+            received = codec.body_length(response)
+        else:
+            sent = received = 0
+        with entry.lock:
+            entry.histogram.record(elapsed)
+            entry.request_bytes += sent
+            entry.response_bytes += received
+            if response is not None:
+                status = str(response.status_code)
+                entry.statuses[status] = entry.statuses.get(status, 0) + 1
+            else:
+                kind = type(error).__name__
+                entry.errors[kind] = entry.errors.get(kind, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._tools.clear()
+            self._upstream.clear()
+            self.started_at = time.time()
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dictionary"""
+        tools = {}
+        for name, entry in sorted(self._tools.items()):
+            with entry.lock:
+                tools[name] = dict(entry.histogram.snapshot(), errors=dict(entry.errors))
+        upstream = {}
+        for name, entry in sorted(self._upstream.items()):
+            with entry.lock:
+                upstream[name] = dict(
+                    entry.histogram.snapshot(),
+                    statuses=dict(entry.statuses),
+                    errors=dict(entry.errors),
+                    request_bytes=entry.request_bytes,
+                    response_bytes=entry.response_bytes
+                )
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "tools": tools,
+            "upstream": upstream,
+            "upstream_health": dhan_client.health_snapshot(),
+            "rate_limits": dhan_client.rate_limit_snapshot()
+        }
+
+    def to_prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        lines = []
+        snapshot_quantiles = [(percent, percent / 100) for percent in REPORTED_PERCENTILES]
+
+        def summary(metric, label, table):
+            lines.append(f"# TYPE {metric} summary")
+            for name, entry in sorted(table.items()):
+                with entry.lock:
+                    histogram = entry.histogram
+                    for percent, quantile in snapshot_quantiles:
+                        lines.append(f'{metric}{{{label}="{name}",quantile="{quantile:g}"}} {histogram.percentile(percent):.6f}')
+                    lines.append(f'{metric}_sum{{{label}="{name}"}} {histogram.total:.6f}')
+                    lines.append(f'{metric}_count{{{label}="{name}"}} {histogram.count}')
+
+        summary("dhan_tool_latency_seconds", "tool", self._tools)
+        lines.append("# TYPE dhan_tool_errors_total counter")
+        for name, entry in sorted(self._tools.items()):
+            for kind, count in sorted(entry.errors.items()):
+                lines.append(f'dhan_tool_errors_total{{tool="{name}",kind="{kind}"}} {count}')
+
+        summary("dhan_upstream_latency_seconds", "endpoint", self._upstream)
+        lines.append("# TYPE dhan_upstream_responses_total counter")
+        for name, entry in sorted(self._upstream.items()):
+            for status, count in sorted(entry.statuses.items()):
+                lines.append(f'dhan_upstream_responses_total{{endpoint="{name}",status="{status}"}} {count}')
+        lines.append("# TYPE dhan_upstream_errors_total counter")
+        for name, entry in sorted(self._upstream.items()):
+            for kind, count in sorted(entry.errors.items()):
+                lines.append(f'dhan_upstream_errors_total{{endpoint="{name}",kind="{kind}"}} {count}')
+        for metric, attribute in (("dhan_upstream_request_bytes_total", "request_bytes"),
+                                  ("dhan_upstream_response_bytes_total", "response_bytes")):
+            lines.append(f"# TYPE {metric} counter")
+            for name, entry in sorted(self._upstream.items()):
+                lines.append(f'{metric}{{endpoint="{name}"}} {getattr(entry, attribute)}')
+
+        health = dhan_client.health_snapshot()
+        for metric, kind, key in (("dhan_upstream_retries_total", "counter", "retries"),
+                                  ("dhan_upstream_short_circuits_total", "counter", "short_circuits"),
+                                  ("dhan_upstream_breaker_opened_total", "counter", "times_opened")):
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, entry in health.items():
+                lines.append(f'{metric}{{endpoint="{name}"}} {entry[key]}')
+        lines.append("# TYPE dhan_upstream_breaker_open gauge")
+        for name, entry in health.items():
+            lines.append(f'dhan_upstream_breaker_open{{endpoint="{name}"}} {int(entry["breaker"] != "closed")}')
+
+        rate_limits = dhan_client.rate_limit_snapshot()
+        for metric, key in (("dhan_rate_limit_acquired_total", "acquired"),
+                            ("dhan_rate_limit_delayed_total", "delayed"),
+                            ("dhan_rate_limit_rejected_total", "rejected"),
+                            ("dhan_rate_limit_wait_seconds_total", "total_wait_seconds")):
+            lines.append(f"# TYPE {metric} counter")
+            for name, entry in sorted(rate_limits.items()):
+                lines.append(f'{metric}{{category="{name}"}} {entry[key]}')
+        return "\n".join(lines) + "\n"
+
+
+# Registry shared by every server in this process
+metrics = MetricsRegistry()
+
+_http_server = {"server": None}
+
+def instrument_tool(fn, name, registry=metrics):
+    """Wrap a tool function so each call is timed and its errors counted"""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                registry.record_tool(name, time.perf_counter() - start, type(e).__name__)
+                raise
+            registry.record_tool(name, time.perf_counter() - start, result_error(result))
+            return result
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        previous = dhan_client.start_call_report()
+        try:
+            if profiler.armed:
+                result = profiler.call(name, fn, args, kwargs)
+            else:
+                result = fn(*args, **kwargs)
+        except Exception as e:
+            registry.record_tool(name, time.perf_counter() - start, type(e).__name__)
+            raise
+        finally:
+            upstream = dhan_client.finish_call_report(previous)
+        registry.record_tool(name, time.perf_counter() - start, result_error(result))
+        # Tell the caller when API calls were retried or hit an open circuit breaker
+        if upstream and isinstance(result, dict):
+            result.setdefault("upstream", upstream)
+        return result
+    return wrapper
+
+def instrument_server(server, registry=metrics):
+    """
+    Collect metrics for every tool the server registers from now on.
+
+    Call this right after creating the FastMCP server, before any
+    @mcp.tool() decorator runs. Also registers the metrics resources, times
+    upstream calls made through dhan_client, adds the profile_tool and
+    get_tool_profile admin tools and, if DHAN_METRICS_PORT is set, starts
+    the HTTP metrics endpoint.
+
+    Args:
+        server: FastMCP server
+        registry: MetricsRegistry to record into (default: the shared registry)
+
+    Returns:
+        The server
+    """
+    if getattr(server, "_metrics_registry", None) is not None:
+        return server
+    server._metrics_registry = registry
+    original_tool = server.tool
+    instrumented = {}
+
+    def tool(*args, **kwargs):
+        decorator = original_tool(*args, **kwargs)
+
+        def register(fn):
+            name = kwargs.get("name") or (args[0] if args and isinstance(args[0], str) else None) or fn.__name__
+            instrumented[name] = inspect.iscoroutinefunction(fn)
+            wrapped = instrument_tool(fn, name, registry)
+            # FastMCP gets the result as JSON text; Python callers still get the dict
+            decorator(codec.encoded_tool(wrapped))
+            return wrapped
+        return register
+
+    server.tool = tool
+    # Every client, so calls made for other accounts are counted too
+    dhan_client.add_client_listener(registry.record_upstream)
+
+    @server.resource(METRICS_URI)
+    def tool_metrics():
+        """
+        Latency percentiles and error counts per tool and per Dhan API endpoint
+        """
+        return json.dumps(registry.snapshot(), indent=2)
+
+    @server.resource(PROMETHEUS_URI, mime_type="text/plain")
+    def tool_metrics_prometheus():
+        """
+        Tool and Dhan API metrics in Prometheus text format
+        """
+        return registry.to_prometheus()
+
+    @original_tool()
+    def profile_tool(tool_name, calls=10):
+        """
+        Profile the next calls of a tool on this server.
+
+        Args:
+            tool_name: Name of the tool to profile (e.g., "place_super_order")
+            calls: Number of calls to profile (default: 10, 0 stops profiling)
+
+        Returns:
+            Profiling status; fetch the result with get_tool_profile
+        """
+        if tool_name not in instrumented:
+            return {
+                "status": "error",
+                "message": f"Tool '{tool_name}' not found. Available tools: {sorted(instrumented)}"
+            }
+        if instrumented[tool_name]:
+            return {
+                "status": "error",
+                "message": f"Tool '{tool_name}' is async; only synchronous tools can be profiled"
+            }
+        calls = int(calls)
+        profiler.arm(tool_name, calls)
+        if calls <= 0:
+            return {
+                "status": "success",
+                "message": f"Stopped profiling {tool_name}"
+            }
+        return {
+            "status": "success",
+            "message": f"Profiling the next {calls} calls of {tool_name}"
+        }
+
+    @original_tool()
+    def get_tool_profile(tool_name):
+        """
+        Get the profile collected for a tool.
+
+        Args:
+            tool_name: Name of the profiled tool
+
+        Returns:
+            Time per phase (lookup, request build, HTTP, response parsing,
+            response shaping), the hottest call stacks and the path of the
+            collapsed-stack file for flame graphs
+        """
+        report = profiler.report(tool_name)
+        if report is None:
+            return {
+                "status": "error",
+                "message": f"No profile for '{tool_name}'. Start one with profile_tool"
+            }
+        return dict(status="success", **report)
+
+    if DHAN_METRICS_PORT:
+        start_metrics_http_server(DHAN_METRICS_PORT, registry=registry)
+    return server
+
+def start_metrics_http_server(port, host="127.0.0.1", registry=metrics):
+    """
+    Serve /metrics (Prometheus text) and /metrics.json in a background thread.
+
+    Only one endpoint is started per process; if the port is taken (e.g. by
+    another server started with the same settings) it is skipped.
+    """
+    if _http_server["server"] is not None:
+        return _http_server["server"]
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                payload, content_type = registry.to_prometheus().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                payload, content_type = json.dumps(registry.snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print(f"Metrics endpoint not started on port {port}: {e}", file=sys.stderr)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    _http_server["server"] = server
+    return server
@@ -0,0 +1,225 @@
+# tool_profiler.py
+# On-demand profiling of MCP tool calls.
+#
+# profiler.arm("place_super_order", 20) profiles the next 20 calls of that
+# tool. Each call runs under a sys.setprofile hook that records self time per
+# call stack, written as collapsed stacks (one "frame;frame;frame microseconds"
+# line per stack) that flamegraph.pl and speedscope read directly. Time is
+# also split into phases: stock lookup, request build, HTTP, response parsing
+# and response shaping. tool_metrics routes instrumented tool calls through
+# here and registers the profile_tool and get_tool_profile admin tools.
+import os
+import sys
+import threading
+import time
+
+from config import DHAN_PROFILE_DIR
+
+PHASES = ["lookup", "request_build", "http", "response_parsing", "response_shaping", "instrumentation"]
+
+# Functions whose whole subtree is attributed to one phase
+LOOKUP_FUNCTIONS = {"find_stock_code", "load_stocks_data", "search_stocks", "resolve_stocks", "load_candles"}
+HTTP_FUNCTIONS = {("dhan_client.py", "_send")}
+INSTRUMENTATION_FUNCTIONS = {("dhan_client.py", "_notify")}
+# Responses are codec.CodecResponse objects, decoded in codec.py
+RESPONSE_PARSING_FUNCTIONS = {("models.py", "json"), ("codec.py", "json"), ("codec.py", "loads"),
+                              ("codec.py", "iter_array")}
+
+
+def classify(code):
+    """Phase a Python function starts, or None if it inherits its caller's"""
+    name = code.co_name
+    if name in LOOKUP_FUNCTIONS:
+        return "lookup"
+    key = (os.path.basename(code.co_filename), name)
+    if key in HTTP_FUNCTIONS:
+        return "http"
+    if key in RESPONSE_PARSING_FUNCTIONS:
+        return "response_parsing"
+    if key in INSTRUMENTATION_FUNCTIONS:
+        return "instrumentation"
+    return None
+
+def frame_name(code):
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+def builtin_name(function):
+    module = getattr(function, "__module__", None) or type(getattr(function, "__self__", None)).__name__
+    return f"{module}:{getattr(function, '__qualname__', repr(function))}"
+
+
+class CallProfile:
+    """
+    Deterministic profile of a single call on the current thread.
+
+    Stack entries are [path, phase, start, child_time]. On return the frame's
+    self time is added to its collapsed path and to its phase. Frames outside
+    the named phases count as request build until the first HTTP call has
+    finished and as response shaping afterwards.
+    """
+
+    def __init__(self):
+        self.stack = []
+        self.stacks = {}
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.http_done = False
+
+    def _push(self, name, phase):
+        stack = self.stack
+        if stack:
+            parent_path, parent_phase = stack[-1][0], stack[-1][1]
+            path = f"{parent_path};{name}"
+            phase = parent_phase or phase
+        else:
+            path = name
+        stack.append([path, phase, time.perf_counter(), 0.0])
+
+    def _pop(self):
+        if not self.stack:
+            return
+        path, phase, start, child_time = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        self_time = max(elapsed - child_time, 0.0)
+        self.stacks[path] = self.stacks.get(path, 0.0) + self_time
+        if phase is None:
+            phase = "response_shaping" if self.http_done else "request_build"
+        self.phases[phase] += self_time
+        if self.stack:
+            self.stack[-1][3] += elapsed
+            if phase == "http" and self.stack[-1][1] != "http":
+                self.http_done = True
+
+    def hook(self, frame, event, arg):
+        if event == "call":
+            self._push(frame_name(frame.f_code), classify(frame.f_code))
+        elif event == "c_call":
+            self._push(builtin_name(arg), None)
+        elif event in ("return", "c_return", "c_exception"):
+            self._pop()
+
+    def run(self, fn, args, kwargs):
+        previous = sys.getprofile()
+        sys.setprofile(self.hook)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            sys.setprofile(previous)
+            # Discard frames still open when profiling stopped
+            self.stack.clear()
+
+
+class ToolProfile:
+    """Profiles of one armed tool, merged across calls"""
+
+    def __init__(self, tool_name, calls):
+        self.tool_name = tool_name
+        self.requested = calls
+        self.remaining = calls
+        self.completed = 0
+        self.total = 0.0
+        self.stacks = {}
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.started_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.output_file = None
+
+    def add(self, call_profile, elapsed):
+        self.completed += 1
+        self.total += elapsed
+        for path, seconds in call_profile.stacks.items():
+            self.stacks[path] = self.stacks.get(path, 0.0) + seconds
+        for phase, seconds in call_profile.phases.items():
+            self.phases[phase] += seconds
+
+    def collapsed(self):
+        """Collapsed stack lines weighted in microseconds"""
+        return [f"{path} {int(round(seconds * 1e6))}" for path, seconds in sorted(self.stacks.items())
+                if seconds >= 5e-7]
+
+    def report(self, top=15):
+        profiled = sum(self.phases.values())
+        hottest = sorted(self.stacks.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {
+            "tool_name": self.tool_name,
+            "profile_status": "complete" if self.remaining == 0 else "collecting",
+            "calls_requested": self.requested,
+            "calls_profiled": self.completed,
+            "started_at": self.started_at,
+            "mean_call_ms": round(self.total / self.completed * 1000, 3) if self.completed else None,
+            "phases": {
+                phase: {
+                    "total_ms": round(seconds * 1000, 3),
+                    "per_call_ms": round(seconds / self.completed * 1000, 3) if self.completed else None,
+                    "percent": round(100 * seconds / profiled, 1) if profiled else 0.0
+                }
+                for phase, seconds in self.phases.items()
+            },
+            "hottest_stacks": [
+                {"stack": path.split(";")[-3:], "self_ms": round(seconds * 1000, 3)}
+                for path, seconds in hottest
+            ],
+            "collapsed_stacks_file": self.output_file
+        }
+
+
+class ToolProfiler:
+    """Arms tools for profiling and collects their profiles"""
+
+    def __init__(self, output_dir=DHAN_PROFILE_DIR):
+        self.output_dir = output_dir
+        self.armed = {}
+        self.profiles = {}
+        self._lock = threading.Lock()
+
+    def arm(self, tool_name, calls):
+        """Profile the next `calls` calls of a tool; 0 stops profiling it"""
+        with self._lock:
+            if calls <= 0:
+                self.armed.pop(tool_name, None)
+                return None
+            profile = ToolProfile(tool_name, calls)
+            self.armed[tool_name] = profile
+            self.profiles[tool_name] = profile
+            return profile
+
+    def call(self, tool_name, fn, args, kwargs):
+        """Run a tool call, profiling it if the tool is armed"""
+        with self._lock:
+            profile = self.armed.get(tool_name)
+            if profile is None:
+                profile_call = False
+            else:
+                profile.remaining -= 1
+                if profile.remaining == 0:
+                    del self.armed[tool_name]
+                profile_call = True
+        if not profile_call:
+            return fn(*args, **kwargs)
+
+        call_profile = CallProfile()
+        start = time.perf_counter()
+        try:
+            return call_profile.run(fn, args, kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                profile.add(call_profile, elapsed)
+                finished = profile.remaining == 0 and profile.completed == profile.requested
+            if finished:
+                self._write(profile)
+
+    def _write(self, profile):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.output_dir, f"{profile.tool_name}-{stamp}.folded")
+        with open(path, 'w') as file:
+            file.write("\n".join(profile.collapsed()) + "\n")
+        profile.output_file = path
+
+    def report(self, tool_name):
+        profile = self.profiles.get(tool_name)
+        return profile.report() if profile is not None else None
+
+
+# Profiler shared by every server in this process
+profiler = ToolProfiler()
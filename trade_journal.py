@@ -0,0 +1,316 @@
+# trade_journal.py
+# Append-only local journal of orders, trades and position conversions.
+#
+# The journal listens to every Dhan API call made through dhan_client. The
+# listener only queues the raw request and response; a background thread
+# parses them and writes batches to SQLite in WAL mode, so journaling adds
+# no database work to the tool call itself. Several tool servers can share
+# one journal file.
+#
+#   orders       one row per order event: placed, rejected, cancelled, or a
+#                status change seen in the order book
+#   trades       one row per fill, deduplicated across order/trade book reads
+#   conversions  one row per position conversion
+import datetime
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from config import DHAN_JOURNAL_PATH
+from reference_cache import find_stock, stock_name_for
+
+# Largest batch written in one transaction, and how long the writer waits
+# for more events before writing a partial batch
+BATCH_SIZE = 500
+BATCH_WAIT_SECONDS = 0.05
+
+# Events queued beyond this are dropped rather than blocking tool calls
+MAX_QUEUED_EVENTS = 100000
+
+# Endpoints worth journaling, matched against the path below /v2
+JOURNALED_PATHS = re.compile(r"^/(orders|super/orders|trades|positions/convert)(/|$)")
+
+# Trades are dated by exchange time when it starts with a date
+TRADE_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,
+    date TEXT NOT NULL,
+    source TEXT NOT NULL,
+    event TEXT NOT NULL,
+    kind TEXT,
+    order_id TEXT,
+    correlation_id TEXT,
+    security_id TEXT,
+    symbol TEXT,
+    side TEXT,
+    quantity REAL,
+    price REAL,
+    order_type TEXT,
+    product_type TEXT,
+    status TEXT,
+    raw TEXT
+);
+CREATE INDEX IF NOT EXISTS orders_symbol_date ON orders (symbol, date);
+CREATE INDEX IF NOT EXISTS orders_date ON orders (date);
+CREATE INDEX IF NOT EXISTS orders_order_id ON orders (order_id);
+
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,
+    date TEXT NOT NULL,
+    source TEXT NOT NULL,
+    order_id TEXT,
+    trade_id TEXT,
+    security_id TEXT,
+    symbol TEXT,
+    side TEXT,
+    quantity REAL,
+    price REAL,
+    product_type TEXT,
+    traded_at TEXT,
+    raw TEXT,
+    UNIQUE (source, date, order_id, trade_id)
+);
+CREATE INDEX IF NOT EXISTS trades_symbol_date ON trades (symbol, date);
+CREATE INDEX IF NOT EXISTS trades_date ON trades (date);
+CREATE INDEX IF NOT EXISTS trades_order_id ON trades (order_id);
+
+CREATE TABLE IF NOT EXISTS conversions (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,
+    date TEXT NOT NULL,
+    source TEXT NOT NULL,
+    security_id TEXT,
+    symbol TEXT,
+    from_product_type TEXT,
+    to_product_type TEXT,
+    position_type TEXT,
+    quantity REAL,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS conversions_symbol_date ON conversions (symbol, date);
+"""
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+class TradeJournal:
+    """
+    SQLite journal fed by dhan_client responses.
+
+    Args:
+        path: Database file
+        batch_size: Maximum events written per transaction
+    """
+
+    def __init__(self, path=DHAN_JOURNAL_PATH, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=MAX_QUEUED_EVENTS)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        # Security ID -> stock name (None if not in stocks.json)
+        self._symbols = {}
+        self._last_status = {}
+        self._schema_ready = False
+
+    # Request path
+
+    def record_response(self, method, url, kwargs, response, elapsed, error):
+        """dhan_client listener: queue journaled calls for the writer thread"""
+        if response is None or method == "GET" and response.status_code != 200:
+            return
+        path = urlsplit(url).path
+        if path.startswith("/v2/"):
+            path = path[3:]
+        if not JOURNALED_PATHS.match(path):
+            return
+        source = "paper" if response.headers.get("X-Paper-Trading") else "live"
+        event = (time.time(), source, method, path, kwargs.get("json"), response.status_code, response.content)
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._writer is None:
+            self._start_writer()
+
+    # Writer thread
+
+    def _start_writer(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="trade-journal", daemon=True)
+                self._writer.start()
+
+    def connect(self):
+        """Open a connection with WAL enabled and the schema in place"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        if not self._schema_ready:
+            # WAL mode is stored in the database file, so this is needed once
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self._schema_ready = True
+        return connection
+
+    def _run(self):
+        connection = self.connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + BATCH_WAIT_SECONDS
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(connection, batch)
+            except Exception as e:
+                print(f"Error writing trade journal: {e}", file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, connection, batch):
+        orders, trades, conversions = [], [], []
+        for event in batch:
+            self._parse(event, orders, trades, conversions)
+        with connection:
+            if orders:
+                connection.executemany(
+                    "INSERT INTO orders (recorded_at, date, source, event, kind, order_id, correlation_id, security_id, "
+                    "symbol, side, quantity, price, order_type, product_type, status, raw) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", orders)
+            if trades:
+                connection.executemany(
+                    "INSERT OR IGNORE INTO trades (recorded_at, date, source, order_id, trade_id, security_id, symbol, "
+                    "side, quantity, price, product_type, traded_at, raw) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    trades)
+            if conversions:
+                connection.executemany(
+                    "INSERT INTO conversions (recorded_at, date, source, security_id, symbol, from_product_type, "
+                    "to_product_type, position_type, quantity, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    conversions)
+        self.written += len(orders) + len(trades) + len(conversions)
+
+    def _symbol(self, security_id, record=None):
+        """Stock name from stocks.json, falling back to the trading symbol"""
+        security_id = str(security_id)
+        if security_id not in self._symbols:
+            self._symbols[security_id] = stock_name_for(security_id)
+        symbol = self._symbols[security_id]
+        if symbol is None and record:
+            symbol = record.get("tradingSymbol") or None
+        return symbol
+
+    def _parse(self, event, orders, trades, conversions):
+        recorded_at, source, method, path, body, status_code, content = event
+        date = datetime.date.fromtimestamp(recorded_at).isoformat()
+        try:
+            data = json.loads(content) if content else None
+        except ValueError:
+            data = None
+        body = body or {}
+        parts = [part for part in path.split("/") if part]
+        ok = 200 <= status_code < 300
+
+        def order_row(event_name, order_id, details, status):
+            if order_id and status:
+                self._last_status[(source, order_id)] = status
+            security_id = details.get("securityId")
+            return (
+                recorded_at, date, source, event_name, kind, order_id, details.get("correlationId"),
+                security_id, self._symbol(security_id, details), details.get("transactionType"),
+                _number(details.get("quantity")), _number(details.get("price")), details.get("orderType"),
+                details.get("productType"), status, json.dumps(details)
+            )
+
+        kind = "super" if parts[0] == "super" else "order"
+        if method == "POST" and parts in (["orders"], ["super", "orders"]):
+            if kind == "order" and body.get("afterMarketOrder"):
+                kind = "amo"
+            details = dict(body)
+            if ok and isinstance(data, dict):
+                details.update(data)
+                orders.append(order_row("placed", data.get("orderId"), details, data.get("orderStatus")))
+            else:
+                details["error"] = data
+                orders.append(order_row("rejected", None, details, "REJECTED"))
+        elif method == "DELETE" and ok and parts[-1] != "orders":
+            order_id = parts[2] if kind == "super" else parts[1]
+            details = dict(data) if isinstance(data, dict) else {}
+            orders.append(order_row("cancelled", order_id, details, details.get("orderStatus", "CANCELLED")))
+        elif method == "GET" and parts[0] in ("orders", "super") and isinstance(data, (list, dict)):
+            for details in data if isinstance(data, list) else [data]:
+                order_id, status = details.get("orderId"), details.get("orderStatus")
+                if order_id and status and self._last_status.get((source, order_id)) != status:
+                    orders.append(order_row("status", order_id, details, status))
+        elif method == "GET" and parts[0] == "trades" and isinstance(data, (list, dict)):
+            for trade in data if isinstance(data, list) else [data]:
+                security_id = trade.get("securityId")
+                traded_at = trade.get("exchangeTime") or trade.get("createTime")
+                trade_date = traded_at[:10] if traded_at and TRADE_DATE.match(traded_at) else date
+                trades.append((
+                    recorded_at, trade_date, source, trade.get("orderId"), trade.get("exchangeTradeId"), security_id,
+                    self._symbol(security_id, trade), trade.get("transactionType"),
+                    _number(trade.get("tradedQuantity")), _number(trade.get("tradedPrice")),
+                    trade.get("productType"), traded_at, json.dumps(trade)
+                ))
+        elif method == "POST" and parts == ["positions", "convert"]:
+            security_id = body.get("securityId")
+            conversions.append((
+                recorded_at, date, source, security_id, self._symbol(security_id, body), body.get("fromProductType"),
+                body.get("toProductType"), body.get("positionType"), _number(body.get("convertQty")),
+                "SUCCESS" if ok else f"FAILED ({status_code})"
+            ))
+
+    def flush(self, timeout=5.0):
+        """Wait until queued events are written (returns False on timeout)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    # Queries
+
+    def symbol_for(self, stock_name):
+        """Symbol a stock is journaled under, matched case-insensitively against stocks.json"""
+        stock = find_stock(stock_name)
+        if stock and stock.get('stock_name'):
+            return stock['stock_name']
+        return stock_name.upper()
+
+    def query(self, sql, params=()):
+        """Run a read-only query and return rows as dictionaries"""
+        connection = self.connect()
+        try:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(sql, params)]
+        finally:
+            connection.close()
+
+
+# Journal shared by this process; dhan_client registers its listener
+journal = TradeJournal()